@@ -30,6 +30,7 @@ if __name__ == "__main__":
     parser.add_argument("--repetition_penalty", type=float, default=1.1)
     parser.add_argument("--output-generation", action='store_true')
     parser.add_argument("--compile", action='store_true')
+    parser.add_argument("--fused-sampling", action='store_true')
     args = parser.parse_args()
 
     device = "cuda"
@@ -79,6 +80,7 @@ if __name__ == "__main__":
             temperature=args.temperature,
             top_p=args.topp,
             repetition_penalty=args.repetition_penalty,
+            use_fused_sampling=args.fused_sampling,
         )
     torch.cuda.synchronize()
     elapsed = time.time() - start
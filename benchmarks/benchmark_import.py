@@ -0,0 +1,55 @@
+# Copyright (c) 2023-2025, Songlin Yang, Yu Zhang
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+STATEMENTS = {
+    'fla': 'import fla',
+    'fla.ops': 'import fla.ops',
+    'fla.layers': 'import fla.layers',
+    'fla.models': 'import fla.models',
+    'layer': 'from fla.layers import GatedDeltaNet',
+    'model': 'from fla.models import GatedDeltaNetForCausalLM',
+    'op': 'from fla.ops import chunk_gated_delta_rule',
+}
+
+
+def measure(statement: str) -> float:
+    # each statement runs in a fresh interpreter, timed from within to exclude the startup of the interpreter
+    code = f"import time; t = time.perf_counter(); {statement}; print(time.perf_counter() - t)"
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import time benchmarking")
+    parser.add_argument("--statements", nargs='+', default=list(STATEMENTS), choices=list(STATEMENTS))
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", type=str, default=None, help="path to write the median timings to as JSON")
+    parser.add_argument("--baseline", type=str, default=None, help="path to the JSON timings to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative slowdown over the baseline to fail on")
+    args = parser.parse_args()
+
+    # warm up the bytecode caches
+    measure(STATEMENTS['fla'])
+    timings = {name: statistics.median(measure(STATEMENTS[name]) for _ in range(args.repeats)) for name in args.statements}
+    baseline = {}
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    regressions = []
+    print(f"{'statement':<50} {'median (s)':>12} {'baseline (s)':>14}")
+    for name, timing in timings.items():
+        reference = baseline.get(name)
+        print(f"{STATEMENTS[name]:<50} {timing:>12.3f} {reference if reference is not None else float('nan'):>14.3f}")
+        if reference is not None and timing > reference * (1 + args.tolerance):
+            regressions.append(name)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(timings, f, indent=2)
+    if regressions:
+        sys.exit(f"Import time regressed by more than {args.tolerance:.0%} for: {', '.join(regressions)}")
@@ -0,0 +1,65 @@
+# Copyright (c) 2023-2025, Songlin Yang, Yu Zhang
+
+import argparse
+import time
+
+import torch
+from transformers import AutoModelForCausalLM
+
+import fla  # noqa
+from fla.serving import Engine, SyntheticLoadGenerator, summarize
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Continuous batching benchmarking")
+    parser.add_argument("--path", type=str, default="fla-hub/gdn-1.3B-100B")
+    parser.add_argument("--num-requests", type=int, default=200)
+    parser.add_argument("--request-rate", type=float, default=float('inf'))
+    parser.add_argument("--min-prompt-len", type=int, default=32)
+    parser.add_argument("--max-prompt-len", type=int, default=2048)
+    parser.add_argument("--min-output-len", type=int, default=16)
+    parser.add_argument("--max-output-len", type=int, default=256)
+    parser.add_argument("--max-num-seqs", type=int, default=64)
+    parser.add_argument("--max-num-batched-tokens", type=int, default=4096)
+    parser.add_argument("--prefill-chunk-size", type=int, default=512)
+    args = parser.parse_args()
+
+    device = "cuda"
+    dtype = torch.bfloat16
+    torch.manual_seed(0)
+
+    print(f"Loading {args.path}")
+    model = AutoModelForCausalLM.from_pretrained(args.path, device_map={"": device}, torch_dtype=dtype)
+    engine = Engine(
+        model,
+        max_num_seqs=args.max_num_seqs,
+        max_num_batched_tokens=args.max_num_batched_tokens,
+        prefill_chunk_size=args.prefill_chunk_size,
+    )
+    generator = SyntheticLoadGenerator(
+        vocab_size=model.config.vocab_size,
+        num_requests=args.num_requests,
+        request_rate=args.request_rate,
+        prompt_len=(args.min_prompt_len, args.max_prompt_len),
+        output_len=(args.min_output_len, args.max_output_len),
+    )
+
+    # warmup
+    engine.generate([[0] * args.prefill_chunk_size] * 2, max_new_tokens=4)
+
+    torch.cuda.synchronize()
+    start = time.perf_counter()
+    thread = generator.start(engine.queue)
+    finished = []
+    while len(finished) < args.num_requests:
+        if engine.has_unfinished_requests():
+            finished.extend(engine.step())
+        else:
+            time.sleep(1e-4)
+    thread.join()
+    torch.cuda.synchronize()
+    elapsed = time.perf_counter() - start
+
+    print(f"Steps: {engine.num_steps}, mean tokens per step: {engine.num_batched_tokens / engine.num_steps:.1f}")
+    for key, value in summarize(finished, elapsed).items():
+        print(f"{key:>25}: {value:.4f}")
+    print(f"Max memory used: {torch.cuda.max_memory_allocated() / 1024**3:.2f} GiB")
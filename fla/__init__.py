@@ -1,83 +1,174 @@
 # Copyright (c) 2023-2025, Songlin Yang, Yu Zhang
 
-from fla.layers import (
-    ABCAttention,
-    Attention,
-    BasedLinearAttention,
-    BitAttention,
-    Comba,
-    DeltaFormerAttention,
-    DeltaNet,
-    GatedDeltaNet,
-    GatedDeltaProduct,
-    GatedLinearAttention,
-    GatedSlotAttention,
-    HGRN2Attention,
-    HGRNAttention,
-    LightNetAttention,
-    LinearAttention,
-    LogLinearMamba2,
-    MesaNet,
-    MomAttention,
-    MultiheadLatentAttention,
-    MultiScaleRetention,
-    NativeSparseAttention,
-    PaTHAttention,
-    ReBasedLinearAttention,
-    RodimusAttention,
-    RWKV6Attention,
-    RWKV7Attention,
-)
-from fla.models import (
-    ABCForCausalLM,
-    ABCModel,
-    BitNetForCausalLM,
-    BitNetModel,
-    CombaForCausalLM,
-    CombaModel,
-    DeltaFormerForCausalLM,
-    DeltaFormerModel,
-    DeltaNetForCausalLM,
-    DeltaNetModel,
-    GatedDeltaNetForCausalLM,
-    GatedDeltaNetModel,
-    GatedDeltaProductForCausalLM,
-    GatedDeltaProductModel,
-    GLAForCausalLM,
-    GLAModel,
-    GSAForCausalLM,
-    GSAModel,
-    HGRN2ForCausalLM,
-    HGRN2Model,
-    HGRNForCausalLM,
-    HGRNModel,
-    LightNetForCausalLM,
-    LightNetModel,
-    LinearAttentionForCausalLM,
-    LinearAttentionModel,
-    LogLinearMamba2ForCausalLM,
-    LogLinearMamba2Model,
-    MesaNetForCausalLM,
-    MesaNetModel,
-    MLAForCausalLM,
-    MLAModel,
-    MomForCausalLM,
-    MomModel,
-    NSAForCausalLM,
-    NSAModel,
-    PaTHAttentionForCausalLM,
-    PaTHAttentionModel,
-    RetNetForCausalLM,
-    RetNetModel,
-    RodimusForCausalLM,
-    RodimusModel,
-    RWKV6ForCausalLM,
-    RWKV6Model,
-    RWKV7ForCausalLM,
-    RWKV7Model,
-    TransformerForCausalLM,
-    TransformerModel,
-)
+from typing import TYPE_CHECKING
+
+# registers the FLA models to the `transformers` Auto classes, while the models themselves are imported on first use
+import fla.models  # noqa: F401
+from fla.lazy import lazy_import, seed_tuned_configs_on_import
+
+seed_tuned_configs_on_import()
+
+if TYPE_CHECKING:
+    from fla.layers import (
+        ABCAttention,
+        Attention,
+        BasedLinearAttention,
+        BitAttention,
+        Comba,
+        DeltaFormerAttention,
+        DeltaNet,
+        GatedDeltaNet,
+        GatedDeltaProduct,
+        GatedLinearAttention,
+        GatedSlotAttention,
+        HGRN2Attention,
+        HGRNAttention,
+        LightNetAttention,
+        LinearAttention,
+        LogLinearMamba2,
+        MesaNet,
+        MomAttention,
+        MultiheadLatentAttention,
+        MultiScaleRetention,
+        NativeSparseAttention,
+        PaTHAttention,
+        ReBasedLinearAttention,
+        RodimusAttention,
+        RWKV6Attention,
+        RWKV7Attention,
+    )
+    from fla.models import (
+        ABCForCausalLM,
+        ABCModel,
+        BitNetForCausalLM,
+        BitNetModel,
+        CombaForCausalLM,
+        CombaModel,
+        DeltaFormerForCausalLM,
+        DeltaFormerModel,
+        DeltaNetForCausalLM,
+        DeltaNetModel,
+        GatedDeltaNetForCausalLM,
+        GatedDeltaNetModel,
+        GatedDeltaProductForCausalLM,
+        GatedDeltaProductModel,
+        GLAForCausalLM,
+        GLAModel,
+        GSAForCausalLM,
+        GSAModel,
+        HGRN2ForCausalLM,
+        HGRN2Model,
+        HGRNForCausalLM,
+        HGRNModel,
+        LightNetForCausalLM,
+        LightNetModel,
+        LinearAttentionForCausalLM,
+        LinearAttentionModel,
+        LogLinearMamba2ForCausalLM,
+        LogLinearMamba2Model,
+        MesaNetForCausalLM,
+        MesaNetModel,
+        MLAForCausalLM,
+        MLAModel,
+        MomForCausalLM,
+        MomModel,
+        NSAForCausalLM,
+        NSAModel,
+        PaTHAttentionForCausalLM,
+        PaTHAttentionModel,
+        RetNetForCausalLM,
+        RetNetModel,
+        RodimusForCausalLM,
+        RodimusModel,
+        RWKV6ForCausalLM,
+        RWKV6Model,
+        RWKV7ForCausalLM,
+        RWKV7Model,
+        TransformerForCausalLM,
+        TransformerModel,
+    )
+else:
+    __getattr__, __dir__ = lazy_import(__name__, {
+        'fla.layers': [
+            'ABCAttention',
+            'Attention',
+            'BasedLinearAttention',
+            'BitAttention',
+            'Comba',
+            'DeltaFormerAttention',
+            'DeltaNet',
+            'GatedDeltaNet',
+            'GatedDeltaProduct',
+            'GatedLinearAttention',
+            'GatedSlotAttention',
+            'HGRN2Attention',
+            'HGRNAttention',
+            'LightNetAttention',
+            'LinearAttention',
+            'LogLinearMamba2',
+            'MesaNet',
+            'MomAttention',
+            'MultiheadLatentAttention',
+            'MultiScaleRetention',
+            'NativeSparseAttention',
+            'PaTHAttention',
+            'ReBasedLinearAttention',
+            'RodimusAttention',
+            'RWKV6Attention',
+            'RWKV7Attention',
+        ],
+        'fla.models': [
+            'ABCForCausalLM',
+            'ABCModel',
+            'BitNetForCausalLM',
+            'BitNetModel',
+            'CombaForCausalLM',
+            'CombaModel',
+            'DeltaFormerForCausalLM',
+            'DeltaFormerModel',
+            'DeltaNetForCausalLM',
+            'DeltaNetModel',
+            'GatedDeltaNetForCausalLM',
+            'GatedDeltaNetModel',
+            'GatedDeltaProductForCausalLM',
+            'GatedDeltaProductModel',
+            'GLAForCausalLM',
+            'GLAModel',
+            'GSAForCausalLM',
+            'GSAModel',
+            'HGRN2ForCausalLM',
+            'HGRN2Model',
+            'HGRNForCausalLM',
+            'HGRNModel',
+            'LightNetForCausalLM',
+            'LightNetModel',
+            'LinearAttentionForCausalLM',
+            'LinearAttentionModel',
+            'LogLinearMamba2ForCausalLM',
+            'LogLinearMamba2Model',
+            'MesaNetForCausalLM',
+            'MesaNetModel',
+            'MLAForCausalLM',
+            'MLAModel',
+            'MomForCausalLM',
+            'MomModel',
+            'NSAForCausalLM',
+            'NSAModel',
+            'PaTHAttentionForCausalLM',
+            'PaTHAttentionModel',
+            'RetNetForCausalLM',
+            'RetNetModel',
+            'RodimusForCausalLM',
+            'RodimusModel',
+            'RWKV6ForCausalLM',
+            'RWKV6Model',
+            'RWKV7ForCausalLM',
+            'RWKV7Model',
+            'TransformerForCausalLM',
+            'TransformerModel',
+        ],
+    })
+
 
 __all__ = [
     "ABCAttention",
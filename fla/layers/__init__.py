@@ -1,35 +1,74 @@
 # Copyright (c) 2023-2025, Songlin Yang, Yu Zhang
 
-from .abc import ABCAttention
-from .attn import Attention
-from .based import BasedLinearAttention
-from .bitattn import BitAttention
-from .comba import Comba
-from .delta_net import DeltaNet
-from .deltaformer import DeltaFormerAttention
-from .forgetting_attn import ForgettingAttention
-from .gated_deltanet import GatedDeltaNet
-from .gated_deltaproduct import GatedDeltaProduct
-from .gla import GatedLinearAttention
-from .gsa import GatedSlotAttention
-from .hgrn import HGRNAttention
-from .hgrn2 import HGRN2Attention
-from .kda import KimiDeltaAttention
-from .lightnet import LightNetAttention
-from .linear_attn import LinearAttention
-from .log_linear_mamba2 import LogLinearMamba2
-from .mamba import Mamba
-from .mamba2 import Mamba2
-from .mesa_net import MesaNet
-from .mla import MultiheadLatentAttention
-from .mom import MomAttention
-from .multiscale_retention import MultiScaleRetention
-from .nsa import NativeSparseAttention
-from .path_attn import PaTHAttention
-from .rebased import ReBasedLinearAttention
-from .rodimus import RodimusAttention, SlidingWindowSharedKeyAttention
-from .rwkv6 import RWKV6Attention
-from .rwkv7 import RWKV7Attention
+from typing import TYPE_CHECKING
+
+from fla.lazy import lazy_import
+
+if TYPE_CHECKING:
+    from .abc import ABCAttention
+    from .attn import Attention
+    from .based import BasedLinearAttention
+    from .bitattn import BitAttention
+    from .comba import Comba
+    from .delta_net import DeltaNet
+    from .deltaformer import DeltaFormerAttention
+    from .forgetting_attn import ForgettingAttention
+    from .gated_deltanet import GatedDeltaNet
+    from .gated_deltaproduct import GatedDeltaProduct
+    from .gla import GatedLinearAttention
+    from .gsa import GatedSlotAttention
+    from .hgrn import HGRNAttention
+    from .hgrn2 import HGRN2Attention
+    from .kda import KimiDeltaAttention
+    from .lightnet import LightNetAttention
+    from .linear_attn import LinearAttention
+    from .log_linear_mamba2 import LogLinearMamba2
+    from .mamba import Mamba
+    from .mamba2 import Mamba2
+    from .mesa_net import MesaNet
+    from .mla import MultiheadLatentAttention
+    from .mom import MomAttention
+    from .multiscale_retention import MultiScaleRetention
+    from .nsa import NativeSparseAttention
+    from .path_attn import PaTHAttention
+    from .rebased import ReBasedLinearAttention
+    from .rodimus import RodimusAttention, SlidingWindowSharedKeyAttention
+    from .rwkv6 import RWKV6Attention
+    from .rwkv7 import RWKV7Attention
+else:
+    __getattr__, __dir__ = lazy_import(__name__, {
+        '.abc': ['ABCAttention'],
+        '.attn': ['Attention'],
+        '.based': ['BasedLinearAttention'],
+        '.bitattn': ['BitAttention'],
+        '.comba': ['Comba'],
+        '.delta_net': ['DeltaNet'],
+        '.deltaformer': ['DeltaFormerAttention'],
+        '.forgetting_attn': ['ForgettingAttention'],
+        '.gated_deltanet': ['GatedDeltaNet'],
+        '.gated_deltaproduct': ['GatedDeltaProduct'],
+        '.gla': ['GatedLinearAttention'],
+        '.gsa': ['GatedSlotAttention'],
+        '.hgrn': ['HGRNAttention'],
+        '.hgrn2': ['HGRN2Attention'],
+        '.kda': ['KimiDeltaAttention'],
+        '.lightnet': ['LightNetAttention'],
+        '.linear_attn': ['LinearAttention'],
+        '.log_linear_mamba2': ['LogLinearMamba2'],
+        '.mamba': ['Mamba'],
+        '.mamba2': ['Mamba2'],
+        '.mesa_net': ['MesaNet'],
+        '.mla': ['MultiheadLatentAttention'],
+        '.mom': ['MomAttention'],
+        '.multiscale_retention': ['MultiScaleRetention'],
+        '.nsa': ['NativeSparseAttention'],
+        '.path_attn': ['PaTHAttention'],
+        '.rebased': ['ReBasedLinearAttention'],
+        '.rodimus': ['RodimusAttention', 'SlidingWindowSharedKeyAttention'],
+        '.rwkv6': ['RWKV6Attention'],
+        '.rwkv7': ['RWKV7Attention'],
+    })
+
 
 __all__ = [
     'ABCAttention',
@@ -9,6 +9,7 @@ import torch
 import torch.nn as nn
 from einops import rearrange
 
+from fla.layers.utils import get_conv_state_shapes
 from fla.modules import FusedRMSNormGated, RMSNorm, RotaryEmbedding, ShortConvolution
 from fla.modules.activations import swiglu, swish
 from fla.ops.abc.chunk import chunk_abc
@@ -130,6 +131,17 @@ class ABCAttention(nn.Module):
         if self.use_rope:
             self.rotary = RotaryEmbedding(self.head_k_dim)
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """Returns the shapes of the states cached for `batch_size` sequences of `seq_len` tokens."""
+        # the key and value memories of `num_slots` slots
+        return {
+            'recurrent_state': [
+                (batch_size, self.num_heads, self.head_k_dim, self.num_slots),
+                (batch_size, self.num_heads, self.num_slots, self.head_v_dim),
+            ],
+            'conv_state': get_conv_state_shapes(self, batch_size),
+        }
+
     def forward(
         self,
         hidden_states: torch.Tensor,
@@ -76,6 +76,11 @@ class Attention(nn.Module):
 
         self.rotary = RotaryEmbedding(dim=self.head_dim, base=self.rope_theta)
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """Returns the shapes of the states cached for `batch_size` sequences of `seq_len` tokens."""
+        L = min(seq_len, self.window_size or seq_len)
+        return {'attn_state': [(batch_size, L, self.num_kv_heads * self.head_dim)] * 2}
+
     def forward(
         self,
         hidden_states: torch.Tensor,
@@ -118,13 +123,16 @@ class Attention(nn.Module):
             max_seqlen = max(max_seqlen, self.max_position_embeddings)
         q, k = self.rotary(q, k, seqlen_offset=seqlen_offset, max_seqlen=max_seqlen, cu_seqlens=cu_seqlens)
 
+        # when decoding with a sliding window, attend to the keys in the slot order of the ring buffer of the cache,
+        # which is fine as softmax attention is invariant to the key order and the positions are encoded already
+        ring_buffer = self.window_size is not None and q_len == 1
         if past_key_values is not None:
             cache_has_content = past_key_values.get_seq_length(self.layer_idx) > 0
             k_cached, v_cached = past_key_values.update(
                 attn_state=(k.flatten(-2, -1), v.flatten(-2, -1)),
                 layer_idx=self.layer_idx,
                 offset=q_len,
-                cache_kwargs=dict(window_size=self.window_size),
+                cache_kwargs=dict(window_size=self.window_size, ring_buffer=ring_buffer),
             )['attn_state']
             if cache_has_content:
                 k, v = k_cached, v_cached
@@ -135,7 +143,14 @@ class Attention(nn.Module):
         if attention_mask is not None:
             if q.shape[1] == 1 and self.window_size is not None:
                 attention_mask = attention_mask[:, -self.window_size:]
-            q, (k, v), indices_q, cu_seqlens, max_seq_lens = unpad_input(q, (k, v), attention_mask, q_len)
+                if ring_buffer and past_key_values is not None:
+                    # the mask of the token at position `p` goes to slot `p % window_size`
+                    window_offset = past_key_values.get_window_offset(self.layer_idx)
+                    if window_offset != 0:
+                        attention_mask = attention_mask.roll(window_offset, dims=1)
+            q, (k, v), indices_q, cu_seqlens, max_seq_lens = unpad_input(
+                q, (k, v), attention_mask, q_len, varlen_plan=kwargs.get('varlen_plan'),
+            )
             cu_seqlens_q, cu_seqlens_k = cu_seqlens
             max_seqlen_q, max_seqlen_k = max_seq_lens
             o = flash_attn_varlen_func(
@@ -47,6 +47,10 @@ class BasedLinearAttention(nn.Module):
         self.feature_map = TaylorFeatureMap(feature_dim)
         self.eps = eps
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """The layer caches no states across calls."""
+        return {}
+
     def forward(self, hidden_states: torch.Tensor, **kwargs):
         mode = self.mode
         q, k, v = self.q_proj(hidden_states), self.k_proj(hidden_states), self.v_proj(hidden_states)
@@ -67,6 +67,11 @@ class BitAttention(nn.Module):
 
         self.rotary = RotaryEmbedding(dim=self.head_dim, base=self.rope_theta)
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """Returns the shapes of the states cached for `batch_size` sequences of `seq_len` tokens."""
+        L = min(seq_len, self.window_size or seq_len)
+        return {'attn_state': [(batch_size, L, self.num_kv_heads * self.head_dim)] * 2}
+
     def forward(
         self,
         hidden_states: torch.Tensor,
@@ -124,7 +129,9 @@ class BitAttention(nn.Module):
 
         # Contains at least one padding token in the sequence
         if attention_mask is not None:
-            q, (k, v), indices_q, cu_seqlens, max_seq_lens = unpad_input(q, (k, v), attention_mask, q_len)
+            q, (k, v), indices_q, cu_seqlens, max_seq_lens = unpad_input(
+                q, (k, v), attention_mask, q_len, varlen_plan=kwargs.get('varlen_plan'),
+            )
             cu_seqlens_q, cu_seqlens_k = cu_seqlens
             max_seqlen_q, max_seqlen_k = max_seq_lens
             o = flash_attn_varlen_func(
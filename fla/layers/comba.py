@@ -11,9 +11,16 @@ import torch.nn as nn
 from einops import rearrange, repeat
 from torch.nn import functional as F
 
-from fla.layers.utils import get_unpad_data, index_first_axis, pad_input
+from fla.layers.utils import (
+    fuse_qkv_load_state_dict_pre_hook,
+    get_conv_state_shapes,
+    get_unpad_data,
+    index_first_axis,
+    pad_input,
+)
 from fla.modules import FusedRMSNormGated, RMSNorm, ShortConvolution
 from fla.ops.comba import chunk_comba, fused_recurrent_comba
+from fla.ops.utils import select_mode
 
 if TYPE_CHECKING:
     from transformers.processing_utils import Unpack
@@ -68,6 +75,10 @@ class Comba(nn.Module):
             The kernel size of the short convolution, only used when `use_short_conv` is `True`. Default: 4.
         conv_bias (bool, Optional):
             Whether to use bias in the short convolution, only used when `use_short_conv` is `True`. Default: `False`.
+        fuse_qkv (bool, Optional):
+            Whether to pack the q/k/v projections and short convolutions into a single `qkv_proj` and `qkv_conv1d`,
+            running one GEMM and one conv kernel with a single conv cache instead of three.
+            Checkpoints of either layout can be loaded. Default: `False`.
         layer_idx (int, Optional):
             The index of the layer. Default: None.
         norm_eps (float, Optional):
@@ -89,6 +100,7 @@ class Comba(nn.Module):
         correction_factor: float = 1.,
         conv_size: int = 4,
         conv_bias: bool = False,
+        fuse_qkv: bool = False,
         layer_idx: int = None,
         norm_eps: float = 1e-5,
         **kwargs,
@@ -106,6 +118,7 @@ class Comba(nn.Module):
         self.use_inner_decay = use_inner_decay
         self.conv_size = conv_size
         self.conv_bias = conv_bias
+        self.fuse_qkv = fuse_qkv
 
         self.head_dim = head_dim
         self.num_heads = num_heads
@@ -115,6 +128,7 @@ class Comba(nn.Module):
         self.head_v_dim = int(self.head_dim * self.expand_v)
         self.key_dim = int(self.num_heads * self.head_k_dim)
         self.value_dim = int(self.num_v_heads * self.head_v_dim)
+        self.qkv_sizes = (self.key_dim, self.key_dim, self.value_dim)
         self.layer_idx = layer_idx
 
         # Consistency check: Ensure expand_v produces integer values
@@ -135,9 +149,13 @@ class Comba(nn.Module):
             )
         assert mode in ['chunk', 'fused_recurrent'], f"Not supported mode `{mode}`."
 
-        self.q_proj = nn.Linear(hidden_size, self.key_dim, bias=False)
-        self.k_proj = nn.Linear(hidden_size, self.key_dim, bias=False)
-        self.v_proj = nn.Linear(hidden_size, self.value_dim, bias=False)
+        if fuse_qkv:
+            self.qkv_proj = nn.Linear(hidden_size, sum(self.qkv_sizes), bias=False)
+        else:
+            self.q_proj = nn.Linear(hidden_size, self.key_dim, bias=False)
+            self.k_proj = nn.Linear(hidden_size, self.key_dim, bias=False)
+            self.v_proj = nn.Linear(hidden_size, self.value_dim, bias=False)
+        self._register_load_state_dict_pre_hook(fuse_qkv_load_state_dict_pre_hook, with_module=True)
         self.a_proj = nn.Linear(hidden_size, self.num_v_heads, bias=False)
         self.b_proj = nn.Linear(hidden_size, self.num_v_heads, bias=False)
 
@@ -172,7 +190,14 @@ class Comba(nn.Module):
         # name.endswith("bias") in param_grouping.py
         self.dt_bias._no_weight_decay = True
 
-        if use_short_conv:
+        if use_short_conv and fuse_qkv:
+            self.qkv_conv1d = ShortConvolution(
+                hidden_size=sum(self.qkv_sizes),
+                kernel_size=conv_size,
+                bias=conv_bias,
+                activation='silu',
+            )
+        elif use_short_conv:
             self.conv_size = conv_size
             self.q_conv1d = ShortConvolution(
                 hidden_size=self.key_dim,
@@ -204,6 +229,13 @@ class Comba(nn.Module):
             self.o_norm = RMSNorm(self.head_v_dim, eps=norm_eps, dtype=torch.float32)
         self.o_proj = nn.Linear(self.value_dim, hidden_size, bias=False)
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """Returns the shapes of the states cached for `batch_size` sequences of `seq_len` tokens."""
+        return {
+            'recurrent_state': [(batch_size, self.num_v_heads, self.head_k_dim, self.head_v_dim)],
+            'conv_state': get_conv_state_shapes(self, batch_size),
+        }
+
     def forward(
         self,
         hidden_states: torch.Tensor,
@@ -222,7 +254,17 @@ class Comba(nn.Module):
 
         batch_size, q_len, _ = hidden_states.shape
         # change to inference mode.
-        mode = 'fused_recurrent' if (q_len <= 64 and not self.training) else self.mode
+        mode = select_mode(
+            'comba',
+            self.mode,
+            seq_len=q_len,
+            batch_size=batch_size,
+            num_heads=self.num_v_heads,
+            head_k_dim=self.head_k_dim,
+            head_v_dim=self.head_v_dim,
+            cu_seqlens=kwargs.get('cu_seqlens'),
+            training=self.training,
+        )
         if self.training:
             assert mode == 'chunk', "Only chunk mode is supported in training."
         last_state = None
@@ -231,10 +273,25 @@ class Comba(nn.Module):
 
         cu_seqlens = kwargs.get('cu_seqlens')
         if attention_mask is not None:
-            indices, cu_seqlens, _ = get_unpad_data(attention_mask[:, -q_len:])
+            indices, cu_seqlens, _ = get_unpad_data(attention_mask[:, -q_len:], varlen_plan=kwargs.get('varlen_plan'))
             hidden_states = index_first_axis(rearrange(hidden_states, "b s ... -> (b s) ..."), indices).unsqueeze(0)
 
-        if self.use_short_conv:
+        conv_state = None
+        if self.fuse_qkv:
+            qkv = self.qkv_proj(hidden_states)
+            if self.use_short_conv:
+                conv_state = last_state['conv_state'][0] if last_state is not None else None
+                qkv, conv_state = self.qkv_conv1d(
+                    x=qkv,
+                    cache=conv_state,
+                    output_final_state=use_cache,
+                    cu_seqlens=cu_seqlens,
+                )
+                conv_state = (conv_state,)
+            else:
+                qkv = F.silu(qkv)
+            q, k, v = qkv.split(self.qkv_sizes, -1)
+        elif self.use_short_conv:
             conv_state_q, conv_state_k, conv_state_v = None, None, None
             if last_state is not None:
                 conv_state_q, conv_state_k, conv_state_v = last_state['conv_state']
@@ -256,6 +313,7 @@ class Comba(nn.Module):
                 output_final_state=use_cache,
                 cu_seqlens=cu_seqlens,
             )
+            conv_state = (conv_state_q, conv_state_k, conv_state_v)
         else:
             q = F.silu(self.q_proj(hidden_states))
             k = F.silu(self.k_proj(hidden_states))
@@ -312,7 +370,7 @@ class Comba(nn.Module):
         if past_key_values is not None:
             past_key_values.update(
                 recurrent_state=recurrent_state,
-                conv_state=(conv_state_q, conv_state_k, conv_state_v) if self.use_short_conv else None,
+                conv_state=conv_state,
                 layer_idx=self.layer_idx,
                 offset=q_len,
             )
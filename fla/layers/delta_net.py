@@ -10,9 +10,16 @@ import torch.nn as nn
 from einops import rearrange
 from torch.nn import functional as F
 
-from fla.layers.utils import get_unpad_data, index_first_axis, pad_input
+from fla.layers.utils import (
+    fuse_qkv_load_state_dict_pre_hook,
+    get_conv_state_shapes,
+    get_unpad_data,
+    index_first_axis,
+    pad_input,
+)
 from fla.modules import FusedRMSNormGated, RMSNorm, ShortConvolution
 from fla.ops.delta_rule import chunk_delta_rule, fused_recurrent_delta_rule
+from fla.ops.utils import select_mode
 
 if TYPE_CHECKING:
     from transformers.processing_utils import Unpack
@@ -56,6 +63,10 @@ class DeltaNet(nn.Module):
             The kernel size of the short convolution, only used when `use_short_conv` is `True`. Default: 4.
         conv_bias (bool, Optional):
             Whether to use bias in the short convolution, only used when `use_short_conv` is `True`. Default: `False`.
+        fuse_qkv (bool, Optional):
+            Whether to pack the q/k/v projections and short convolutions into a single `qkv_proj` and `qkv_conv1d`,
+            running one GEMM and one conv kernel with a single conv cache instead of three.
+            Checkpoints of either layout can be loaded. Default: `False`.
         allow_neg_eigval (bool, Optional):
             Allow negative eigenvalues. Default: `False`. If set to `True`, the beta will be multiplied by 2.
             See reference: [Unlocking State-Tracking in Linear RNNs Through Negative Eigenvalues](https://arxiv.org/abs/2411.12537)
@@ -82,6 +93,7 @@ class DeltaNet(nn.Module):
         use_short_conv: bool = True,
         conv_size: int = 4,
         conv_bias: bool = False,
+        fuse_qkv: bool = False,
         allow_neg_eigval: bool = False,
         layer_idx: int = None,
         qk_activation: str = 'silu',
@@ -108,12 +120,14 @@ class DeltaNet(nn.Module):
         self.use_short_conv = use_short_conv
         self.conv_size = conv_size
         self.conv_bias = conv_bias
+        self.fuse_qkv = fuse_qkv
         self.allow_neg_eigval = allow_neg_eigval
 
         self.key_dim = int(hidden_size * expand_k)
         self.value_dim = int(hidden_size * expand_v)
         self.head_k_dim = self.key_dim // num_heads
         self.head_v_dim = self.value_dim // num_heads
+        self.qkv_sizes = (self.key_dim, self.key_dim, self.value_dim)
         self.layer_idx = layer_idx
 
         if mode == 'fused_chunk':
@@ -122,14 +136,26 @@ class DeltaNet(nn.Module):
         assert self.key_dim % num_heads == 0, f"key dim must be divisible by num_heads of {num_heads}"
         assert self.value_dim % num_heads == 0, f"value dim must be divisible by num_heads of {num_heads}"
 
-        self.q_proj = nn.Linear(hidden_size, self.key_dim, bias=False)
-        self.k_proj = nn.Linear(hidden_size, self.key_dim, bias=False)
-        self.v_proj = nn.Linear(hidden_size, self.value_dim, bias=False)
+        if fuse_qkv:
+            self.qkv_proj = nn.Linear(hidden_size, sum(self.qkv_sizes), bias=False)
+        else:
+            self.q_proj = nn.Linear(hidden_size, self.key_dim, bias=False)
+            self.k_proj = nn.Linear(hidden_size, self.key_dim, bias=False)
+            self.v_proj = nn.Linear(hidden_size, self.value_dim, bias=False)
+        self._register_load_state_dict_pre_hook(fuse_qkv_load_state_dict_pre_hook, with_module=True)
 
         self.use_beta = use_beta
         if self.use_beta:
             self.b_proj = nn.Linear(hidden_size, self.num_heads, bias=False)
-        if use_short_conv:
+        if use_short_conv and fuse_qkv:
+            # the values are always activated by SiLU, which is applied outside the conv for other `qk_activation`s
+            self.qkv_conv1d = ShortConvolution(
+                hidden_size=sum(self.qkv_sizes),
+                kernel_size=conv_size,
+                bias=conv_bias,
+                activation='silu' if qk_activation == 'silu' else None,
+            )
+        elif use_short_conv:
             self.conv_size = conv_size
             self.q_conv1d = ShortConvolution(
                 hidden_size=self.key_dim,
@@ -162,6 +188,13 @@ class DeltaNet(nn.Module):
 
         self.o_proj = nn.Linear(self.value_dim, hidden_size, bias=False)
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """Returns the shapes of the states cached for `batch_size` sequences of `seq_len` tokens."""
+        return {
+            'recurrent_state': [(batch_size, self.num_heads, self.head_k_dim, self.head_v_dim)],
+            'conv_state': get_conv_state_shapes(self, batch_size),
+        }
+
     def forward(
         self,
         hidden_states: torch.Tensor,
@@ -180,7 +213,17 @@ class DeltaNet(nn.Module):
 
         batch_size, q_len, _ = hidden_states.shape
         # change to inference mode.
-        mode = 'fused_recurrent' if q_len <= 64 else self.mode
+        mode = select_mode(
+            'delta_rule',
+            self.mode,
+            seq_len=q_len,
+            batch_size=batch_size,
+            num_heads=self.num_heads,
+            head_k_dim=self.head_k_dim,
+            head_v_dim=self.head_v_dim,
+            cu_seqlens=kwargs.get('cu_seqlens'),
+            training=self.training,
+        )
 
         last_state = None
         if past_key_values is not None and len(past_key_values) > self.layer_idx:
@@ -188,10 +231,27 @@ class DeltaNet(nn.Module):
 
         cu_seqlens = kwargs.get('cu_seqlens')
         if attention_mask is not None:
-            indices, cu_seqlens, _ = get_unpad_data(attention_mask[:, -q_len:])
+            indices, cu_seqlens, _ = get_unpad_data(attention_mask[:, -q_len:], varlen_plan=kwargs.get('varlen_plan'))
             hidden_states = index_first_axis(rearrange(hidden_states, "b s ... -> (b s) ..."), indices).unsqueeze(0)
 
-        if self.use_short_conv:
+        conv_state = None
+        if self.fuse_qkv:
+            qkv = self.qkv_proj(hidden_states)
+            if self.use_short_conv:
+                conv_state = last_state['conv_state'][0] if last_state is not None else None
+                qkv, conv_state = self.qkv_conv1d(
+                    x=qkv,
+                    cache=conv_state,
+                    output_final_state=use_cache,
+                    cu_seqlens=cu_seqlens,
+                )
+                conv_state = (conv_state,)
+            q, k, v = qkv.split(self.qkv_sizes, -1)
+            if not self.use_short_conv and self.qk_activation == 'silu':
+                q, k = F.silu(q), F.silu(k)
+            if not self.use_short_conv or self.qk_activation != 'silu':
+                v = F.silu(v)
+        elif self.use_short_conv:
             conv_state_q, conv_state_k, conv_state_v = None, None, None
             if last_state is not None:
                 conv_state_q, conv_state_k, conv_state_v = last_state['conv_state']
@@ -213,6 +273,7 @@ class DeltaNet(nn.Module):
                 output_final_state=use_cache,
                 cu_seqlens=cu_seqlens,
             )
+            conv_state = (conv_state_q, conv_state_k, conv_state_v)
         else:
             q = self.q_proj(hidden_states)
             k = self.k_proj(hidden_states)
@@ -271,7 +332,7 @@ class DeltaNet(nn.Module):
         if past_key_values is not None:
             past_key_values.update(
                 recurrent_state=recurrent_state,
-                conv_state=(conv_state_q, conv_state_k, conv_state_v) if self.use_short_conv else None,
+                conv_state=conv_state,
                 layer_idx=self.layer_idx,
                 offset=q_len,
             )
@@ -92,6 +92,10 @@ class DeltaFormerAttention(nn.Module):
 
         self.rotary = RotaryEmbedding(dim=self.head_dim, base=self.rope_theta)
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """The layer caches no states across calls."""
+        return {}
+
     def forward(
         self,
         hidden_states: torch.Tensor,
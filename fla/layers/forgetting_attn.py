@@ -74,6 +74,12 @@ class ForgettingAttention(nn.Module):
                 is_rms_norm=True,
             )
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """Returns the shapes of the states cached for `batch_size` sequences of `seq_len` tokens."""
+        # the forget gates of each head are cached along with the keys and values
+        L = min(seq_len, self.window_size or seq_len)
+        return {'attn_state': [(batch_size, L, self.kv_dim)] * 2 + [(batch_size, L, self.num_heads)]}
+
     def forward(
         self,
         hidden_states: torch.Tensor,
@@ -113,7 +119,9 @@ class ForgettingAttention(nn.Module):
         v = rearrange(v, '... (h d) -> ... h d', d=self.head_dim)
 
         if attention_mask is not None:
-            q, (k, v, f), indices_q, cu_seqlens, max_seq_lens = unpad_input(q, (k, v, f), attention_mask, q_len, keepdim=True)
+            q, (k, v, f), indices_q, cu_seqlens, max_seq_lens = unpad_input(
+                q, (k, v, f), attention_mask, q_len, keepdim=True, varlen_plan=kwargs.get('varlen_plan'),
+            )
             _, cu_seqlens_k = cu_seqlens
             cu_seqlens = cu_seqlens_k
             max_seqlen_q, max_seqlen_k = max_seq_lens
@@ -8,12 +8,19 @@ from typing import TYPE_CHECKING
 
 import torch
 import torch.nn as nn
-from einops import rearrange, repeat
+from einops import rearrange
 from torch.nn import functional as F
 
-from fla.layers.utils import get_unpad_data, index_first_axis, pad_input
+from fla.layers.utils import (
+    fuse_qkv_load_state_dict_pre_hook,
+    get_conv_state_shapes,
+    get_unpad_data,
+    index_first_axis,
+    pad_input,
+)
 from fla.modules import FusedRMSNormGated, RMSNorm, ShortConvolution
-from fla.ops.gated_delta_rule import chunk_gated_delta_rule, fused_recurrent_gated_delta_rule
+from fla.ops.gated_delta_rule import chunk_gated_delta_rule, fused_gated_delta_rule_step, fused_recurrent_gated_delta_rule
+from fla.ops.utils import select_mode
 
 if TYPE_CHECKING:
     from transformers.processing_utils import Unpack
@@ -79,6 +86,10 @@ class GatedDeltaNet(nn.Module):
             The kernel size of the short convolution, only used when `use_short_conv` is `True`. Default: 4.
         conv_bias (bool, Optional):
             Whether to use bias in the short convolution, only used when `use_short_conv` is `True`. Default: `False`.
+        fuse_qkv (bool, Optional):
+            Whether to pack the q/k/v projections and short convolutions into a single `qkv_proj` and `qkv_conv1d`,
+            running one GEMM and one conv kernel with a single conv cache instead of three.
+            Checkpoints of either layout can be loaded. Default: `False`.
         layer_idx (int, Optional):
             The index of the layer. Default: None.
         norm_eps (float, Optional):
@@ -98,6 +109,7 @@ class GatedDeltaNet(nn.Module):
         allow_neg_eigval: bool = False,
         conv_size: int = 4,
         conv_bias: bool = False,
+        fuse_qkv: bool = False,
         layer_idx: int = None,
         norm_eps: float = 1e-5,
         **kwargs,
@@ -113,6 +125,7 @@ class GatedDeltaNet(nn.Module):
         self.use_short_conv = use_short_conv
         self.conv_size = conv_size
         self.conv_bias = conv_bias
+        self.fuse_qkv = fuse_qkv
 
         self.head_dim = head_dim
         self.num_heads = num_heads
@@ -122,6 +135,7 @@ class GatedDeltaNet(nn.Module):
         self.head_v_dim = int(self.head_dim * self.expand_v)
         self.key_dim = int(self.num_heads * self.head_k_dim)
         self.value_dim = int(self.num_v_heads * self.head_v_dim)
+        self.qkv_sizes = (self.key_dim, self.key_dim, self.value_dim)
         self.layer_idx = layer_idx
 
         # Consistency check: Ensure expand_v produces integer values
@@ -142,9 +156,13 @@ class GatedDeltaNet(nn.Module):
             )
         assert mode in ['chunk', 'fused_recurrent'], f"Not supported mode `{mode}`."
 
-        self.q_proj = nn.Linear(hidden_size, self.key_dim, bias=False)
-        self.k_proj = nn.Linear(hidden_size, self.key_dim, bias=False)
-        self.v_proj = nn.Linear(hidden_size, self.value_dim, bias=False)
+        if fuse_qkv:
+            self.qkv_proj = nn.Linear(hidden_size, sum(self.qkv_sizes), bias=False)
+        else:
+            self.q_proj = nn.Linear(hidden_size, self.key_dim, bias=False)
+            self.k_proj = nn.Linear(hidden_size, self.key_dim, bias=False)
+            self.v_proj = nn.Linear(hidden_size, self.value_dim, bias=False)
+        self._register_load_state_dict_pre_hook(fuse_qkv_load_state_dict_pre_hook, with_module=True)
         self.a_proj = nn.Linear(hidden_size, self.num_v_heads, bias=False)
         self.b_proj = nn.Linear(hidden_size, self.num_v_heads, bias=False)
 
@@ -167,7 +185,14 @@ class GatedDeltaNet(nn.Module):
         # name.endswith("bias") in param_grouping.py
         self.dt_bias._no_weight_decay = True
 
-        if use_short_conv:
+        if use_short_conv and fuse_qkv:
+            self.qkv_conv1d = ShortConvolution(
+                hidden_size=sum(self.qkv_sizes),
+                kernel_size=conv_size,
+                bias=conv_bias,
+                activation='silu',
+            )
+        elif use_short_conv:
             self.conv_size = conv_size
             self.q_conv1d = ShortConvolution(
                 hidden_size=self.key_dim,
@@ -199,6 +224,13 @@ class GatedDeltaNet(nn.Module):
             self.o_norm = RMSNorm(self.head_v_dim, eps=norm_eps, dtype=torch.float32)
         self.o_proj = nn.Linear(self.value_dim, hidden_size, bias=False)
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """Returns the shapes of the states cached for `batch_size` sequences of `seq_len` tokens."""
+        return {
+            'recurrent_state': [(batch_size, self.num_v_heads, self.head_k_dim, self.head_v_dim)],
+            'conv_state': get_conv_state_shapes(self, batch_size),
+        }
+
     def forward(
         self,
         hidden_states: torch.Tensor,
@@ -217,7 +249,18 @@ class GatedDeltaNet(nn.Module):
 
         batch_size, q_len, _ = hidden_states.shape
         # change to inference mode.
-        mode = 'fused_recurrent' if (q_len <= 64 and not self.training) else self.mode
+        mode = select_mode(
+            'gated_delta_rule',
+            self.mode,
+            seq_len=q_len,
+            batch_size=batch_size,
+            num_heads=self.num_v_heads,
+            head_k_dim=self.head_k_dim,
+            head_v_dim=self.head_v_dim,
+            cu_seqlens=kwargs.get('cu_seqlens'),
+            training=self.training,
+            history_size=getattr(past_key_values, 'history_size', 0),
+        )
         if self.training:
             assert mode == 'chunk', "Only chunk mode is supported in training."
 
@@ -226,32 +269,70 @@ class GatedDeltaNet(nn.Module):
             last_state = past_key_values[self.layer_idx]
 
         cu_seqlens = kwargs.get('cu_seqlens')
+        # decode the new tokens, which are never paddings, with the single-kernel fast path
+        if (
+            q_len == 1 and use_cache and not self.training and cu_seqlens is None
+            and last_state is not None and last_state['recurrent_state'] is not None
+            and getattr(past_key_values, 'history_size', 0) == 0
+        ):
+            return self.step(hidden_states, past_key_values)
+
         if attention_mask is not None:
-            indices, cu_seqlens, _ = get_unpad_data(attention_mask[:, -q_len:])
+            indices, cu_seqlens, _ = get_unpad_data(attention_mask[:, -q_len:], varlen_plan=kwargs.get('varlen_plan'))
             hidden_states = index_first_axis(rearrange(hidden_states, "b s ... -> (b s) ..."), indices).unsqueeze(0)
 
-        if self.use_short_conv:
+        # keep the states after each token for rolling back rejected draft tokens in speculative decoding
+        output_history = (
+            mode == 'fused_recurrent' and cu_seqlens is None and getattr(past_key_values, 'history_size', 0) > 0
+        )
+        recurrent_history, conv_history = None, None
+        conv_state = None
+        if self.fuse_qkv:
+            qkv = self.qkv_proj(hidden_states)
+            if self.use_short_conv:
+                conv_state = last_state['conv_state'][0] if last_state is not None else None
+                if output_history:
+                    conv_history = (self.qkv_conv1d.window(qkv, conv_state),)
+                qkv, conv_state = self.qkv_conv1d(
+                    x=qkv,
+                    cache=conv_state,
+                    output_final_state=use_cache,
+                    cu_seqlens=cu_seqlens,
+                )
+                conv_state = (conv_state,)
+            else:
+                qkv = F.silu(qkv)
+            q, k, v = qkv.split(self.qkv_sizes, -1)
+        elif self.use_short_conv:
             conv_state_q, conv_state_k, conv_state_v = None, None, None
             if last_state is not None:
                 conv_state_q, conv_state_k, conv_state_v = last_state['conv_state']
+            q, k, v = self.q_proj(hidden_states), self.k_proj(hidden_states), self.v_proj(hidden_states)
+            if output_history:
+                conv_history = (
+                    self.q_conv1d.window(q, conv_state_q),
+                    self.k_conv1d.window(k, conv_state_k),
+                    self.v_conv1d.window(v, conv_state_v),
+                )
             q, conv_state_q = self.q_conv1d(
-                x=self.q_proj(hidden_states),
+                x=q,
                 cache=conv_state_q,
                 output_final_state=use_cache,
                 cu_seqlens=cu_seqlens,
             )
             k, conv_state_k = self.k_conv1d(
-                x=self.k_proj(hidden_states),
+                x=k,
                 cache=conv_state_k,
                 output_final_state=use_cache,
                 cu_seqlens=cu_seqlens,
             )
             v, conv_state_v = self.v_conv1d(
-                x=self.v_proj(hidden_states),
+                x=v,
                 cache=conv_state_v,
                 output_final_state=use_cache,
                 cu_seqlens=cu_seqlens,
             )
+            conv_state = (conv_state_q, conv_state_k, conv_state_v)
         else:
             q = F.silu(self.q_proj(hidden_states))
             k = F.silu(self.k_proj(hidden_states))
@@ -259,9 +340,7 @@ class GatedDeltaNet(nn.Module):
 
         q, k = map(lambda x: rearrange(x, '... (h d) -> ... h d', d=self.head_k_dim), (q, k))
         v = rearrange(v, '... (h d) -> ... h d', d=self.head_v_dim)
-
-        if self.num_v_heads > self.num_heads:
-            q, k = map(lambda x: repeat(x, '... h d -> ... (h g) d', g=self.num_v_heads // self.num_heads), (q, k))
+        # GVA is handled inside the kernels, with each query/key head shared by `num_v_heads // num_heads` value heads
 
         beta = self.b_proj(hidden_states).sigmoid()
         if self.allow_neg_eigval:
@@ -283,7 +362,12 @@ class GatedDeltaNet(nn.Module):
                 use_qk_l2norm_in_kernel=True,
             )
         elif mode == 'fused_recurrent':
-            o, recurrent_state = fused_recurrent_gated_delta_rule(
+            state_indices = None
+            # write the final states to the preallocated buffers of static caches inplace
+            is_static = hasattr(past_key_values, 'get_state_indices')
+            if is_static and use_cache and recurrent_state is not None and cu_seqlens is None:
+                state_indices = past_key_values.get_state_indices(batch_size, q.device)
+            o, recurrent_state, *intermediate_states = fused_recurrent_gated_delta_rule(
                 q=q,
                 k=k,
                 v=v,
@@ -293,16 +377,21 @@ class GatedDeltaNet(nn.Module):
                 output_final_state=use_cache,
                 cu_seqlens=cu_seqlens,
                 use_qk_l2norm_in_kernel=True,
+                initial_state_indices=state_indices,
+                output_intermediate_states=output_history,
             )
+            if output_history:
+                recurrent_history = intermediate_states[0]
         else:
             raise NotImplementedError(f"Not supported mode `{mode}`.")
 
         if past_key_values is not None:
             past_key_values.update(
                 recurrent_state=recurrent_state,
-                conv_state=(conv_state_q, conv_state_k, conv_state_v) if self.use_short_conv else None,
+                conv_state=conv_state,
                 layer_idx=self.layer_idx,
                 offset=q_len,
+                cache_kwargs=dict(recurrent_history=recurrent_history, conv_history=conv_history) if output_history else None,
             )
 
         if self.use_gate:
@@ -316,3 +405,69 @@ class GatedDeltaNet(nn.Module):
             o = pad_input(o.squeeze(0), indices, batch_size, q_len)
 
         return o, None, past_key_values
+
+    def step(
+        self,
+        hidden_states: torch.Tensor,
+        past_key_values: Cache,
+    ) -> tuple[torch.Tensor, None, Cache]:
+        """
+        Decodes one token per sequence given the cached states of the layer,
+        with the short convolutions, the gates and the recurrent update fused into a single kernel
+        by :func:`~fla.ops.gated_delta_rule.fused_gated_delta_rule_step`.
+        The recurrent state is updated inplace.
+
+        Args:
+            hidden_states (torch.Tensor):
+                Inputs of shape `[B, 1, D]`.
+            past_key_values (Cache):
+                The cache holding the states of the layer.
+        """
+        last_state = past_key_values[self.layer_idx]
+        if self.fuse_qkv:
+            q, k, v = self.qkv_proj(hidden_states).split(self.qkv_sizes, -1)
+        else:
+            q, k, v = self.q_proj(hidden_states), self.k_proj(hidden_states), self.v_proj(hidden_states)
+        q, k = (rearrange(x, 'b 1 (h d) -> b h d', d=self.head_k_dim) for x in (q, k))
+        v = rearrange(v, 'b 1 (h d) -> b h d', d=self.head_v_dim)
+        conv_state, conv_weight, conv_bias = None, None, None
+        if self.use_short_conv:
+            conv_state = last_state['conv_state']
+            if self.fuse_qkv:
+                # the packed cache/weights are passed as is and split into the q/k/v channels by the kernel
+                conv_state = conv_state[0]
+                conv_weight = rearrange(self.qkv_conv1d.weight, 'd 1 w -> d w')
+                conv_bias = self.qkv_conv1d.bias
+            else:
+                convs = (self.q_conv1d, self.k_conv1d, self.v_conv1d)
+                conv_weight = tuple(rearrange(conv.weight, 'd 1 w -> d w') for conv in convs)
+                conv_bias = tuple(conv.bias for conv in convs) if self.conv_bias else None
+        o, recurrent_state, conv_state = fused_gated_delta_rule_step(
+            q=q,
+            k=k,
+            v=v,
+            a=self.a_proj(hidden_states).squeeze(1),
+            b=self.b_proj(hidden_states).squeeze(1),
+            A_log=self.A_log,
+            dt_bias=self.dt_bias,
+            recurrent_state=last_state['recurrent_state'],
+            conv_state=conv_state,
+            conv_weight=conv_weight,
+            conv_bias=conv_bias,
+            allow_neg_eigval=self.allow_neg_eigval,
+        )
+        past_key_values.update(
+            recurrent_state=recurrent_state,
+            conv_state=(conv_state,) if self.fuse_qkv and conv_state is not None else conv_state,
+            layer_idx=self.layer_idx,
+            offset=1,
+        )
+
+        o = o.unsqueeze(1)
+        if self.use_gate:
+            g = rearrange(self.g_proj(hidden_states), '... (h d) -> ... h d', d=self.head_v_dim)
+            o = self.o_norm(o, g)
+        else:
+            o = self.o_norm(o)
+        o = self.o_proj(rearrange(o, 'b t h d -> b t (h d)'))
+        return o, None, past_key_values
@@ -10,10 +10,11 @@ import torch.nn as nn
 import torch.nn.functional as F
 from einops import rearrange, repeat
 
-from fla.layers.utils import get_unpad_data, index_first_axis, pad_input
+from fla.layers.utils import get_conv_state_shapes, get_unpad_data, index_first_axis, pad_input
 from fla.modules import FusedRMSNormGated, RMSNorm, ShortConvolution
 from fla.modules.activations import ACT2FN
 from fla.ops.gla import chunk_gla, fused_chunk_gla, fused_recurrent_gla
+from fla.ops.utils import select_mode
 
 if TYPE_CHECKING:
     from transformers.processing_utils import Unpack
@@ -170,6 +171,13 @@ class GatedLinearAttention(nn.Module):
 
         self.gate_logit_normalizer = gate_logit_normalizer
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """Returns the shapes of the states cached for `batch_size` sequences of `seq_len` tokens."""
+        return {
+            'recurrent_state': [(batch_size, self.num_heads, self.head_k_dim, self.head_v_dim)],
+            'conv_state': get_conv_state_shapes(self, batch_size),
+        }
+
     def forward(
         self,
         hidden_states: torch.Tensor,
@@ -187,7 +195,18 @@ class GatedLinearAttention(nn.Module):
             )
 
         batch_size, q_len, _ = hidden_states.shape
-        mode = 'fused_recurrent' if hidden_states.shape[1] <= 64 else self.mode
+        mode = select_mode(
+            'gla',
+            self.mode,
+            seq_len=q_len,
+            batch_size=batch_size,
+            num_heads=self.num_heads,
+            head_k_dim=self.head_k_dim,
+            head_v_dim=self.head_v_dim,
+            cu_seqlens=kwargs.get('cu_seqlens'),
+            training=self.training,
+            history_size=getattr(past_key_values, 'history_size', 0),
+        )
 
         last_state = None
         if past_key_values is not None and len(past_key_values) > self.layer_idx:
@@ -195,27 +214,39 @@ class GatedLinearAttention(nn.Module):
 
         cu_seqlens = kwargs.get('cu_seqlens')
         if attention_mask is not None:
-            indices, cu_seqlens, _ = get_unpad_data(attention_mask[:, -q_len:])
+            indices, cu_seqlens, _ = get_unpad_data(attention_mask[:, -q_len:], varlen_plan=kwargs.get('varlen_plan'))
             hidden_states = index_first_axis(rearrange(hidden_states, "b s ... -> (b s) ..."), indices).unsqueeze(0)
 
+        # keep the states after each token for rolling back rejected draft tokens in speculative decoding
+        output_history = (
+            mode == 'fused_recurrent' and cu_seqlens is None and getattr(past_key_values, 'history_size', 0) > 0
+        )
+        recurrent_history, conv_history = None, None
         if self.use_short_conv:
             conv_state_q, conv_state_k, conv_state_v = None, None, None
             if last_state is not None:
                 conv_state_q, conv_state_k, conv_state_v = last_state['conv_state']
+            q, k, v = self.q_proj(hidden_states), self.k_proj(hidden_states), self.v_proj(hidden_states)
+            if output_history:
+                conv_history = (
+                    self.q_conv1d.window(q, conv_state_q),
+                    self.k_conv1d.window(k, conv_state_k),
+                    self.v_conv1d.window(v, conv_state_v),
+                )
             q, conv_state_q = self.q_conv1d(
-                x=self.q_proj(hidden_states),
+                x=q,
                 cache=conv_state_q,
                 output_final_state=use_cache,
                 cu_seqlens=cu_seqlens,
             )
             k, conv_state_k = self.k_conv1d(
-                x=self.k_proj(hidden_states),
+                x=k,
                 cache=conv_state_k,
                 output_final_state=use_cache,
                 cu_seqlens=cu_seqlens,
             )
             v, conv_state_v = self.v_conv1d(
-                x=self.v_proj(hidden_states),
+                x=v,
                 cache=conv_state_v,
                 output_final_state=use_cache,
                 cu_seqlens=cu_seqlens,
@@ -243,7 +274,7 @@ class GatedLinearAttention(nn.Module):
 
         recurrent_state = last_state['recurrent_state'] if last_state is not None else None
         if mode == 'fused_recurrent':
-            o, recurrent_state = fused_recurrent_gla(
+            o, recurrent_state, *intermediate_states = fused_recurrent_gla(
                 q=q,
                 k=k,
                 v=v,
@@ -251,7 +282,10 @@ class GatedLinearAttention(nn.Module):
                 initial_state=recurrent_state,
                 output_final_state=use_cache,
                 cu_seqlens=cu_seqlens,
+                output_intermediate_states=output_history,
             )
+            if output_history:
+                recurrent_history = intermediate_states[0]
         elif mode == 'fused_chunk':
             o, recurrent_state = fused_chunk_gla(
                 q=q,
@@ -280,6 +314,7 @@ class GatedLinearAttention(nn.Module):
                 conv_state=(conv_state_q, conv_state_k, conv_state_v) if self.use_short_conv else None,
                 layer_idx=self.layer_idx,
                 offset=q_len,
+                cache_kwargs=dict(recurrent_history=recurrent_history, conv_history=conv_history) if output_history else None,
             )
 
         if self.use_output_gate:
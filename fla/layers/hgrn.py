@@ -10,9 +10,11 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
+from fla.layers.utils import get_conv_state_shapes
 from fla.modules import FusedRMSNormGated, ShortConvolution
 from fla.modules.activations import swiglu
 from fla.ops.hgrn import chunk_hgrn, fused_recurrent_hgrn
+from fla.ops.utils import select_mode
 
 if TYPE_CHECKING:
     from transformers.processing_utils import Unpack
@@ -75,6 +77,13 @@ class HGRNAttention(nn.Module):
         )
         self.o_proj = nn.Linear(self.input_dim, hidden_size, bias=False)
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """Returns the shapes of the states cached for `batch_size` sequences of `seq_len` tokens."""
+        return {
+            'recurrent_state': [(batch_size, self.input_dim)],
+            'conv_state': get_conv_state_shapes(self, batch_size),
+        }
+
     def forward(
         self,
         hidden_states: torch.Tensor,
@@ -93,7 +102,14 @@ class HGRNAttention(nn.Module):
             )
 
         # launching the triton kernel for just one token will actually be slower
-        mode = 'fused_recurrent' if not self.training and hidden_states.shape[1] <= 64 else self.mode
+        mode = select_mode(
+            'hgrn',
+            self.mode,
+            seq_len=hidden_states.shape[1],
+            batch_size=hidden_states.shape[0],
+            cu_seqlens=kwargs.get('cu_seqlens'),
+            training=self.training,
+        )
 
         last_state = None
         if past_key_values is not None and len(past_key_values) > self.layer_idx:
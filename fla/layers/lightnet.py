@@ -11,9 +11,11 @@ import torch.nn as nn
 import torch.nn.functional as F
 from einops import rearrange
 
+from fla.layers.utils import get_conv_state_shapes
 from fla.modules import FusedRMSNormGated, ShortConvolution
 from fla.modules.fused_norm_gate import rms_norm_swish_gate_linear
 from fla.ops.gla import chunk_gla, fused_recurrent_gla
+from fla.ops.utils import select_mode
 
 if TYPE_CHECKING:
     from transformers.processing_utils import Unpack
@@ -103,6 +105,15 @@ class LightNetAttention(nn.Module):
         )
         self.o_proj = nn.Linear(self.value_dim, hidden_size, bias=False)
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """Returns the shapes of the states cached for `batch_size` sequences of `seq_len` tokens."""
+        return {
+            'recurrent_state': [
+                (batch_size, self.num_heads, self.key_dim // self.num_heads, self.value_dim // self.num_heads),
+            ],
+            'conv_state': get_conv_state_shapes(self, batch_size),
+        }
+
     def forward(
         self,
         hidden_states: torch.Tensor,
@@ -120,7 +131,16 @@ class LightNetAttention(nn.Module):
             )
 
         # launching the triton kernel for just one token will actually be slower
-        mode = 'fused_recurrent' if hidden_states.shape[1] <= 64 else self.mode
+        mode = select_mode(
+            'gla',
+            self.mode,
+            seq_len=hidden_states.shape[1],
+            batch_size=hidden_states.shape[0],
+            num_heads=self.num_heads,
+            head_k_dim=self.head_f_dim,
+            cu_seqlens=kwargs.get('cu_seqlens'),
+            training=self.training,
+        )
 
         last_state = None
         if past_key_values is not None and len(past_key_values) > self.layer_idx:
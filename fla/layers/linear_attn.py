@@ -108,6 +108,10 @@ class LinearAttention(nn.Module):
         self.norm_q = norm_q
         self.norm_k = norm_k
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """The layer caches no states across calls."""
+        return {}
+
     def forward(
         self,
         hidden_states: torch.Tensor,
@@ -8,6 +8,7 @@ from transformers.activations import ACT2FN
 from transformers.utils import logging
 
 from fla.layers.mamba2 import apply_mask_to_padding_states, causal_conv1d_fn, causal_conv1d_update, is_fast_path_available
+from fla.layers.utils import get_conv_state_shapes
 from fla.modules.layernorm_gated import RMSNormGated, rmsnorm_fn
 from fla.ops.log_linear_attn.chunk import LogLinearAttentionState, chunk_log_linear_attn
 
@@ -633,6 +634,23 @@ class LogLinearMamba2(nn.Module):
 
         return out
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """Returns the shapes of the states cached for `batch_size` sequences of `seq_len` tokens."""
+        # the states of all levels of the hierarchy over the chunks, plus one, followed by the inputs of the last chunk
+        BT = 64
+        num_levels = ceil_log(max(math.ceil(seq_len / BT), 1), 2) + 1
+        return {
+            'recurrent_state': [
+                (batch_size, num_levels, self.num_heads, self.ssm_state_size, self.head_dim),
+                (batch_size, BT, self.n_groups, self.ssm_state_size),
+                (batch_size, BT, self.n_groups, self.ssm_state_size),
+                (batch_size, BT, self.num_heads, self.head_dim),
+                (batch_size, BT, self.num_heads),
+                (batch_size, BT, self.num_heads, self.num_lambda_dims),
+            ],
+            'conv_state': get_conv_state_shapes(self, batch_size),
+        }
+
     def forward(
         self,
         hidden_states,
@@ -9,7 +9,9 @@ import torch
 import torch.nn as nn
 from transformers.utils import logging
 
+from fla.layers.utils import get_conv_state_shapes
 from fla.modules.activations import ACT2FN
+from fla.ops.utils.dispatch import dispatch, register_backend, resolve
 
 with warnings.catch_warnings():
     warnings.simplefilter('ignore')
@@ -36,6 +38,20 @@ if TYPE_CHECKING:
 logger = logging.get_logger(__name__)
 
 
+@register_backend(
+    'mamba',
+    'cuda',
+    check=lambda layer, *args, **kwargs: is_fast_path_available and 'cuda' in layer.x_proj.weight.device.type,
+)
+def mamba_cuda(layer: Mamba, *args, **kwargs):
+    return layer.cuda_kernels_forward(*args, **kwargs)
+
+
+@dispatch('mamba', backend='torch')
+def mamba(layer: Mamba, *args, **kwargs):
+    return layer.slow_forward(*args, **kwargs)
+
+
 class Mamba(nn.Module):
     """
     Compute ∆, A, B, C, and D the state space parameters and compute the `contextualized_states`.
@@ -105,8 +121,6 @@ class Mamba(nn.Module):
                 "To install follow https://github.com/state-spaces/mamba/#installation and"
                 " https://github.com/Dao-AILab/causal-conv1d",
             )
-        import os
-        backend = os.environ.get('FLA_CONV_BACKEND', backend)
         assert backend in ['cuda', 'triton'], f"Unsupported backend: {backend}"
         if backend == 'cuda' and causal_conv1d_fn is None:
             logger.warning_once(
@@ -114,7 +128,9 @@ class Mamba(nn.Module):
                 "Falling back to the Triton backend. "
                 "To install follow https://github.com/Dao-AILab/causal-conv1d",
             )
-            backend = 'triton'
+        # the backend may be forced for all convolutions, e.g., by `FLA_CONV_BACKEND`
+        backend = resolve('causal_conv1d', backend=backend).backend
+        assert backend in ['cuda', 'triton'], f"Unsupported backend: {backend}"
         if backend == 'triton':
             from fla.modules.convolution import causal_conv1d as causal_conv1d_triton
             from fla.modules.convolution import causal_conv1d_update as causal_conv1d_update_triton
@@ -321,6 +337,13 @@ class Mamba(nn.Module):
         return contextualized_states
     # fmt: on
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """Returns the shapes of the states cached for `batch_size` sequences of `seq_len` tokens."""
+        return {
+            'recurrent_state': [(batch_size, self.intermediate_size, self.ssm_state_size)],
+            'conv_state': get_conv_state_shapes(self, batch_size),
+        }
+
     def forward(
         self,
         hidden_states,
@@ -329,6 +352,5 @@ class Mamba(nn.Module):
         attention_mask: torch.LongTensor | None = None,
         **kwargs: Unpack[dict],
     ):
-        if is_fast_path_available and "cuda" in self.x_proj.weight.device.type:
-            return self.cuda_kernels_forward(hidden_states, cache_params, cache_position, attention_mask, **kwargs)
-        return self.slow_forward(hidden_states, cache_params, cache_position, attention_mask, **kwargs)
+        # the kernels of `mamba_ssm` are used if installed and on CUDA devices, see `fla.ops.utils.dispatch`
+        return mamba(self, hidden_states, cache_params, cache_position, attention_mask, **kwargs)
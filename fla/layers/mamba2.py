@@ -9,8 +9,10 @@ import torch
 import torch.nn as nn
 from transformers.utils import logging
 
+from fla.layers.utils import get_conv_state_shapes
 from fla.modules.activations import ACT2FN
 from fla.modules.layernorm_gated import RMSNormGated
+from fla.ops.utils.dispatch import dispatch, register_backend, resolve
 
 with warnings.catch_warnings():
     warnings.simplefilter('ignore')
@@ -94,6 +96,25 @@ def segment_sum(input_tensor):
     return tensor_segsum
 
 
+@register_backend(
+    'mamba2',
+    'cuda',
+    check=lambda layer, *args, **kwargs: is_fast_path_available and 'cuda' in layer.in_proj.weight.device.type,
+)
+def mamba2_cuda(layer: Mamba2, hidden_states, cache_params=None, cache_position=None, attention_mask=None):
+    return layer.cuda_kernels_forward(hidden_states, cache_params, cache_position, attention_mask)
+
+
+@dispatch('mamba2', backend='torch')
+def mamba2(layer: Mamba2, hidden_states, cache_params=None, cache_position=None, attention_mask=None):
+    dtype = hidden_states.dtype
+    if attention_mask is not None and attention_mask.shape[1] > 1 and attention_mask.shape[0] > 1:
+        # tune out hidden states for pad tokens, see https://github.com/state-spaces/mamba/issues/66
+        hidden_states = (hidden_states * attention_mask[:, :, None]).to(dtype)
+
+    return layer.torch_forward(hidden_states, cache_params, cache_position, attention_mask)
+
+
 class Mamba2(nn.Module):
     """
     Compute ∆, A, B, C, and D the state space parameters and compute the `contextualized_states`.
@@ -195,8 +216,6 @@ class Mamba2(nn.Module):
                 "Falling back to the naive implementation. "
                 "To install follow https://github.com/state-spaces/mamba/#installation",
             )
-        import os
-        backend = os.environ.get('FLA_CONV_BACKEND', backend)
         assert backend in ['cuda', 'triton'], f"Unsupported backend: {backend}"
         if backend == 'cuda' and causal_conv1d_fn is None:
             logger.warning_once(
@@ -204,7 +223,9 @@ class Mamba2(nn.Module):
                 "Falling back to the Triton backend. "
                 "To install follow https://github.com/Dao-AILab/causal-conv1d",
             )
-            backend = 'triton'
+        # the backend may be forced for all convolutions, e.g., by `FLA_CONV_BACKEND`
+        backend = resolve('causal_conv1d', backend=backend).backend
+        assert backend in ['cuda', 'triton'], f"Unsupported backend: {backend}"
         if backend == 'triton':
             from fla.modules.convolution import causal_conv1d as causal_conv1d_triton
             from fla.modules.convolution import causal_conv1d_update as causal_conv1d_update_triton
@@ -595,6 +616,13 @@ class Mamba2(nn.Module):
         return contextualized_states
     # fmt: on
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """Returns the shapes of the states cached for `batch_size` sequences of `seq_len` tokens."""
+        return {
+            'recurrent_state': [(batch_size, self.num_heads, self.head_dim, self.ssm_state_size)],
+            'conv_state': get_conv_state_shapes(self, batch_size),
+        }
+
     def forward(
         self,
         hidden_states,
@@ -602,11 +630,5 @@ class Mamba2(nn.Module):
         cache_position: torch.LongTensor | None = None,
         attention_mask: torch.Tensor | None = None,
     ):
-        if is_fast_path_available and "cuda" in self.in_proj.weight.device.type:
-            return self.cuda_kernels_forward(hidden_states, cache_params, cache_position, attention_mask)
-        dtype = hidden_states.dtype
-        if attention_mask is not None and attention_mask.shape[1] > 1 and attention_mask.shape[0] > 1:
-            # tune out hidden states for pad tokens, see https://github.com/state-spaces/mamba/issues/66
-            hidden_states = (hidden_states * attention_mask[:, :, None]).to(dtype)
-
-        return self.torch_forward(hidden_states, cache_params, cache_position, attention_mask)
+        # the kernels of `mamba_ssm` are used if installed and on CUDA devices, see `fla.ops.utils.dispatch`
+        return mamba2(self, hidden_states, cache_params, cache_position, attention_mask)
@@ -42,9 +42,102 @@ def yarn_get_mscale(scale=1, mscale=1):
     return 0.1 * mscale * math.log(scale) + 1.0
 
 
+def get_latent_attention_mask(
+    q_len: int,
+    k_len: int,
+    attention_mask: torch.Tensor | None = None,
+    window_size: int | None = None,
+    device: torch.device | None = None,
+) -> torch.Tensor:
+    """
+    Builds the boolean mask of shape `[B or 1, 1, q_len, k_len]` for the last `q_len` of `k_len` tokens,
+    combining the causal mask aligned to the bottom right, the sliding window and the padding mask.
+    Padding queries that can see no keys attend to all keys to avoid NaNs, whose outputs are to be discarded.
+    """
+    i = torch.arange(k_len - q_len, k_len, device=device)[:, None]
+    j = torch.arange(k_len, device=device)[None, :]
+    mask = j <= i
+    if window_size is not None:
+        mask = mask & (j > i - window_size)
+    mask = mask[None, None]
+    if attention_mask is not None:
+        mask = mask & attention_mask[:, None, None, -k_len:].bool()
+    return mask | ~mask.any(-1, keepdim=True)
+
+
+def latent_attention(
+    q_lat: torch.Tensor,
+    q_rot: torch.Tensor,
+    c: torch.Tensor,
+    k_rot: torch.Tensor,
+    scale: float,
+    attention_mask: torch.Tensor | None = None,
+    window_size: int | None = None,
+) -> torch.Tensor:
+    r"""
+    Multi-query attention against the compressed latent KV cache of MLA.
+
+    With the up-projections of the keys and values absorbed into the queries and the outputs,
+    all heads share a single key `[c; k_rot]` of `kv_lora_rank + qk_rope_head_dim` dims and a single value `c`,
+    which are read directly from the latent cache without being decompressed.
+
+    Args:
+        q_lat (`torch.Tensor`):
+            Queries projected onto the latent space of shape `[B, T, H, R]`.
+        q_rot (`torch.Tensor`):
+            Rotary part of the queries of shape `[B, T, H, D_rope]`.
+        c (`torch.Tensor`):
+            Cached latents of shape `[B, S, R]`, S >= T, the last T of which belong to the queries.
+        k_rot (`torch.Tensor`):
+            Cached rotary part of the keys shared by all heads of shape `[B, S, D_rope]`.
+        scale (`float`):
+            Scale factor of the attention scores.
+        attention_mask (`Optional[torch.Tensor]`):
+            Padding mask of shape `[B, S']`, S' >= S, whose last S columns are applied to the keys.
+        window_size (`Optional[int]`):
+            The size of the sliding window.
+
+    Returns:
+        Outputs in the latent space of shape `[B, T, H, R]`.
+    """
+    B, T, H, R = q_lat.shape
+    q = torch.cat((q_lat, q_rot), -1).transpose(1, 2)
+    k = torch.cat((c, k_rot), -1)[:, None].expand(-1, H, -1, -1)
+    v = c[:, None].expand(-1, H, -1, -1)
+    mask = get_latent_attention_mask(T, c.shape[1], attention_mask, window_size, c.device)
+    o = F.scaled_dot_product_attention(q, k, v, attn_mask=mask, scale=scale)
+    return o.transpose(1, 2)
+
+
+def naive_latent_attention(
+    q_lat: torch.Tensor,
+    q_rot: torch.Tensor,
+    c: torch.Tensor,
+    k_rot: torch.Tensor,
+    scale: float,
+    attention_mask: torch.Tensor | None = None,
+    window_size: int | None = None,
+) -> torch.Tensor:
+    """
+    Reference implementation of :func:`latent_attention` in fp32.
+    """
+    dtype = q_lat.dtype
+    q_lat, q_rot, c, k_rot = map(lambda x: x.float(), (q_lat, q_rot, c, k_rot))
+    scores = (torch.einsum('bqhr,bkr->bhqk', q_lat, c) + torch.einsum('bqhd,bkd->bhqk', q_rot, k_rot)) * scale
+    mask = get_latent_attention_mask(q_lat.shape[1], c.shape[1], attention_mask, window_size, c.device)
+    scores = scores.masked_fill(~mask, float('-inf'))
+    o = torch.einsum('bhqk,bkr->bqhr', scores.softmax(-1), c)
+    return o.to(dtype)
+
+
 class MultiheadLatentAttention(nn.Module):
     r"""
     Multi-headed attention from [Deepseek V2](https://arxiv.org/abs/2405.04434)
+
+    If `latent_cache` is True, only the compressed latents and the shared rotary keys are cached,
+    i.e., `kv_lora_rank + qk_rope_head_dim` dims per token instead of `num_heads * (qk_head_dim + v_head_dim)`.
+    Tokens attending to the cache then run against the latents directly by absorbing the up-projections of
+    the keys into the queries and those of the values into the outputs.
     """
 
     def __init__(
@@ -61,6 +154,7 @@ class MultiheadLatentAttention(nn.Module):
         rope_theta: float = 10000.,
         max_position_embeddings: int | None = None,
         rope_scaling: dict | None = None,
+        latent_cache: bool = False,
         layer_idx: int = None,
     ) -> MultiheadLatentAttention:
         super().__init__()
@@ -85,6 +179,7 @@ class MultiheadLatentAttention(nn.Module):
         self.window_size = window_size
         self.rope_theta = rope_theta
         self.max_position_embeddings = max_position_embeddings
+        self.latent_cache = latent_cache
         self.layer_idx = layer_idx
 
         if flash_attn_func is None:
@@ -118,6 +213,19 @@ class MultiheadLatentAttention(nn.Module):
 
         self.rotary = RotaryEmbedding(dim=self.qk_rope_head_dim, base=self.rope_theta)
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """Returns the shapes of the states cached for `batch_size` sequences of `seq_len` tokens."""
+        L = min(seq_len, self.window_size or seq_len)
+        if self.latent_cache:
+            # the compressed latents and the rotary keys shared by all heads
+            return {'attn_state': [(batch_size, L, self.kv_lora_rank), (batch_size, L, self.qk_rope_head_dim)]}
+        return {
+            'attn_state': [
+                (batch_size, L, self.num_heads, self.qk_head_dim),
+                (batch_size, L, self.num_heads, self.v_head_dim),
+            ],
+        }
+
     def forward(
         self,
         hidden_states: torch.Tensor,
@@ -141,11 +249,9 @@ class MultiheadLatentAttention(nn.Module):
         q_states = self.q_proj(hidden_states)
         q_states = rearrange(q_states, '... (h d) -> ... h d', d=self.qk_head_dim)
         q_pass, q_rot = torch.split(q_states, [self.qk_nope_head_dim, self.qk_rope_head_dim], dim=-1)
-        k_pass, k_rot = self.kv_proj(hidden_states), self.k_rope(hidden_states)
-
-        k_rot = rearrange(k_rot, 'b t d -> b t 1 d')
-        k_pass = rearrange(k_pass, '... (h d) -> ... h d', d=self.qk_nope_head_dim + self.v_head_dim)
-        k_pass, v = torch.split(k_pass, [self.qk_nope_head_dim, self.v_head_dim], dim=-1)
+        # compressed latents
+        c = self.kv_proj[1](self.kv_proj[0](hidden_states))
+        k_rot = rearrange(self.k_rope(hidden_states), 'b t d -> b t 1 d')
 
         # apply rotary position embedding
         seqlen_offset, max_seqlen = 0, q_len
@@ -164,13 +270,26 @@ class MultiheadLatentAttention(nn.Module):
             q_rot, k_rot, seqlen_offset=seqlen_offset, max_seqlen=max_seqlen, cu_seqlens=cu_seqlens,
         )
 
+        if past_key_values is not None and self.latent_cache:
+            cache_has_content = past_key_values.get_seq_length(self.layer_idx) > 0
+            c_cached, k_rot_cached = past_key_values.update(
+                attn_state=(c, k_rot.squeeze(2)),
+                layer_idx=self.layer_idx,
+                offset=q_len,
+                cache_kwargs=dict(window_size=self.window_size),
+            )['attn_state']
+            if cache_has_content:
+                o = self.absorbed_attention(q_pass, q_rot, c_cached, k_rot_cached, attention_mask)
+                o = self.o_proj(o.reshape(batch_size, q_len, -1))
+                return o, None, past_key_values
+
+        k_pass = rearrange(self.kv_proj[2](c), '... (h d) -> ... h d', d=self.qk_nope_head_dim + self.v_head_dim)
+        k_pass, v = torch.split(k_pass, [self.qk_nope_head_dim, self.v_head_dim], dim=-1)
         k_rot = repeat(k_rot, 'b t 1 d -> b t h d', h=self.num_heads)
         q = torch.cat((q_pass, q_rot), dim=-1)
         k = torch.cat((k_pass, k_rot), dim=-1)
 
-        # TODO: instead of caching the full k, v, we can actually only cache the compressed_kv and k_rot
-        # and recover the full k, v from compressed_kv and k_rot
-        if past_key_values is not None:
+        if past_key_values is not None and not self.latent_cache:
             cache_has_content = past_key_values.get_seq_length(self.layer_idx) > 0
             k_cached, v_cached = past_key_values.update(
                 attn_state=(k, v),
@@ -188,7 +307,9 @@ class MultiheadLatentAttention(nn.Module):
         if attention_mask is not None:
             if q.shape[1] == 1 and self.window_size is not None:
                 attention_mask = attention_mask[:, -self.window_size:]
-            q, (k, v), indices_q, cu_seqlens, max_seq_lens = unpad_input(q, (k, v), attention_mask, q_len)
+            q, (k, v), indices_q, cu_seqlens, max_seq_lens = unpad_input(
+                q, (k, v), attention_mask, q_len, varlen_plan=kwargs.get('varlen_plan'),
+            )
             cu_seqlens_q, cu_seqlens_k = cu_seqlens
             max_seqlen_q, max_seqlen_k = max_seq_lens
             o = flash_attn_varlen_func(
@@ -198,6 +319,7 @@ class MultiheadLatentAttention(nn.Module):
                 max_seqlen_q=max_seqlen_q,
                 max_seqlen_k=max_seqlen_k,
                 causal=True,
+                softmax_scale=self.scaling,
                 window_size=(-1, -1) if self.window_size is None else (self.window_size-1, 0),
             )
             o = pad_input(o, indices_q, batch_size, q_len)
@@ -209,12 +331,14 @@ class MultiheadLatentAttention(nn.Module):
                 max_seqlen_q=max_seqlen,
                 max_seqlen_k=max_seqlen,
                 causal=True,
+                softmax_scale=self.scaling,
                 window_size=(-1, -1) if self.window_size is None else (self.window_size-1, 0),
             ).unsqueeze(0)
         else:
             o = flash_attn_func(
                 q, k, v,
                 causal=True,
+                softmax_scale=self.scaling,
                 window_size=(-1, -1) if self.window_size is None else (self.window_size-1, 0),
             )
 
@@ -223,3 +347,24 @@ class MultiheadLatentAttention(nn.Module):
         o = o.reshape(batch_size, q_len, -1)
         o = self.o_proj(o)
         return o, None, past_key_values
+
+    def absorbed_attention(
+        self,
+        q_pass: torch.Tensor,
+        q_rot: torch.Tensor,
+        c: torch.Tensor,
+        k_rot: torch.Tensor,
+        attention_mask: torch.Tensor | None = None,
+    ) -> torch.Tensor:
+        """
+        Attends to the latent cache `c` and `k_rot` with the up-projections of the keys and values absorbed,
+        i.e., `q_pass^T (W_uk c) = (W_uk^T q_pass)^T c` and `sum_t p_t (W_uv c_t) = W_uv (sum_t p_t c_t)`.
+
+        Returns:
+            Outputs of shape `[B, T, H, v_head_dim]` before the output projection.
+        """
+        w_kv = self.kv_proj[2].weight.view(self.num_heads, self.qk_nope_head_dim + self.v_head_dim, self.kv_lora_rank)
+        w_uk, w_uv = torch.split(w_kv, [self.qk_nope_head_dim, self.v_head_dim], dim=1)
+        q_lat = torch.einsum('bthd,hdr->bthr', q_pass, w_uk)
+        o = latent_attention(q_lat, q_rot, c, k_rot, self.scaling, attention_mask, self.window_size)
+        return torch.einsum('bthr,hvr->bthv', o, w_uv)
@@ -11,13 +11,14 @@ from torch.nn import functional as F
 
 from fla.modules import FusedRMSNormGated, RMSNorm, ShortConvolution
 from fla.ops.gated_delta_rule import chunk_gated_delta_rule, fused_recurrent_gated_delta_rule
+from fla.ops.utils import select_mode
 
 if TYPE_CHECKING:
     from transformers.processing_utils import Unpack
 
     from fla.models.utils import Cache
 
-from fla.layers.utils import get_unpad_data, index_first_axis, pad_input, unpad_input
+from fla.layers.utils import get_conv_state_shapes, get_unpad_data, index_first_axis, pad_input, unpad_input
 
 
 def _upad_input(
@@ -416,6 +417,15 @@ class MomAttention(nn.Module):
                 nn.init.zeros_(module.bias)
         module._is_hf_initialized = True
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """Returns the shapes of the states cached for `batch_size` sequences of `seq_len` tokens."""
+        # the tokens routed to each memory are cached as separate sequences, followed by those of the shared memory
+        batch_sizes = [self.num_memories * batch_size] + [batch_size] * int(self.shared_mem)
+        return {
+            'recurrent_state': [(n, self.num_heads, self.head_qk_dim, self.head_v_dim) for n in batch_sizes],
+            'conv_state': [shape for n in batch_sizes for shape in get_conv_state_shapes(self, n)],
+        }
+
     def forward(
         self,
         hidden_states: torch.Tensor,
@@ -437,7 +447,16 @@ class MomAttention(nn.Module):
         if origin_cu_seqlens is not None:
             hidden_states, attention_mask = self.cu2pad(hidden_states, origin_cu_seqlens)
 
-        mode = 'fused_recurrent' if (hidden_states.shape[1] <= 64 and not self.training) else self.mode
+        mode = select_mode(
+            'gated_delta_rule',
+            self.mode,
+            seq_len=hidden_states.shape[1],
+            batch_size=hidden_states.shape[0],
+            num_heads=self.num_heads,
+            head_k_dim=self.head_qk_dim,
+            head_v_dim=self.head_v_dim,
+            training=self.training,
+        )
         if self.training:
             assert mode == 'chunk', "Only chunk mode is supported in training."
 
@@ -668,14 +687,23 @@ class MomAttention(nn.Module):
                 "Arbitrary attention masks of shape [batch_size, seq_len, seq_len] are not allowed."
             )
 
-        mode = 'fused_recurrent' if hidden_states.shape[1] <= 64 else self.mode
+        mode = select_mode(
+            'gated_delta_rule',
+            self.mode,
+            seq_len=hidden_states.shape[1],
+            batch_size=hidden_states.shape[0],
+            num_heads=self.num_heads,
+            head_k_dim=self.head_qk_dim,
+            head_v_dim=self.head_v_dim,
+            training=self.training,
+        )
         if self.training:
             assert mode == 'chunk', "Only chunk mode is supported in training."
 
         cu_seqlens = None
         if attention_mask is not None:
             batch_size, q_len = hidden_states.shape[0], hidden_states.shape[1]
-            indices, cu_seqlens, _ = get_unpad_data(attention_mask[:, -q_len:])
+            indices, cu_seqlens, _ = get_unpad_data(attention_mask[:, -q_len:], varlen_plan=kwargs.get('varlen_plan'))
             hidden_states = index_first_axis(rearrange(hidden_states, "b s ... -> (b s) ..."), indices).unsqueeze(0)
 
         if self.use_short_conv:
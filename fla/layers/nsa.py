@@ -63,6 +63,11 @@ class NativeSparseAttention(nn.Module):
 
         self.rotary = RotaryEmbedding(dim=self.head_dim, base=self.rope_theta)
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """Returns the shapes of the states cached for `batch_size` sequences of `seq_len` tokens."""
+        L = min(seq_len, self.window_size or seq_len)
+        return {'attn_state': [(batch_size, L, self.num_kv_heads * self.head_dim)] * 2}
+
     def forward(
         self,
         hidden_states: torch.Tensor,
@@ -10,7 +10,7 @@ import torch.nn.functional as F
 from einops import rearrange
 from transformers.utils import logging
 
-from fla.layers.utils import pad_input, unpad_input
+from fla.layers.utils import get_conv_state_shapes, pad_input, unpad_input
 from fla.modules import RMSNorm, ShortConvolution
 from fla.modules.l2norm import l2_norm
 from fla.ops.attn.decoding import attn_decoding_one_step
@@ -81,6 +81,13 @@ class PaTHAttention(nn.Module):
             self.g_proj = nn.Linear(self.hidden_size, self.num_heads, bias=True)
         self.o_proj = nn.Linear(self.hidden_size, self.hidden_size, bias=False)
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """Returns the shapes of the states cached for `batch_size` sequences of `seq_len` tokens."""
+        attn_state = [(batch_size, seq_len, self.kv_dim)] * 2
+        if self.use_forget_gate:
+            attn_state.append((batch_size, seq_len, self.num_heads))
+        return {'attn_state': attn_state, 'conv_state': get_conv_state_shapes(self, batch_size)}
+
     def forward(
         self,
         hidden_states: torch.Tensor,
@@ -165,11 +172,11 @@ class PaTHAttention(nn.Module):
                 )
                 if g is not None:
                     q, (k, v, g), indices_q, cu_seqlens, max_seq_lens = unpad_input(
-                        q, (k, v, g), attention_mask, q_len, keepdim=True)
+                        q, (k, v, g), attention_mask, q_len, keepdim=True, varlen_plan=kwargs.get('varlen_plan'))
                     max_seqlen_q, max_seqlen_k = max_seq_lens
                 else:
                     q, (k, v), indices_q, cu_seqlens, max_seq_lens = unpad_input(
-                        q, (k, v), attention_mask, q_len, keepdim=True)
+                        q, (k, v), attention_mask, q_len, keepdim=True, varlen_plan=kwargs.get('varlen_plan'))
                     max_seqlen_q, max_seqlen_k = max_seq_lens
                 _, cu_seqlens = cu_seqlens
                 q = rearrange(q, '... (h d) -> ... h d', d=self.head_dim)
@@ -183,10 +190,10 @@ class PaTHAttention(nn.Module):
                 g_cache = g.clone() if g is not None else None
                 if g is None:
                     q, (k, v, w, beta), indices_q, cu_seqlens, max_seq_lens = unpad_input(
-                        q, (k, v, w, beta), attention_mask, q_len, keepdim=True)
+                        q, (k, v, w, beta), attention_mask, q_len, keepdim=True, varlen_plan=kwargs.get('varlen_plan'))
                 else:
                     q, (k, v, w, beta, g), indices_q, cu_seqlens, max_seq_lens = unpad_input(
-                        q, (k, v, w, beta, g), attention_mask, q_len, keepdim=True)
+                        q, (k, v, w, beta, g), attention_mask, q_len, keepdim=True, varlen_plan=kwargs.get('varlen_plan'))
                 max_seqlen_q, max_seqlen_k = max_seq_lens
                 assert max_seqlen_q == max_seqlen_k, "max_seqlen_q should be equal to max_seqlen_k in prefilling"
                 _, cu_seqlens = cu_seqlens
@@ -58,6 +58,10 @@ class ReBasedLinearAttention(nn.Module):
         self.o_proj = nn.Linear(self.num_heads * self.head_dim, self.hidden_size, bias=False)
         self.dropout = nn.Identity()
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """The layer caches no states across calls."""
+        return {}
+
     def forward(self, hidden_states: torch.Tensor, **kwargs):
         mode = self.mode
         q = rearrange(
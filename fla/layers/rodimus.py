@@ -12,7 +12,7 @@ import torch.utils.checkpoint
 from einops import rearrange, repeat
 from transformers.utils import logging
 
-from fla.layers.utils import get_unpad_data, index_first_axis, pad_input, unpad_input
+from fla.layers.utils import get_conv_state_shapes, get_unpad_data, index_first_axis, pad_input, unpad_input
 from fla.modules import RMSNorm, RotaryEmbedding, ShortConvolution
 from fla.modules.layernorm_gated import RMSNormGated
 from fla.ops.gla import chunk_gla, fused_chunk_gla, fused_recurrent_gla
@@ -113,6 +113,13 @@ class RodimusAttention(nn.Module):
             nn.Sigmoid(),
         )
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """Returns the shapes of the states cached for `batch_size` sequences of `seq_len` tokens."""
+        return {
+            'recurrent_state': [(batch_size, 1, self.mem_size, self.d_inner)],
+            'conv_state': get_conv_state_shapes(self, batch_size),
+        }
+
     def forward(
         self,
         hidden_states: torch.Tensor,
@@ -139,7 +146,7 @@ class RodimusAttention(nn.Module):
 
         cu_seqlens = kwargs.get('cu_seqlens')
         if attention_mask is not None:
-            indices, cu_seqlens, _ = get_unpad_data(attention_mask[:, -q_len:])
+            indices, cu_seqlens, _ = get_unpad_data(attention_mask[:, -q_len:], varlen_plan=kwargs.get('varlen_plan'))
             hidden_states = index_first_axis(rearrange(hidden_states, "b s ... -> (b s) ..."), indices).unsqueeze(0)
 
         hidden_states, final_gate = self.up_proj(hidden_states), self.gate_proj(hidden_states)
@@ -275,6 +282,12 @@ class SlidingWindowSharedKeyAttention(nn.Module):
 
         self.rotary = RotaryEmbedding(dim=self.head_dim, base=self.rope_theta)
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """Returns the shapes of the states cached for `batch_size` sequences of `seq_len` tokens."""
+        # the keys are shared by all heads
+        L = min(seq_len, self.window_size or seq_len)
+        return {'attn_state': [(batch_size, L, self.head_dim), (batch_size, L, self.hidden_size)]}
+
     def forward(
         self,
         hidden_states: torch.Tensor,
@@ -351,6 +364,7 @@ class SlidingWindowSharedKeyAttention(nn.Module):
                 states=(k, v),
                 attention_mask=attention_mask[:, -max(self.window_size, q_len):],
                 q_len=q_len,
+                varlen_plan=kwargs.get('varlen_plan'),
             )
             cu_seqlens_q, cu_seqlens_k = cu_seqlens
             max_seqlen_q, max_seqlen_k = max_seq_lens
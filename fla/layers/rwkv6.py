@@ -16,6 +16,7 @@ from fla.modules import GroupNorm
 from fla.modules.activations import ACT2FN
 from fla.modules.token_shift import token_shift
 from fla.ops.rwkv6 import chunk_rwkv6, fused_recurrent_rwkv6
+from fla.ops.utils import select_mode
 
 if TYPE_CHECKING:
     from fla.models.utils import Cache
@@ -105,6 +106,14 @@ class RWKV6Attention(nn.Module):
             nn.init.xavier_uniform_(module, gain=2 ** -2.5)
         module._is_hf_initialized = True
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """Returns the shapes of the states cached for `batch_size` sequences of `seq_len` tokens."""
+        # the token shift caches the last token
+        return {
+            'recurrent_state': [(batch_size, self.num_heads, self.head_k_dim, self.head_v_dim)],
+            'conv_state': [(batch_size, self.hidden_size)],
+        }
+
     def forward(
         self,
         hidden_states: torch.Tensor,
@@ -124,7 +133,17 @@ class RWKV6Attention(nn.Module):
 
         batch_size, seq_len, hidden_size = hidden_states.shape
         # launching the triton kernel for just one token will actually be slower
-        mode = 'fused_recurrent' if hidden_states.shape[1] <= 64 else self.mode
+        mode = select_mode(
+            'rwkv6',
+            self.mode,
+            seq_len=seq_len,
+            batch_size=batch_size,
+            num_heads=self.num_heads,
+            head_k_dim=self.head_k_dim,
+            head_v_dim=self.head_v_dim,
+            cu_seqlens=kwargs.get('cu_seqlens'),
+            training=self.training,
+        )
 
         last_state = None
         if past_key_values is not None and len(past_key_values) > self.layer_idx:
@@ -213,6 +213,14 @@ class RWKV7Attention(nn.Module):
         nn.init.orthogonal_(weight, gain=gain)
         weight = weight.to(oringinal_dtype)
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """Returns the shapes of the states cached for `batch_size` sequences of `seq_len` tokens."""
+        # the token shift caches the last token
+        return {
+            'recurrent_state': [(batch_size, self.num_heads, self.head_dim, self.head_v_dim)],
+            'conv_state': [(batch_size, self.hidden_size)],
+        }
+
     def forward(
         self,
         hidden_states: torch.Tensor,
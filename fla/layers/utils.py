@@ -6,7 +6,7 @@
 import torch
 from einops import rearrange, repeat
 
-from fla.ops.utils.index import prepare_cu_seqlens_from_mask, prepare_lens_from_mask
+from fla.ops.utils.index import VarlenPlan, prepare_cu_seqlens_from_mask, prepare_lens_from_mask, prepare_unpad_indices
 from fla.utils import tensor_cache
 
 
@@ -72,6 +72,9 @@ index_put_first_axis = IndexPutFirstAxis.apply
 @tensor_cache
 def get_unpad_data(
     attention_mask: torch.Tensor,
+    max_seqlen: int | None = None,
+    total_tokens: int | None = None,
+    varlen_plan: VarlenPlan | None = None,
 ) -> tuple[torch.Tensor, torch.Tensor, int]:
     """
     Retrieves indexing data required to repad unpadded (ragged) tensors.
@@ -79,6 +82,12 @@ def get_unpad_data(
     Args:
         attention_mask (`torch.Tensor`):
             Boolean or int tensor of shape (batch_size, sequence_length), 1 means valid and 0 means not valid.
+        max_seqlen (`Optional[int]`):
+            Maximum sequence length in batch if known on the host, avoiding the synchronization of reading it back.
+        total_tokens (`Optional[int]`):
+            Total number of valid tokens if known on the host, avoiding the synchronization of `torch.nonzero`.
+        varlen_plan (`Optional[VarlenPlan]`):
+            The plan of the inputs of the model, sharing the results among the layers if provided.
 
     Return:
         indices (`torch.Tensor`):
@@ -89,9 +98,11 @@ def get_unpad_data(
         max_seqlen_in_batch (`int`):
             Maximum sequence length in batch.
     """
+    if varlen_plan is not None:
+        return varlen_plan.unpad_data(attention_mask)
     lens = prepare_lens_from_mask(attention_mask)
-    indices = torch.nonzero(attention_mask.flatten(), as_tuple=False).flatten()
-    max_seqlen_in_batch = lens.max().item()
+    indices = prepare_unpad_indices(attention_mask, total_tokens)
+    max_seqlen_in_batch = max_seqlen if max_seqlen is not None else lens.max().item()
     cu_seqlens = prepare_cu_seqlens_from_mask(attention_mask)
     return indices, cu_seqlens, max_seqlen_in_batch
 
@@ -102,6 +113,7 @@ def unpad_input(
     attention_mask: torch.Tensor,
     q_len: int,
     keepdim: bool = False,
+    varlen_plan: VarlenPlan | None = None,
 ):
     """
     Unpads query, key, and values tensors, using a single dimension for all tokens
@@ -119,6 +131,8 @@ def unpad_input(
             Target length.
         keepdim (`bool`):
             Whether to keep the batch dimension. Default: `False`.
+        varlen_plan (`Optional[VarlenPlan]`):
+            The plan of the inputs of the model, sharing the unpadding data among the layers if provided.
 
     Return:
         q (`torch.Tensor`):
@@ -137,7 +151,7 @@ def unpad_input(
             Maximum sequence length in batch (`max_seqlen_in_batch_q` for the target sequence
             i.e. query, `max_seqlen_in_batch_k` for the source sequence i.e. key/value).
     """
-    indices_k, cu_seqlens_k, max_seqlen_in_batch_k = get_unpad_data(attention_mask)
+    indices_k, cu_seqlens_k, max_seqlen_in_batch_k = get_unpad_data(attention_mask, varlen_plan=varlen_plan)
     batch_size, seq_len, *_ = states[0].shape
 
     state = tuple(
@@ -193,3 +207,32 @@ def pad_input(
     """
     output = index_put_first_axis(hidden_states, indices, batch_size * seq_len)
     return rearrange(output, "(b s) ... -> b s ...", b=batch_size)
+
+
+def fuse_qkv_load_state_dict_pre_hook(module: torch.nn.Module, state_dict: dict, prefix: str, *args, **kwargs):
+    """
+    A `load_state_dict` pre-hook converting the checkpoints of layers between the separate q/k/v projections
+    and short convolutions, i.e., `q_proj`, `k_proj`, `v_proj`, `q_conv1d`, `k_conv1d` and `v_conv1d`,
+    and the packed `qkv_proj` and `qkv_conv1d` of `fuse_qkv=True`,
+    so that checkpoints of either layout can be loaded regardless of the `fuse_qkv` of the module.
+    The module is expected to define the sizes of the q/k/v channels as `qkv_sizes`.
+    """
+    for fused, names in (('qkv_proj', ('q_proj', 'k_proj', 'v_proj')), ('qkv_conv1d', ('q_conv1d', 'k_conv1d', 'v_conv1d'))):
+        for param in ('weight', 'bias'):
+            key, keys = f'{prefix}{fused}.{param}', [f'{prefix}{name}.{param}' for name in names]
+            if module.fuse_qkv and all(k in state_dict for k in keys):
+                state_dict[key] = torch.cat([state_dict.pop(k) for k in keys])
+            elif not module.fuse_qkv and key in state_dict:
+                state_dict.update(zip(keys, state_dict.pop(key).split(module.qkv_sizes)))
+
+
+def get_conv_state_shapes(module: torch.nn.Module, batch_size: int) -> list[tuple[int, ...]]:
+    """
+    Returns the shapes of the states cached by the short convolutions in `module` for `batch_size` sequences,
+    i.e., the last `kernel_size` inputs of each channel of shape `[B, D, W]`.
+    """
+    return [
+        (batch_size, conv.in_channels, conv.kernel_size[0])
+        for conv in module.modules()
+        if isinstance(conv, torch.nn.Conv1d)
+    ]
@@ -0,0 +1,74 @@
+# Copyright (c) 2023-2025, Songlin Yang, Yu Zhang
+
+import importlib
+import importlib.abc
+import importlib.machinery
+import importlib.util
+import sys
+from collections.abc import Callable, Sequence
+from types import ModuleType
+from typing import Any
+
+
+class TunedConfigLoader(importlib.machinery.SourceFileLoader):
+    """
+    Seeds the autotuned kernels of each module it executes with the configs tuned offline.
+    """
+
+    def exec_module(self, module: ModuleType) -> None:
+        super().exec_module(module)
+        # only the modules defining Triton kernels, which have imported Triton themselves, load the tuned configs
+        jit = sys.modules.get('triton.runtime.jit')
+        if jit is not None and any(isinstance(i, jit.KernelInterface) for i in vars(module).values()):
+            from fla.ops.utils.autotune import load_tuned_configs
+            load_tuned_configs(module=module)
+
+
+class TunedConfigFinder(importlib.abc.MetaPathFinder):
+    """
+    Finds the `fla` modules as usual, but loads them by :class:`TunedConfigLoader`.
+    """
+
+    def find_spec(self, fullname: str, path: Sequence[str] | None, target: ModuleType | None = None):
+        if not fullname.startswith('fla.'):
+            return None
+        spec = importlib.machinery.PathFinder.find_spec(fullname, path)
+        if spec is not None and type(spec.loader) is importlib.machinery.SourceFileLoader:
+            spec.loader = TunedConfigLoader(spec.loader.name, spec.loader.path)
+        return spec
+
+
+def seed_tuned_configs_on_import() -> None:
+    """
+    Seeds the autotuned kernels with the configs tuned offline as soon as their modules are imported,
+    whether directly, through the lazy attributes of the `fla` packages or by the `transformers` Auto classes.
+    """
+    if not any(isinstance(finder, TunedConfigFinder) for finder in sys.meta_path):
+        sys.meta_path.insert(0, TunedConfigFinder())
+
+
+def lazy_import(
+    package: str,
+    import_structure: dict[str, list[str]],
+) -> tuple[Callable[[str], Any], Callable[[], list[str]]]:
+    """
+    Returns the module-level `__getattr__` and `__dir__` (PEP 562) of `package`, which import the objects listed
+    per (relative) module in `import_structure` on first access rather than on the import of the package.
+    Submodules of `package` are imported on attribute access as well.
+    """
+    objects = {name: module for module, names in import_structure.items() for name in names}
+
+    def __getattr__(name: str) -> Any:
+        if name in objects:
+            value = getattr(importlib.import_module(objects[name], package), name)
+        elif importlib.util.find_spec(f'{package}.{name}') is not None:
+            value = importlib.import_module(f'{package}.{name}')
+        else:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        setattr(sys.modules[package], name, value)
+        return value
+
+    def __dir__() -> list[str]:
+        return sorted(set(vars(sys.modules[package])) | set(objects))
+
+    return __getattr__, __dir__
@@ -1,37 +1,131 @@
 
-from fla.models.abc import ABCConfig, ABCForCausalLM, ABCModel
-from fla.models.bitnet import BitNetConfig, BitNetForCausalLM, BitNetModel
-from fla.models.comba import CombaConfig, CombaForCausalLM, CombaModel
-from fla.models.delta_net import DeltaNetConfig, DeltaNetForCausalLM, DeltaNetModel
-from fla.models.deltaformer import DeltaFormerConfig, DeltaFormerForCausalLM, DeltaFormerModel
-from fla.models.forgetting_transformer import (
-    ForgettingTransformerConfig,
-    ForgettingTransformerForCausalLM,
-    ForgettingTransformerModel,
+import importlib
+import sys
+from typing import TYPE_CHECKING
+
+from transformers import AutoConfig
+from transformers.models.auto.configuration_auto import CONFIG_MAPPING
+
+from fla.lazy import lazy_import
+
+if TYPE_CHECKING:
+    from fla.models.abc import ABCConfig, ABCForCausalLM, ABCModel
+    from fla.models.bitnet import BitNetConfig, BitNetForCausalLM, BitNetModel
+    from fla.models.comba import CombaConfig, CombaForCausalLM, CombaModel
+    from fla.models.delta_net import DeltaNetConfig, DeltaNetForCausalLM, DeltaNetModel
+    from fla.models.deltaformer import DeltaFormerConfig, DeltaFormerForCausalLM, DeltaFormerModel
+    from fla.models.forgetting_transformer import (
+        ForgettingTransformerConfig,
+        ForgettingTransformerForCausalLM,
+        ForgettingTransformerModel,
+    )
+    from fla.models.gated_deltanet import GatedDeltaNetConfig, GatedDeltaNetForCausalLM, GatedDeltaNetModel
+    from fla.models.gated_deltaproduct import GatedDeltaProductConfig, GatedDeltaProductForCausalLM, GatedDeltaProductModel
+    from fla.models.gla import GLAConfig, GLAForCausalLM, GLAModel
+    from fla.models.gsa import GSAConfig, GSAForCausalLM, GSAModel
+    from fla.models.hgrn import HGRNConfig, HGRNForCausalLM, HGRNModel
+    from fla.models.hgrn2 import HGRN2Config, HGRN2ForCausalLM, HGRN2Model
+    from fla.models.kda import KDAConfig, KDAForCausalLM, KDAModel
+    from fla.models.lightnet import LightNetConfig, LightNetForCausalLM, LightNetModel
+    from fla.models.linear_attn import LinearAttentionConfig, LinearAttentionForCausalLM, LinearAttentionModel
+    from fla.models.log_linear_mamba2 import LogLinearMamba2Config, LogLinearMamba2ForCausalLM, LogLinearMamba2Model
+    from fla.models.mamba import MambaConfig, MambaForCausalLM, MambaModel
+    from fla.models.mamba2 import Mamba2Config, Mamba2ForCausalLM, Mamba2Model
+    from fla.models.mesa_net import MesaNetConfig, MesaNetForCausalLM, MesaNetModel
+    from fla.models.mla import MLAConfig, MLAForCausalLM, MLAModel
+    from fla.models.mom import MomConfig, MomForCausalLM, MomModel
+    from fla.models.nsa import NSAConfig, NSAForCausalLM, NSAModel
+    from fla.models.path_attn import PaTHAttentionConfig, PaTHAttentionForCausalLM, PaTHAttentionModel
+    from fla.models.retnet import RetNetConfig, RetNetForCausalLM, RetNetModel
+    from fla.models.rodimus import RodimusConfig, RodimusForCausalLM, RodimusModel
+    from fla.models.rwkv6 import RWKV6Config, RWKV6ForCausalLM, RWKV6Model
+    from fla.models.rwkv7 import RWKV7Config, RWKV7ForCausalLM, RWKV7Model
+    from fla.models.samba import SambaConfig, SambaForCausalLM, SambaModel
+    from fla.models.transformer import TransformerConfig, TransformerForCausalLM, TransformerModel
+else:
+    __getattr__, __dir__ = lazy_import(__name__, {
+        'fla.models.abc': ['ABCConfig', 'ABCForCausalLM', 'ABCModel'],
+        'fla.models.bitnet': ['BitNetConfig', 'BitNetForCausalLM', 'BitNetModel'],
+        'fla.models.comba': ['CombaConfig', 'CombaForCausalLM', 'CombaModel'],
+        'fla.models.delta_net': ['DeltaNetConfig', 'DeltaNetForCausalLM', 'DeltaNetModel'],
+        'fla.models.deltaformer': ['DeltaFormerConfig', 'DeltaFormerForCausalLM', 'DeltaFormerModel'],
+        'fla.models.forgetting_transformer': [
+            'ForgettingTransformerConfig',
+            'ForgettingTransformerForCausalLM',
+            'ForgettingTransformerModel',
+        ],
+        'fla.models.gated_deltanet': ['GatedDeltaNetConfig', 'GatedDeltaNetForCausalLM', 'GatedDeltaNetModel'],
+        'fla.models.gated_deltaproduct': ['GatedDeltaProductConfig', 'GatedDeltaProductForCausalLM', 'GatedDeltaProductModel'],
+        'fla.models.gla': ['GLAConfig', 'GLAForCausalLM', 'GLAModel'],
+        'fla.models.gsa': ['GSAConfig', 'GSAForCausalLM', 'GSAModel'],
+        'fla.models.hgrn': ['HGRNConfig', 'HGRNForCausalLM', 'HGRNModel'],
+        'fla.models.hgrn2': ['HGRN2Config', 'HGRN2ForCausalLM', 'HGRN2Model'],
+        'fla.models.kda': ['KDAConfig', 'KDAForCausalLM', 'KDAModel'],
+        'fla.models.lightnet': ['LightNetConfig', 'LightNetForCausalLM', 'LightNetModel'],
+        'fla.models.linear_attn': ['LinearAttentionConfig', 'LinearAttentionForCausalLM', 'LinearAttentionModel'],
+        'fla.models.log_linear_mamba2': ['LogLinearMamba2Config', 'LogLinearMamba2ForCausalLM', 'LogLinearMamba2Model'],
+        'fla.models.mamba': ['MambaConfig', 'MambaForCausalLM', 'MambaModel'],
+        'fla.models.mamba2': ['Mamba2Config', 'Mamba2ForCausalLM', 'Mamba2Model'],
+        'fla.models.mesa_net': ['MesaNetConfig', 'MesaNetForCausalLM', 'MesaNetModel'],
+        'fla.models.mla': ['MLAConfig', 'MLAForCausalLM', 'MLAModel'],
+        'fla.models.mom': ['MomConfig', 'MomForCausalLM', 'MomModel'],
+        'fla.models.nsa': ['NSAConfig', 'NSAForCausalLM', 'NSAModel'],
+        'fla.models.path_attn': ['PaTHAttentionConfig', 'PaTHAttentionForCausalLM', 'PaTHAttentionModel'],
+        'fla.models.retnet': ['RetNetConfig', 'RetNetForCausalLM', 'RetNetModel'],
+        'fla.models.rodimus': ['RodimusConfig', 'RodimusForCausalLM', 'RodimusModel'],
+        'fla.models.rwkv6': ['RWKV6Config', 'RWKV6ForCausalLM', 'RWKV6Model'],
+        'fla.models.rwkv7': ['RWKV7Config', 'RWKV7ForCausalLM', 'RWKV7Model'],
+        'fla.models.samba': ['SambaConfig', 'SambaForCausalLM', 'SambaModel'],
+        'fla.models.transformer': ['TransformerConfig', 'TransformerForCausalLM', 'TransformerModel'],
+    })
+
+
+# the model types of the FLA models, identical to the names of the subpackages defining them
+MODEL_TYPES = (
+    'abc', 'bitnet', 'comba', 'delta_net', 'deltaformer', 'forgetting_transformer', 'gated_deltanet',
+    'gated_deltaproduct', 'gla', 'gsa', 'hgrn', 'hgrn2', 'kda', 'lightnet', 'linear_attn', 'log_linear_mamba2',
+    'mamba', 'mamba2', 'mesa_net', 'mla', 'mom', 'nsa', 'path_attn', 'retnet', 'rodimus', 'rwkv6', 'rwkv7', 'samba',
+    'transformer',
 )
-from fla.models.gated_deltanet import GatedDeltaNetConfig, GatedDeltaNetForCausalLM, GatedDeltaNetModel
-from fla.models.gated_deltaproduct import GatedDeltaProductConfig, GatedDeltaProductForCausalLM, GatedDeltaProductModel
-from fla.models.gla import GLAConfig, GLAForCausalLM, GLAModel
-from fla.models.gsa import GSAConfig, GSAForCausalLM, GSAModel
-from fla.models.hgrn import HGRNConfig, HGRNForCausalLM, HGRNModel
-from fla.models.hgrn2 import HGRN2Config, HGRN2ForCausalLM, HGRN2Model
-from fla.models.kda import KDAConfig, KDAForCausalLM, KDAModel
-from fla.models.lightnet import LightNetConfig, LightNetForCausalLM, LightNetModel
-from fla.models.linear_attn import LinearAttentionConfig, LinearAttentionForCausalLM, LinearAttentionModel
-from fla.models.log_linear_mamba2 import LogLinearMamba2Config, LogLinearMamba2ForCausalLM, LogLinearMamba2Model
-from fla.models.mamba import MambaConfig, MambaForCausalLM, MambaModel
-from fla.models.mamba2 import Mamba2Config, Mamba2ForCausalLM, Mamba2Model
-from fla.models.mesa_net import MesaNetConfig, MesaNetForCausalLM, MesaNetModel
-from fla.models.mla import MLAConfig, MLAForCausalLM, MLAModel
-from fla.models.mom import MomConfig, MomForCausalLM, MomModel
-from fla.models.nsa import NSAConfig, NSAForCausalLM, NSAModel
-from fla.models.path_attn import PaTHAttentionConfig, PaTHAttentionForCausalLM, PaTHAttentionModel
-from fla.models.retnet import RetNetConfig, RetNetForCausalLM, RetNetModel
-from fla.models.rodimus import RodimusConfig, RodimusForCausalLM, RodimusModel
-from fla.models.rwkv6 import RWKV6Config, RWKV6ForCausalLM, RWKV6Model
-from fla.models.rwkv7 import RWKV7Config, RWKV7ForCausalLM, RWKV7Model
-from fla.models.samba import SambaConfig, SambaForCausalLM, SambaModel
-from fla.models.transformer import TransformerConfig, TransformerForCausalLM, TransformerModel
+
+
+class LazyConfig:
+    """
+    A placeholder of the config class of `model_type` registered to `AutoConfig`, which imports the subpackage
+    defining the model on first use. On import, the subpackage registers its actual config and model classes
+    to the Auto classes in place of the placeholder, so that `import fla` keeps the FLA models loadable
+    by `AutoModelForCausalLM.from_pretrained` without importing any of them beforehand.
+    """
+
+    model_type: str
+
+    @classmethod
+    def load(cls) -> type:
+        importlib.import_module(f'fla.models.{cls.model_type}')
+        return CONFIG_MAPPING[cls.model_type]
+
+    def __new__(cls, *args, **kwargs):
+        return cls.load()(*args, **kwargs)
+
+    @classmethod
+    def from_dict(cls, *args, **kwargs):
+        return cls.load().from_dict(*args, **kwargs)
+
+    @classmethod
+    def from_pretrained(cls, *args, **kwargs):
+        return cls.load().from_pretrained(*args, **kwargs)
+
+
+def register_lazy_configs() -> None:
+    for model_type in MODEL_TYPES:
+        # the subpackages imported already have registered their actual classes
+        if f'fla.models.{model_type}' not in sys.modules:
+            config = type(f'Lazy{model_type}Config', (LazyConfig,), {'model_type': model_type})
+            AutoConfig.register(model_type, config, exist_ok=True)
+
+
+register_lazy_configs()
+
 
 __all__ = [
     'ABCConfig',
@@ -18,6 +18,7 @@ from fla.modules import FusedCrossEntropyLoss, FusedLinearCrossEntropyLoss, RMSN
 from fla.modules.activations import swiglu
 from fla.modules.fused_bitlinear import FusedBitLinear
 from fla.modules.l2warp import l2_warp
+from fla.ops.utils.index import VarlenPlan
 
 if TYPE_CHECKING:
     from transformers.processing_utils import Unpack
@@ -251,6 +252,12 @@ class BitNetModel(BitNetPreTrainedModel):
         # embed positions
         hidden_states = inputs_embeds
 
+        if kwargs.get('varlen_plan') is None:
+            # the metadata of variable-length inputs is prepared once and shared by all layers
+            kwargs['varlen_plan'] = VarlenPlan.from_inputs(
+                attention_mask, kwargs.get('cu_seqlens'), kwargs.get('cu_seqlens_cpu'), seq_len=hidden_states.shape[1],
+            )
+
         all_hidden_states = () if output_hidden_states else None
         all_attns = () if output_attentions else None
         next_cache = None
@@ -13,6 +13,7 @@ class CombaConfig(PretrainedConfig):
         attn_mode: str = "chunk",
         hidden_size: int = 2048,
         conv_size: int = 4,
+        fuse_qkv: bool = False,
         head_dim: int = 256,
         num_heads: int = 6,
         num_v_heads: int | None = None,
@@ -46,6 +47,7 @@ class CombaConfig(PretrainedConfig):
         self.attn_mode = attn_mode
         self.hidden_size = hidden_size
         self.conv_size = conv_size
+        self.fuse_qkv = fuse_qkv
         self.head_dim = head_dim
         self.num_heads = num_heads
         self.num_v_heads = num_v_heads
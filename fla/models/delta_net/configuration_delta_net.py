@@ -18,6 +18,7 @@ class DeltaNetConfig(PretrainedConfig):
         use_gate: bool = False,
         use_short_conv: bool = True,
         conv_size: int = 4,
+        fuse_qkv: bool = False,
         use_beta: bool = True,
         use_output_norm: bool = True,
         num_heads: int = 16,
@@ -51,6 +52,7 @@ class DeltaNetConfig(PretrainedConfig):
         self.use_gate = use_gate
         self.use_short_conv = use_short_conv
         self.conv_size = conv_size
+        self.fuse_qkv = fuse_qkv
         self.use_beta = use_beta
         self.use_output_norm = use_output_norm
         self.num_heads = num_heads
@@ -18,6 +18,7 @@ from fla.models.utils import Cache, FLAGenerationMixin
 from fla.modules import FusedCrossEntropyLoss, FusedLinearCrossEntropyLoss, RMSNorm
 from fla.modules import GatedMLP as DeltaNetMLP
 from fla.modules.l2warp import l2_warp
+from fla.ops.utils.index import VarlenPlan
 
 try:
     from transformers.modeling_layers import GradientCheckpointingLayer
@@ -62,6 +63,7 @@ class DeltaNetBlock(GradientCheckpointingLayer):
                 use_short_conv=config.use_short_conv,
                 use_output_norm=config.use_output_norm,
                 conv_size=config.conv_size,
+                fuse_qkv=config.fuse_qkv,
                 qk_norm=config.qk_norm,
                 qk_activation=config.qk_activation,
                 norm_eps=config.norm_eps,
@@ -218,6 +220,12 @@ class DeltaNetModel(DeltaNetPreTrainedModel):
         if use_cache and not isinstance(past_key_values, Cache):
             past_key_values = Cache.from_legacy_cache(past_key_values)
 
+        if kwargs.get('varlen_plan') is None:
+            # the metadata of variable-length inputs is prepared once and shared by all layers
+            kwargs['varlen_plan'] = VarlenPlan.from_inputs(
+                attention_mask, kwargs.get('cu_seqlens'), kwargs.get('cu_seqlens_cpu'), seq_len=hidden_states.shape[1],
+            )
+
         all_hidden_states = () if output_hidden_states else None
         all_attns = () if output_attentions else None
         for layer in self.layers:
@@ -17,6 +17,7 @@ class GatedDeltaNetConfig(PretrainedConfig):
         use_short_conv: bool = True,
         allow_neg_eigval: bool = False,
         conv_size: int = 4,
+        fuse_qkv: bool = False,
         head_dim: int = 256,
         num_heads: int = 6,
         num_v_heads: int | None = None,
@@ -47,6 +48,7 @@ class GatedDeltaNetConfig(PretrainedConfig):
         self.use_gate = use_gate
         self.use_short_conv = use_short_conv
         self.conv_size = conv_size
+        self.fuse_qkv = fuse_qkv
         self.head_dim = head_dim
         self.num_heads = num_heads
         self.num_v_heads = num_v_heads
@@ -12,6 +12,7 @@ class GatedDeltaProductConfig(PretrainedConfig):
         self,
         attn_mode: str = "chunk",
         conv_size: int = 4,
+        fuse_qkv: bool = False,
         head_dim: int = 256,
         num_heads: int = 6,
         hidden_size: int = 2048,
@@ -44,6 +45,7 @@ class GatedDeltaProductConfig(PretrainedConfig):
     ):
         self.attn_mode = attn_mode
         self.conv_size = conv_size
+        self.fuse_qkv = fuse_qkv
         self.head_dim = head_dim
         self.num_heads = num_heads
         self.hidden_size = hidden_size
@@ -24,6 +24,7 @@ class MLAConfig(PretrainedConfig):
         rope_theta: float | None = 10000.,
         max_position_embeddings: int = 2048,
         rope_scaling: dict | None = None,
+        latent_cache: bool = False,
         hidden_ratio: int | None = 4,
         intermediate_size: int | None = None,
         hidden_act: str = "swish",
@@ -55,6 +56,7 @@ class MLAConfig(PretrainedConfig):
         self.qk_nope_head_dim = qk_nope_head_dim
         self.qk_head_dim = qk_head_dim
         self.rope_scaling = rope_scaling
+        self.latent_cache = latent_cache
 
         self.window_size = window_size
         self.rope_theta = rope_theta
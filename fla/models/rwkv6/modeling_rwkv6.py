@@ -62,6 +62,11 @@ class RWKV6FeedForward(nn.Module):
 
         self.layer_idx = layer_idx
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """Returns the shapes of the states cached for `batch_size` sequences of `seq_len` tokens."""
+        # the token shift caches the last token
+        return {'ffn_state': [(batch_size, self.hidden_size)]}
+
     def forward(
         self,
         x: torch.Tensor,
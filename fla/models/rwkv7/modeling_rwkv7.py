@@ -88,6 +88,11 @@ class RWKV7FeedForward(nn.Module):
             module.key.weight.data = nn.init.orthogonal_(module.key.weight.data.to(torch.float32)).to(original_dtype)
             module.value.weight.data.zero_()
 
+    def state_shapes(self, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+        """Returns the shapes of the states cached for `batch_size` sequences of `seq_len` tokens."""
+        # the token shift caches the last token
+        return {'ffn_state': [(batch_size, self.hidden_size)]}
+
     def forward(
         self,
         x: torch.Tensor,
@@ -1,15 +1,23 @@
 from __future__ import annotations
 
+import functools
+import hashlib
 import inspect
+import math
+from collections import OrderedDict
+from collections.abc import Callable
 from typing import Any
 
 import torch
+import torch.nn as nn
 import transformers
 from packaging import version
 from transformers.cache_utils import Cache as HFCacheBase
-from transformers.generation import GenerationMixin
+from transformers.generation import GenerationConfig, GenerationMixin
 from transformers.utils.deprecation import deprecate_kwarg
 
+from fla.modules.sampling import FusedSampler
+
 _TF_VERSION = transformers.__version__
 _NEED_NEW = "4.53.3"
 _IS_TRANSFORMERS_4_56_PLUS = version.parse(_TF_VERSION) >= version.parse("4.56.0")
@@ -20,6 +28,526 @@ else:
     CacheLayerMixin = object
 
 
+def map_states(
+    state: dict[str, Any] | None,
+    fn: Callable[[torch.Tensor], torch.Tensor],
+    window: SlidingWindowBuffer | None = None,
+) -> dict[str, Any] | None:
+    """
+    Applies `fn` to every tensor of the (batch-first) states of a layer, keeping the tuple/list structures.
+    If the attention states are the views of `window`, `fn` is applied to its whole ring buffers instead.
+    """
+    if state is None:
+        return None
+    ring = window is not None and window.views is not None and state.get("attn_state") is window.views
+    if ring:
+        window.map(fn)
+    for key, value in state.items():
+        if ring and key == "attn_state":
+            state[key] = window.views
+        elif isinstance(value, torch.Tensor):
+            state[key] = fn(value)
+        elif isinstance(value, (tuple, list)):
+            state[key] = type(value)(fn(x) if isinstance(x, torch.Tensor) else x for x in value)
+    return state
+
+
+def iter_tensors(state: dict[str, Any] | None):
+    """
+    Iterates over all tensors of the states of a layer.
+    """
+    if state is None:
+        return
+    for value in state.values():
+        if isinstance(value, torch.Tensor):
+            yield value
+        elif isinstance(value, (tuple, list)):
+            yield from (x for x in value if isinstance(x, torch.Tensor))
+
+
+def crop_states(state: dict[str, Any] | None, num_tokens: int) -> dict[str, Any] | None:
+    """
+    Drops the last `num_tokens` tokens of the attention states of a layer.
+    Recurrent/conv/ffn states summarize the whole prefix and can not be cropped.
+    """
+    if state is None or num_tokens <= 0:
+        return state
+    for key in ("recurrent_state", "conv_state", "ffn_state"):
+        if state.get(key) is not None:
+            raise ValueError(
+                f"Unable to crop `{key}` by {num_tokens} tokens, "
+                "as the constant-size states of linear attention layers can not be rolled back.",
+            )
+    if state.get("attn_state") is not None:
+        state["attn_state"] = type(state["attn_state"])(
+            x[:, :max(x.shape[1] - num_tokens, 0)] for x in state["attn_state"]
+        )
+    return state
+
+
+class StateHistory:
+    """
+    The recurrent/conv states of a layer after each of its most recent tokens,
+    kept for rolling the layer back to any of them, e.g., for dropping rejected draft tokens in speculative decoding.
+
+    The chunks emitted by each update are stored as is:
+    the recurrent states after each token of shape `[B, T, ...]`,
+    and the conv windows of shape `[B, D, W+T]`, i.e., the previous conv state followed by the `T` new inputs,
+    whose slice `[..., t:t+W]` is the conv state after the first `t` tokens.
+
+    Args:
+        recurrent_state (`Optional[torch.Tensor]`):
+            The recurrent state before the first tracked token, `None` for the initial zero state.
+    """
+
+    def __init__(self, recurrent_state: torch.Tensor | None = None):
+        self.recurrent_state = recurrent_state
+        self.conv_state = None
+        self.chunks: list[tuple[int, torch.Tensor | None, tuple[torch.Tensor, ...] | None]] = []
+        self.num_tokens = 0
+
+    def append(
+        self,
+        num_tokens: int,
+        recurrent_states: torch.Tensor | None = None,
+        conv_windows: tuple[torch.Tensor, ...] | None = None,
+    ):
+        """Tracks the states after each of the `num_tokens` new tokens."""
+        if not self.chunks and conv_windows is not None:
+            self.conv_state = tuple(x[..., :x.shape[-1] - num_tokens] for x in conv_windows)
+        self.chunks.append((num_tokens, recurrent_states, None if conv_windows is None else tuple(conv_windows)))
+        self.num_tokens += num_tokens
+
+    def trim(self, max_tokens: int):
+        """Forgets the oldest chunks as long as at least `max_tokens` tokens remain tracked."""
+        while len(self.chunks) > 1 and self.num_tokens - self.chunks[0][0] >= max_tokens:
+            T, recurrent_states, conv_windows = self.chunks.pop(0)
+            self.recurrent_state = None if recurrent_states is None else recurrent_states[:, -1]
+            self.conv_state = None if conv_windows is None else tuple(x[..., T:] for x in conv_windows)
+            self.num_tokens -= T
+
+    def get(self, num_tokens: int) -> tuple[torch.Tensor | None, tuple[torch.Tensor, ...] | None]:
+        """Returns the recurrent/conv states after the first `num_tokens` tracked tokens."""
+        if not 0 <= num_tokens <= self.num_tokens:
+            raise ValueError(f"Only {self.num_tokens} tokens are tracked, got {num_tokens}")
+        if num_tokens == 0:
+            return self.recurrent_state, self.conv_state
+        for T, recurrent_states, conv_windows in self.chunks:
+            if num_tokens <= T:
+                recurrent_state = None if recurrent_states is None else recurrent_states[:, num_tokens - 1]
+                conv_state = None
+                if conv_windows is not None:
+                    conv_state = tuple(x[..., num_tokens:x.shape[-1] - T + num_tokens] for x in conv_windows)
+                return recurrent_state, conv_state
+            num_tokens -= T
+
+    def truncate(self, num_tokens: int):
+        """Forgets the tokens after the first `num_tokens` tracked tokens."""
+        chunks, remaining = [], num_tokens
+        for T, recurrent_states, conv_windows in self.chunks:
+            if remaining <= 0:
+                break
+            if remaining < T:
+                if recurrent_states is not None:
+                    recurrent_states = recurrent_states[:, :remaining]
+                if conv_windows is not None:
+                    conv_windows = tuple(x[..., :x.shape[-1] - T + remaining] for x in conv_windows)
+                T = remaining
+            chunks.append((T, recurrent_states, conv_windows))
+            remaining -= T
+        self.chunks = chunks
+        self.num_tokens = min(self.num_tokens, num_tokens)
+
+    def tensors(self):
+        """Iterates over all tensors held by the history."""
+        if self.recurrent_state is not None:
+            yield self.recurrent_state
+        yield from self.conv_state or ()
+        for _, recurrent_states, conv_windows in self.chunks:
+            if recurrent_states is not None:
+                yield recurrent_states
+            yield from conv_windows or ()
+
+
+def can_rollback_states(state: dict[str, Any] | None, history: StateHistory | None, num_tokens: int) -> bool:
+    """Whether the last `num_tokens` tokens can be dropped from the states of a layer, see :func:`rollback_states`."""
+    if state is None or num_tokens <= 0:
+        return True
+    if state.get("ffn_state") is not None:
+        return False
+    if state.get("recurrent_state") is None and state.get("conv_state") is None:
+        return True
+    return history is not None and history.num_tokens >= num_tokens
+
+
+def rollback_states(
+    state: dict[str, Any] | None,
+    history: StateHistory | None,
+    num_tokens: int,
+) -> dict[str, Any] | None:
+    """
+    Drops the last `num_tokens` tokens of the states of a layer.
+    Attention states are cropped, while recurrent/conv states are restored from the per-token `history`.
+    """
+    if state is None or num_tokens <= 0:
+        return state
+    if not can_rollback_states(state, history, num_tokens):
+        raise ValueError(
+            f"Unable to roll the constant-size states of linear attention layers back by {num_tokens} tokens, "
+            "as they are not tracked in the state history. Consider setting `history_size` of the cache.",
+        )
+    if state.get("recurrent_state") is not None or state.get("conv_state") is not None:
+        num_kept = history.num_tokens - num_tokens
+        recurrent_state, conv_state = history.get(num_kept)
+        history.truncate(num_kept)
+        if state.get("recurrent_state") is not None:
+            state["recurrent_state"] = None if recurrent_state is None else recurrent_state.contiguous()
+        if state.get("conv_state") is not None and conv_state is not None:
+            # cloned as conv states are updated inplace when decoding
+            state["conv_state"] = tuple(x.clone() for x in conv_state)
+    attn_state = crop_states({"attn_state": state.get("attn_state")}, num_tokens)["attn_state"]
+    state["attn_state"] = attn_state
+    return state
+
+
+def track_history(
+    history: StateHistory | None,
+    recurrent_state: torch.Tensor | None,
+    offset: int,
+    cache_kwargs: dict[str, Any],
+    history_size: int = 0,
+) -> StateHistory | None:
+    """
+    Appends the per-token states passed by layers as `recurrent_history`/`conv_history` in `cache_kwargs` to `history`,
+    given the `recurrent_state` before the update. The history is dropped by updates not passing them.
+    """
+    recurrent_history = cache_kwargs.get("recurrent_history")
+    conv_history = cache_kwargs.get("conv_history")
+    if history_size <= 0 or (recurrent_history is None and conv_history is None):
+        return None
+    if history is None:
+        history = StateHistory(recurrent_state)
+    history.append(offset, recurrent_history, conv_history)
+    history.trim(history_size)
+    return history
+
+
+STATE_KEYS = ("recurrent_state", "attn_state", "conv_state", "ffn_state")
+# the state types reported by `memory_footprint`, including the per-token states kept for rollback
+FOOTPRINT_KEYS = STATE_KEYS + ("history",)
+
+
+def iter_layer_tensors(
+    state: dict[str, Any] | None,
+    window: SlidingWindowBuffer | None = None,
+    history: StateHistory | None = None,
+):
+    """
+    Iterates over all tensors held by a layer as `(state_type, tensor)` pairs,
+    including the whole ring buffers of the sliding `window` and the tensors of the state `history`.
+    """
+    for key in STATE_KEYS:
+        yield from ((key, x) for x in iter_tensors({key: state.get(key)} if state is not None else None))
+    if window is not None and window.buffers is not None:
+        yield from (("attn_state", x) for x in window.buffers)
+    if history is not None:
+        yield from (("history", x) for x in history.tensors())
+
+
+def summarize_footprint(layers) -> dict[str, Any]:
+    """
+    Sums up the bytes held by each layer, given as an iterable of `(state_type, tensor)` pairs per layer.
+
+    The whole storage of each tensor is counted, and only once across all layers, so that the views of
+    a sliding window buffer or of a preallocated slab account for the memory actually allocated.
+
+    Returns:
+        A dict with the bytes of all states in `total`, the bytes per state type in `states`,
+        the bytes per device in `devices`, and the breakdown of each layer, including its `total`, in `layers`.
+    """
+    footprint = {'total': 0, 'states': dict.fromkeys(FOOTPRINT_KEYS, 0), 'devices': {}, 'layers': []}
+    seen = set()
+    for tensors in layers:
+        layer = dict.fromkeys(FOOTPRINT_KEYS, 0)
+        for key, x in tensors:
+            storage = x.untyped_storage()
+            if (x.device, storage.data_ptr()) in seen:
+                continue
+            seen.add((x.device, storage.data_ptr()))
+            layer[key] += storage.nbytes()
+            footprint['devices'][str(x.device)] = footprint['devices'].get(str(x.device), 0) + storage.nbytes()
+        for key in FOOTPRINT_KEYS:
+            footprint['states'][key] += layer[key]
+        layer['total'] = sum(layer.values())
+        footprint['total'] += layer['total']
+        footprint['layers'].append(layer)
+    return footprint
+
+
+def layer_state_shapes(layer: nn.Module, batch_size: int, seq_len: int) -> dict[str, list[tuple[int, ...]]]:
+    """
+    Returns the shapes of the states cached by `layer` for `batch_size` sequences of `seq_len` tokens,
+    as declared by its `state_shapes` method, with an entry for each of the state types.
+    """
+    if not hasattr(layer, "state_shapes"):
+        raise NotImplementedError(
+            f"`{type(layer).__name__}` does not declare the shapes of its cached states by `state_shapes`, "
+            f"so the memory taken by its states can not be estimated"
+        )
+    shapes = {key: [] for key in STATE_KEYS}
+    for key, value in layer.state_shapes(batch_size, seq_len).items():
+        if key not in shapes:
+            raise ValueError(f"Unknown state `{key}` of `{type(layer).__name__}`, expected one of {list(STATE_KEYS)}")
+        shapes[key] += list(value)
+    return shapes
+
+
+def get_declared_modules(module: nn.Module) -> list[nn.Module]:
+    """Returns the outermost submodules of `module`, including itself, declaring their cached states."""
+    if hasattr(module, "state_shapes"):
+        return [module]
+    return [m for child in module.children() for m in get_declared_modules(child)]
+
+
+def estimate_cache_bytes(
+    config: transformers.PretrainedConfig,
+    batch_size: int = 1,
+    seq_len: int = 2048,
+    dtype: torch.dtype = torch.bfloat16,
+    state_dtype: torch.dtype = torch.float32,
+) -> dict[str, Any]:
+    """
+    Estimates the memory taken by the cache of a model for `batch_size` sequences of `seq_len` tokens,
+    e.g., for admission control when serving, without allocating any tensors.
+
+    The model is built from `config` on the meta device, and the states of each layer are those declared by
+    the `state_shapes` of its modules, see :func:`layer_state_shapes`, which raises for layers declaring none.
+    Recurrent states are assumed to be kept in `state_dtype`, as returned by the kernels,
+    and attention/conv/ffn states in `dtype`.
+    The states tracked for rollback and the padding of preallocated caches are not included.
+
+    Returns:
+        The same breakdown as :meth:`FLACache.memory_footprint`, without `devices`.
+    """
+    from transformers import AutoModel
+
+    with torch.device("meta"):
+        model = AutoModel.from_config(config)
+    # the innermost modules with a `layer_idx` own the states, e.g., the attention of each block
+    owners = [
+        module for module in model.modules()
+        if getattr(module, "layer_idx", None) is not None
+        and not any(getattr(m, "layer_idx", None) is not None for m in module.modules() if m is not module)
+    ]
+    footprint = {'total': 0, 'states': dict.fromkeys(FOOTPRINT_KEYS, 0), 'layers': []}
+    for layer_idx in sorted({module.layer_idx for module in owners}):
+        layer = dict.fromkeys(FOOTPRINT_KEYS, 0)
+        for module in owners:
+            if module.layer_idx != layer_idx:
+                continue
+            # the states are declared by the owner itself or by its submodules, e.g., the token mixer of a block
+            for m in get_declared_modules(module) or [module]:
+                for key, shapes in layer_state_shapes(m, batch_size, seq_len).items():
+                    itemsize = (state_dtype if key == "recurrent_state" else dtype).itemsize
+                    layer[key] += sum(math.prod(shape) for shape in shapes) * itemsize
+        for key in FOOTPRINT_KEYS:
+            footprint['states'][key] += layer[key]
+        layer['total'] = sum(layer.values())
+        footprint['total'] += layer['total']
+        footprint['layers'].append(layer)
+    return footprint
+
+
+# the version of the on-disk format of the caches, bumped on incompatible changes
+CACHE_FORMAT_VERSION = 1
+QUANTIZED_DTYPES = {'int8': torch.int8, 'fp8': getattr(torch, 'float8_e4m3fn', None)}
+
+
+def quantize_state(x: torch.Tensor, quantization: str) -> dict[str, Any]:
+    """Quantizes `x` to `int8` or `fp8` (`float8_e4m3fn`) with an absmax scale per vector along the last dim."""
+    dtype = QUANTIZED_DTYPES.get(quantization)
+    if dtype is None:
+        raise ValueError(f"Unsupported quantization `{quantization}`, expected one of {list(QUANTIZED_DTYPES)}")
+    qmax = 127. if dtype == torch.int8 else torch.finfo(dtype).max
+    scale = x.float().abs().amax(-1, keepdim=True).clamp_min(1e-12) / qmax
+    data = x.float() / scale
+    data = data.round().clamp(-qmax, qmax).to(dtype) if dtype == torch.int8 else data.to(dtype)
+    return {'data': data, 'scale': scale, 'dtype': str(x.dtype).removeprefix('torch.')}
+
+
+def dequantize_state(packed: dict[str, Any], device: torch.device | str | None = None) -> torch.Tensor:
+    """Restores the tensor quantized by :func:`quantize_state` in its original dtype."""
+    data, scale = packed['data'], packed['scale']
+    if device is not None:
+        data, scale = data.to(device), scale.to(device)
+    return (data.float() * scale).to(getattr(torch, packed['dtype']))
+
+
+def save_cache(cache: HFCacheBase, path: str, quantization: str | None = None):
+    """
+    Saves the states of `cache` to `path` along with the number of seen tokens,
+    optionally quantizing floating-point states to `int8` or `fp8` with per-vector scales.
+    """
+    def pack(value):
+        if isinstance(value, torch.Tensor):
+            x = value.detach().cpu().contiguous()
+            return quantize_state(x, quantization) if quantization is not None and x.is_floating_point() else x
+        if isinstance(value, (tuple, list)):
+            return [pack(x) for x in value]
+        return value
+
+    states = []
+    for layer_idx, state in enumerate(cache):
+        state = dict(state or {})
+        # keep the sliding window states in temporal order
+        start = cache.get_window_offset(layer_idx)
+        if start != 0:
+            state['attn_state'] = tuple(x.roll(-start, dims=1) for x in state['attn_state'])
+        states.append({key: pack(value) for key, value in state.items()})
+    torch.save({
+        'version': CACHE_FORMAT_VERSION,
+        'seen_tokens': int(cache.get_seq_length()),
+        'quantization': quantization,
+        'states': states,
+    }, path)
+
+
+def load_cache(
+    cache: HFCacheBase,
+    path: str,
+    mmap: bool = True,
+    device: torch.device | str | None = None,
+) -> HFCacheBase:
+    """
+    Loads the states saved by :func:`save_cache` into the empty `cache`.
+    With `mmap=True`, the tensors are memory-mapped rather than read into memory,
+    so that unquantized states are loaded zero-copy unless moved to another `device`.
+    """
+    checkpoint = torch.load(path, map_location='cpu', mmap=mmap, weights_only=True)
+    if checkpoint.get('version') != CACHE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported cache format version {checkpoint.get('version')}, expected {CACHE_FORMAT_VERSION}")
+
+    def unpack(value):
+        if isinstance(value, torch.Tensor):
+            return value if device is None else value.to(device)
+        if isinstance(value, dict):
+            return dequantize_state(value, device)
+        if isinstance(value, list):
+            return tuple(unpack(x) for x in value)
+        return value
+
+    for layer_idx, state in enumerate(checkpoint['states']):
+        state = {key: unpack(value) for key, value in state.items()}
+        cache.update(**state, layer_idx=layer_idx, offset=checkpoint['seen_tokens'] if layer_idx == 0 else 0)
+    return cache
+
+
+class SlidingWindowBuffer:
+    """
+    A preallocated circular buffer holding the attention states of the last `window_size` tokens.
+
+    New tokens are written in place at the write pointer `offset`, wrapping around the end of the buffer,
+    so that decoding never rolls or concatenates the whole window.
+    Once the buffer is full, the oldest token lives at slot `offset` rather than slot 0,
+    which is exposed by :attr:`start` for readers that do not rely on the temporal order of the keys.
+
+    Args:
+        window_size (`int`):
+            The number of tokens to keep.
+    """
+
+    def __init__(self, window_size: int):
+        self.window_size = window_size
+        self.buffers = None
+        # the slot to write the next token to
+        self.offset = 0
+        # the number of valid tokens, shared by all sequences as their paddings are masked out by the readers
+        self.length = 0
+        self.views = None
+
+    @property
+    def start(self) -> int:
+        """The slot of the oldest token."""
+        return self.offset if self.length == self.window_size else 0
+
+    def _refresh(self):
+        if self.length < self.window_size:
+            self.views = tuple(x[:, :self.length] for x in self.buffers)
+        else:
+            self.views = tuple(self.buffers)
+
+    def update(self, states: tuple[torch.Tensor, ...] | list[torch.Tensor]) -> tuple[torch.Tensor, ...]:
+        """Writes the `[B, T, ...]` states of the new tokens, returning the valid part of the buffers in slot order."""
+        W, T = self.window_size, states[0].shape[1]
+        if self.buffers is None or self.buffers[0].shape[0] != states[0].shape[0]:
+            self.buffers = tuple(x.new_zeros(x.shape[0], W, *x.shape[2:]) for x in states)
+            self.offset, self.length = 0, 0
+        if T >= W:
+            for buffer, x in zip(self.buffers, states, strict=False):
+                buffer.copy_(x[:, -W:])
+            self.offset, self.length = 0, W
+        else:
+            end = self.offset + T
+            for buffer, x in zip(self.buffers, states, strict=False):
+                if end <= W:
+                    buffer[:, self.offset:end].copy_(x)
+                else:
+                    # wrap around the end of the buffer
+                    buffer[:, self.offset:].copy_(x[:, :W - self.offset])
+                    buffer[:, :end - W].copy_(x[:, W - self.offset:])
+            self.offset = end % W
+            self.length = min(self.length + T, W)
+        self._refresh()
+        return self.views
+
+    def reset(self):
+        """Empties the buffer in place, keeping the allocated buffers and thus their addresses."""
+        self.offset, self.length = 0, 0
+        if self.buffers is not None:
+            self._refresh()
+
+    def linearize(self) -> tuple[torch.Tensor, ...]:
+        """Rotates the buffers so that the tokens are stored in temporal order starting from slot 0."""
+        if self.buffers is not None and self.start != 0:
+            self.buffers = tuple(x.roll(-self.start, dims=1) for x in self.buffers)
+            self.offset = 0
+            self._refresh()
+        return self.views
+
+    def map(self, fn: Callable[[torch.Tensor], torch.Tensor]):
+        """Applies `fn` to the whole (batch-first) buffers, e.g., for reordering or offloading."""
+        if self.buffers is not None:
+            self.buffers = tuple(fn(x) for x in self.buffers)
+            self._refresh()
+
+
+def update_window(
+    window: SlidingWindowBuffer | None,
+    cached: tuple[torch.Tensor, ...] | None,
+    attn_state: tuple[torch.Tensor, ...],
+    window_size: int,
+    ring_buffer: bool = False,
+) -> SlidingWindowBuffer:
+    """
+    Appends `attn_state` to the sliding window buffer of a layer, whose current states are `cached`.
+
+    The buffer is (re)built from `cached` in temporal order if `cached` has been set elsewhere,
+    e.g., restored from a legacy cache or a snapshot, while an empty buffer is reused for empty states.
+    Unless `ring_buffer` is set, the buffer is linearized afterwards for readers relying on the token order.
+    """
+    if (
+        window is None or window.window_size != window_size
+        or (cached is not window.views if cached is not None else window.length > 0)
+    ):
+        window = SlidingWindowBuffer(window_size)
+        if cached is not None:
+            window.update(cached)
+    window.update(attn_state)
+    if not ring_buffer:
+        window.linearize()
+    return window
+
+
 class FLALayer(CacheLayerMixin):
     is_compileable = True
     is_sliding = False
@@ -27,9 +555,13 @@ class FLALayer(CacheLayerMixin):
     def __init__(self):
         super().__init__()
         self.state = None
+        self.window = None
+        self.history = None
 
     def lazy_initialization(self, key_states: torch.Tensor):
         self.state = None
+        self.window = None
+        self.history = None
 
     def update(
         self,
@@ -39,6 +571,8 @@ class FLALayer(CacheLayerMixin):
         conv_state: Any | None = None,
         ffn_state: Any | None = None,
         cache_kwargs: dict[str, Any] | None = None,
+        offset: int = 1,
+        history_size: int = 0,
         **_: Any,
     ) -> dict[str, Any]:
         if cache_kwargs is None:
@@ -56,29 +590,27 @@ class FLALayer(CacheLayerMixin):
                 "ffn_state": None,
             }
 
+        self.history = track_history(self.history, self.state["recurrent_state"], offset, cache_kwargs, history_size)
         if recurrent_state is not None:
             self.state["recurrent_state"] = recurrent_state
 
         if attn_state is not None:
-            input_size = attn_state[0].shape[1]
-            if self.state["attn_state"] is None:
-                if window_size is not None and input_size > window_size:
-                    attn_state = tuple(x[:, -window_size:].contiguous() for x in attn_state)
+            if window_size is not None:
+                self.window = update_window(
+                    self.window,
+                    self.state["attn_state"],
+                    attn_state,
+                    window_size,
+                    cache_kwargs.get("ring_buffer", False),
+                )
+                self.state["attn_state"] = self.window.views
+            elif self.state["attn_state"] is None:
                 self.state["attn_state"] = tuple(attn_state)
             else:
                 old = self.state["attn_state"]
-                if window_size is not None and old[0].shape[1] >= window_size:
-                    new_tuple = []
-                    for old_x, new_x in zip(old, attn_state, strict=False):
-                        rolled = old_x.roll(-input_size, dims=1)
-                        tail = new_x[:, -window_size:]
-                        rolled[:, -tail.shape[1]:] = tail
-                        new_tuple.append(rolled)
-                    self.state["attn_state"] = tuple(new_tuple)
-                else:
-                    self.state["attn_state"] = tuple(
-                        torch.cat([old_x, new_x], dim=1) for old_x, new_x in zip(old, attn_state, strict=False)
-                    )
+                self.state["attn_state"] = tuple(
+                    torch.cat([old_x, new_x], dim=1) for old_x, new_x in zip(old, attn_state, strict=False)
+                )
 
         if conv_state is not None:
             self.state["conv_state"] = conv_state
@@ -94,6 +626,10 @@ class FLALayer(CacheLayerMixin):
 
         return self.state
 
+    def tensors(self):
+        """Iterates over all tensors held by the layer as `(state_type, tensor)` pairs."""
+        yield from iter_layer_tensors(self.state, self.window, self.history)
+
     def get_seq_length(self, cache_position=None) -> int:
         # we do not store seen_tokens here
         return 0
@@ -105,37 +641,452 @@ class FLALayer(CacheLayerMixin):
         return 0, 0
 
     def offload(self):
+        map_states(self.state, lambda x: x.to("cpu", non_blocking=True), self.window)
+
+    def prefetch(self):
+        map_states(self.state, lambda x: x.to(self.device, non_blocking=True), self.window)
+
+    @property
+    def is_croppable(self) -> bool:
+        return self.state is None or all(self.state.get(key) is None for key in ("recurrent_state", "conv_state", "ffn_state"))
+
+    def can_crop(self, num_tokens: int) -> bool:
+        """Whether the last `num_tokens` tokens can be dropped, either as attention states or through the state history."""
+        return self.is_croppable or can_rollback_states(self.state, self.history, num_tokens)
+
+    def reorder_cache(self, beam_idx: torch.LongTensor):
+        """Reorders the states along the batch dimension for beam search."""
+        map_states(self.state, lambda x: x.index_select(0, beam_idx.to(x.device)), self.window)
+        self.history = None
+
+    def batch_select_indices(self, indices: torch.Tensor):
+        """Keeps the states of the sequences in `indices` only."""
+        map_states(self.state, lambda x: x[indices], self.window)
+        self.history = None
+
+    def batch_repeat_interleave(self, repeats: int):
+        """Repeats the states of each sequence `repeats` times."""
+        map_states(self.state, lambda x: x.repeat_interleave(repeats, dim=0), self.window)
+        self.history = None
+
+    def get_window_offset(self) -> int:
+        """Returns the slot of the oldest token in the sliding window buffer, 0 if stored in temporal order."""
+        if self.window is None or self.state is None or self.state.get("attn_state") is not self.window.views:
+            return 0
+        return self.window.start
+
+    def crop(self, max_length: int, seen_tokens: int | None = None):
+        """Crops the cached tokens to the first `max_length` ones, `seen_tokens` defaults to the length of `attn_state`."""
         if self.state is None:
             return
+        if self.get_window_offset() != 0:
+            self.state["attn_state"] = self.window.linearize()
+        if seen_tokens is None:
+            attn_state = self.state.get("attn_state")
+            seen_tokens = attn_state[0].shape[1] if attn_state is not None else max_length
+        if self.is_croppable:
+            crop_states(self.state, seen_tokens - max_length)
+        else:
+            rollback_states(self.state, self.history, seen_tokens - max_length)
 
-        def to_cpu(x):
-            return x.to("cpu", non_blocking=True) if isinstance(x, torch.Tensor) else x
-        for k in ("recurrent_state", "attn_state", "conv_state", "ffn_state"):
-            v = self.state.get(k, None)
-            if v is None:
+    def reset(self):
+        pass
+
+
+class SlotTable:
+    """
+    Bookkeeping of the slots of a state pool, shared by a :class:`PagedFLACache` and all of its layers.
+
+    Args:
+        max_slots (`int`):
+            The number of rows of each preallocated state slab.
+    """
+
+    def __init__(self, max_slots: int):
+        self.max_slots = max_slots
+        self.free_slots = list(range(max_slots))
+        self.seen_tokens = [0] * max_slots
+        self.slots: list[int] = []
+        # `(start, end)` if the running batch occupies consecutive slots, so that its states are views of the slabs
+        self.span: tuple[int, int] | None = (0, 0)
+        self._indices: dict[torch.device, torch.Tensor] = {}
+
+    def bind(self, slots: list[int]):
+        self.slots = list(slots)
+        start = self.slots[0] if len(self.slots) > 0 else 0
+        if self.slots == list(range(start, start + len(self.slots))):
+            self.span = (start, start + len(self.slots))
+        else:
+            self.span = None
+        self._indices = {}
+
+    def indices(self, device: torch.device) -> torch.LongTensor:
+        if device not in self._indices:
+            self._indices[device] = torch.tensor(self.slots, dtype=torch.long, device=device)
+        return self._indices[device]
+
+
+class PagedFLALayer(FLALayer):
+    """
+    A cache layer whose states live in preallocated slabs of `max_slots` rows.
+
+    Recurrent/conv/ffn states are stored as slabs of shape `[max_slots, ...]`, e.g., `[max_slots, H, K, V]`,
+    and attention states as slabs of shape `[max_slots, max_cache_len, D]` along with the valid length of each slot.
+    The sequences of the running batch are mapped to the rows through the :class:`SlotTable` of the owning cache.
+    """
+
+    def __init__(self, table: SlotTable, max_cache_len: int | None = None):
+        self.table = table
+        self.max_len = max_cache_len
+        self.slabs = dict.fromkeys(("recurrent_state", "attn_state", "conv_state", "ffn_state"))
+        self.attn_lens = [0] * table.max_slots
+        super().__init__()
+
+    @property
+    def state(self) -> dict[str, Any] | None:
+        if all(slab is None for slab in self.slabs.values()):
+            return None
+        return {key: self._read(key) for key in self.slabs}
+
+    @state.setter
+    def state(self, state: dict[str, Any] | None):
+        if state is not None:
+            self.update(**state)
+
+    def _read(self, key: str) -> torch.Tensor | tuple[torch.Tensor, ...] | None:
+        slab = self.slabs[key]
+        if slab is None:
+            return None
+        if isinstance(slab, tuple):
+            return tuple(self._gather(x, key) if x is not None else None for x in slab)
+        return self._gather(slab, key)
+
+    def _gather(self, slab: torch.Tensor, key: str) -> torch.Tensor:
+        if key == "attn_state":
+            slab = slab[:, :max((self.attn_lens[i] for i in self.table.slots), default=0)]
+        if self.table.span is not None:
+            return slab[self.table.span[0]:self.table.span[1]]
+        return slab.index_select(0, self.table.indices(slab.device))
+
+    def _scatter(self, slab: torch.Tensor | None, value: torch.Tensor) -> torch.Tensor:
+        if value.shape[0] != len(self.table.slots):
+            raise ValueError(f"Expected states of {len(self.table.slots)} bound slots, got a batch of {value.shape[0]}")
+        if slab is None:
+            slab = value.new_zeros(self.table.max_slots, *value.shape[1:])
+        if self.table.span is not None:
+            rows = slab[self.table.span[0]:self.table.span[1]]
+            # states updated inplace by the kernels, e.g., the conv cache during decoding, already live in the slab
+            if value.data_ptr() != rows.data_ptr():
+                rows.copy_(value)
+        else:
+            slab.index_copy_(0, self.table.indices(slab.device), value.to(slab.dtype))
+        return slab
+
+    def _append(self, attn_state: tuple[torch.Tensor, ...], window_size: int | None = None):
+        slots = self.table.slots
+        N, T = attn_state[0].shape[:2]
+        if N != len(slots):
+            raise ValueError(f"Expected states of {len(slots)} bound slots, got a batch of {N}")
+        slabs = self.slabs["attn_state"] or (None,) * len(attn_state)
+        if slabs[0] is not None:
+            capacity = slabs[0].shape[1]
+        else:
+            capacity = window_size if window_size is not None else self.max_len
+        if capacity is None:
+            raise ValueError("`max_cache_len` is required to cache attention states without a sliding window")
+        slabs = tuple(
+            slab if slab is not None else x.new_zeros(self.table.max_slots, capacity, *x.shape[2:])
+            for slab, x in zip(slabs, attn_state, strict=False)
+        )
+        self.slabs["attn_state"] = slabs
+
+        lens = [self.attn_lens[i] for i in slots]
+        if len(set(lens)) == 1 and lens[0] + T <= capacity:
+            # all sequences are aligned, write the new tokens of the whole batch at once
+            start = lens[0]
+            for slab, x in zip(slabs, attn_state, strict=False):
+                if self.table.span is not None:
+                    slab[self.table.span[0]:self.table.span[1], start:start+T].copy_(x)
+                else:
+                    slab[self.table.indices(slab.device), start:start+T] = x.to(slab.dtype)
+            for i in slots:
+                self.attn_lens[i] = start + T
+            return
+        for i, (slot, start) in enumerate(zip(slots, lens, strict=False)):
+            if start + T > capacity and window_size is None:
+                raise ValueError(f"Slot {slot} exceeds `max_cache_len={capacity}` with {start + T} tokens")
+            for slab, x in zip(slabs, attn_state, strict=False):
+                if start + T > capacity:
+                    # keep the last `window_size` tokens only
+                    tokens = torch.cat((slab[slot, :start], x[i].to(slab.dtype)))[-capacity:]
+                    slab[slot, :tokens.shape[0]] = tokens
+                else:
+                    slab[slot, start:start+T] = x[i]
+            self.attn_lens[slot] = min(start + T, capacity)
+
+    def update(
+        self,
+        *,
+        recurrent_state: torch.Tensor | tuple[torch.Tensor, ...] | None = None,
+        attn_state: tuple[torch.Tensor, ...] | None = None,
+        conv_state: Any | None = None,
+        ffn_state: Any | None = None,
+        cache_kwargs: dict[str, Any] | None = None,
+        **_: Any,
+    ) -> dict[str, Any]:
+        if cache_kwargs is None:
+            cache_kwargs = {}
+        if attn_state is not None and not isinstance(attn_state, (tuple, list)):
+            raise ValueError("`attn_state` must be a tuple/list of tensors")
+
+        updated = {}
+        for key, value in (("recurrent_state", recurrent_state), ("conv_state", conv_state), ("ffn_state", ffn_state)):
+            if value is None:
                 continue
-            if isinstance(v, (tuple, list)):
-                self.state[k] = tuple(to_cpu(t) for t in v)
+            if isinstance(value, torch.Tensor):
+                self.slabs[key] = self._scatter(self.slabs[key], value)
             else:
-                self.state[k] = to_cpu(v)
+                slabs = self.slabs[key] or (None,) * len(value)
+                self.slabs[key] = tuple(
+                    slab if x is None else self._scatter(slab, x)
+                    for slab, x in zip(slabs, value, strict=False)
+                )
+            updated[key] = value
+        if attn_state is not None:
+            self._append(tuple(attn_state), cache_kwargs.get("window_size"))
 
-    def prefetch(self):
-        if self.state is None:
-            return
+        for state in (recurrent_state, attn_state, conv_state, ffn_state):
+            if state is not None:
+                self.device = state.device if isinstance(state, torch.Tensor) else state[0].device
+                break
+        # the states written in this step are returned as is to avoid gathering them back from the slabs
+        return {key: updated[key] if key in updated else self._read(key) for key in self.slabs}
+
+    def _slabs(self, keys: tuple[str, ...] = ("recurrent_state", "attn_state", "conv_state", "ffn_state")):
+        for key in keys:
+            slab = self.slabs[key]
+            if isinstance(slab, torch.Tensor):
+                yield slab
+            elif slab is not None:
+                yield from (x for x in slab if x is not None)
+
+    def tensors(self):
+        for key in STATE_KEYS:
+            yield from ((key, x) for x in self._slabs((key,)))
+
+    def clear_slots(self, slots: list[int]):
+        # attention states are invalidated by resetting the lengths, no need to touch the slabs
+        for slab in self._slabs(("recurrent_state", "conv_state", "ffn_state")):
+            slab[slots] = 0
+        for slot in slots:
+            self.attn_lens[slot] = 0
+
+    @property
+    def is_croppable(self) -> bool:
+        return all(self.slabs[key] is None for key in ("recurrent_state", "conv_state", "ffn_state"))
+
+    def can_crop(self, num_tokens: int) -> bool:
+        return self.is_croppable
+
+    def load(self, state: dict[str, Any], attn_lens: list[int]):
+        """Overwrites the states of the bound slots, `attn_lens` being the valid lengths of the attention states."""
+        for slot in self.table.slots:
+            self.attn_lens[slot] = 0
+        self.update(**state)
+        for slot, length in zip(self.table.slots, attn_lens, strict=False):
+            self.attn_lens[slot] = length
+
+    def reorder_cache(self, beam_idx: torch.LongTensor):
+        state = map_states(self.state, lambda x: x.index_select(0, beam_idx.to(x.device)))
+        if state is not None:
+            self.load(state, [self.attn_lens[self.table.slots[i]] for i in beam_idx.tolist()])
+
+    def batch_select_indices(self, indices: torch.Tensor):
+        raise NotImplementedError("The batch of a paged cache is changed by `PagedFLACache.batch_select_indices`")
+
+    def batch_repeat_interleave(self, repeats: int):
+        raise NotImplementedError("The batch of a paged cache is changed by `PagedFLACache.batch_repeat_interleave`")
+
+    def crop(self, max_length: int, seen_tokens: int | None = None):
+        if not self.is_croppable:
+            raise ValueError("Unable to crop the constant-size states of linear attention layers.")
+        lens = [self.attn_lens[slot] for slot in self.table.slots]
+        num_tokens = (seen_tokens if seen_tokens is not None else max(lens, default=0)) - max_length
+        for slot, length in zip(self.table.slots, lens, strict=False):
+            self.attn_lens[slot] = max(length - num_tokens, 0)
 
+    def offload(self):
+        def to_cpu(x):
+            return x.to("cpu", non_blocking=True) if isinstance(x, torch.Tensor) else x
+        for key, slab in self.slabs.items():
+            self.slabs[key] = tuple(to_cpu(x) for x in slab) if isinstance(slab, tuple) else to_cpu(slab)
+
+    def prefetch(self):
         def to_dev(x):
             return x.to(self.device, non_blocking=True) if isinstance(x, torch.Tensor) else x
-        for k in ("recurrent_state", "attn_state", "conv_state", "ffn_state"):
-            v = self.state.get(k, None)
-            if v is None:
-                continue
-            if isinstance(v, (tuple, list)):
-                self.state[k] = tuple(to_dev(t) for t in v)
+        for key, slab in self.slabs.items():
+            self.slabs[key] = tuple(to_dev(x) for x in slab) if isinstance(slab, tuple) else to_dev(slab)
+
+    def reset(self):
+        for slab in self._slabs():
+            slab.zero_()
+        self.attn_lens = [0] * self.table.max_slots
+
+
+class StaticFLALayer(FLALayer):
+    """
+    A cache layer whose states live in buffers preallocated for `max_batch_size` sequences,
+    which are updated strictly inplace so that the states keep their shapes and addresses across decoding steps.
+
+    Recurrent/conv/ffn states are stored as buffers of shape `[max_batch_size, ...]`
+    and attention states as buffers of shape `[max_batch_size, max_cache_len, ...]`,
+    all allocated on the first update and exposed as views of the rows of the running batch.
+    Attention states with a sliding window are kept in a :class:`SlidingWindowBuffer` instead.
+    """
+
+    def __init__(self, max_batch_size: int, max_cache_len: int | None = None):
+        super().__init__()
+        self.max_batch_size = max_batch_size
+        self.max_len = max_cache_len
+        self.buffers = {}
+        self.attn_len = 0
+
+    def _write(self, key: str, value: torch.Tensor | tuple[torch.Tensor, ...]) -> torch.Tensor | tuple[torch.Tensor, ...]:
+        if isinstance(value, (tuple, list)):
+            buffers = self.buffers.get(key) or (None,) * len(value)
+            buffers = tuple(self._copy(buffer, x) for buffer, x in zip(buffers, value, strict=False))
+            self.buffers[key] = tuple(buffer for buffer, _ in buffers)
+            return tuple(view for _, view in buffers)
+        self.buffers[key], view = self._copy(self.buffers.get(key), value)
+        return view
+
+    def _copy(self, buffer: torch.Tensor | None, x: torch.Tensor | None) -> tuple[torch.Tensor, torch.Tensor]:
+        if x is None:
+            return buffer, None
+        if x.shape[0] > self.max_batch_size:
+            raise ValueError(f"The batch size {x.shape[0]} exceeds `max_batch_size={self.max_batch_size}`")
+        if buffer is None:
+            buffer = x.new_zeros(self.max_batch_size, *x.shape[1:])
+        view = buffer[tuple(slice(n) for n in x.shape)]
+        # states updated inplace by the kernels, e.g., the conv cache during decoding, already live in the buffer
+        if x.data_ptr() != view.data_ptr():
+            view.copy_(x)
+        return buffer, view
+
+    def _append(self, attn_state: tuple[torch.Tensor, ...]) -> tuple[torch.Tensor, ...]:
+        B, T = attn_state[0].shape[:2]
+        if self.max_len is None:
+            raise ValueError("`max_cache_len` is required to cache attention states without a sliding window")
+        if self.attn_len + T > self.max_len:
+            raise ValueError(f"The cache exceeds `max_cache_len={self.max_len}` with {self.attn_len + T} tokens")
+        if B > self.max_batch_size:
+            raise ValueError(f"The batch size {B} exceeds `max_batch_size={self.max_batch_size}`")
+        if self.buffers.get("attn_state") is None:
+            self.buffers["attn_state"] = tuple(
+                x.new_zeros(self.max_batch_size, self.max_len, *x.shape[2:]) for x in attn_state
+            )
+        for buffer, x in zip(self.buffers["attn_state"], attn_state, strict=False):
+            buffer[:B, self.attn_len:self.attn_len + T].copy_(x)
+        self.attn_len += T
+        return tuple(buffer[:B, :self.attn_len] for buffer in self.buffers["attn_state"])
+
+    def update(
+        self,
+        *,
+        recurrent_state: torch.Tensor | tuple[torch.Tensor, ...] | None = None,
+        attn_state: tuple[torch.Tensor, ...] | None = None,
+        conv_state: Any | None = None,
+        ffn_state: Any | None = None,
+        cache_kwargs: dict[str, Any] | None = None,
+        **_: Any,
+    ) -> dict[str, Any]:
+        if cache_kwargs is None:
+            cache_kwargs = {}
+        window_size = cache_kwargs.get("window_size")
+        if attn_state is not None and not isinstance(attn_state, (tuple, list)):
+            raise ValueError("`attn_state` must be a tuple/list of tensors")
+
+        if self.state is None:
+            self.state = dict.fromkeys(("recurrent_state", "attn_state", "conv_state", "ffn_state"))
+        for key, value in (("recurrent_state", recurrent_state), ("conv_state", conv_state), ("ffn_state", ffn_state)):
+            if value is not None:
+                self.state[key] = self._write(key, value)
+        if attn_state is not None:
+            if window_size is not None:
+                self.window = update_window(
+                    self.window,
+                    self.state["attn_state"],
+                    attn_state,
+                    window_size,
+                    cache_kwargs.get("ring_buffer", False),
+                )
+                self.state["attn_state"] = self.window.views
             else:
-                self.state[k] = to_dev(v)
+                self.state["attn_state"] = self._append(tuple(attn_state))
+
+        for state in (recurrent_state, attn_state, conv_state, ffn_state):
+            if state is not None:
+                self.device = state.device if isinstance(state, torch.Tensor) else state[0].device
+                break
+        return self.state
+
+    def _map(self, fn: Callable[[torch.Tensor], torch.Tensor]):
+        if self.state is None:
+            return
+        attn_state = self.state["attn_state"]
+        if attn_state is not None and self.window is not None and attn_state is self.window.views:
+            self.window.map(fn)
+            self.state["attn_state"] = self.window.views
+        elif attn_state is not None:
+            # rewrite the valid tokens of the new batch to the start of the buffers
+            attn_state = tuple(fn(x) for x in attn_state)
+            self.attn_len = 0
+            self.state["attn_state"] = self._append(attn_state)
+        for key in ("recurrent_state", "conv_state", "ffn_state"):
+            value = self.state[key]
+            if isinstance(value, torch.Tensor):
+                self.state[key] = self._write(key, fn(value))
+            elif value is not None:
+                self.state[key] = self._write(key, tuple(None if x is None else fn(x) for x in value))
+
+    def reorder_cache(self, beam_idx: torch.LongTensor):
+        self._map(lambda x: x.index_select(0, beam_idx.to(x.device)))
+
+    def batch_select_indices(self, indices: torch.Tensor):
+        self._map(lambda x: x[indices])
+
+    def batch_repeat_interleave(self, repeats: int):
+        self._map(lambda x: x.repeat_interleave(repeats, dim=0))
+
+    def can_crop(self, num_tokens: int) -> bool:
+        return self.is_croppable
+
+    def crop(self, max_length: int, seen_tokens: int | None = None):
+        if not self.is_croppable:
+            raise ValueError("Unable to crop the constant-size states of linear attention layers.")
+        if self.state is None or self.state["attn_state"] is None:
+            return
+        if self.window is not None and self.state["attn_state"] is self.window.views:
+            super().crop(max_length, seen_tokens)
+            return
+        num_tokens = (seen_tokens if seen_tokens is not None else self.attn_len) - max_length
+        # the dropped tokens are simply overwritten by the next update
+        self.attn_len = max(self.attn_len - max(num_tokens, 0), 0)
+        self.state["attn_state"] = tuple(x[:, :self.attn_len] for x in self.state["attn_state"])
+
+    def offload(self):
+        raise NotImplementedError("The buffers of a static cache are pinned to the device")
+
+    def prefetch(self):
+        raise NotImplementedError("The buffers of a static cache are pinned to the device")
 
     def reset(self):
-        pass
+        # the buffers are kept and overwritten by the next prefilling, keeping their addresses across requests
+        self.state = None
+        if self.window is not None:
+            self.window.reset()
+        self.history = None
+        self.attn_len = 0
 
 
 class LegacyFLACache(HFCacheBase):
@@ -154,8 +1105,14 @@ class LegacyFLACache(HFCacheBase):
         super().__init__()
 
         self.states: list[dict[str, Any]] = []
+        # the sliding window buffers of the attention states, keyed by layer index
+        self.windows: dict[int, SlidingWindowBuffer] = {}
+        # the number of most recent tokens whose recurrent/conv states are tracked for rollback, 0 to disable
+        self.history_size = 0
+        self.histories: dict[int, StateHistory] = {}
 
         self._seen_tokens = seen_tokens  # Used in `generate` to keep tally of how many tokens the cache has seen
+        self._last_offset = 0
 
     def __getitem__(self, layer_idx: int) -> dict[str, Any]:
         if layer_idx < len(self):
@@ -203,7 +1160,6 @@ class LegacyFLACache(HFCacheBase):
         if cache_kwargs is None:
             cache_kwargs = {}
         if attn_state is not None:
-            input_size = attn_state[0].shape[1]
             window_size = cache_kwargs.get('window_size')
             if not isinstance(attn_state, (tuple, list)):
                 raise ValueError("`attn_state` must be a tuple of tensors for key/value states")
@@ -211,9 +1167,15 @@ class LegacyFLACache(HFCacheBase):
             # update the number of seen tokens
             if layer_idx == 0:
                 self._seen_tokens += offset
-            if attn_state is not None:
-                if window_size is not None and input_size > window_size:
-                    attn_state = [state[:, -window_size:].contiguous() for state in attn_state]
+                self._last_offset = offset
+            history = track_history(None, None, offset, cache_kwargs, self.history_size)
+            if history is not None:
+                self.histories[layer_idx] = history
+            if attn_state is not None and window_size is not None:
+                self.windows[layer_idx] = update_window(
+                    None, None, attn_state, window_size, cache_kwargs.get('ring_buffer', False)
+                )
+                attn_state = self.windows[layer_idx].views
             state = dict(
                 recurrent_state=recurrent_state,
                 attn_state=attn_state,
@@ -225,18 +1187,30 @@ class LegacyFLACache(HFCacheBase):
             # update the number of seen tokens
             if layer_idx == len(self.states) - 1:
                 self._seen_tokens += offset
+                self._last_offset = offset
             state = self.states[layer_idx]
+            history = track_history(
+                self.histories.get(layer_idx), state['recurrent_state'], offset, cache_kwargs, self.history_size
+            )
+            if history is None:
+                self.histories.pop(layer_idx, None)
+            else:
+                self.histories[layer_idx] = history
             if recurrent_state is not None:
                 state['recurrent_state'] = recurrent_state
             if attn_state is not None:
-                if window_size is not None and state['attn_state'][0].shape[1] == window_size:
-                    for i, (old_state, new_state) in enumerate(zip(state['attn_state'], attn_state, strict=False)):
-                        # DO NOT allocate new memory if the cache is full
-                        # roll the key/value states to the left by `input_size`
-                        old_state = old_state.roll(-input_size, 1)
-                        # replace the last `input_size` tokens with the new key/value states
-                        old_state[:, -input_size:] = new_state
-                        state['attn_state'][i] = old_state
+                if window_size is not None:
+                    # write the new tokens to the ring buffer in place without rolling the whole window
+                    self.windows[layer_idx] = update_window(
+                        self.windows.get(layer_idx),
+                        state['attn_state'],
+                        attn_state,
+                        window_size,
+                        cache_kwargs.get('ring_buffer', False),
+                    )
+                    state['attn_state'] = self.windows[layer_idx].views
+                elif state['attn_state'] is None:
+                    state['attn_state'] = attn_state
                 else:
                     attn_state = [
                         torch.cat([old_state, new_state], 1)
@@ -260,9 +1234,86 @@ class LegacyFLACache(HFCacheBase):
         """Returns the maximum sequence length of the cached states. Cache does not have a maximum length."""
         return None
 
+    def get_window_offset(self, layer_idx: int = 0) -> int:
+        """
+        Returns the slot of the oldest token in the sliding window buffer of the layer, 0 if stored in temporal order.
+        Only non-zero if the states are updated with `ring_buffer=True` in `cache_kwargs`.
+        """
+        window = self.windows.get(layer_idx)
+        if window is None or layer_idx >= len(self.states) or self.states[layer_idx]['attn_state'] is not window.views:
+            return 0
+        return window.start
+
+    def reorder_cache(self, beam_idx: torch.LongTensor):
+        """Reorders the states along the batch dimension for beam search, with one indexed copy per state."""
+        for i, state in enumerate(self.states):
+            map_states(state, lambda x: x.index_select(0, beam_idx.to(x.device)), self.windows.get(i))
+        self.histories.clear()
+
+    def batch_select_indices(self, indices: torch.Tensor):
+        for i, state in enumerate(self.states):
+            map_states(state, lambda x: x[indices], self.windows.get(i))
+        self.histories.clear()
+
+    def batch_repeat_interleave(self, repeats: int):
+        for i, state in enumerate(self.states):
+            map_states(state, lambda x: x.repeat_interleave(repeats, dim=0), self.windows.get(i))
+        self.histories.clear()
+
+    def crop(self, max_length: int):
+        """
+        Crops the cache to the first `max_length` tokens, negative values removing `abs(max_length)` tokens.
+        Recurrent/conv states can only be cropped within the last `history_size` tokens.
+        """
+        if max_length < 0:
+            max_length = self._seen_tokens + max_length
+        if self._seen_tokens <= max_length:
+            return
+        num_tokens = self._seen_tokens - max_length
+        if not all(can_rollback_states(state, self.histories.get(i), num_tokens) for i, state in enumerate(self.states)):
+            raise ValueError("Unable to crop the constant-size states of linear attention layers.")
+        for i, state in enumerate(self.states):
+            if self.get_window_offset(i) != 0:
+                state['attn_state'] = self.windows[i].linearize()
+            rollback_states(state, self.histories.get(i), num_tokens)
+        self._seen_tokens = max_length
+
+    def rollback(self, num_accepted: int):
+        """
+        Keeps only the first `num_accepted` tokens of the last update, e.g., the accepted draft tokens in speculative decoding.
+        Recurrent/conv states are rolled back through their history, requiring `history_size` to cover the last update.
+        """
+        if not 0 <= num_accepted <= self._last_offset:
+            raise ValueError(f"Expected `num_accepted` in [0, {self._last_offset}], got {num_accepted}")
+        self.crop(self._seen_tokens - self._last_offset + num_accepted)
+        self._last_offset = num_accepted
+
+    def memory_footprint(self) -> dict[str, Any]:
+        """
+        Returns the bytes held by the cache, in `total` and broken down by state type in `states`,
+        by device in `devices` and by layer in `layers`, see :func:`summarize_footprint`.
+        """
+        return summarize_footprint(
+            iter_layer_tensors(state, self.windows.get(i), self.histories.get(i)) for i, state in enumerate(self.states)
+        )
+
+    estimate_cache_bytes = staticmethod(estimate_cache_bytes)
+
     def to_legacy_cache(self) -> tuple:
         return tuple(self.states)
 
+    def save(self, path: str, quantization: str | None = None):
+        """
+        Saves the cache to `path`, e.g., for resuming an evicted session without prefilling it again.
+        Floating-point states can be quantized to `int8` or `fp8` to reduce the size, see :func:`save_cache`.
+        """
+        save_cache(self, path, quantization)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True, device: torch.device | str | None = None, **kwargs: Any):
+        """Loads a cache saved by :meth:`save`, memory-mapping the file if `mmap=True`, see :func:`load_cache`."""
+        return load_cache(cls(**kwargs), path, mmap, device)
+
     @classmethod
     @torch.compiler.disable
     def from_legacy_cache(
@@ -288,17 +1339,17 @@ class FLACache(HFCacheBase):
 
     is_compileable = True
 
-    def __init__(self, seen_tokens: int = 0, **kwargs):
+    def __init__(self, seen_tokens: int = 0, layer_class: Callable[[], FLALayer] = FLALayer, **kwargs):
         parent_init = super().__init__
         sig = inspect.signature(parent_init)
         param_names = list(sig.parameters.keys())
 
         if 'layer_class_to_replicate' in param_names:
             self.use_layer_class_to_replicate = True
-            super().__init__(layer_class_to_replicate=FLALayer, **kwargs)
+            super().__init__(layer_class_to_replicate=layer_class, **kwargs)
         elif 'layer_classes' in param_names:
             self.use_layer_class_to_replicate = False
-            super().__init__(layer_classes=FLALayer, **kwargs)
+            super().__init__(layer_classes=layer_class, **kwargs)
         else:
             raise TypeError(
                 "FLA cache initialization failed: HFCacheBase.__init__ accepts neither "
@@ -306,6 +1357,9 @@ class FLACache(HFCacheBase):
                 "transformers version. Please check your transformers>=4.36.0",
             )
         self._seen_tokens = int(seen_tokens)
+        self._last_offset = 0
+        # the number of most recent tokens whose recurrent/conv states are tracked for rollback, 0 to disable
+        self.history_size = 0
 
     def update(
         self,
@@ -324,6 +1378,7 @@ class FLACache(HFCacheBase):
                 self.layers.append(self.layer_class_to_replicate())
         if layer_idx == 0:
             self._seen_tokens += int(offset)
+            self._last_offset = int(offset)
 
         return self.layers[layer_idx].update(
             recurrent_state=recurrent_state,
@@ -331,6 +1386,8 @@ class FLACache(HFCacheBase):
             conv_state=conv_state,
             ffn_state=ffn_state,
             cache_kwargs=cache_kwargs,
+            offset=int(offset),
+            history_size=self.history_size,
         )
 
     def __getitem__(self, layer_idx: int) -> dict[str, Any]:
@@ -353,6 +1410,15 @@ class FLACache(HFCacheBase):
     def get_max_cache_shape(self, layer_idx: int = 0) -> int:
         return -1
 
+    def get_window_offset(self, layer_idx: int = 0) -> int:
+        """
+        Returns the slot of the oldest token in the sliding window buffer of the layer, 0 if stored in temporal order.
+        Only non-zero if the states are updated with `ring_buffer=True` in `cache_kwargs`.
+        """
+        if layer_idx >= len(self.layers):
+            return 0
+        return self.layers[layer_idx].get_window_offset()
+
     def get_mask_sizes(self, cache_position: torch.Tensor, layer_idx: int) -> tuple[int, int]:
         # Respect your global seen_tokens semantics
         # kv_length = past_seen + current_query_length
@@ -360,9 +1426,69 @@ class FLACache(HFCacheBase):
         kv_length = int(self._seen_tokens) + query_len
         return kv_length, 0
 
+    def reorder_cache(self, beam_idx: torch.LongTensor):
+        """Reorders the states along the batch dimension for beam search, with one indexed copy per state."""
+        for layer in self.layers:
+            layer.reorder_cache(beam_idx)
+
+    def batch_select_indices(self, indices: torch.Tensor):
+        for layer in self.layers:
+            layer.batch_select_indices(indices)
+
+    def batch_repeat_interleave(self, repeats: int):
+        for layer in self.layers:
+            layer.batch_repeat_interleave(repeats)
+
+    def crop(self, max_length: int):
+        """
+        Crops the cache to the first `max_length` tokens, negative values removing `abs(max_length)` tokens.
+        Recurrent/conv states can only be cropped within the last `history_size` tokens.
+        """
+        if max_length < 0:
+            max_length = self._seen_tokens + max_length
+        if self._seen_tokens <= max_length:
+            return
+        # check all layers beforehand to leave the cache untouched on failure
+        if not all(layer.can_crop(self._seen_tokens - max_length) for layer in self.layers):
+            raise ValueError("Unable to crop the constant-size states of linear attention layers.")
+        for layer in self.layers:
+            layer.crop(max_length, self._seen_tokens)
+        self._seen_tokens = max_length
+
+    def rollback(self, num_accepted: int):
+        """
+        Keeps only the first `num_accepted` tokens of the last update, e.g., the accepted draft tokens in speculative decoding.
+        Recurrent/conv states are rolled back through their history, requiring `history_size` to cover the last update.
+        """
+        if not 0 <= num_accepted <= self._last_offset:
+            raise ValueError(f"Expected `num_accepted` in [0, {self._last_offset}], got {num_accepted}")
+        self.crop(self._seen_tokens - self._last_offset + num_accepted)
+        self._last_offset = num_accepted
+
+    def memory_footprint(self) -> dict[str, Any]:
+        """
+        Returns the bytes held by the cache, in `total` and broken down by state type in `states`,
+        by device in `devices` and by layer in `layers`, see :func:`summarize_footprint`.
+        """
+        return summarize_footprint(layer.tensors() for layer in self.layers)
+
+    estimate_cache_bytes = staticmethod(estimate_cache_bytes)
+
     def to_legacy_cache(self) -> tuple[dict[str, Any], ...]:
         return tuple(self[i] for i in range(len(self.layers)))
 
+    def save(self, path: str, quantization: str | None = None):
+        """
+        Saves the cache to `path`, e.g., for resuming an evicted session without prefilling it again.
+        Floating-point states can be quantized to `int8` or `fp8` to reduce the size, see :func:`save_cache`.
+        """
+        save_cache(self, path, quantization)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True, device: torch.device | str | None = None, **kwargs: Any):
+        """Loads a cache saved by :meth:`save`, memory-mapping the file if `mmap=True`, see :func:`load_cache`."""
+        return load_cache(cls(**kwargs), path, mmap, device)
+
     @classmethod
     @torch.compiler.disable
     def from_legacy_cache(
@@ -399,8 +1525,34 @@ class FLAGenerationMixin(GenerationMixin):
         use_cache: bool = True,
         logits_to_keep: int | None = None,
         cache_position: torch.LongTensor | None = None,
+        prefix_cache: PrefixStateCache | None = None,
+        prefill_chunk_size: int | None = None,
         **kwargs,
     ):
+        if (
+            prefix_cache is not None and input_ids is not None and inputs_embeds is None and input_ids.shape[0] == 1
+            and input_ids.shape[1] > 1 and (past_key_values is None or len(past_key_values) == 0)
+            and (attention_mask is None or bool(attention_mask.all()))
+        ):
+            # skip to the longest cached prefix and run the rest of the prompt but the last token through the cache,
+            # taking snapshots at the prefix boundaries along the way
+            past_key_values = prefix_cache.prefill(self, input_ids[:, :-1], past_key_values=past_key_values)
+            if cache_position is not None:
+                cache_position = cache_position[-1:]
+        elif (
+            prefill_chunk_size is not None and input_ids is not None and inputs_embeds is None
+            and input_ids.shape[1] > prefill_chunk_size and (past_key_values is None or len(past_key_values) == 0)
+        ):
+            # feed the prompt but the last token through the cache in segments, bounding the activation memory
+            past_key_values = self.chunked_prefill(
+                input_ids[:, :-1],
+                prefill_chunk_size,
+                past_key_values=past_key_values,
+                attention_mask=attention_mask[:, :-1] if attention_mask is not None else None,
+            )
+            if cache_position is not None:
+                cache_position = cache_position[-1:]
+
         # Use pre-computed version comparison for performance
         if _IS_TRANSFORMERS_4_56_PLUS:
             # For transformers 4.56.0+, use cache_position-based logic
@@ -459,6 +1611,279 @@ class FLAGenerationMixin(GenerationMixin):
         })
         return model_inputs
 
+    @torch.no_grad()
+    def chunked_prefill(
+        self,
+        input_ids: torch.LongTensor,
+        prefill_chunk_size: int,
+        past_key_values: HFCacheBase | None = None,
+        attention_mask: torch.Tensor | None = None,
+    ) -> HFCacheBase:
+        """
+        Runs the model over `input_ids` in segments of `prefill_chunk_size` tokens, carrying the states forward
+        through the cache and computing the logits of the last position of each segment only.
+        The activations of a single segment are alive at a time, so that the peak memory of prefilling is independent
+        of the prompt length, except for the growing KV cache of attention layers.
+        Multiples of the chunk size of the kernels, e.g., 64, keep the throughput of chunked computation.
+
+        Pass `prefill_chunk_size` to `generate` to prefill the prompt this way.
+
+        Args:
+            input_ids (`torch.LongTensor`):
+                The tokens of shape `[B, T]`.
+            prefill_chunk_size (`int`):
+                The number of tokens per segment.
+            past_key_values (`Cache`, *optional*):
+                The cache to continue from, a new one if not provided.
+            attention_mask (`torch.Tensor`, *optional*):
+                The padding mask of shape `[B, T]` covering the cached tokens and `input_ids`.
+
+        Returns:
+            The cache holding the states after the last token.
+        """
+        if prefill_chunk_size <= 0:
+            raise ValueError(f"`prefill_chunk_size` must be positive, got {prefill_chunk_size}")
+        if past_key_values is None or not isinstance(past_key_values, HFCacheBase):
+            past_key_values = Cache()
+        offset = attention_mask.shape[1] - input_ids.shape[1] if attention_mask is not None else 0
+        for start in range(0, input_ids.shape[1], prefill_chunk_size):
+            end = min(start + prefill_chunk_size, input_ids.shape[1])
+            self(
+                input_ids=input_ids[:, start:end],
+                attention_mask=attention_mask[:, :offset + end] if attention_mask is not None else None,
+                past_key_values=past_key_values,
+                use_cache=True,
+                logits_to_keep=1,
+            )
+        return past_key_values
+
+    def generate(
+        self,
+        *args,
+        draft_model: GenerationMixin | None = None,
+        num_draft_tokens: int = 4,
+        use_fused_sampling: bool = False,
+        **kwargs,
+    ):
+        if use_fused_sampling:
+            if args:
+                kwargs['input_ids'], *args = args
+            if args:
+                raise ValueError("Fused sampling takes the generation arguments but the inputs as keywords")
+            if 'inputs' in kwargs:
+                kwargs['input_ids'] = kwargs.pop('inputs')
+            return self.fused_sampling_generate(**kwargs)
+        if draft_model is not None:
+            if args:
+                kwargs['input_ids'], *args = args
+            if args:
+                raise ValueError("Speculative decoding takes the generation arguments but the inputs as keywords")
+            if 'inputs' in kwargs:
+                kwargs['input_ids'] = kwargs.pop('inputs')
+            return self.speculative_generate(draft_model=draft_model, num_draft_tokens=num_draft_tokens, **kwargs)
+        return super().generate(*args, **kwargs)
+
+    @torch.no_grad()
+    def fused_sampling_generate(
+        self,
+        input_ids: torch.LongTensor,
+        attention_mask: torch.Tensor | None = None,
+        generation_config: GenerationConfig | None = None,
+        max_length: int | None = None,
+        max_new_tokens: int | None = None,
+        do_sample: bool | None = None,
+        temperature: float | list[float] | None = None,
+        top_k: int | list[int] | None = None,
+        top_p: float | list[float] | None = None,
+        min_p: float | list[float] | None = None,
+        repetition_penalty: float | list[float] | None = None,
+        presence_penalty: float | list[float] | None = None,
+        frequency_penalty: float | list[float] | None = None,
+        eos_token_id: int | list[int] | None = None,
+        pad_token_id: int | None = None,
+        use_cache: bool = True,
+        **kwargs,
+    ) -> torch.LongTensor:
+        """
+        A fast decoding loop sampling with :class:`~fla.modules.FusedSampler` rather than a chain of logits processors,
+        with per-row sampling parameters given as lists. Pass `use_fused_sampling=True` to `generate` to use it.
+
+        As in `generate`, the arguments not given are taken from `generation_config` (`self.generation_config`
+        by default), and `max_new_tokens` takes precedence over `max_length`.
+        Other generation arguments, e.g., `logits_processor`, `stopping_criteria` or `streamer`, are not supported.
+
+        Returns:
+            The prompts followed by the generated tokens, finished rows padded with `pad_token_id`.
+        """
+        if kwargs:
+            raise ValueError(f"Fused sampling does not support the generation arguments {sorted(kwargs)}")
+        if not use_cache:
+            raise ValueError("Fused sampling always decodes with the cache")
+        generation_config = generation_config if generation_config is not None else self.generation_config
+
+        def resolve(value, key, neutral=None):
+            # scalars with no effect are dropped so that the sampler skips their computations
+            value = value if value is not None else getattr(generation_config, key, None)
+            return None if isinstance(value, (int, float)) and value == neutral else value
+
+        if max_new_tokens is None:
+            max_new_tokens = generation_config.max_new_tokens
+        if max_new_tokens is None:
+            max_new_tokens = (max_length if max_length is not None else generation_config.max_length) - input_ids.shape[1]
+        do_sample = do_sample if do_sample is not None else generation_config.do_sample
+        temperature = resolve(temperature, 'temperature')
+        top_k, top_p, min_p = resolve(top_k, 'top_k', 0), resolve(top_p, 'top_p', 1.), resolve(min_p, 'min_p', 0.)
+        repetition_penalty = resolve(repetition_penalty, 'repetition_penalty', 1.)
+        presence_penalty = resolve(presence_penalty, 'presence_penalty', 0.)
+        frequency_penalty = resolve(frequency_penalty, 'frequency_penalty', 0.)
+        eos_token_id, pad_token_id = resolve(eos_token_id, 'eos_token_id'), resolve(pad_token_id, 'pad_token_id')
+        sampler = FusedSampler(
+            temperature=(temperature if temperature is not None else 1.) if do_sample else 0.,
+            top_k=top_k,
+            top_p=top_p,
+            min_p=min_p,
+            repetition_penalty=repetition_penalty,
+            presence_penalty=presence_penalty,
+            frequency_penalty=frequency_penalty,
+        )
+        decoder, lm_head = self.get_decoder(), self.get_output_embeddings()
+        sampler.reset(input_ids, lm_head.weight.shape[0], attention_mask)
+        eos_token_ids = [eos_token_id] if isinstance(eos_token_id, int) else list(eos_token_id or [])
+        if eos_token_ids and pad_token_id is None:
+            pad_token_id = eos_token_ids[0]
+        eos_token_ids = input_ids.new_tensor(eos_token_ids)
+
+        past_key_values, ids, outputs = Cache(), input_ids, []
+        finished = input_ids.new_zeros(input_ids.shape[0], dtype=torch.bool)
+        for _ in range(max_new_tokens):
+            hidden_states = decoder(
+                input_ids=ids,
+                attention_mask=attention_mask,
+                past_key_values=past_key_values,
+                use_cache=True,
+            ).last_hidden_state
+            tokens = sampler(hidden_states=hidden_states[:, -1], lm_head=lm_head)
+            if len(eos_token_ids) > 0:
+                tokens = torch.where(finished, pad_token_id, tokens)
+                finished |= torch.isin(tokens, eos_token_ids)
+            outputs.append(tokens)
+            if len(eos_token_ids) > 0 and bool(finished.all()):
+                break
+            ids = tokens.unsqueeze(-1)
+            if attention_mask is not None:
+                attention_mask = torch.cat((attention_mask, attention_mask.new_ones(attention_mask.shape[0], 1)), 1)
+        return torch.cat((input_ids, torch.stack(outputs, 1)), 1) if outputs else input_ids
+
+    @torch.no_grad()
+    def speculative_generate(
+        self,
+        input_ids: torch.LongTensor,
+        draft_model: GenerationMixin,
+        num_draft_tokens: int = 4,
+        attention_mask: torch.Tensor | None = None,
+        generation_config: GenerationConfig | None = None,
+        max_length: int | None = None,
+        max_new_tokens: int | None = None,
+        do_sample: bool | None = None,
+        eos_token_id: int | list[int] | None = None,
+        pad_token_id: int | None = None,
+        use_cache: bool = True,
+        **kwargs,
+    ) -> torch.LongTensor:
+        """
+        Greedy speculative decoding with a smaller `draft_model` sharing the same vocabulary.
+
+        In each round, the draft model proposes `num_draft_tokens` tokens that are verified by a single forward pass,
+        after which both models roll their caches back over the rejected tokens.
+        As the recurrent/conv states can not be cropped, the caches track the states after each of the most recent tokens
+        (see `history_size`), so the outputs are identical to greedy decoding with this model alone.
+
+        Args:
+            input_ids (`torch.LongTensor`):
+                The prompt of shape `[1, T]`, only a batch size of 1 is supported.
+            draft_model (`GenerationMixin`):
+                The model proposing the draft tokens.
+            num_draft_tokens (`int`, defaults to 4):
+                The number of tokens proposed in each round.
+            attention_mask (`torch.Tensor`, *optional*):
+                The mask of the prompt, which must not contain paddings.
+            generation_config (`GenerationConfig`, *optional*):
+                The config the arguments not given are taken from, `self.generation_config` by default.
+            max_length (`int`, *optional*):
+                The maximum length of the prompt and the generated tokens, overridden by `max_new_tokens`.
+            max_new_tokens (`int`, *optional*):
+                The maximum number of tokens to generate.
+            do_sample (`bool`, *optional*):
+                Only greedy decoding, i.e., `False`, is supported.
+            eos_token_id (`Optional[Union[int, List[int]]]`):
+                The token(s) stopping the generation.
+            pad_token_id (`int`, *optional*):
+                Unused, as a single sequence is never padded.
+
+        Other generation arguments, e.g., `temperature`, `logits_processor` or `streamer`, are not supported.
+
+        Returns:
+            The prompt followed by the generated tokens.
+        """
+        if kwargs:
+            raise ValueError(f"Speculative decoding does not support the generation arguments {sorted(kwargs)}")
+        if not use_cache:
+            raise ValueError("Speculative decoding always decodes with the cache")
+        generation_config = generation_config if generation_config is not None else self.generation_config
+        if do_sample if do_sample is not None else generation_config.do_sample:
+            raise ValueError("Speculative decoding only supports greedy decoding, got `do_sample=True`")
+        if input_ids.shape[0] != 1:
+            raise ValueError(f"Speculative decoding only supports a batch size of 1, got {input_ids.shape[0]}")
+        if attention_mask is not None and not bool(attention_mask.all()):
+            raise ValueError("Speculative decoding does not support paddings in `attention_mask`")
+        if num_draft_tokens < 1:
+            raise ValueError(f"`num_draft_tokens` must be positive, got {num_draft_tokens}")
+        if max_new_tokens is None:
+            max_new_tokens = generation_config.max_new_tokens
+        if max_new_tokens is None:
+            max_new_tokens = (max_length if max_length is not None else generation_config.max_length) - input_ids.shape[1]
+        if eos_token_id is None:
+            eos_token_id = generation_config.eos_token_id
+        eos_token_ids = set([eos_token_id] if isinstance(eos_token_id, int) else eos_token_id or [])
+        k = num_draft_tokens
+        cache, draft_cache = Cache(), Cache()
+        # the draft model consumes at most k+1 tokens in a round, i.e., 2 pending tokens and k-1 draft tokens
+        cache.history_size = draft_cache.history_size = k + 1
+
+        def step(model, ids, past_key_values, logits_to_keep=1):
+            outputs = model(input_ids=ids, past_key_values=past_key_values, use_cache=True, logits_to_keep=logits_to_keep)
+            return outputs.logits[:, -logits_to_keep:].argmax(-1)
+
+        # run both models through the prompt but the last token, which is consumed along with the drafts
+        if input_ids.shape[1] > 1:
+            step(self, input_ids[:, :-1], cache)
+            step(draft_model, input_ids[:, :-1], draft_cache)
+        last, pending = input_ids[:, -1:], input_ids[:, -1:]
+        generated = []
+        while len(generated) < max_new_tokens:
+            drafts = [step(draft_model, pending, draft_cache)]
+            for _ in range(k - 1):
+                drafts.append(step(draft_model, drafts[-1], draft_cache))
+            drafts = torch.cat(drafts, 1)
+            # the predictions after `last` and each of the drafts
+            preds = step(self, torch.cat((last, drafts), 1), cache, k + 1)
+            matches = (drafts == preds[:, :-1])[0].int()
+            num_accepted = int(matches.cumprod(0).sum())
+            # keep the states after `last` and the accepted drafts
+            cache.rollback(num_accepted + 1)
+            if num_accepted < k - 1:
+                draft_cache.crop(num_accepted - k + 1)
+            bonus = preds[:, num_accepted:num_accepted + 1]
+            last = bonus
+            pending = bonus if num_accepted < k else torch.cat((drafts[:, -1:], bonus), 1)
+            for token in torch.cat((drafts[:, :num_accepted], bonus), 1)[0].tolist():
+                generated.append(token)
+                if token in eos_token_ids or len(generated) == max_new_tokens:
+                    break
+            if generated[-1] in eos_token_ids:
+                break
+        return torch.cat((input_ids, input_ids.new_tensor([generated])), 1)
+
 
 if version.parse(_TF_VERSION) > version.parse(_NEED_NEW):
     class Cache(FLACache):
@@ -468,3 +1893,506 @@ else:
     class Cache(LegacyFLACache):
         def __init__(self, seen_tokens: int = 0, **kwargs: Any) -> None:
             super().__init__(seen_tokens=seen_tokens)
+
+
+class PagedFLACache(Cache):
+    """
+    A cache for continuous batching, which keeps the states of up to `max_slots` sequences in preallocated slabs.
+
+    Sequences are assigned slots by :meth:`allocate` and release them by :meth:`free`,
+    while :meth:`bind` sets the slots making up the running batch, in batch order.
+    Requests can thus join and leave the running batch without copying or reallocating the states of the others.
+    If the bound slots are consecutive, the layers read the states as views of the slabs,
+    so that kernels updating the states inplace, e.g., the short convolution during decoding, write to the pool directly.
+    The slab of a layer, e.g., `cache.layers[i].slabs['recurrent_state']`, can also be passed to kernels
+    supporting `initial_state_indices` along with :meth:`slot_indices` to read and write the states inplace.
+
+    If no slots are bound on the first update, the cache allocates and binds as many slots as the batch size,
+    so that it can serve as a drop-in replacement of :class:`FLACache` in `generate`.
+
+    Args:
+        max_slots (`int`):
+            The maximum number of sequences cached at the same time.
+        max_cache_len (`int`, *optional*):
+            The maximum number of tokens of the attention states of each sequence.
+            Only required by attention layers without a sliding window.
+    """
+
+    def __init__(self, max_slots: int, max_cache_len: int | None = None, seen_tokens: int = 0, **kwargs: Any) -> None:
+        if not issubclass(Cache, FLACache):
+            raise ImportError(f"PagedFLACache requires transformers>{_NEED_NEW}, but got {_TF_VERSION}")
+        self.table = SlotTable(max_slots)
+        super().__init__(
+            seen_tokens=seen_tokens,
+            layer_class=functools.partial(PagedFLALayer, self.table, max_cache_len),
+            **kwargs,
+        )
+
+    @property
+    def slots(self) -> list[int]:
+        """The slots of the running batch, in batch order."""
+        return list(self.table.slots)
+
+    @property
+    def num_free_slots(self) -> int:
+        return len(self.table.free_slots)
+
+    def allocate(self, num_slots: int = 1) -> list[int]:
+        """Reserves `num_slots` free slots with zero-initialized states, without binding them."""
+        if num_slots > len(self.table.free_slots):
+            raise RuntimeError(
+                f"Unable to allocate {num_slots} slots, "
+                f"only {len(self.table.free_slots)} of {self.table.max_slots} slots are free",
+            )
+        slots, self.table.free_slots = self.table.free_slots[:num_slots], self.table.free_slots[num_slots:]
+        for layer in self.layers:
+            layer.clear_slots(slots)
+        for slot in slots:
+            self.table.seen_tokens[slot] = 0
+        return slots
+
+    def free(self, slots: list[int]):
+        """Releases `slots`, and drops them from the running batch if bound."""
+        for slot in slots:
+            if not 0 <= slot < self.table.max_slots or slot in self.table.free_slots:
+                raise ValueError(f"Slot {slot} is not allocated")
+        self.table.free_slots = sorted(self.table.free_slots + list(slots))
+        if any(slot in slots for slot in self.table.slots):
+            self.bind([slot for slot in self.table.slots if slot not in slots])
+
+    def bind(self, slots: list[int]):
+        """Sets the allocated `slots` as the running batch, the `i`-th sequence of the inputs maps to `slots[i]`."""
+        for slot in slots:
+            if not 0 <= slot < self.table.max_slots or slot in self.table.free_slots:
+                raise ValueError(f"Slot {slot} is not allocated")
+        self.table.bind(slots)
+        self._seen_tokens = max((self.table.seen_tokens[slot] for slot in slots), default=0)
+
+    def slot_indices(self, device: torch.device | str | None = None) -> torch.LongTensor:
+        """Returns the slots of the running batch as a tensor, e.g., for `initial_state_indices`."""
+        return self.table.indices(torch.device(device) if device is not None else torch.device("cpu"))
+
+    def get_slot_seq_lengths(self) -> list[int]:
+        """Returns the number of tokens seen by each sequence of the running batch."""
+        return [self.table.seen_tokens[slot] for slot in self.table.slots]
+
+    def reorder_cache(self, beam_idx: torch.LongTensor):
+        for layer in self.layers:
+            layer.reorder_cache(beam_idx)
+        seen_tokens = self.get_slot_seq_lengths()
+        for slot, i in zip(self.table.slots, beam_idx.tolist(), strict=False):
+            self.table.seen_tokens[slot] = seen_tokens[i]
+
+    def batch_select_indices(self, indices: torch.Tensor):
+        """Keeps the sequences in `indices` in the running batch, the slots of the others are freed."""
+        slots = [self.table.slots[i] for i in torch.as_tensor(indices).flatten().tolist()]
+        self.free([slot for slot in self.table.slots if slot not in slots])
+        self.bind(slots)
+
+    def batch_repeat_interleave(self, repeats: int):
+        """Repeats each sequence of the running batch `repeats` times, copying its states to newly allocated slots."""
+        states = [map_states(layer.state, lambda x: x.repeat_interleave(repeats, dim=0)) for layer in self.layers]
+        lens = [[layer.attn_lens[slot] for slot in self.table.slots for _ in range(repeats)] for layer in self.layers]
+        seen_tokens = [self.table.seen_tokens[slot] for slot in self.table.slots for _ in range(repeats)]
+        new_slots = iter(self.allocate(len(self.table.slots) * (repeats - 1)))
+        self.bind([slot if i == 0 else next(new_slots) for slot in self.table.slots for i in range(repeats)])
+        for layer, state, attn_lens in zip(self.layers, states, lens, strict=False):
+            if state is not None:
+                layer.load(state, attn_lens)
+        for slot, n in zip(self.table.slots, seen_tokens, strict=False):
+            self.table.seen_tokens[slot] = n
+
+    def crop(self, max_length: int):
+        super().crop(max_length)
+        for slot in self.table.slots:
+            self.table.seen_tokens[slot] = min(self.table.seen_tokens[slot], self._seen_tokens)
+
+    def update(
+        self,
+        recurrent_state: tuple[torch.Tensor] | None = None,
+        attn_state: tuple[torch.Tensor] | None = None,
+        conv_state: tuple[torch.Tensor] | None = None,
+        ffn_state: tuple[torch.Tensor] | None = None,
+        layer_idx: int = 0,
+        offset: int | None = 1,
+        cache_kwargs: dict[str, Any] | None = None,
+    ) -> dict[str, Any]:
+        if len(self.table.slots) == 0:
+            batch_size = 0
+            for state in (recurrent_state, attn_state, conv_state, ffn_state):
+                if isinstance(state, torch.Tensor):
+                    batch_size = state.shape[0]
+                elif state is not None:
+                    batch_size = next(x.shape[0] for x in state if isinstance(x, torch.Tensor))
+                if batch_size > 0:
+                    break
+            self.bind(self.allocate(batch_size))
+        if layer_idx == 0:
+            for slot in self.table.slots:
+                self.table.seen_tokens[slot] += int(offset)
+        state = super().update(
+            recurrent_state=recurrent_state,
+            attn_state=attn_state,
+            conv_state=conv_state,
+            ffn_state=ffn_state,
+            layer_idx=layer_idx,
+            offset=offset,
+            cache_kwargs=cache_kwargs,
+        )
+        self._seen_tokens = max(self.get_slot_seq_lengths(), default=0)
+        return state
+
+
+class StaticFLACache(Cache):
+    """
+    A cache whose states live in buffers preallocated for `max_batch_size` sequences and updated strictly inplace,
+    so that the decoding step can be compiled with `torch.compile` or captured as a CUDA graph without recompilation.
+
+    The buffers are allocated on the first update, i.e., during prefilling, from which point on their shapes
+    and addresses stay fixed: states are written with `copy_`, unless already written inplace by the kernels,
+    e.g., the short convolution during decoding, or `fused_recurrent_gated_delta_rule` given the buffer as its
+    `initial_state` along with the indices returned by :meth:`get_state_indices`.
+    Attention states are exposed as views of the valid tokens, whose length is fixed for sliding windows only.
+    :meth:`reset` keeps the buffers, so that the same cache, and any graph captured with it, serves the next request.
+
+    Args:
+        max_batch_size (`int`):
+            The maximum number of sequences cached at the same time.
+        max_cache_len (`int`, *optional*):
+            The maximum number of tokens of the attention states of each sequence.
+            Only required by attention layers without a sliding window.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int,
+        max_cache_len: int | None = None,
+        seen_tokens: int = 0,
+        **kwargs: Any,
+    ) -> None:
+        if not issubclass(Cache, FLACache):
+            raise ImportError(f"StaticFLACache requires transformers>{_NEED_NEW}, but got {_TF_VERSION}")
+        self.max_batch_size = max_batch_size
+        self.max_cache_len = max_cache_len
+        self.state_indices: dict[tuple[int, torch.device], torch.LongTensor] = {}
+        super().__init__(
+            seen_tokens=seen_tokens,
+            layer_class=functools.partial(StaticFLALayer, max_batch_size, max_cache_len),
+            **kwargs,
+        )
+
+    def get_state_indices(self, batch_size: int, device: torch.device | str) -> torch.LongTensor:
+        """
+        Returns the rows of the running batch in the buffers, e.g., for `initial_state_indices`,
+        as the same tensor across steps.
+        """
+        key = (batch_size, torch.device(device))
+        if key not in self.state_indices:
+            self.state_indices[key] = torch.arange(batch_size, device=device)
+        return self.state_indices[key]
+
+    def get_max_cache_shape(self, layer_idx: int = 0) -> int:
+        return self.max_cache_len if self.max_cache_len is not None else -1
+
+    def reset(self):
+        for layer in self.layers:
+            layer.reset()
+        self._seen_tokens = 0
+        self._last_offset = 0
+
+
+class OffloadedFLACache(Cache):
+    """
+    A cache keeping only the states of the running layer and the next one on the compute device,
+    for serving more concurrent long-context sessions than the device memory could hold.
+
+    When layer `i` accesses the cache, the states of layer `i+1` are prefetched to the device on a side stream,
+    and those of layer `i-1` offloaded on another one, both overlapping with the computation of layer `i`.
+    The states are offloaded to a pool of pinned host buffers that is reused across steps, and grown if needed,
+    rather than allocating fresh host tensors every step.
+    The layers wrap around once the number of layers is known, i.e., from the second forward pass on,
+    so that the first layer is prefetched while the last one is running.
+
+    Offloading only takes effect on CUDA devices, otherwise the cache behaves like :class:`FLACache`.
+    """
+
+    def __init__(self, seen_tokens: int = 0, **kwargs: Any) -> None:
+        if not issubclass(Cache, FLACache):
+            raise ImportError(f"OffloadedFLACache requires transformers>{_NEED_NEW}, but got {_TF_VERSION}")
+        super().__init__(seen_tokens=seen_tokens, **kwargs)
+        self.enabled = torch.cuda.is_available()
+        self.prefetch_stream = torch.cuda.Stream() if self.enabled else None
+        self.offload_stream = torch.cuda.Stream() if self.enabled else None
+        self.device = None
+        self.num_layers = None
+        self.current = None
+        # pinned host buffers of each layer, in the order of the tensors visited by `map_states`
+        self.pool: dict[int, list[torch.Tensor]] = {}
+        # the layers whose states are on the host
+        self.offloaded: set[int] = set()
+        # the events marking the completion of the last transfer of each layer
+        self.events: dict[int, torch.cuda.Event] = {}
+
+    def _tensors(self, layer_idx: int):
+        layer = self.layers[layer_idx]
+        yield from iter_tensors(layer.state)
+        if layer.window is not None and layer.window.buffers is not None:
+            yield from layer.window.buffers
+
+    def _to_host(self, layer_idx: int) -> Callable[[torch.Tensor], torch.Tensor]:
+        pool, count = self.pool.setdefault(layer_idx, []), 0
+
+        def to_host(x: torch.Tensor) -> torch.Tensor:
+            nonlocal count
+            i, count = count, count + 1
+            if i == len(pool):
+                pool.append(None)
+            buffer = pool[i]
+            if buffer is None or buffer.dtype != x.dtype or buffer.numel() < x.numel():
+                # leave room for the attention states growing by one token per step
+                numel = x.numel() if buffer is None or buffer.dtype != x.dtype else max(x.numel(), 2 * buffer.numel())
+                buffer = pool[i] = torch.empty(numel, dtype=x.dtype, pin_memory=True)
+            host = buffer[:x.numel()].view(x.shape)
+            host.copy_(x, non_blocking=True)
+            x.record_stream(self.offload_stream)
+            return host
+        return to_host
+
+    def _offload(self, layer_idx: int):
+        if layer_idx >= len(self.layers) or layer_idx in self.offloaded or self.layers[layer_idx].state is None:
+            return
+        layer = self.layers[layer_idx]
+        # the states are final once the compute stream reaches this point
+        self.offload_stream.wait_stream(torch.cuda.current_stream(self.device))
+        with torch.cuda.stream(self.offload_stream):
+            map_states(layer.state, self._to_host(layer_idx), layer.window)
+        self.events[layer_idx] = self.offload_stream.record_event()
+        self.offloaded.add(layer_idx)
+
+    def _prefetch(self, layer_idx: int):
+        if layer_idx not in self.offloaded:
+            return
+        layer = self.layers[layer_idx]
+        # the host buffers are valid once offloaded
+        self.prefetch_stream.wait_event(self.events[layer_idx])
+        with torch.cuda.stream(self.prefetch_stream):
+            map_states(layer.state, lambda x: x.to(self.device, non_blocking=True), layer.window)
+        self.events[layer_idx] = self.prefetch_stream.record_event()
+        self.offloaded.discard(layer_idx)
+
+    def _access(self, layer_idx: int):
+        """Makes sure the states of the layer are on the device, and schedules the transfers of its neighbors."""
+        if not self.enabled or layer_idx == self.current:
+            return
+        if layer_idx == 0 and len(self.layers) > 1:
+            # the start of a new forward pass, the number of layers is known since
+            self.num_layers = len(self.layers)
+        self.current = layer_idx
+        if self.device is None:
+            x = next((x for i in range(len(self.layers)) for x in self._tensors(i)), None)
+            if x is None:
+                return
+            self.device = x.device
+            if self.device.type != 'cuda':
+                self.enabled = False
+                return
+        # the layers are created by their first update, e.g., during the first forward pass
+        if layer_idx < len(self.layers):
+            self._prefetch(layer_idx)
+            if layer_idx in self.events:
+                stream = torch.cuda.current_stream(self.device)
+                stream.wait_event(self.events.pop(layer_idx))
+                # the states are allocated on the prefetch stream but consumed by the compute stream
+                for x in self._tensors(layer_idx):
+                    x.record_stream(stream)
+        if self.num_layers is not None or layer_idx > 0:
+            self._offload((layer_idx - 1) % len(self.layers))
+        if layer_idx + 1 < len(self.layers):
+            self._prefetch(layer_idx + 1)
+        elif self.num_layers is not None:
+            self._prefetch(0)
+
+    def synchronize(self):
+        """Waits for all pending transfers, e.g., before modifying the states of all layers on the host side."""
+        if self.enabled and self.device is not None:
+            self.offload_stream.synchronize()
+            self.prefetch_stream.synchronize()
+
+    def __getitem__(self, layer_idx: int) -> dict[str, Any]:
+        self._access(layer_idx)
+        return super().__getitem__(layer_idx)
+
+    def update(
+        self,
+        recurrent_state: tuple[torch.Tensor] | None = None,
+        attn_state: tuple[torch.Tensor] | None = None,
+        conv_state: tuple[torch.Tensor] | None = None,
+        ffn_state: tuple[torch.Tensor] | None = None,
+        layer_idx: int = 0,
+        offset: int | None = 1,
+        cache_kwargs: dict[str, Any] | None = None,
+    ) -> dict[str, Any]:
+        self._access(layer_idx)
+        return super().update(
+            recurrent_state=recurrent_state,
+            attn_state=attn_state,
+            conv_state=conv_state,
+            ffn_state=ffn_state,
+            layer_idx=layer_idx,
+            offset=offset,
+            cache_kwargs=cache_kwargs,
+        )
+
+    def reorder_cache(self, beam_idx: torch.LongTensor):
+        self.synchronize()
+        super().reorder_cache(beam_idx)
+
+    def batch_select_indices(self, indices: torch.Tensor):
+        self.synchronize()
+        super().batch_select_indices(indices)
+
+    def batch_repeat_interleave(self, repeats: int):
+        self.synchronize()
+        super().batch_repeat_interleave(repeats)
+
+    def crop(self, max_length: int):
+        self.synchronize()
+        super().crop(max_length)
+
+    def get_device_layers(self) -> list[int]:
+        """Returns the indices of the layers whose states currently reside on the compute device."""
+        return [i for i in range(len(self.layers)) if i not in self.offloaded and self.layers[i].state is not None]
+
+
+class PrefixStateCache:
+    """
+    A store of per-layer state snapshots of token prefixes, for skipping the prefill of prompts sharing a prefix.
+
+    Linear attention layers compress arbitrarily long prefixes into constant-size states,
+    so snapshots are cheap compared to sharing KV caches.
+    The snapshots are taken every `interval` tokens and at the given `boundaries`, e.g., at the end of the system prompt,
+    keyed by the chained hash of the token ids, and evicted in LRU order to keep the total size within `max_bytes`.
+    As the keys only depend on the token ids, each store is expected to serve a single model.
+
+    Pass the store to `generate` as `prefix_cache` to restore the longest cached prefix of a single unpadded prompt,
+    or use :meth:`prefill` directly.
+
+    Args:
+        max_bytes (`int`):
+            The budget of the total size of the snapshots.
+        interval (`int`, *optional*):
+            Takes snapshots every `interval` tokens.
+        boundaries (`list[int]`, *optional*):
+            Additional prefix lengths to take snapshots at.
+        device (`torch.device`, *optional*):
+            The device to keep the snapshots on, e.g., `'cpu'`. Defaults to the device of the states.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        interval: int | None = None,
+        boundaries: list[int] | None = None,
+        device: torch.device | str | None = None,
+    ) -> PrefixStateCache:
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.boundaries = sorted(set(boundaries or []))
+        self.device = device
+
+        self.entries: OrderedDict[tuple[int, bytes], tuple[list[dict[str, Any]], int]] = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: tuple[int, bytes]) -> bool:
+        return key in self.entries
+
+    def get_boundaries(self, seq_len: int, boundaries: list[int] | None = None) -> list[int]:
+        """Returns the sorted prefix lengths up to `seq_len` to take snapshots at."""
+        positions = {i for i in self.boundaries + list(boundaries or []) if 0 < i <= seq_len}
+        if self.interval is not None:
+            positions.update(range(self.interval, seq_len + 1, self.interval))
+        return sorted(positions)
+
+    def get_keys(self, input_ids: torch.LongTensor, positions: list[int]) -> list[tuple[int, bytes]]:
+        """Returns the keys of the prefixes of `input_ids` ending at the sorted `positions`."""
+        tokens = input_ids.flatten().to(device='cpu', dtype=torch.int64).numpy()
+        digest, keys, start = hashlib.blake2b(digest_size=16), [], 0
+        for end in positions:
+            # chain the hash from the previous boundary on, so that all keys are computed in one pass
+            digest.update(tokens[start:end].tobytes())
+            keys.append((end, digest.digest()))
+            start = end
+        return keys
+
+    def store(self, key: tuple[int, bytes], cache: HFCacheBase):
+        """Takes a snapshot of the states in `cache`, evicting the least recently used ones if over budget."""
+        states = [map_states(dict(state), lambda x: x.to(device=self.device or x.device, copy=True)) for state in cache]
+        for layer_idx, state in enumerate(states):
+            # keep the sliding window states in temporal order
+            start = cache.get_window_offset(layer_idx)
+            if start != 0:
+                state['attn_state'] = tuple(x.roll(-start, dims=1) for x in state['attn_state'])
+        nbytes = sum(x.numel() * x.element_size() for state in states for x in iter_tensors(state))
+        if nbytes > self.max_bytes:
+            return
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key)[1]
+        while self.nbytes + nbytes > self.max_bytes:
+            self.nbytes -= self.entries.popitem(last=False)[1][1]
+        self.entries[key] = (states, nbytes)
+        self.nbytes += nbytes
+
+    def restore(self, key: tuple[int, bytes], cache: HFCacheBase, device: torch.device | None = None) -> HFCacheBase:
+        """Loads a copy of the snapshot of `key` into the empty `cache`."""
+        self.entries.move_to_end(key)
+        length = key[0]
+        for layer_idx, state in enumerate(self.entries[key][0]):
+            state = map_states(dict(state), lambda x: x.to(device=device or x.device, copy=True))
+            cache.update(**state, layer_idx=layer_idx, offset=length if layer_idx == 0 else 0)
+        return cache
+
+    @torch.no_grad()
+    def prefill(
+        self,
+        model: torch.nn.Module,
+        input_ids: torch.LongTensor,
+        past_key_values: HFCacheBase | None = None,
+        boundaries: list[int] | None = None,
+    ) -> HFCacheBase:
+        """
+        Runs `model` over `input_ids` of shape `[1, T]` starting from the longest cached prefix,
+        and takes snapshots at the boundaries not cached yet.
+
+        Returns:
+            The cache holding the states after the last token.
+        """
+        if input_ids.shape[0] != 1:
+            raise ValueError(f"Prefix caching expects a single sequence, got a batch of {input_ids.shape[0]}")
+        if past_key_values is None or not isinstance(past_key_values, Cache):
+            past_key_values = Cache()
+        seq_len = input_ids.shape[1]
+        keys = self.get_keys(input_ids, self.get_boundaries(seq_len, boundaries))
+
+        start = 0
+        for key in reversed(keys):
+            if key in self.entries:
+                self.restore(key, past_key_values, input_ids.device)
+                start = key[0]
+                break
+        if start > 0:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+        for end, digest in [key for key in keys if key[0] > start] + [(seq_len, None)]:
+            if end > start:
+                model(input_ids=input_ids[:, start:end], past_key_values=past_key_values, use_cache=True, logits_to_keep=1)
+                start = end
+            if digest is not None:
+                self.store((end, digest), past_key_values)
+        return past_key_values
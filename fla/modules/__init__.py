@@ -16,6 +16,7 @@ from fla.modules.l2norm import L2Norm
 from fla.modules.layernorm import GroupNorm, GroupNormLinear, LayerNorm, LayerNormLinear, RMSNorm, RMSNormLinear
 from fla.modules.mlp import GatedMLP
 from fla.modules.rotary import RotaryEmbedding
+from fla.modules.sampling import FusedSampler, fused_sample
 from fla.modules.token_shift import TokenShift
 
 __all__ = [
@@ -28,5 +29,6 @@ __all__ = [
     'FusedRMSNormGated', 'FusedRMSNormSwishGate', 'FusedRMSNormSwishGateLinear',
     'GatedMLP',
     'RotaryEmbedding',
+    'FusedSampler', 'fused_sample',
     'TokenShift',
 ]
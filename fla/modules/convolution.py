@@ -1,6 +1,7 @@
 # Copyright (c) 2023-2025, Songlin Yang, Yu Zhang
 
 import math
+import os
 import warnings
 
 import torch
@@ -11,6 +12,8 @@ import triton.language as tl
 from einops import rearrange
 
 from fla.ops.utils import prepare_chunk_indices, prepare_sequence_ids
+from fla.ops.utils.custom_op import FLA_USE_CUSTOM_OPS, placeholder
+from fla.ops.utils.dispatch import dispatch, register_backend, set_backend
 from fla.utils import IS_AMD, autotune_cache_kwargs, get_multiprocessor_count, input_guard
 
 NUM_WARPS_AUTOTUNE = [2, 4, 8, 16] if IS_AMD else [4, 8, 16, 32]
@@ -26,6 +29,13 @@ except ImportError:
     causal_conv1d_update_cuda = None
     causal_conv1d_bwd_function = None
 
+FLA_CONV_BACKEND = os.getenv('FLA_CONV_BACKEND')
+if FLA_CONV_BACKEND is not None:
+    # forces all convolutions to the given backend regardless of the `backend` of each call,
+    # with decoding falling back to Triton for the mixed backend, as does its forward pass
+    set_backend('causal_conv1d', FLA_CONV_BACKEND)
+    set_backend('causal_conv1d_update', 'triton' if FLA_CONV_BACKEND == 'mix' else FLA_CONV_BACKEND)
+
 
 @triton.heuristics({
     'HAS_WEIGHT': lambda args: args['weight'] is not None,
@@ -603,7 +613,42 @@ def causal_conv1d_update_states(
     return final_state
 
 
+@register_backend(
+    'causal_conv1d_update',
+    'cuda',
+    check=lambda *args, backend='triton', **kwargs: backend == 'cuda' and causal_conv1d_update_cuda is not None,
+)
+def causal_conv1d_update_cuda_fn(
+    x: torch.Tensor,
+    cache: torch.Tensor,
+    residual: torch.Tensor | None = None,
+    weight: torch.Tensor | None = None,
+    bias: torch.Tensor | None = None,
+    activation: str | None = None,
+    cu_seqlens: torch.LongTensor | None = None,
+    **kwargs,
+) -> torch.Tensor:
+    shape = x.shape
+    x = x.squeeze(0) if cu_seqlens is not None else x.squeeze(1)
+    # equivalent to:
+    # cache.copy_(cache.roll(shifts=-1, dims=-1))
+    # cache[:, :, -1] = x
+    # y = torch.sum(cache * rearrange(self.weight, "d 1 w -> d w"), dim=-1)
+    y = causal_conv1d_update_cuda(
+        x=x,
+        conv_state=cache,
+        weight=weight,
+        bias=bias,
+        activation=activation,
+    )
+    y = y.view(shape)
+    if residual is not None:
+        y.add_(residual)
+    return y, cache
+
+
 @input_guard
+@dispatch('causal_conv1d_update')
 def causal_conv1d_update(
     x: torch.Tensor,
     cache: torch.Tensor,
@@ -611,6 +656,7 @@ def causal_conv1d_update(
     weight: torch.Tensor | None = None,
     bias: torch.Tensor | None = None,
     activation: str | None = None,
+    **kwargs,
 ) -> torch.Tensor:
     shape = x.shape
     if weight is not None and x.shape[-1] != weight.shape[0]:
@@ -697,6 +743,112 @@ class CausalConv1dFunction(torch.autograd.Function):
         return dx, dw, db, dr, dh0, None, None, None, None, None
 
 
+if FLA_USE_CUSTOM_OPS:
+    # The same forward/backward passes as `CausalConv1dFunction` registered as custom ops,
+    # with `None` stood in for by empty placeholders.
+    # The gradient of the residual is the output gradient itself, which is passed through outside the backward op.
+
+    @torch.library.custom_op('fla::causal_conv1d_fwd', mutates_args=())
+    @input_guard
+    def causal_conv1d_fwd_op(
+        x: torch.Tensor,
+        weight: torch.Tensor | None,
+        bias: torch.Tensor | None,
+        residual: torch.Tensor | None,
+        initial_state: torch.Tensor | None,
+        output_final_state: bool,
+        activation: str | None,
+        cu_seqlens: torch.Tensor | None,
+        cu_seqlens_cpu: torch.Tensor | None,
+        chunk_indices: torch.Tensor | None,
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        y, final_state = causal_conv1d_fwd(
+            x=x,
+            weight=weight,
+            bias=bias,
+            residual=residual,
+            initial_state=initial_state,
+            output_final_state=output_final_state,
+            activation=activation,
+            cu_seqlens=cu_seqlens,
+            cu_seqlens_cpu=cu_seqlens_cpu,
+            chunk_indices=chunk_indices,
+        )
+        return y, final_state if final_state is not None else placeholder(x)
+
+    @causal_conv1d_fwd_op.register_fake
+    def _(x, weight, bias, residual, initial_state, output_final_state, activation, cu_seqlens, cu_seqlens_cpu,
+          chunk_indices):
+        N = x.shape[0] if cu_seqlens is None else cu_seqlens.shape[0] - 1
+        final_state = x.new_empty(N, *weight.shape) if output_final_state else placeholder(x)
+        return torch.empty_like(x), final_state
+
+    @torch.library.custom_op('fla::causal_conv1d_bwd', mutates_args=())
+    @input_guard
+    def causal_conv1d_bwd_op(
+        x: torch.Tensor,
+        dy: torch.Tensor,
+        dht: torch.Tensor | None,
+        weight: torch.Tensor | None,
+        bias: torch.Tensor | None,
+        initial_state: torch.Tensor | None,
+        activation: str | None,
+        cu_seqlens: torch.Tensor | None,
+        cu_seqlens_cpu: torch.Tensor | None,
+        chunk_indices: torch.Tensor | None,
+    ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+        dx, dw, db, _, dh0 = causal_conv1d_bwd(
+            x=x,
+            dy=dy,
+            dht=dht,
+            weight=weight,
+            bias=bias,
+            initial_state=initial_state,
+            activation=activation,
+            cu_seqlens=cu_seqlens,
+            cu_seqlens_cpu=cu_seqlens_cpu,
+            chunk_indices=chunk_indices,
+        )
+        dw, db, dh0 = (i if i is not None else placeholder(x) for i in (dw, db, dh0))
+        return dx, dw, db, dh0
+
+    @causal_conv1d_bwd_op.register_fake
+    def _(x, dy, dht, weight, bias, initial_state, activation, cu_seqlens, cu_seqlens_cpu, chunk_indices):
+        dw, db, dh0 = (torch.empty_like(i) if i is not None else placeholder(x) for i in (weight, bias, initial_state))
+        return torch.empty_like(x), dw, db, dh0
+
+    def causal_conv1d_setup_context(ctx, inputs, output):
+        x, weight, bias, residual, initial_state, output_final_state, activation, *varlen = inputs
+        ctx.save_for_backward(x, weight, bias, initial_state, *varlen)
+        ctx.output_final_state = output_final_state
+        ctx.activation = activation
+        ctx.has_residual = residual is not None
+
+    def causal_conv1d_backward(ctx, dy, dht):
+        x, weight, bias, initial_state, cu_seqlens, cu_seqlens_cpu, chunk_indices = ctx.saved_tensors
+        dx, dw, db, dh0 = causal_conv1d_bwd_op(
+            x, dy, dht if ctx.output_final_state else None, weight, bias, initial_state, ctx.activation,
+            cu_seqlens, cu_seqlens_cpu, chunk_indices,
+        )
+        return (
+            dx,
+            dw if weight is not None else None,
+            db if bias is not None else None,
+            dy if ctx.has_residual else None,
+            dh0 if initial_state is not None else None,
+            None,
+            None,
+            None,
+            None,
+            None,
+        )
+
+    causal_conv1d_fwd_op.register_autograd(
+        causal_conv1d_backward,
+        setup_context=causal_conv1d_setup_context,
+    )
+
+
 class FastCausalConv1dFn(torch.autograd.Function):
     """
     Mixed-mode (Mix) Causal Convolution Implementation - Combining Triton Forward and CUDA Backward Propagation
@@ -849,8 +1001,41 @@ def fast_causal_conv1d_fn(
     )
 
 
-@input_guard
-def causal_conv1d(
+def use_causal_conv1d_mix(
+    x: torch.Tensor | None = None,
+    weight: torch.Tensor | None = None,
+    bias: torch.Tensor | None = None,
+    residual: torch.Tensor | None = None,
+    initial_state: torch.Tensor | None = None,
+    output_final_state: bool | None = False,
+    activation: str | None = None,
+    backend: str | None = 'triton',
+    cu_seqlens: torch.Tensor | None = None,
+    **kwargs,
+) -> bool:
+    return backend == 'mix'
+
+
+def use_causal_conv1d_cuda(
+    x: torch.Tensor | None = None,
+    weight: torch.Tensor | None = None,
+    bias: torch.Tensor | None = None,
+    residual: torch.Tensor | None = None,
+    initial_state: torch.Tensor | None = None,
+    output_final_state: bool | None = False,
+    activation: str | None = None,
+    backend: str | None = 'triton',
+    cu_seqlens: torch.Tensor | None = None,
+    **kwargs,
+) -> bool:
+    # the CUDA kernels support neither initial nor final states for variable-length inputs
+    return backend == 'cuda' and causal_conv1d_fn is not None and (
+        cu_seqlens is None or (initial_state is None and not output_final_state)
+    )
+
+
+@register_backend('causal_conv1d', 'mix', check=use_causal_conv1d_mix)
+def causal_conv1d_mix(
     x: torch.Tensor,
     weight: torch.Tensor | None = None,
     bias: torch.Tensor | None = None,
@@ -864,77 +1049,47 @@ def causal_conv1d(
     chunk_indices: torch.LongTensor | None = None,
     **kwargs,
 ):
-    """
-    A causal 1D convolution implementation that powers Mamba/Mamba2 and DeltaNet architectures.
-
-    When a residual connection is provided, this implements the Canon operation
-    described in the paper at https://papers.ssrn.com/sol3/papers.cfm?abstract_id=5240330.
-
-    Args:
-        x (torch.Tensor):
-            Input tensor of shape [B, T, D].
-        weight (Optional[torch.Tensor]):
-            Weight tensor of shape [D, W]. Default: `None`.
-        bias (Optional[torch.Tensor]):
-            Bias tensor of shape [D]. Default: `None`.
-        residual (Optional[torch.Tensor]):
-            Residual tensor of shape [B, T, D]. Default: `None`.
-        initial_state (Optional[torch.Tensor]):
-            Initial state tensor of shape [N, D, W],
-            where `N` is the number of sequences in the batch and `W` is the kernel size.
-            If provided, the initial state is used to initialize the cache. Default: `None`.
-        output_final_state (Optional[bool]):
-            Whether to output the final state of shape [N, D, W]. Default: `False`.
-        activation (Optional[str]):
-            Activations applied to output, only `swish`/`silu` or `None` (i.e., no activation) are supported.
-            Default: `None`.
-        backend (Optional[str]):
-            Specifies the backend to use for the convolution operation. Supported values are `'cuda'` 、 `'triton'` and `'mix'`.
-            Default: `'triton'`.
-        cu_seqlens (Optional[torch.Tensor]):
-            Cumulative sequence lengths (optional)
-        chunk_indices (Optional[torch.LongTensor]):
-            Chunk indices for variable-length sequences (optional)
+    if causal_conv1d_bwd_function is None:
+        raise ImportError(
+            "causal_conv1d is required for backend='mix', but it is not installed. "
+            "Please install it with: pip install causal-conv1d\n"
+            "For more details, see: https://github.com/Dao-AILab/causal-conv1d"
+        )
+    seq_idx = kwargs.get('seq_idx')
+    return fast_causal_conv1d_fn(
+        x,
+        weight,
+        bias,
+        residual,
+        initial_state,
+        output_final_state,
+        activation,
+        cu_seqlens,
+        cu_seqlens_cpu=cu_seqlens_cpu,
+        chunk_indices=chunk_indices,
+        seq_idx=seq_idx,
+    )
 
-    Returns:
-        Tuple of (output, final_state).
-        If `output_final_state` is `False`, the final state is `None`.
-    """
 
-    if backend == 'triton':
-        y, final_state = CausalConv1dFunction.apply(
-            x,
-            weight,
-            bias,
-            residual,
-            initial_state,
-            output_final_state,
-            activation,
-            cu_seqlens,
-            cu_seqlens_cpu,
-            chunk_indices,
-        )
-        return y, final_state
-    elif backend == 'mix':
-        if causal_conv1d_bwd_function is None:
-            raise ImportError(
-                "causal_conv1d is required for backend='mix', but it is not installed. "
-                "Please install it with: pip install causal-conv1d\n"
-                "For more details, see: https://github.com/Dao-AILab/causal-conv1d"
-            )
-        seq_idx = kwargs.get('seq_idx')
-        return fast_causal_conv1d_fn(
-            x,
-            weight,
-            bias,
-            residual,
-            initial_state,
-            output_final_state,
-            activation,
-            cu_seqlens,
-            cu_seqlens_cpu=cu_seqlens_cpu,
-            chunk_indices=chunk_indices,
-            seq_idx=seq_idx,
+@register_backend('causal_conv1d', 'cuda', check=use_causal_conv1d_cuda)
+def causal_conv1d_cuda(
+    x: torch.Tensor,
+    weight: torch.Tensor | None = None,
+    bias: torch.Tensor | None = None,
+    residual: torch.Tensor | None = None,
+    initial_state: torch.Tensor | None = None,
+    output_final_state: bool | None = False,
+    activation: str | None = None,
+    backend: str | None = 'triton',
+    cu_seqlens: torch.Tensor | None = None,
+    cu_seqlens_cpu: torch.LongTensor | None = None,
+    chunk_indices: torch.LongTensor | None = None,
+    **kwargs,
+):
+    if causal_conv1d_fn is None:
+        raise ImportError(
+            "causal_conv1d is required for the CUDA backend, but it is not installed. "
+            "Please install it with: pip install causal-conv1d"
         )
     B, _, D, W = *x.shape, weight.shape[-1]
     N = B if cu_seqlens is None else len(cu_seqlens) - 1
@@ -985,6 +1140,89 @@ def causal_conv1d(
     return y, cache
 
 
+@input_guard
+@dispatch('causal_conv1d')
+def causal_conv1d(
+    x: torch.Tensor,
+    weight: torch.Tensor | None = None,
+    bias: torch.Tensor | None = None,
+    residual: torch.Tensor | None = None,
+    initial_state: torch.Tensor | None = None,
+    output_final_state: bool | None = False,
+    activation: str | None = None,
+    backend: str | None = 'triton',
+    cu_seqlens: torch.Tensor | None = None,
+    cu_seqlens_cpu: torch.LongTensor | None = None,
+    chunk_indices: torch.LongTensor | None = None,
+    **kwargs,
+):
+    """
+    A causal 1D convolution implementation that powers Mamba/Mamba2 and DeltaNet architectures.
+
+    When a residual connection is provided, this implements the Canon operation
+    described in the paper at https://papers.ssrn.com/sol3/papers.cfm?abstract_id=5240330.
+
+    Args:
+        x (torch.Tensor):
+            Input tensor of shape [B, T, D].
+        weight (Optional[torch.Tensor]):
+            Weight tensor of shape [D, W]. Default: `None`.
+        bias (Optional[torch.Tensor]):
+            Bias tensor of shape [D]. Default: `None`.
+        residual (Optional[torch.Tensor]):
+            Residual tensor of shape [B, T, D]. Default: `None`.
+        initial_state (Optional[torch.Tensor]):
+            Initial state tensor of shape [N, D, W],
+            where `N` is the number of sequences in the batch and `W` is the kernel size.
+            If provided, the initial state is used to initialize the cache. Default: `None`.
+        output_final_state (Optional[bool]):
+            Whether to output the final state of shape [N, D, W]. Default: `False`.
+        activation (Optional[str]):
+            Activations applied to output, only `swish`/`silu` or `None` (i.e., no activation) are supported.
+            Default: `None`.
+        backend (Optional[str]):
+            Specifies the backend to use for the convolution operation. Supported values are `'cuda'` 、 `'triton'` and `'mix'`.
+            The CUDA backend falls back to Triton for the inputs it does not support,
+            and all calls can be forced to one backend by `fla.ops.utils.dispatch.set_backend('causal_conv1d', ...)`.
+            Default: `'triton'`.
+        cu_seqlens (Optional[torch.Tensor]):
+            Cumulative sequence lengths (optional)
+        chunk_indices (Optional[torch.LongTensor]):
+            Chunk indices for variable-length sequences (optional)
+
+    Returns:
+        Tuple of (output, final_state).
+        If `output_final_state` is `False`, the final state is `None`.
+    """
+    if FLA_USE_CUSTOM_OPS:
+        y, final_state = causal_conv1d_fwd_op(
+            x,
+            weight,
+            bias,
+            residual,
+            initial_state,
+            output_final_state,
+            activation,
+            cu_seqlens,
+            cu_seqlens_cpu,
+            chunk_indices,
+        )
+        return y, final_state if output_final_state else None
+    y, final_state = CausalConv1dFunction.apply(
+        x,
+        weight,
+        bias,
+        residual,
+        initial_state,
+        output_final_state,
+        activation,
+        cu_seqlens,
+        cu_seqlens_cpu,
+        chunk_indices,
+    )
+    return y, final_state
+
+
 class ShortConvolution(nn.Conv1d):
     """Short convolution layer for efficient causal convolution operations.
 
@@ -1047,8 +1285,7 @@ class ShortConvolution(nn.Conv1d):
                 "The `use_fast_conv1d` parameter is deprecated and will be ignored. "
                 "Please use the `backend` parameter instead.",
             )
-        import os
-        self.backend = os.environ.get('FLA_CONV_BACKEND', backend)
+        self.backend = backend
         if backend not in ['cuda', 'triton']:
             raise ValueError(f"Invalid backend: {backend}, must be one of ['cuda', 'triton']")
         if backend == 'cuda':
@@ -1132,21 +1369,8 @@ class ShortConvolution(nn.Conv1d):
             )
             return y, cache
 
-        # cuda backend do not support:
-        # 1. both `cu_seqlens` and `cache` being provided
-        # 2. both `cu_seqlens` and `output_final_state` being provided
-        if self.backend == 'cuda' and (
-            (cu_seqlens is not None and cache is not None) or
-            (cu_seqlens is not None and output_final_state)
-        ):
-            warnings.warn(
-                "The CUDA backend does not support both `cu_seqlens` and `cache` being provided, "
-                "or both `cu_seqlens` and `output_final_state` being provided. "
-                "Switching to the Triton backend instead. ",
-                stacklevel=2,
-            )
-            self.backend = 'triton'
-
+        # the inputs the CUDA backend does not support, i.e., `cu_seqlens` along with `cache` or `output_final_state`,
+        # are dispatched to the Triton backend
         return causal_conv1d(
             x=x,
             weight=rearrange(self.weight, "d 1 w -> d w"),
@@ -1161,6 +1385,16 @@ class ShortConvolution(nn.Conv1d):
             **kwargs,
         )
 
+    def window(self, x: torch.Tensor, cache: torch.Tensor | None = None) -> torch.Tensor:
+        """
+        Returns the inputs `x` of shape `[B, T, D]` prepended by the `[B, D, W]` cache as a window of shape `[B, D, W+T]`,
+        whose slice `[..., t:t+W]` is the cache after the first `t` tokens.
+        Must be called before :meth:`forward`, which updates the cache inplace when decoding.
+        """
+        if cache is None:
+            cache = x.new_zeros(x.shape[0], x.shape[-1], self.kernel_size[0])
+        return torch.cat([cache, x.transpose(1, 2).to(cache.dtype)], -1)
+
     def step(
         self,
         x: torch.Tensor,
@@ -1174,33 +1408,16 @@ class ShortConvolution(nn.Conv1d):
         if output_final_state and cache is None:
             cache = x.new_zeros(N, D, W)
         # NOTE: we follow the fast mode that updates the cache in-place
-        if self.backend == 'triton':
-            return causal_conv1d_update(
-                x=x,
-                cache=cache,
-                residual=residual,
-                weight=rearrange(self.weight, "d 1 w -> d w"),
-                bias=self.bias,
-                activation=self.activation,
-            )
-
-        shape = x.shape
-        x = x.squeeze(0) if cu_seqlens is not None else x.squeeze(1)
-        # equivalent to:
-        # cache.copy_(cache.roll(shifts=-1, dims=-1))
-        # cache[:, :, -1] = x
-        # y = torch.sum(cache * rearrange(self.weight, "d 1 w -> d w"), dim=-1)
-        y = causal_conv1d_update_cuda(
+        return causal_conv1d_update(
             x=x,
-            conv_state=cache,
+            cache=cache,
+            residual=residual,
             weight=rearrange(self.weight, "d 1 w -> d w"),
             bias=self.bias,
             activation=self.activation,
+            backend=self.backend,
+            cu_seqlens=cu_seqlens,
         )
-        y = y.view(shape)
-        if residual is not None:
-            y.add_(residual)
-        return y, cache
 
     @property
     def state_size(self) -> int:
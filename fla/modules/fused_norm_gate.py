@@ -10,6 +10,7 @@ import torch.nn.functional as F
 import triton
 import triton.language as tl
 
+from fla.ops.utils.custom_op import FLA_USE_CUSTOM_OPS, placeholder
 from fla.utils import autotune_cache_kwargs, get_multiprocessor_count, input_guard
 
 
@@ -810,6 +811,150 @@ class LayerNormGatedLinearFunction(torch.autograd.Function):
         )
 
 
+if FLA_USE_CUSTOM_OPS:
+    # The same forward/backward passes as `LayerNormGatedFunction` registered as custom ops.
+    # The statistics saved for backward are returned as extra outputs, with `None` stood in for by empty placeholders,
+    # as is the residual output whenever it would be the input itself, since custom ops cannot return their inputs.
+
+    @torch.library.custom_op('fla::layer_norm_gated_fwd', mutates_args=())
+    @input_guard
+    def layer_norm_gated_fwd_op(
+        x: torch.Tensor,
+        g: torch.Tensor,
+        weight: torch.Tensor | None,
+        bias: torch.Tensor | None,
+        activation: str,
+        residual: torch.Tensor | None,
+        eps: float,
+        prenorm: bool,
+        residual_in_fp32: bool,
+        is_rms_norm: bool,
+    ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+        x_shape_og = x.shape
+        x = x.reshape(-1, x.shape[-1])
+        g = g.reshape(-1, g.shape[-1])
+        if residual is not None:
+            assert residual.shape == x_shape_og
+            residual = residual.reshape(-1, residual.shape[-1])
+        residual_dtype = (
+            residual.dtype
+            if residual is not None
+            else (torch.float if residual_in_fp32 else None)
+        )
+        y, mean, rstd, residual_out = layer_norm_gated_fwd(
+            x=x,
+            g=g,
+            weight=weight,
+            bias=bias,
+            activation=activation,
+            eps=eps,
+            residual=residual,
+            residual_dtype=residual_dtype,
+            is_rms_norm=is_rms_norm,
+        )
+        mean = mean if mean is not None else placeholder(x)
+        residual_out = residual_out.reshape(x_shape_og) if residual_out is not x else placeholder(x)
+        return y.reshape(x_shape_og), mean, rstd, residual_out
+
+    @layer_norm_gated_fwd_op.register_fake
+    def _(x, g, weight, bias, activation, residual, eps, prenorm, residual_in_fp32, is_rms_norm):
+        T = x.numel() // x.shape[-1]
+        mean = x.new_empty(T, dtype=torch.float) if not is_rms_norm else placeholder(x)
+        rstd = x.new_empty(T, dtype=torch.float)
+        residual_dtype = residual.dtype if residual is not None else (torch.float if residual_in_fp32 else x.dtype)
+        if residual is not None or residual_dtype != x.dtype:
+            residual_out = torch.empty_like(x, dtype=residual_dtype)
+        else:
+            residual_out = placeholder(x)
+        return torch.empty_like(x), mean, rstd, residual_out
+
+    @torch.library.custom_op('fla::layer_norm_gated_bwd', mutates_args=())
+    @input_guard
+    def layer_norm_gated_bwd_op(
+        dy: torch.Tensor,
+        x: torch.Tensor,
+        g: torch.Tensor,
+        weight: torch.Tensor | None,
+        bias: torch.Tensor | None,
+        activation: str,
+        eps: float,
+        mean: torch.Tensor | None,
+        rstd: torch.Tensor,
+        dresidual: torch.Tensor | None,
+        has_residual: bool,
+        is_rms_norm: bool,
+        x_dtype: torch.dtype,
+    ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+        dx, dg, dw, db, dres_in = layer_norm_gated_bwd(
+            dy=dy.reshape(-1, dy.shape[-1]),
+            x=x.reshape(-1, x.shape[-1]),
+            g=g.reshape(-1, g.shape[-1]),
+            weight=weight,
+            bias=bias,
+            activation=activation,
+            eps=eps,
+            mean=mean,
+            rstd=rstd,
+            dresidual=dresidual.reshape(-1, dresidual.shape[-1]) if dresidual is not None else None,
+            has_residual=has_residual,
+            is_rms_norm=is_rms_norm,
+            x_dtype=x_dtype,
+        )
+        # the gradient of the residual shares the storage of `dx` unless their dtypes differ
+        dres_in = dres_in.reshape(x.shape) if dres_in is not None and dres_in is not dx else placeholder(dy)
+        return (
+            dx.reshape(x.shape),
+            dg.reshape(g.shape),
+            dw if dw is not None else placeholder(dy),
+            db if db is not None else placeholder(dy),
+            dres_in,
+        )
+
+    @layer_norm_gated_bwd_op.register_fake
+    def _(dy, x, g, weight, bias, activation, eps, mean, rstd, dresidual, has_residual, is_rms_norm, x_dtype):
+        dw = torch.empty_like(weight) if weight is not None else placeholder(dy)
+        db = torch.empty_like(bias) if bias is not None else placeholder(dy)
+        dres_in = torch.empty_like(x) if has_residual and x_dtype != x.dtype else placeholder(dy)
+        return torch.empty_like(x, dtype=x_dtype), torch.empty_like(g, dtype=x_dtype), dw, db, dres_in
+
+    def layer_norm_gated_setup_context(ctx, inputs, output):
+        x, g, weight, bias, activation, residual, eps, prenorm, _, is_rms_norm = inputs
+        _, mean, rstd, residual_out = output
+        ctx.save_for_backward(residual_out if residual_out.numel() > 0 else x, g, weight, bias, mean, rstd)
+        ctx.activation = activation
+        ctx.eps = eps
+        ctx.is_rms_norm = is_rms_norm
+        ctx.has_residual = residual is not None
+        ctx.prenorm = prenorm and residual_out.numel() > 0
+        ctx.x_dtype = x.dtype
+
+    def layer_norm_gated_backward(ctx, dy, dmean, drstd, dresidual):
+        x, g, weight, bias, mean, rstd = ctx.saved_tensors
+        dx, dg, dw, db, dres_in = layer_norm_gated_bwd_op(
+            dy, x, g, weight, bias, ctx.activation, ctx.eps,
+            mean if not ctx.is_rms_norm else None, rstd,
+            dresidual if ctx.prenorm else None,
+            ctx.has_residual, ctx.is_rms_norm, ctx.x_dtype,
+        )
+        return (
+            dx,
+            dg,
+            dw if weight is not None else None,
+            db if bias is not None else None,
+            None,
+            (dres_in if dres_in.numel() > 0 else dx) if ctx.has_residual else None,
+            None,
+            None,
+            None,
+            None,
+        )
+
+    layer_norm_gated_fwd_op.register_autograd(
+        layer_norm_gated_backward,
+        setup_context=layer_norm_gated_setup_context,
+    )
+
+
 def layer_norm_gated(
     x: torch.Tensor,
     g: torch.Tensor,
@@ -821,6 +966,21 @@ def layer_norm_gated(
     residual_in_fp32: bool = False,
     eps: float = 1e-6,
 ):
+    if FLA_USE_CUSTOM_OPS:
+        y, _, _, residual_out = layer_norm_gated_fwd_op(
+            x,
+            g,
+            weight,
+            bias,
+            activation,
+            residual,
+            eps,
+            prenorm,
+            residual_in_fp32,
+            False,
+        )
+        # the residual output is the input itself if it is neither accumulated nor cast
+        return y if not prenorm else (y, residual_out if residual_out.numel() > 0 else x)
     return LayerNormGatedFunction.apply(
         x,
         g,
@@ -846,6 +1006,21 @@ def rms_norm_gated(
     residual_in_fp32: bool = False,
     eps: float = 1e-6,
 ):
+    if FLA_USE_CUSTOM_OPS:
+        y, _, _, residual_out = layer_norm_gated_fwd_op(
+            x,
+            g,
+            weight,
+            bias,
+            activation,
+            residual,
+            eps,
+            prenorm,
+            residual_in_fp32,
+            True,
+        )
+        # the residual output is the input itself if it is neither accumulated nor cast
+        return y if not prenorm else (y, residual_out if residual_out.numel() > 0 else x)
     return LayerNormGatedFunction.apply(
         x,
         g,
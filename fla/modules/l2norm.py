@@ -5,6 +5,7 @@ import torch.nn as nn
 import triton
 import triton.language as tl
 
+from fla.ops.utils.custom_op import FLA_USE_CUSTOM_OPS
 from fla.utils import IS_AMD, autotune_cache_kwargs, input_guard
 
 BT_LIST = [8, 16, 32, 64, 128]
@@ -260,11 +261,56 @@ class L2NormFunction(torch.autograd.Function):
         return dx, None, None
 
 
+if FLA_USE_CUSTOM_OPS:
+    # The same forward/backward passes as `L2NormFunction` registered as custom ops,
+    # with the inverse norms saved for backward returned as an extra output.
+
+    @torch.library.custom_op('fla::l2norm_fwd', mutates_args=())
+    @input_guard
+    def l2norm_fwd_op(
+        x: torch.Tensor,
+        eps: float,
+        output_dtype: torch.dtype | None,
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        return l2norm_fwd(x, eps, output_dtype)
+
+    @l2norm_fwd_op.register_fake
+    def _(x, eps, output_dtype):
+        return torch.empty_like(x, dtype=output_dtype), x.new_empty(x.shape[:-1], dtype=torch.float)
+
+    @torch.library.custom_op('fla::l2norm_bwd', mutates_args=())
+    @input_guard
+    def l2norm_bwd_op(
+        y: torch.Tensor,
+        rstd: torch.Tensor,
+        dy: torch.Tensor,
+        eps: float,
+    ) -> torch.Tensor:
+        return l2norm_bwd(y, rstd, dy, eps)
+
+    @l2norm_bwd_op.register_fake
+    def _(y, rstd, dy, eps):
+        return torch.empty_like(y)
+
+    def l2norm_setup_context(ctx, inputs, output):
+        _, eps, _ = inputs
+        ctx.save_for_backward(*output)
+        ctx.eps = eps
+
+    def l2norm_backward(ctx, dy, *args):
+        y, rstd = ctx.saved_tensors
+        return l2norm_bwd_op(y, rstd, dy, ctx.eps), None, None
+
+    l2norm_fwd_op.register_autograd(l2norm_backward, setup_context=l2norm_setup_context)
+
+
 def l2norm(
     x: torch.Tensor,
     eps: float = 1e-6,
     output_dtype: torch.dtype | None = None,
 ) -> torch.Tensor:
+    if FLA_USE_CUSTOM_OPS:
+        return l2norm_fwd_op(x, eps, output_dtype)[0]
     return L2NormFunction.apply(x, eps, output_dtype)
 
 
@@ -23,6 +23,7 @@ from torch.distributed import DeviceMesh
 from torch.distributed.tensor import Replicate, Shard, distribute_module
 from torch.distributed.tensor.parallel import ParallelStyle
 
+from fla.ops.utils.dispatch import dispatch, on_device, register_backend
 from fla.utils import autotune_cache_kwargs, get_multiprocessor_count, input_guard
 
 try:
@@ -847,6 +848,31 @@ def group_norm(
     )
 
 
+@register_backend('rms_norm', 'torch', check=on_device('cpu'))
+def rms_norm_cpu(
+    x: torch.Tensor,
+    weight: torch.Tensor,
+    bias: torch.Tensor,
+    residual: torch.Tensor = None,
+    eps: float = 1e-5,
+    prenorm: bool = False,
+    residual_in_fp32: bool = False,
+):
+    dtype, residual_dtype = x.dtype, residual.dtype if residual is not None else x.dtype
+    if residual is not None:
+        x = x.float() + residual.float()
+    residual_out = x.to(torch.float if residual_in_fp32 else residual_dtype)
+    x = x.float()
+    y = x * torch.rsqrt(x.square().mean(-1, keepdim=True) + eps)
+    if weight is not None:
+        y = y * weight.float()
+    if bias is not None:
+        y = y + bias.float()
+    y = y.to(dtype)
+    return y if not prenorm else (y, residual_out)
+
+
+@dispatch('rms_norm')
 def rms_norm(
     x: torch.Tensor,
     weight: torch.Tensor,
@@ -0,0 +1,322 @@
+# Copyright (c) 2023-2025, Songlin Yang, Yu Zhang
+
+from __future__ import annotations
+
+import torch
+import torch.nn as nn
+import triton
+import triton.language as tl
+
+from fla.ops.utils.op import log
+from fla.utils import input_guard
+
+
+@triton.heuristics({
+    'USE_PENALTY': lambda args: args['counts'] is not None,
+})
+@triton.jit
+def sampling_logits_kernel(
+    logits,
+    z,
+    counts,
+    temperature,
+    repetition_penalty,
+    presence_penalty,
+    frequency_penalty,
+    V,
+    BV: tl.constexpr,
+    USE_PENALTY: tl.constexpr,
+):
+    i_b = tl.program_id(0).to(tl.int64)
+    logits += i_b * V
+    z += i_b * V
+
+    b_t = tl.load(temperature + i_b).to(tl.float32)
+    if USE_PENALTY:
+        counts += i_b * V
+        b_rp = tl.load(repetition_penalty + i_b).to(tl.float32)
+        b_pp = tl.load(presence_penalty + i_b).to(tl.float32)
+        b_fp = tl.load(frequency_penalty + i_b).to(tl.float32)
+    for i_v in range(0, tl.cdiv(V, BV)):
+        o_v = i_v * BV + tl.arange(0, BV)
+        m_v = o_v < V
+        b_z = tl.load(logits + o_v, mask=m_v, other=0).to(tl.float32)
+        if USE_PENALTY:
+            b_c = tl.load(counts + o_v, mask=m_v, other=0).to(tl.float32)
+            b_z = tl.where(b_c > 0, tl.where(b_z > 0, b_z / b_rp, b_z * b_rp), b_z)
+            b_z = b_z - b_pp * (b_c > 0).to(tl.float32) - b_fp * b_c
+        # rows with zero temperature are decoded greedily by the sampling kernel
+        b_z = tl.where(b_t > 0, b_z / b_t, b_z)
+        tl.store(z + o_v, b_z, mask=m_v)
+
+
+@triton.jit
+def sampling_kernel(
+    z,
+    cutoff,
+    temperature,
+    min_p,
+    tokens,
+    seed,
+    V,
+    BV: tl.constexpr,
+):
+    i_b = tl.program_id(0).to(tl.int64)
+    z += i_b * V
+
+    b_t = tl.load(temperature + i_b).to(tl.float32)
+    b_min_p = tl.load(min_p + i_b).to(tl.float32)
+    b_m = tl.full([], float('-inf'), dtype=tl.float32)
+    for i_v in range(0, tl.cdiv(V, BV)):
+        o_v = i_v * BV + tl.arange(0, BV)
+        b_m = tl.maximum(b_m, tl.max(tl.load(z + o_v, mask=o_v < V, other=float('-inf')), 0))
+    # tokens with probabilities below `min_p` times the largest one are masked out, as well as those below the cutoff
+    b_thr = tl.load(cutoff + i_b).to(tl.float32)
+    b_thr = tl.where(b_min_p > 0, tl.maximum(b_thr, b_m + log(tl.maximum(b_min_p, 1e-38))), b_thr)
+
+    # draw the sample with the Gumbel-max trick in a single pass over the vocabulary
+    b_best = tl.full([], float('-inf'), dtype=tl.float32)
+    b_token = tl.full([], 0, dtype=tl.int64)
+    for i_v in range(0, tl.cdiv(V, BV)):
+        o_v = i_v * BV + tl.arange(0, BV)
+        m_v = o_v < V
+        b_z = tl.load(z + o_v, mask=m_v, other=float('-inf'))
+        b_u = tl.maximum(tl.rand(seed, i_b * V + o_v), 1e-10)
+        b_s = b_z + tl.where(b_t > 0, -log(-log(b_u)), 0.)
+        b_s = tl.where(m_v & (b_z >= b_thr), b_s, float('-inf'))
+        b_val = tl.max(b_s, 0)
+        b_idx = tl.argmax(b_s, 0).to(tl.int64) + i_v * BV
+        b_token = tl.where(b_val > b_best, b_idx, b_token)
+        b_best = tl.maximum(b_best, b_val)
+    tl.store(tokens + i_b, b_token)
+
+
+def _as_rows(x: torch.Tensor | float | int | list | None, B: int, default: float, device: torch.device) -> torch.Tensor:
+    if x is None:
+        x = default
+    if isinstance(x, torch.Tensor):
+        return x.to(device=device, dtype=torch.float32).expand(B).contiguous()
+    if isinstance(x, (list, tuple)):
+        return torch.tensor([default if i is None else i for i in x], dtype=torch.float32, device=device)
+    return torch.full((B,), x, dtype=torch.float32, device=device)
+
+
+def _max_top_k(top_k: torch.Tensor | int | list | None, V: int) -> int | None:
+    # the largest `top_k` known on the host, or `None` if given as a tensor
+    if top_k is None or isinstance(top_k, torch.Tensor):
+        return None
+    top_k = top_k if isinstance(top_k, (list, tuple)) else [top_k]
+    return max(min(k, V) if k is not None and k > 0 else V for k in top_k)
+
+
+def sampling_cutoff(
+    z: torch.Tensor,
+    top_k: torch.Tensor | None = None,
+    top_p: torch.Tensor | None = None,
+    max_top_k: int | None = None,
+) -> torch.Tensor:
+    """
+    Returns the smallest logit kept by top-k and top-p (nucleus) filtering of each row of `z`,
+    with a single sort shared by both. Rows with `top_k <= 0` or `top_p >= 1` are not filtered by them.
+    `max_top_k`, the largest effective `top_k` of all rows if known on the host,
+    saves the synchronization with the device for it.
+    """
+    B, V = z.shape
+    if top_p is None:
+        # the k largest values are enough for top-k filtering only
+        k = top_k.clamp(0, V).long()
+        k = torch.where(k > 0, k, V)
+        values = z.topk(max_top_k if max_top_k is not None else int(k.max()), -1).values
+        return values.gather(-1, (k.clamp_max(values.shape[-1]) - 1).unsqueeze(-1)).squeeze(-1)
+    values = z.sort(-1, descending=True).values
+    n = torch.full((B,), V, dtype=torch.long, device=z.device)
+    if top_k is not None:
+        n = torch.where(top_k > 0, top_k.clamp(1, V).long(), n)
+    probs = values.softmax(-1)
+    # the number of tokens whose preceding cumulative probabilities are below `top_p`
+    n_p = ((probs.cumsum(-1) - probs) < top_p.unsqueeze(-1)).sum(-1).clamp_min(1)
+    n = torch.minimum(n, torch.where(top_p < 1, n_p, V))
+    return values.gather(-1, (n - 1).unsqueeze(-1)).squeeze(-1)
+
+
+@input_guard
+def fused_sample(
+    logits: torch.Tensor,
+    temperature: torch.Tensor | float | list[float] = 1.,
+    top_k: torch.Tensor | int | list[int] | None = None,
+    top_p: torch.Tensor | float | list[float] | None = None,
+    min_p: torch.Tensor | float | list[float] | None = None,
+    repetition_penalty: torch.Tensor | float | list[float] | None = None,
+    presence_penalty: torch.Tensor | float | list[float] | None = None,
+    frequency_penalty: torch.Tensor | float | list[float] | None = None,
+    token_counts: torch.Tensor | None = None,
+    seed: int | None = None,
+) -> torch.LongTensor:
+    r"""
+    Samples the next tokens from the last-position logits with per-row sampling parameters.
+
+    Penalties and temperature are applied in one pass over the vocabulary, and the tokens are drawn by another one
+    with the Gumbel-max trick under the top-k/top-p/min-p masks, without materializing probabilities.
+    Top-k/top-p filtering additionally sorts the logits once to find the cutoff of each row.
+
+    Args:
+        logits (torch.Tensor):
+            Logits of shape `[B, V]`.
+        temperature (Union[torch.Tensor, float, List[float]]):
+            The temperature of each row of shape `[B]` or shared by all rows, 0 for greedy decoding. Default: `1.`.
+        top_k (Union[torch.Tensor, int, List[int]]):
+            Keeps the `top_k` most likely tokens only, disabled if non-positive. Default: `None`.
+        top_p (Union[torch.Tensor, float, List[float]]):
+            Keeps the smallest set of most likely tokens whose probabilities sum up to `top_p`. Default: `None`.
+        min_p (Union[torch.Tensor, float, List[float]]):
+            Drops tokens whose probabilities are below `min_p` times the largest one. Default: `None`.
+        repetition_penalty (Union[torch.Tensor, float, List[float]]):
+            Divides positive logits and multiplies negative ones of seen tokens by the penalty. Default: `None`.
+        presence_penalty (Union[torch.Tensor, float, List[float]]):
+            Subtracted from the logits of seen tokens. Default: `None`.
+        frequency_penalty (Union[torch.Tensor, float, List[float]]):
+            Subtracted from the logits of seen tokens times their counts. Default: `None`.
+        token_counts (torch.Tensor):
+            The number of occurrences of each token in each row of shape `[B, V]`, required by the penalties.
+            Default: `None`.
+        seed (Optional[int]):
+            The seed of the random numbers, drawn from the default CPU generator if not provided. Default: `None`.
+
+    Returns:
+        The sampled tokens of shape `[B]`.
+    """
+    B, V = logits.shape
+    device = logits.device
+    temperature = _as_rows(temperature, B, 1., device)
+    use_penalty = any(x is not None for x in (repetition_penalty, presence_penalty, frequency_penalty))
+    if use_penalty and token_counts is None:
+        raise ValueError("`token_counts` is required to apply the repetition/presence/frequency penalties")
+    if seed is None:
+        seed = int(torch.randint(2**31 - 1, (1,)))
+
+    z = torch.empty(B, V, dtype=torch.float32, device=device)
+    BV = min(4096, triton.next_power_of_2(V))
+    sampling_logits_kernel[(B,)](
+        logits=logits,
+        z=z,
+        counts=token_counts if use_penalty else None,
+        temperature=temperature,
+        repetition_penalty=_as_rows(repetition_penalty, B, 1., device),
+        presence_penalty=_as_rows(presence_penalty, B, 0., device),
+        frequency_penalty=_as_rows(frequency_penalty, B, 0., device),
+        V=V,
+        BV=BV,
+    )
+    if top_k is not None or top_p is not None:
+        cutoff = sampling_cutoff(
+            z,
+            _as_rows(top_k, B, 0, device) if top_k is not None else None,
+            _as_rows(top_p, B, 1., device) if top_p is not None else None,
+            _max_top_k(top_k, V),
+        )
+    else:
+        cutoff = torch.full((B,), float('-inf'), dtype=torch.float32, device=device)
+    tokens = torch.empty(B, dtype=torch.long, device=device)
+    sampling_kernel[(B,)](
+        z=z,
+        cutoff=cutoff.float().contiguous(),
+        temperature=temperature,
+        min_p=_as_rows(min_p, B, 0., device),
+        tokens=tokens,
+        seed=seed,
+        V=V,
+        BV=BV,
+    )
+    return tokens
+
+
+class FusedSampler(nn.Module):
+    """
+    Batched sampling with per-row parameters, see :func:`fused_sample`.
+    The sampler keeps the token counts of each row for the penalties, set by :meth:`reset` from the prompts
+    and updated with each sampled token.
+
+    Args:
+        temperature (Union[float, List[float]]):
+            The temperature of each row or shared by all rows, 0 for greedy decoding. Default: `1.`.
+        top_k (Union[int, List[int]]):
+            Top-k filtering. Default: `None`.
+        top_p (Union[float, List[float]]):
+            Top-p (nucleus) filtering. Default: `None`.
+        min_p (Union[float, List[float]]):
+            Min-p filtering. Default: `None`.
+        repetition_penalty (Union[float, List[float]]):
+            The repetition penalty. Default: `None`.
+        presence_penalty (Union[float, List[float]]):
+            The presence penalty. Default: `None`.
+        frequency_penalty (Union[float, List[float]]):
+            The frequency penalty. Default: `None`.
+    """
+
+    def __init__(
+        self,
+        temperature: float | list[float] = 1.,
+        top_k: int | list[int] | None = None,
+        top_p: float | list[float] | None = None,
+        min_p: float | list[float] | None = None,
+        repetition_penalty: float | list[float] | None = None,
+        presence_penalty: float | list[float] | None = None,
+        frequency_penalty: float | list[float] | None = None,
+    ):
+        super().__init__()
+        self.temperature = temperature
+        self.top_k = top_k
+        self.top_p = top_p
+        self.min_p = min_p
+        self.repetition_penalty = repetition_penalty
+        self.presence_penalty = presence_penalty
+        self.frequency_penalty = frequency_penalty
+        self.token_counts = None
+
+    @property
+    def use_penalty(self) -> bool:
+        return any(x is not None for x in (self.repetition_penalty, self.presence_penalty, self.frequency_penalty))
+
+    def extra_repr(self) -> str:
+        keys = ('temperature', 'top_k', 'top_p', 'min_p', 'repetition_penalty', 'presence_penalty', 'frequency_penalty')
+        return ', '.join(f'{key}={getattr(self, key)}' for key in keys if getattr(self, key) is not None)
+
+    def reset(self, input_ids: torch.LongTensor, vocab_size: int, attention_mask: torch.Tensor | None = None):
+        """Counts the tokens of the prompts of shape `[B, T]`, skipping paddings."""
+        self.token_counts = None
+        if self.use_penalty:
+            ones = torch.ones_like(input_ids, dtype=torch.int32)
+            if attention_mask is not None:
+                ones = ones * attention_mask.to(torch.int32)
+            self.token_counts = ones.new_zeros(input_ids.shape[0], vocab_size).scatter_add_(1, input_ids, ones)
+
+    def forward(
+        self,
+        logits: torch.Tensor | None = None,
+        hidden_states: torch.Tensor | None = None,
+        lm_head: nn.Module | None = None,
+        seed: int | None = None,
+    ) -> torch.LongTensor:
+        """
+        Samples the next tokens from the last-position `logits` of shape `[B, V]`,
+        or from the `hidden_states` of shape `[B, D]` projected by `lm_head`.
+        """
+        if logits is None:
+            logits = lm_head(hidden_states)
+        if self.use_penalty and self.token_counts is None:
+            raise ValueError("Call `reset` with the prompts before sampling with penalties")
+        tokens = fused_sample(
+            logits,
+            temperature=self.temperature,
+            top_k=self.top_k,
+            top_p=self.top_p,
+            min_p=self.min_p,
+            repetition_penalty=self.repetition_penalty,
+            presence_penalty=self.presence_penalty,
+            frequency_penalty=self.frequency_penalty,
+            token_counts=self.token_counts,
+            seed=seed,
+        )
+        if self.token_counts is not None:
+            self.token_counts.scatter_add_(1, tokens.unsqueeze(-1), torch.ones_like(self.token_counts[:, :1]))
+        return tokens
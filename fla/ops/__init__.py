@@ -1,31 +1,71 @@
 
-from .abc import chunk_abc
-from .attn import parallel_attn
-from .based import fused_chunk_based, parallel_based
-from .comba import chunk_comba, fused_recurrent_comba
-from .delta_rule import chunk_delta_rule, fused_chunk_delta_rule, fused_recurrent_delta_rule
-from .forgetting_attn import parallel_forgetting_attn
-from .gated_delta_rule import chunk_gated_delta_rule, fused_recurrent_gated_delta_rule
-from .generalized_delta_rule import (
-    chunk_dplr_delta_rule,
-    chunk_iplr_delta_rule,
-    fused_recurrent_dplr_delta_rule,
-    fused_recurrent_iplr_delta_rule,
-)
-from .gla import chunk_gla, fused_chunk_gla, fused_recurrent_gla
-from .gsa import chunk_gsa, fused_recurrent_gsa
-from .hgrn import fused_recurrent_hgrn
-from .kda import chunk_kda, fused_recurrent_kda
-from .lightning_attn import chunk_lightning_attn, fused_recurrent_lightning_attn
-from .linear_attn import chunk_linear_attn, fused_chunk_linear_attn, fused_recurrent_linear_attn
-from .log_linear_attn import chunk_log_linear_attn
-from .mesa_net import chunk_mesa_net
-from .nsa import parallel_nsa
-from .path_attn import parallel_path_attn
-from .retention import chunk_retention, fused_chunk_retention, fused_recurrent_retention, parallel_retention
-from .rwkv6 import chunk_rwkv6, fused_recurrent_rwkv6
-from .rwkv7 import chunk_rwkv7, fused_recurrent_rwkv7
-from .simple_gla import chunk_simple_gla, fused_chunk_simple_gla, fused_recurrent_simple_gla, parallel_simple_gla
+from typing import TYPE_CHECKING
+
+from fla.lazy import lazy_import
+
+if TYPE_CHECKING:
+    from .abc import chunk_abc
+    from .attn import parallel_attn
+    from .based import fused_chunk_based, parallel_based
+    from .comba import chunk_comba, fused_recurrent_comba
+    from .delta_rule import chunk_delta_rule, fused_chunk_delta_rule, fused_recurrent_delta_rule
+    from .forgetting_attn import parallel_forgetting_attn
+    from .gated_delta_rule import chunk_gated_delta_rule, fused_recurrent_gated_delta_rule
+    from .generalized_delta_rule import (
+        chunk_dplr_delta_rule,
+        chunk_iplr_delta_rule,
+        fused_recurrent_dplr_delta_rule,
+        fused_recurrent_iplr_delta_rule,
+    )
+    from .gla import chunk_gla, fused_chunk_gla, fused_recurrent_gla
+    from .gsa import chunk_gsa, fused_recurrent_gsa
+    from .hgrn import fused_recurrent_hgrn
+    from .kda import chunk_kda, fused_recurrent_kda
+    from .lightning_attn import chunk_lightning_attn, fused_recurrent_lightning_attn
+    from .linear_attn import chunk_linear_attn, fused_chunk_linear_attn, fused_recurrent_linear_attn
+    from .log_linear_attn import chunk_log_linear_attn
+    from .mesa_net import chunk_mesa_net
+    from .nsa import parallel_nsa
+    from .path_attn import parallel_path_attn
+    from .retention import chunk_retention, fused_chunk_retention, fused_recurrent_retention, parallel_retention
+    from .rwkv6 import chunk_rwkv6, fused_recurrent_rwkv6
+    from .rwkv7 import chunk_rwkv7, fused_recurrent_rwkv7
+    from .simple_gla import chunk_simple_gla, fused_chunk_simple_gla, fused_recurrent_simple_gla, parallel_simple_gla
+    from .utils.dispatch import get_backends, get_dispatch_report, set_backend, use_backend
+    from .utils.mode import select_mode
+else:
+    __getattr__, __dir__ = lazy_import(__name__, {
+        '.abc': ['chunk_abc'],
+        '.attn': ['parallel_attn'],
+        '.based': ['fused_chunk_based', 'parallel_based'],
+        '.comba': ['chunk_comba', 'fused_recurrent_comba'],
+        '.delta_rule': ['chunk_delta_rule', 'fused_chunk_delta_rule', 'fused_recurrent_delta_rule'],
+        '.forgetting_attn': ['parallel_forgetting_attn'],
+        '.gated_delta_rule': ['chunk_gated_delta_rule', 'fused_recurrent_gated_delta_rule'],
+        '.generalized_delta_rule': [
+            'chunk_dplr_delta_rule',
+            'chunk_iplr_delta_rule',
+            'fused_recurrent_dplr_delta_rule',
+            'fused_recurrent_iplr_delta_rule',
+        ],
+        '.gla': ['chunk_gla', 'fused_chunk_gla', 'fused_recurrent_gla'],
+        '.gsa': ['chunk_gsa', 'fused_recurrent_gsa'],
+        '.hgrn': ['fused_recurrent_hgrn'],
+        '.kda': ['chunk_kda', 'fused_recurrent_kda'],
+        '.lightning_attn': ['chunk_lightning_attn', 'fused_recurrent_lightning_attn'],
+        '.linear_attn': ['chunk_linear_attn', 'fused_chunk_linear_attn', 'fused_recurrent_linear_attn'],
+        '.log_linear_attn': ['chunk_log_linear_attn'],
+        '.mesa_net': ['chunk_mesa_net'],
+        '.nsa': ['parallel_nsa'],
+        '.path_attn': ['parallel_path_attn'],
+        '.retention': ['chunk_retention', 'fused_chunk_retention', 'fused_recurrent_retention', 'parallel_retention'],
+        '.rwkv6': ['chunk_rwkv6', 'fused_recurrent_rwkv6'],
+        '.rwkv7': ['chunk_rwkv7', 'fused_recurrent_rwkv7'],
+        '.simple_gla': ['chunk_simple_gla', 'fused_chunk_simple_gla', 'fused_recurrent_simple_gla', 'parallel_simple_gla'],
+        '.utils.dispatch': ['get_backends', 'get_dispatch_report', 'set_backend', 'use_backend'],
+        '.utils.mode': ['select_mode'],
+    })
+
 
 __all__ = [
     'chunk_abc',
@@ -51,4 +91,6 @@ __all__ = [
     'chunk_rwkv6', 'fused_recurrent_rwkv6',
     'chunk_rwkv7', 'fused_recurrent_rwkv7',
     'chunk_simple_gla', 'fused_chunk_simple_gla', 'fused_recurrent_simple_gla', 'parallel_simple_gla',
+    'get_backends', 'get_dispatch_report', 'set_backend', 'use_backend',
+    'select_mode',
 ]
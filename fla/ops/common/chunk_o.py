@@ -40,6 +40,7 @@ def chunk_fwd_kernel_o(
     scale,
     T,
     H: tl.constexpr,
+    G: tl.constexpr,
     K: tl.constexpr,
     V: tl.constexpr,
     BT: tl.constexpr,
@@ -50,7 +51,9 @@ def chunk_fwd_kernel_o(
     IS_VARLEN: tl.constexpr,
 ):
     i_v, i_t, i_bh = tl.program_id(0), tl.program_id(1), tl.program_id(2)
+    # the queries/keys are shared by every `G` heads
     i_b, i_h = i_bh // H, i_bh % H
+    i_hk = i_h // G
 
     if IS_VARLEN:
         i_tg = i_t
@@ -64,8 +67,8 @@ def chunk_fwd_kernel_o(
         bos, eos = i_b * T, i_b * T + T
 
     # offset calculation
-    q += (bos * H + i_h) * K
-    k += (bos * H + i_h) * K
+    q += (bos * (H//G) + i_hk) * K
+    k += (bos * (H//G) + i_hk) * K
     v += (bos * H + i_h) * V
     o += (bos * H + i_h) * V
     h += (i_tg * H + i_h).to(tl.int64) * K*V
@@ -74,8 +77,8 @@ def chunk_fwd_kernel_o(
     b_A = tl.zeros([BT, BT], dtype=tl.float32)
 
     for i_k in range(tl.cdiv(K, BK)):
-        p_q = tl.make_block_ptr(q, (T, K), (H*K, 1), (i_t * BT, i_k * BK), (BT, BK), (1, 0))
-        p_k = tl.make_block_ptr(k, (K, T), (1, H*K), (i_k * BK, i_t * BT), (BK, BT), (0, 1))
+        p_q = tl.make_block_ptr(q, (T, K), ((H//G)*K, 1), (i_t * BT, i_k * BK), (BT, BK), (1, 0))
+        p_k = tl.make_block_ptr(k, (K, T), (1, (H//G)*K), (i_k * BK, i_t * BT), (BK, BT), (0, 1))
         p_h = tl.make_block_ptr(h, (K, V), (V, 1), (i_k * BK, i_v * BV), (BK, BV), (1, 0))
         # [BT, BK]
         b_q = tl.load(p_q, boundary_check=(0, 1))
@@ -153,6 +156,7 @@ def chunk_bwd_kernel_dqkwg(
     B: tl.constexpr,
     T,
     H: tl.constexpr,
+    G: tl.constexpr,
     K: tl.constexpr,
     V: tl.constexpr,
     BT: tl.constexpr,
@@ -164,7 +168,9 @@ def chunk_bwd_kernel_dqkwg(
     IS_VARLEN: tl.constexpr,
 ):
     i_k, i_t, i_bh = tl.program_id(0), tl.program_id(1), tl.program_id(2)
+    # the queries/keys are shared by every `G` heads
     i_b, i_h = i_bh // H, i_bh % H
+    i_hk = i_h // G
 
     all = B * T
     if IS_VARLEN:
@@ -183,8 +189,8 @@ def chunk_bwd_kernel_dqkwg(
     do += (bos * H + i_h) * V
     h += (i_tg * H + i_h).to(tl.int64) * K*V
     dh += (i_tg * H + i_h).to(tl.int64) * K*V
-    q += (bos * H + i_h) * K
-    k += (bos * H + i_h) * K
+    q += (bos * (H//G) + i_hk) * K
+    k += (bos * (H//G) + i_hk) * K
     dq += (bos * H + i_h) * K
     dk += (bos * H + i_h) * K
 
@@ -234,8 +240,8 @@ def chunk_bwd_kernel_dqkwg(
         tl.store(p_dw, -b_dw.to(p_dw.dtype.element_ty), boundary_check=(0, 1))
 
     tl.debug_barrier()
-    p_q = tl.make_block_ptr(q, (T, K), (H*K, 1), (i_t * BT, i_k * BK), (BT, BK), (1, 0))
-    p_k = tl.make_block_ptr(k, (T, K), (H*K, 1), (i_t * BT, i_k * BK), (BT, BK), (1, 0))
+    p_q = tl.make_block_ptr(q, (T, K), ((H//G)*K, 1), (i_t * BT, i_k * BK), (BT, BK), (1, 0))
+    p_k = tl.make_block_ptr(k, (T, K), ((H//G)*K, 1), (i_t * BT, i_k * BK), (BT, BK), (1, 0))
     b_q = tl.load(p_q, boundary_check=(0, 1))
     b_k = tl.load(p_k, boundary_check=(0, 1))
 
@@ -327,6 +333,7 @@ def chunk_bwd_kernel_dv(
     scale,
     T,
     H: tl.constexpr,
+    G: tl.constexpr,
     K: tl.constexpr,
     V: tl.constexpr,
     BT: tl.constexpr,
@@ -337,7 +344,9 @@ def chunk_bwd_kernel_dv(
     IS_VARLEN: tl.constexpr,
 ):
     i_v, i_t, i_bh = tl.program_id(0), tl.program_id(1), tl.program_id(2)
+    # the queries/keys are shared by every `G` heads
     i_b, i_h = i_bh // H, i_bh % H
+    i_hk = i_h // G
     if IS_VARLEN:
         i_tg = i_t
         i_n, i_t = tl.load(chunk_indices + i_t * 2).to(tl.int32), tl.load(chunk_indices + i_t * 2 + 1).to(tl.int32)
@@ -352,16 +361,16 @@ def chunk_bwd_kernel_dv(
     b_dv = tl.zeros([BT, BV], dtype=tl.float32)
 
     # offset calculation
-    q += (bos * H + i_h) * K
-    k += (bos * H + i_h) * K
+    q += (bos * (H//G) + i_hk) * K
+    k += (bos * (H//G) + i_hk) * K
     do += (bos * H + i_h) * V
     dv += (bos * H + i_h) * V
     dh += (i_tg * H + i_h).to(tl.int64) * K*V
 
     b_A = tl.zeros([BT, BT], dtype=tl.float32)
     for i_k in range(tl.cdiv(K, BK)):
-        p_k = tl.make_block_ptr(k, (T, K), (H*K, 1), (i_t * BT, i_k * BK), (BT, BK), (1, 0))
-        p_q = tl.make_block_ptr(q, (K, T), (1, H*K), (i_k * BK, i_t * BT), (BK, BT), (0, 1))
+        p_k = tl.make_block_ptr(k, (T, K), ((H//G)*K, 1), (i_t * BT, i_k * BK), (BT, BK), (1, 0))
+        p_q = tl.make_block_ptr(q, (K, T), (1, (H//G)*K), (i_k * BK, i_t * BT), (BK, BT), (0, 1))
         b_q = tl.load(p_q, boundary_check=(0, 1))
         b_k = tl.load(p_k, boundary_check=(0, 1))
         b_A += tl.dot(b_k, b_q)
@@ -423,6 +432,7 @@ def chunk_bwd_kernel_dv_local(
     scale,
     T,
     H: tl.constexpr,
+    G: tl.constexpr,
     K: tl.constexpr,
     V: tl.constexpr,
     BT: tl.constexpr,
@@ -434,7 +444,9 @@ def chunk_bwd_kernel_dv_local(
     IS_VARLEN: tl.constexpr,
 ):
     i_t, i_bh = tl.program_id(0), tl.program_id(1)
+    # the queries/keys are shared by every `G` heads
     i_b, i_h = i_bh // H, i_bh % H
+    i_hk = i_h // G
     if IS_VARLEN:
         i_n, i_t = tl.load(chunk_indices + i_t * 2).to(tl.int32), tl.load(chunk_indices + i_t * 2 + 1).to(tl.int32)
         bos, eos = tl.load(cu_seqlens + i_n).to(tl.int32), tl.load(cu_seqlens + i_n + 1).to(tl.int32)
@@ -443,8 +455,8 @@ def chunk_bwd_kernel_dv_local(
         bos, eos = i_b * T, i_b * T + T
 
     # offset calculation
-    q += (bos * H + i_h) * K
-    k += (bos * H + i_h) * K
+    q += (bos * (H//G) + i_hk) * K
+    k += (bos * (H//G) + i_hk) * K
     do += (bos * H + i_h) * V
     dv += (bos * H + i_h) * V
 
@@ -462,8 +474,8 @@ def chunk_bwd_kernel_dv_local(
 
         b_A = tl.zeros([BT, BT], dtype=tl.float32)
         for i_k in range(tl.cdiv(K, BK)):
-            p_k = tl.make_block_ptr(k, (T, K), (H*K, 1), (i_t * BT, i_k * BK), (BT, BK), (1, 0))
-            p_q = tl.make_block_ptr(q, (K, T), (1, H*K), (i_k * BK, i_t * BT), (BK, BT), (0, 1))
+            p_k = tl.make_block_ptr(k, (T, K), ((H//G)*K, 1), (i_t * BT, i_k * BK), (BT, BK), (1, 0))
+            p_q = tl.make_block_ptr(q, (K, T), (1, (H//G)*K), (i_k * BK, i_t * BT), (BK, BT), (0, 1))
 
             b_k = tl.load(p_k, boundary_check=(0, 1))
             b_q = tl.load(p_q, boundary_check=(0, 1))
@@ -495,7 +507,7 @@ def chunk_fwd_o(
     cu_seqlens: torch.LongTensor | None = None,
     chunk_size: int = 64,
 ) -> torch.Tensor:
-    B, T, H, K, V = *q.shape, v.shape[-1]
+    B, T, Hk, K, H, V = *q.shape, *v.shape[2:]
     BT = chunk_size
     chunk_indices = prepare_chunk_indices(cu_seqlens, BT) if cu_seqlens is not None else None
     NT = triton.cdiv(T, BT) if cu_seqlens is None else len(chunk_indices)
@@ -517,6 +529,7 @@ def chunk_fwd_o(
         scale=scale,
         T=T,
         H=H,
+        G=H // Hk,
         K=K,
         V=V,
         BT=BT,
@@ -535,7 +548,7 @@ def chunk_bwd_dv(
     cu_seqlens: torch.LongTensor | None = None,
     chunk_size: int = 64,
 ) -> torch.Tensor:
-    B, T, H, K, V = *k.shape, do.shape[-1]
+    B, T, Hk, K, H, V = *k.shape, *do.shape[2:]
     BT = chunk_size
     chunk_indices = prepare_chunk_indices(cu_seqlens, BT) if cu_seqlens is not None else None
     # H100 can have larger block size
@@ -567,6 +580,7 @@ def chunk_bwd_dv(
         scale=scale,
         T=T,
         H=H,
+        G=H // Hk,
         K=K,
         V=V,
         BT=BT,
@@ -588,7 +602,7 @@ def chunk_bwd_dv_local(
     chunk_size: int = 64,
     chunk_indices: torch.LongTensor | None = None,
 ) -> torch.Tensor:
-    B, T, H, K, V = *k.shape, do.shape[-1]
+    B, T, Hk, K, H, V = *k.shape, *do.shape[2:]
     BT = chunk_size
     if chunk_indices is None and cu_seqlens is not None:
         chunk_indices = prepare_chunk_indices(cu_seqlens, BT)
@@ -618,6 +632,7 @@ def chunk_bwd_dv_local(
         scale=scale,
         T=T,
         H=H,
+        G=H // Hk,
         K=K,
         V=V,
         BT=BT,
@@ -643,7 +658,8 @@ def chunk_bwd_dqkwg(
     chunk_size: int = 64,
 ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
 
-    B, T, H, K, V = *k.shape, v.shape[-1]
+    B, T, Hk, K, H, V = *k.shape, *v.shape[2:]
+    G = H // Hk
     BT = chunk_size
     chunk_indices = prepare_chunk_indices(cu_seqlens, BT) if cu_seqlens is not None else None
     NT = triton.cdiv(T, BT) if cu_seqlens is None else len(chunk_indices)
@@ -652,8 +668,9 @@ def chunk_bwd_dqkwg(
     BK = min(max(triton.next_power_of_2(K), 16), CONST_TILING)
     BV = min(max(triton.next_power_of_2(V), 16), CONST_TILING)
     NK = triton.cdiv(K, BK)
-    dq = torch.empty_like(q)
-    dk = torch.empty_like(k)
+    # the gradients of the shared queries/keys are accumulated over the groups afterwards
+    dq = torch.empty_like(q) if G == 1 else q.new_empty(B, T, H, K, dtype=torch.float32)
+    dk = torch.empty_like(k) if G == 1 else k.new_empty(B, T, H, K, dtype=torch.float32)
     dg = torch.empty(NK, *g.shape, dtype=torch.float32, device=g.device) if g is not None else None
     dw = torch.empty_like(w) if w is not None else None
 
@@ -678,6 +695,7 @@ def chunk_bwd_dqkwg(
         B=B,
         T=T,
         H=H,
+        G=G,
         K=K,
         V=V,
         BT=BT,
@@ -687,4 +705,6 @@ def chunk_bwd_dqkwg(
 
     if dg is not None:
         dg = dg.sum(0)
+    if G > 1:
+        dq, dk = (x.view(B, T, Hk, G, K).sum(3).to(y) for x, y in ((dq, q), (dk, k)))
     return dq, dk, dw, dg
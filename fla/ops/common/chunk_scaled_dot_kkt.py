@@ -34,6 +34,7 @@ def chunk_scaled_dot_kkt_fwd_kernel(
     chunk_indices,
     T,
     H: tl.constexpr,
+    G: tl.constexpr,
     K: tl.constexpr,
     BT: tl.constexpr,
     BK: tl.constexpr,
@@ -41,7 +42,9 @@ def chunk_scaled_dot_kkt_fwd_kernel(
     USE_G: tl.constexpr,
 ):
     i_t, i_bh = tl.program_id(0), tl.program_id(1)
+    # the keys are shared by every `G` heads
     i_b, i_h = i_bh // H, i_bh % H
+    i_hk = i_h // G
     if IS_VARLEN:
         i_n, i_t = tl.load(chunk_indices + i_t * 2).to(tl.int32), tl.load(chunk_indices + i_t * 2 + 1).to(tl.int32)
         bos, eos = tl.load(cu_seqlens + i_n).to(tl.int32), tl.load(cu_seqlens + i_n + 1).to(tl.int32)
@@ -56,7 +59,7 @@ def chunk_scaled_dot_kkt_fwd_kernel(
 
     b_A = tl.zeros([BT, BT], dtype=tl.float32)
     for i_k in range(tl.cdiv(K, BK)):
-        p_k = tl.make_block_ptr(k + (bos*H + i_h) * K, (T, K), (H*K, 1), (i_t * BT, i_k * BK), (BT, BK), (1, 0))
+        p_k = tl.make_block_ptr(k + (bos*(H//G) + i_hk) * K, (T, K), ((H//G)*K, 1), (i_t * BT, i_k * BK), (BT, BK), (1, 0))
         b_k = tl.load(p_k, boundary_check=(0, 1))
         b_A += tl.dot(b_k, tl.trans(b_k))
 
@@ -86,7 +89,7 @@ def chunk_scaled_dot_kkt_fwd(
 
     Args:
         k (torch.Tensor):
-            The key tensor of shape `[B, T, H, K]`.
+            The key tensor of shape `[B, T, Hk, K]`, shared by every `H // Hk` heads of `beta` if `Hk < H`.
         beta (torch.Tensor):
             The beta tensor of shape `[B, T, H]`.
         g (torch.Tensor):
@@ -104,7 +107,8 @@ def chunk_scaled_dot_kkt_fwd(
     Returns:
         beta * K * K^T of shape `[B, T, H, BT]` where `BT` is the chunk size.
     """
-    B, T, H, K = k.shape
+    B, T, Hk, K = k.shape
+    H = beta.shape[2]
     BT = chunk_size
     chunk_indices = prepare_chunk_indices(cu_seqlens, BT) if cu_seqlens is not None else None
     NT = triton.cdiv(T, BT) if cu_seqlens is None else len(chunk_indices)
@@ -118,6 +122,7 @@ def chunk_scaled_dot_kkt_fwd(
         chunk_indices=chunk_indices,
         T=T,
         H=H,
+        G=H // Hk,
         K=K,
         BT=BT,
     )
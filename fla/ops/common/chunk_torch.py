@@ -0,0 +1,225 @@
+# Copyright (c) 2023-2025, Songlin Yang, Yu Zhang
+
+"""
+Chunkwise-parallel PyTorch implementations of the linear attention ops.
+
+The Triton kernels are unavailable on CPU, so the ops register these implementations as their `torch` backends
+for inputs on CPU. The intra-chunk work is batched over all chunks and only the state propagation is sequential.
+"""
+
+import torch
+import torch.nn.functional as F
+from einops import rearrange
+
+from fla.ops.utils.index import prepare_token_indices
+
+
+def to_chunks(
+    x: torch.Tensor | None,
+    chunk_size: int,
+    cu_seqlens: torch.LongTensor | None = None,
+) -> torch.Tensor | None:
+    """
+    Converts `x` of shape `[B, T, H, ...]` to fp32 chunks of shape `[N, H, NT, BT, ...]`.
+    Variable-length inputs are unpacked into `N` sequences, and all sequences are padded with zeros at the end,
+    which leaves the states intact as padded tokens neither decay nor write the states.
+    """
+    if x is None:
+        return None
+    x = x.float()
+    if cu_seqlens is not None:
+        if x.shape[0] != 1:
+            raise ValueError(
+                f"The batch size is expected to be 1 rather than {x.shape[0]} when using `cu_seqlens`."
+                f"Please flatten variable-length inputs before processing.",
+            )
+        lens = torch.diff(cu_seqlens)
+        token_indices = prepare_token_indices(cu_seqlens).long()
+        padded = x.new_zeros(len(lens), int(lens.max()), *x.shape[2:])
+        x = padded.index_put((token_indices[:, 0], token_indices[:, 1]), x[0])
+    x = F.pad(x, (0, 0) * (x.ndim - 2) + (0, -x.shape[1] % chunk_size))
+    return rearrange(x, 'b (n c) h ... -> b h n c ...', c=chunk_size)
+
+
+def from_chunks(
+    x: torch.Tensor,
+    T: int,
+    cu_seqlens: torch.LongTensor | None = None,
+) -> torch.Tensor:
+    """
+    The inverse of :func:`to_chunks`, returning `x` of shape `[B, T, H, ...]`.
+    """
+    x = rearrange(x, 'b h n c ... -> b (n c) h ...')
+    if cu_seqlens is not None:
+        token_indices = prepare_token_indices(cu_seqlens).long()
+        return x[token_indices[:, 0], token_indices[:, 1]].unsqueeze(0)
+    return x[:, :T]
+
+
+def chunk_gla_torch(
+    q: torch.Tensor,
+    k: torch.Tensor,
+    v: torch.Tensor,
+    g: torch.Tensor | None = None,
+    gk: torch.Tensor | None = None,
+    scale: float | None = None,
+    initial_state: torch.Tensor | None = None,
+    output_final_state: bool = False,
+    cu_seqlens: torch.LongTensor | None = None,
+    chunk_size: int = 64,
+) -> tuple[torch.Tensor, torch.Tensor | None]:
+    r"""
+    Chunkwise gated linear attention in PyTorch, covering :func:`fla.ops.gla.chunk_gla` with key-wise decays `gk`,
+    :func:`fla.ops.simple_gla.chunk_simple_gla` with head-wise decays `g` and plain linear attention without decays.
+    All chunks are processed in parallel, leaving only the propagation of the states across chunks sequential.
+
+    Args:
+        q (torch.Tensor):
+            queries of shape `[B, T, H, K]`.
+        k (torch.Tensor):
+            keys of shape `[B, T, H, K]`.
+        v (torch.Tensor):
+            values of shape `[B, T, H, V]`.
+        g (Optional[torch.Tensor]):
+            Head-wise forget gates (in log space!) of shape `[B, T, H]`. Default: `None`.
+        gk (Optional[torch.Tensor]):
+            Key-wise forget gates (in log space!) of shape `[B, T, H, K]`. Default: `None`.
+        scale (Optional[float]):
+            Scale factor of the attention scores. If not provided, it will default to `1 / sqrt(K)`. Default: `None`.
+        initial_state (Optional[torch.Tensor]):
+            Initial state of shape `[N, H, K, V]` for `N` input sequences. Default: `None`.
+        output_final_state (bool):
+            Whether to output the final state of shape `[N, H, K, V]`. Default: `False`.
+        cu_seqlens (Optional[torch.LongTensor]):
+            Cumulative sequence lengths of shape `[N+1]` used for variable-length inputs. Default: `None`.
+        chunk_size (int):
+            The chunk size. Default: 64.
+
+    Returns:
+        o (torch.Tensor):
+            Outputs of shape `[B, T, H, V]`.
+        final_state (torch.Tensor):
+            Final state of shape `[N, H, K, V]` in fp32 if `output_final_state=True` else `None`.
+    """
+    T, K, dtype = q.shape[1], q.shape[-1], v.dtype
+    if scale is None:
+        scale = K ** -0.5
+    q, k, v, g, gk = (to_chunks(x, chunk_size, cu_seqlens) for x in (q, k, v, g, gk))
+    q = q * scale
+    mask = torch.ones(chunk_size, chunk_size, dtype=torch.bool, device=q.device).tril()
+
+    # intra-chunk attention scores, with the decays between pairs of tokens taken as differences of the cumsums
+    # rather than factorized into the queries/keys to stay finite under strong decays
+    if gk is not None:
+        gk = gk.cumsum(-2)
+        A = []
+        for i in range(chunk_size):
+            # the keys of the tokens up to `i` decayed to `i`, for all chunks at once
+            k_i = k[..., :i+1, :] * (gk[..., i:i+1, :] - gk[..., :i+1, :]).exp()
+            A.append(F.pad(torch.einsum('...k,...jk->...j', q[..., i, :], k_i), (0, chunk_size - i - 1)))
+        A = torch.stack(A, -2)
+        q, k, decay = q * gk.exp(), k * (gk[..., -1:, :] - gk).exp(), gk[..., -1, :, None].exp()
+    else:
+        A = (q @ k.transpose(-1, -2)).masked_fill(~mask, 0)
+        decay = None
+        if g is not None:
+            g = g.cumsum(-1)
+            A = A * torch.where(mask, g[..., :, None] - g[..., None, :], float('-inf')).exp()
+            q, k, decay = q * g[..., None].exp(), k * (g[..., -1:] - g)[..., None].exp(), g[..., -1, None, None].exp()
+    o = A @ v
+
+    N, H, NT = q.shape[:3]
+    h = q.new_zeros(N, H, K, v.shape[-1]) if initial_state is None else initial_state.float()
+    o_inter = []
+    for i in range(NT):
+        o_inter.append(q[:, :, i] @ h)
+        h = (h * decay[:, :, i] if decay is not None else h) + k[:, :, i].transpose(-1, -2) @ v[:, :, i]
+    o = o + torch.stack(o_inter, 2)
+    return from_chunks(o, T, cu_seqlens).to(dtype), h if output_final_state else None
+
+
+def chunk_gated_delta_rule_torch(
+    q: torch.Tensor,
+    k: torch.Tensor,
+    v: torch.Tensor,
+    beta: torch.Tensor,
+    g: torch.Tensor | None = None,
+    scale: float | None = None,
+    initial_state: torch.Tensor | None = None,
+    output_final_state: bool = False,
+    use_qk_l2norm_in_kernel: bool = False,
+    cu_seqlens: torch.LongTensor | None = None,
+    chunk_size: int = 64,
+) -> tuple[torch.Tensor, torch.Tensor | None]:
+    r"""
+    Chunkwise (gated) delta rule in PyTorch, covering :func:`fla.ops.gated_delta_rule.chunk_gated_delta_rule`
+    and :func:`fla.ops.delta_rule.chunk_delta_rule` without decays. The updates within each chunk are folded into
+    the WY representation by a triangular solve for all chunks in parallel,
+    leaving only the propagation of the states across chunks sequential.
+
+    Args:
+        q (torch.Tensor):
+            queries of shape `[B, T, H, K]`.
+        k (torch.Tensor):
+            keys of shape `[B, T, H, K]`.
+        v (torch.Tensor):
+            values of shape `[B, T, HV, V]`. GVA is applied if `HV > H`.
+        beta (torch.Tensor):
+            betas of shape `[B, T, HV]`.
+        g (Optional[torch.Tensor]):
+            Forget gates (in log space!) of shape `[B, T, HV]`. Default: `None`.
+        scale (Optional[float]):
+            Scale factor of the attention scores. If not provided, it will default to `1 / sqrt(K)`. Default: `None`.
+        initial_state (Optional[torch.Tensor]):
+            Initial state of shape `[N, HV, K, V]` for `N` input sequences. Default: `None`.
+        output_final_state (bool):
+            Whether to output the final state of shape `[N, HV, K, V]`. Default: `False`.
+        use_qk_l2norm_in_kernel (bool):
+            Whether to apply L2norm to the queries/keys. Default: `False`.
+        cu_seqlens (Optional[torch.LongTensor]):
+            Cumulative sequence lengths of shape `[N+1]` used for variable-length inputs. Default: `None`.
+        chunk_size (int):
+            The chunk size. Default: 64.
+
+    Returns:
+        o (torch.Tensor):
+            Outputs of shape `[B, T, HV, V]`.
+        final_state (torch.Tensor):
+            Final state of shape `[N, HV, K, V]` in fp32 if `output_final_state=True` else `None`.
+    """
+    T, K, dtype = q.shape[1], q.shape[-1], v.dtype
+    if scale is None:
+        scale = K ** -0.5
+    if use_qk_l2norm_in_kernel:
+        q, k = (x.float() / torch.sqrt(x.float().pow(2).sum(-1, keepdim=True) + 1e-6) for x in (q, k))
+    if v.shape[2] > q.shape[2]:
+        q, k = (x.repeat_interleave(v.shape[2] // q.shape[2], 2) for x in (q, k))
+    q, k, v, beta, g = (to_chunks(x, chunk_size, cu_seqlens) for x in (q, k, v, beta, g))
+    q = q * scale
+    mask = torch.ones(chunk_size, chunk_size, dtype=torch.bool, device=q.device).tril()
+
+    # the decays between pairs of tokens within each chunk, `exp(g_i - g_j)` for `i >= j`
+    if g is not None:
+        g = g.cumsum(-1)
+        decay = torch.where(mask, g[..., :, None] - g[..., None, :], float('-inf')).exp()
+    else:
+        decay = mask.float()
+    # WY representation: the pseudo values of a chunk are `u - w @ h` for the state `h` at its beginning
+    A = ((k * beta[..., None]) @ k.transpose(-1, -2) * decay).tril(-1)
+    A = torch.linalg.solve_triangular(A + torch.eye(chunk_size, device=A.device), torch.eye(chunk_size, device=A.device),
+                                      upper=False, unitriangular=True)
+    w = A @ (k * (beta * g.exp() if g is not None else beta)[..., None])
+    u = A @ (v * beta[..., None])
+    A = q @ k.transpose(-1, -2) * decay
+    if g is not None:
+        q, k, decay = q * g[..., None].exp(), k * (g[..., -1:] - g)[..., None].exp(), g[..., -1, None, None].exp()
+
+    N, H, NT = q.shape[:3]
+    h = q.new_zeros(N, H, K, v.shape[-1]) if initial_state is None else initial_state.float()
+    o = []
+    for i in range(NT):
+        v_new = u[:, :, i] - w[:, :, i] @ h
+        o.append(q[:, :, i] @ h + A[:, :, i] @ v_new)
+        h = (h * decay[:, :, i] if g is not None else h) + k[:, :, i].transpose(-1, -2) @ v_new
+    o = torch.stack(o, 2)
+    return from_chunks(o, T, cu_seqlens).to(dtype), h if output_final_state else None
@@ -12,6 +12,7 @@ from fla.utils import autocast_custom_bwd, autocast_custom_fwd, autotune_cache_k
 @triton.heuristics({
     'USE_INITIAL_STATE': lambda args: args['h0'] is not None,
     'STORE_FINAL_STATE': lambda args: args['ht'] is not None,
+    'STORE_INTERMEDIATE_STATES': lambda args: args['hs'] is not None,
     'IS_VARLEN': lambda args: args['cu_seqlens'] is not None,
 })
 @triton.autotune(
@@ -34,6 +35,7 @@ def fused_recurrent_fwd_kernel(
     o,
     h0,
     ht,
+    hs,
     cu_seqlens,
     scale,
     B,
@@ -50,6 +52,7 @@ def fused_recurrent_fwd_kernel(
     USE_GV: tl.constexpr,
     USE_INITIAL_STATE: tl.constexpr,
     STORE_FINAL_STATE: tl.constexpr,
+    STORE_INTERMEDIATE_STATES: tl.constexpr,
     IS_VARLEN: tl.constexpr,
 ):
     i_v, i_k, i_nh = tl.program_id(0).to(tl.int64), tl.program_id(1).to(tl.int64), tl.program_id(2).to(tl.int64)
@@ -76,6 +79,8 @@ def fused_recurrent_fwd_kernel(
         p_gv = gv + (bos + ((T-1) if REVERSE else 0)) * H*V + i_h * V + o_v
     if USE_G_GAMMA:
         b_g_gamma = tl.load(g_gamma + i_h)
+    if STORE_INTERMEDIATE_STATES:
+        p_hs = hs + ((bos + ((T-1) if REVERSE else 0)) * H + i_h) * K*V + o_k[:, None] * V + o_v[None, :]
 
     m_k = o_k < K
     m_v = o_v < V
@@ -105,6 +110,10 @@ def fused_recurrent_fwd_kernel(
         b_o = b_h * b_q[:, None]
         b_o = tl.sum(b_o, axis=0)
         tl.store(p_o, b_o.to(p_o.dtype.element_ty), mask=m_v)
+        # the state after each token, e.g., for rolling back the rejected tokens of speculative decoding
+        if STORE_INTERMEDIATE_STATES:
+            tl.store(p_hs, b_h.to(p_hs.dtype.element_ty), mask=m_h)
+            p_hs += (-1 if REVERSE else 1) * H*K*V
         p_q += (-1 if REVERSE else 1) * H*K
         p_k += (-1 if REVERSE else 1) * H*K
         p_v += (-1 if REVERSE else 1) * H*V
@@ -346,6 +355,7 @@ def fused_recurrent_fwd(
     output_final_state: bool = False,
     reverse: bool = False,
     cu_seqlens: torch.LongTensor | None = None,
+    output_intermediate_states: bool = False,
 ):
     B, T, H, K, V = *k.shape, v.shape[-1]
     N = B if cu_seqlens is None else len(cu_seqlens) - 1
@@ -354,6 +364,7 @@ def fused_recurrent_fwd(
 
     h0 = initial_state
     ht = q.new_empty(N, H, K, V, dtype=torch.float32) if output_final_state else None
+    hs = q.new_empty(B, T, H, K, V, dtype=torch.float32) if output_intermediate_states else None
     o = q.new_empty(NK, *v.shape, dtype=torch.float32)
 
     grid = (NV, NK, N * H)
@@ -368,6 +379,7 @@ def fused_recurrent_fwd(
         o=o,
         h0=h0,
         ht=ht,
+        hs=hs,
         cu_seqlens=cu_seqlens,
         scale=scale,
         T=T,
@@ -384,7 +396,7 @@ def fused_recurrent_fwd(
         REVERSE=reverse,
     )
     o = o.sum(0)
-    return o, ht
+    return o, ht, hs
 
 
 def fused_recurrent_bwd(
@@ -490,8 +502,9 @@ class FusedRecurrentFunction(torch.autograd.Function):
         output_final_state: bool = False,
         reverse: bool = False,
         cu_seqlens: torch.LongTensor | None = None,
+        output_intermediate_states: bool = False,
     ):
-        o, ht = fused_recurrent_fwd(
+        o, ht, hs = fused_recurrent_fwd(
             q=q,
             k=k,
             v=v,
@@ -504,17 +517,20 @@ class FusedRecurrentFunction(torch.autograd.Function):
             output_final_state=output_final_state,
             reverse=reverse,
             cu_seqlens=cu_seqlens,
+            output_intermediate_states=output_intermediate_states,
         )
         ctx.save_for_backward(q, k, v, g, g_gamma, gk, gv, initial_state, o)
         ctx.scale = scale
         ctx.reverse = reverse
         ctx.cu_seqlens = cu_seqlens
-        return o.to(q.dtype), ht
+        if hs is not None:
+            ctx.mark_non_differentiable(hs)
+        return o.to(q.dtype), ht, hs
 
     @staticmethod
     @input_guard
     @autocast_custom_bwd
-    def backward(ctx, do, dht):
+    def backward(ctx, do, dht, dhs=None):
         q, k, v, g, g_gamma, gk, gv, initial_state, o = ctx.saved_tensors
         dq, dk, dv, dg, dgk, dgv, dh0 = fused_recurrent_bwd(
             q=q,
@@ -532,7 +548,7 @@ class FusedRecurrentFunction(torch.autograd.Function):
             reverse=ctx.reverse,
             cu_seqlens=ctx.cu_seqlens,
         )
-        return dq.to(q.dtype), dk.to(k.dtype), dv.to(v.dtype), dg, None, dgk, dgv, None, dh0, None, None, None
+        return dq.to(q.dtype), dk.to(k.dtype), dv.to(v.dtype), dg, None, dgk, dgv, None, dh0, None, None, None, None
 
 
 def fused_recurrent(
@@ -548,10 +564,11 @@ def fused_recurrent(
     output_final_state: bool = False,
     reverse: bool = False,
     cu_seqlens: torch.LongTensor | None = None,
+    output_intermediate_states: bool = False,
 ):
     if scale is None:
         scale = k.shape[-1] ** -0.5
-    return FusedRecurrentFunction.apply(
+    o, ht, hs = FusedRecurrentFunction.apply(
         q,
         k,
         v,
@@ -564,4 +581,8 @@ def fused_recurrent(
         output_final_state,
         reverse,
         cu_seqlens,
+        output_intermediate_states,
     )
+    if output_intermediate_states:
+        return o, ht, hs
+    return o, ht
@@ -7,7 +7,9 @@ import torch
 from fla.modules.l2norm import l2norm_bwd, l2norm_fwd
 from fla.ops.common.chunk_delta_h import chunk_gated_delta_rule_bwd_dhu, chunk_gated_delta_rule_fwd_h
 from fla.ops.common.chunk_o import chunk_bwd_dqkwg, chunk_bwd_dv_local, chunk_fwd_o
+from fla.ops.common.chunk_torch import chunk_gated_delta_rule_torch
 from fla.ops.delta_rule.wy_fast import prepare_wy_repr_bwd, prepare_wy_repr_fwd, recompute_w_u_fwd
+from fla.ops.utils.dispatch import dispatch, on_device, register_backend
 from fla.utils import autocast_custom_bwd, autocast_custom_fwd, input_guard
 
 
@@ -191,7 +193,26 @@ class ChunkDeltaRuleFunction(torch.autograd.Function):
         return dq.to(q.dtype), dk.to(k.dtype), dv.to(v.dtype), db.to(beta.dtype), None, dh0, None, None, None, None, None
 
 
+@register_backend('chunk_delta_rule', 'torch', check=on_device('cpu'))
+def chunk_delta_rule_cpu(
+    q: torch.Tensor,
+    k: torch.Tensor,
+    v: torch.Tensor,
+    beta: torch.Tensor,
+    scale: float = None,
+    initial_state: torch.Tensor = None,
+    output_final_state: bool = False,
+    use_qk_l2norm_in_kernel: bool = False,
+    cu_seqlens: torch.LongTensor | None = None,
+    **kwargs,
+):
+    return chunk_gated_delta_rule_torch(q, k, v, beta, scale=scale, initial_state=initial_state,
+                                        output_final_state=output_final_state,
+                                        use_qk_l2norm_in_kernel=use_qk_l2norm_in_kernel, cu_seqlens=cu_seqlens)
+
+
 @torch.compiler.disable
+@dispatch('chunk_delta_rule')
 def chunk_delta_rule(
     q: torch.Tensor,
     k: torch.Tensor,
@@ -1,7 +1,9 @@
 from .chunk import chunk_gated_delta_rule
 from .fused_recurrent import fused_recurrent_gated_delta_rule
+from .fused_step import fused_gated_delta_rule_step
 
 __all__ = [
     "chunk_gated_delta_rule",
+    "fused_gated_delta_rule_step",
     "fused_recurrent_gated_delta_rule",
 ]
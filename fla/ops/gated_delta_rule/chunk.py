@@ -8,8 +8,11 @@ from fla.modules.l2norm import l2norm_bwd, l2norm_fwd
 from fla.ops.common.chunk_delta_h import chunk_gated_delta_rule_bwd_dhu, chunk_gated_delta_rule_fwd_h
 from fla.ops.common.chunk_o import chunk_bwd_dqkwg, chunk_bwd_dv_local, chunk_fwd_o
 from fla.ops.common.chunk_scaled_dot_kkt import chunk_scaled_dot_kkt_fwd
+from fla.ops.common.chunk_torch import chunk_gated_delta_rule_torch
 from fla.ops.gated_delta_rule.wy_fast import prepare_wy_repr_bwd, recompute_w_u_fwd
 from fla.ops.utils import chunk_local_cumsum, solve_tril
+from fla.ops.utils.custom_op import FLA_USE_CUSTOM_OPS, compiler_disable_without_custom_ops, placeholder
+from fla.ops.utils.dispatch import dispatch, on_device, register_backend
 from fla.utils import autocast_custom_bwd, autocast_custom_fwd, input_guard
 
 
@@ -213,7 +216,148 @@ class ChunkGatedDeltaRuleFunction(torch.autograd.Function):
         return dq.to(q), dk.to(k), dv.to(v), dg.to(g), db.to(beta), None, dh0, None, None, None
 
 
-@torch.compiler.disable
+if FLA_USE_CUSTOM_OPS:
+    # The same forward/backward passes as `ChunkGatedDeltaRuleFunction` registered as custom ops,
+    # so that `torch.compile` traces through them and fake tensors propagate their shapes.
+    # The tensors saved for backward are returned as extra outputs, with `None` stood in for by empty placeholders.
+
+    @torch.library.custom_op('fla::chunk_gated_delta_rule_fwd', mutates_args=())
+    @input_guard
+    def chunk_gated_delta_rule_fwd_op(
+        q: torch.Tensor,
+        k: torch.Tensor,
+        v: torch.Tensor,
+        g: torch.Tensor,
+        beta: torch.Tensor,
+        scale: float,
+        initial_state: torch.Tensor | None,
+        output_final_state: bool,
+        cu_seqlens: torch.Tensor | None,
+        use_qk_l2norm_in_kernel: bool,
+    ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+        q_rstd, k_rstd = None, None
+        if use_qk_l2norm_in_kernel:
+            q, q_rstd = l2norm_fwd(q)
+            k, k_rstd = l2norm_fwd(k)
+        g, o, A, final_state = chunk_gated_delta_rule_fwd(
+            q=q,
+            k=k,
+            v=v,
+            g=g,
+            beta=beta,
+            scale=scale,
+            initial_state=initial_state,
+            output_final_state=output_final_state,
+            cu_seqlens=cu_seqlens,
+        )
+        o = o.to(q.dtype)
+        if not use_qk_l2norm_in_kernel:
+            q, k, q_rstd, k_rstd = (placeholder(v) for _ in range(4))
+        final_state = final_state if output_final_state else placeholder(v)
+        return o, final_state, g, A, q, q_rstd, k, k_rstd
+
+    @chunk_gated_delta_rule_fwd_op.register_fake
+    def _(q, k, v, g, beta, scale, initial_state, output_final_state, cu_seqlens, use_qk_l2norm_in_kernel):
+        B, T, H, K, HV, V = *q.shape, *v.shape[2:]
+        N = B if cu_seqlens is None else cu_seqlens.shape[0] - 1
+        o = v.new_empty(B, T, HV, V, dtype=q.dtype)
+        final_state = v.new_empty(N, HV, K, V, dtype=torch.float) if output_final_state else placeholder(v)
+        g = g.new_empty(B, T, HV, dtype=torch.float)
+        A = k.new_empty(B, T, HV, 64)
+        if use_qk_l2norm_in_kernel:
+            q_rstd, k_rstd = (q.new_empty(B * T * H, dtype=torch.float) for _ in range(2))
+            q, k = torch.empty_like(q), torch.empty_like(k)
+        else:
+            q, k, q_rstd, k_rstd = (placeholder(v) for _ in range(4))
+        return o, final_state, g, A, q, q_rstd, k, k_rstd
+
+    @torch.library.custom_op('fla::chunk_gated_delta_rule_bwd', mutates_args=())
+    @input_guard
+    def chunk_gated_delta_rule_bwd_op(
+        q: torch.Tensor,
+        k: torch.Tensor,
+        v: torch.Tensor,
+        g: torch.Tensor,
+        beta: torch.Tensor,
+        A: torch.Tensor,
+        q_rstd: torch.Tensor,
+        k_rstd: torch.Tensor,
+        initial_state: torch.Tensor | None,
+        do: torch.Tensor,
+        dht: torch.Tensor | None,
+        scale: float,
+        cu_seqlens: torch.Tensor | None,
+        use_qk_l2norm_in_kernel: bool,
+    ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+        dq, dk, dv, db, dg, dh0 = chunk_gated_delta_rule_bwd(
+            q=q,
+            k=k,
+            v=v,
+            g=g,
+            beta=beta,
+            A=A,
+            scale=scale,
+            initial_state=initial_state,
+            do=do,
+            dht=dht,
+            cu_seqlens=cu_seqlens,
+        )
+        if use_qk_l2norm_in_kernel:
+            dq = l2norm_bwd(q, q_rstd, dq)
+            dk = l2norm_bwd(k, k_rstd, dk)
+        return dq.to(q), dk.to(k), dv.to(v), dg.to(g), db.to(beta), dh0 if dh0 is not None else placeholder(v)
+
+    @chunk_gated_delta_rule_bwd_op.register_fake
+    def _(q, k, v, g, beta, A, q_rstd, k_rstd, initial_state, do, dht, scale, cu_seqlens, use_qk_l2norm_in_kernel):
+        dh0 = torch.empty_like(initial_state) if initial_state is not None else placeholder(v)
+        return torch.empty_like(q), torch.empty_like(k), torch.empty_like(v), torch.empty_like(g), torch.empty_like(beta), dh0
+
+    def chunk_gated_delta_rule_setup_context(ctx, inputs, output):
+        q, k, v, _, beta, scale, initial_state, output_final_state, cu_seqlens, use_qk_l2norm_in_kernel = inputs
+        _, _, g, A, q_norm, q_rstd, k_norm, k_rstd = output
+        if use_qk_l2norm_in_kernel:
+            q, k = q_norm, k_norm
+        ctx.save_for_backward(q, k, v, g, beta, A, q_rstd, k_rstd, initial_state, cu_seqlens)
+        ctx.scale = scale
+        ctx.output_final_state = output_final_state
+        ctx.use_qk_l2norm_in_kernel = use_qk_l2norm_in_kernel
+
+    def chunk_gated_delta_rule_backward(ctx, do, dht, *args):
+        q, k, v, g, beta, A, q_rstd, k_rstd, initial_state, cu_seqlens = ctx.saved_tensors
+        dq, dk, dv, dg, db, dh0 = chunk_gated_delta_rule_bwd_op(
+            q, k, v, g, beta, A, q_rstd, k_rstd, initial_state, do,
+            dht if ctx.output_final_state else None,
+            ctx.scale, cu_seqlens, ctx.use_qk_l2norm_in_kernel,
+        )
+        return dq, dk, dv, dg, db, None, dh0 if initial_state is not None else None, None, None, None
+
+    chunk_gated_delta_rule_fwd_op.register_autograd(
+        chunk_gated_delta_rule_backward,
+        setup_context=chunk_gated_delta_rule_setup_context,
+    )
+
+
+@register_backend('chunk_gated_delta_rule', 'torch', check=on_device('cpu'))
+def chunk_gated_delta_rule_cpu(
+    q: torch.Tensor,
+    k: torch.Tensor,
+    v: torch.Tensor,
+    g: torch.Tensor,
+    beta: torch.Tensor,
+    scale: float = None,
+    initial_state: torch.Tensor = None,
+    output_final_state: bool = False,
+    use_qk_l2norm_in_kernel: bool = False,
+    cu_seqlens: torch.LongTensor | None = None,
+    **kwargs,
+):
+    return chunk_gated_delta_rule_torch(q, k, v, beta, g=g, scale=scale, initial_state=initial_state,
+                                        output_final_state=output_final_state,
+                                        use_qk_l2norm_in_kernel=use_qk_l2norm_in_kernel, cu_seqlens=cu_seqlens)
+
+
+@compiler_disable_without_custom_ops
+@dispatch('chunk_gated_delta_rule')
 def chunk_gated_delta_rule(
     q: torch.Tensor,
     k: torch.Tensor,
@@ -234,20 +378,22 @@ def chunk_gated_delta_rule(
         k (torch.Tensor):
             keys of shape `[B, T, H, K]`.
         v (torch.Tensor):
-            values of shape `[B, T, H, V]`.
+            values of shape `[B, T, HV, V]`.
+            GVA is applied if `HV > H`, where each query/key head is shared by `HV // H` heads of the values
+            inside the kernels rather than being repeated.
         g (torch.Tensor):
-            (forget) gating tensor (in log space!) of shape `[B, T, H]`.
+            (forget) gating tensor (in log space!) of shape `[B, T, HV]`.
         beta (torch.Tensor):
-            betas of shape `[B, T, H]`.
+            betas of shape `[B, T, HV]`.
         scale (Optional[float]):
             Scale factor for the RetNet attention scores.
             If not provided, it will default to `1 / sqrt(K)`. Default: `None`.
         initial_state (Optional[torch.Tensor]):
-            Initial state of shape `[N, H, K, V]` for `N` input sequences.
+            Initial state of shape `[N, HV, K, V]` for `N` input sequences.
             For equal-length input sequences, `N` equals the batch size `B`.
             Default: `None`.
         output_final_state (Optional[bool]):
-            Whether to output the final state of shape `[N, H, K, V]`. Default: `False`.
+            Whether to output the final state of shape `[N, HV, K, V]`. Default: `False`.
         use_qk_l2norm_in_kernel (bool):
             Whether to apply L2norm to the q/k tensor internally. Default: `False`.
         cu_seqlens (torch.LongTensor):
@@ -256,9 +402,9 @@ def chunk_gated_delta_rule(
 
     Returns:
         o (torch.Tensor):
-            Outputs of shape `[B, T, H, V]`.
+            Outputs of shape `[B, T, HV, V]`.
         final_state (torch.Tensor):
-            Final state of shape `[N, H, K, V]` if `output_final_state=True` else `None`.
+            Final state of shape `[N, HV, K, V]` if `output_final_state=True` else `None`.
 
     Examples::
         >>> import torch
@@ -295,6 +441,11 @@ def chunk_gated_delta_rule(
             "Please use head_first=False for now instead.",
         )
 
+    if v.shape[2] % q.shape[2] != 0:
+        raise ValueError(
+            f"The number of heads of the values ({v.shape[2]}) must be divisible by "
+            f"that of the queries/keys ({q.shape[2]}).",
+        )
     if cu_seqlens is not None:
         if q.shape[0] != 1:
             raise ValueError(
@@ -308,6 +459,20 @@ def chunk_gated_delta_rule(
             )
     if scale is None:
         scale = k.shape[-1] ** -0.5
+    if FLA_USE_CUSTOM_OPS:
+        o, final_state, *_ = chunk_gated_delta_rule_fwd_op(
+            q,
+            k,
+            v,
+            g,
+            beta,
+            scale,
+            initial_state,
+            output_final_state,
+            cu_seqlens,
+            use_qk_l2norm_in_kernel,
+        )
+        return o, final_state if output_final_state else None
     o, final_state = ChunkGatedDeltaRuleFunction.apply(
         q,
         k,
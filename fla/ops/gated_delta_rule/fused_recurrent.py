@@ -5,6 +5,9 @@ import torch
 import triton
 import triton.language as tl
 
+from fla.ops.common.chunk_torch import chunk_gated_delta_rule_torch
+from fla.ops.utils.custom_op import FLA_USE_CUSTOM_OPS, placeholder
+from fla.ops.utils.dispatch import dispatch, register_backend
 from fla.ops.utils.op import exp
 from fla.utils import input_guard
 
@@ -16,6 +19,8 @@ from fla.utils import input_guard
     'USE_INITIAL_STATE': lambda args: args['h0'] is not None,
     'STORE_FINAL_STATE': lambda args: args['ht'] is not None,
     'IS_VARLEN': lambda args: args['cu_seqlens'] is not None,
+    'USE_STATE_INDICES': lambda args: args['state_indices'] is not None,
+    'STORE_INTERMEDIATE_STATES': lambda args: args['hs'] is not None,
 })
 @triton.jit(do_not_specialize=['T'])
 def fused_recurrent_gated_delta_rule_fwd_kernel(
@@ -29,7 +34,9 @@ def fused_recurrent_gated_delta_rule_fwd_kernel(
     o,
     h0,
     ht,
+    hs,
     cu_seqlens,
+    state_indices,
     scale,
     T,
     B: tl.constexpr,
@@ -47,10 +54,17 @@ def fused_recurrent_gated_delta_rule_fwd_kernel(
     USE_INITIAL_STATE: tl.constexpr,
     STORE_FINAL_STATE: tl.constexpr,
     IS_VARLEN: tl.constexpr,
+    USE_STATE_INDICES: tl.constexpr,
+    STORE_INTERMEDIATE_STATES: tl.constexpr,
 ):
     i_v, i_nh = tl.program_id(0), tl.program_id(1)
     i_n, i_hv = i_nh // HV, i_nh % HV
     i_h = i_hv // (HV // H)
+    # the row of the state pool to read from/write to
+    if USE_STATE_INDICES:
+        i_s = tl.load(state_indices + i_n).to(tl.int64)
+    else:
+        i_s = i_n
 
     if IS_VARLEN:
         bos, eos = tl.load(cu_seqlens + i_n).to(tl.int64), tl.load(cu_seqlens + i_n + 1).to(tl.int64)
@@ -75,6 +89,8 @@ def fused_recurrent_gated_delta_rule_fwd_kernel(
         p_beta = beta + (bos * HV + i_hv) * V + o_v
 
     p_o = o + (bos * HV + i_hv) * V + o_v
+    if STORE_INTERMEDIATE_STATES:
+        p_hs = hs + (bos * HV + i_hv) * K*V + o_k[:, None] * V + o_v[None, :]
 
     mask_k = o_k < K
     mask_v = o_v < V
@@ -82,7 +98,7 @@ def fused_recurrent_gated_delta_rule_fwd_kernel(
 
     b_h = tl.zeros([BK, BV], dtype=tl.float32)
     if USE_INITIAL_STATE:
-        p_h0 = h0 + i_nh * K*V + o_k[:, None] * V + o_v[None, :]
+        p_h0 = h0 + (i_s * HV + i_hv) * K*V + o_k[:, None] * V + o_v[None, :]
         b_h += tl.load(p_h0, mask=mask_h, other=0).to(tl.float32)
 
     for _ in range(0, T):
@@ -117,6 +133,10 @@ def fused_recurrent_gated_delta_rule_fwd_kernel(
         # [BV]
         b_o = tl.sum(b_h * b_q[:, None], 0)
         tl.store(p_o, b_o.to(p_o.dtype.element_ty), mask=mask_v)
+        # the state after each token, e.g., for rolling back the rejected tokens of speculative decoding
+        if STORE_INTERMEDIATE_STATES:
+            tl.store(p_hs, b_h.to(p_hs.dtype.element_ty), mask=mask_h)
+            p_hs += HV*K*V
 
         p_q += H*K
         p_k += H*K
@@ -131,7 +151,7 @@ def fused_recurrent_gated_delta_rule_fwd_kernel(
         p_o += HV*V
 
     if STORE_FINAL_STATE:
-        p_ht = ht + i_nh * K*V + o_k[:, None] * V + o_v[None, :]
+        p_ht = ht + (i_s * HV + i_hv) * K*V + o_k[:, None] * V + o_v[None, :]
         tl.store(p_ht, b_h.to(p_ht.dtype.element_ty), mask=mask_h)
 
 
@@ -148,7 +168,9 @@ def fused_recurrent_gated_delta_rule_fwd(
     output_final_state: bool = False,
     use_qk_l2norm_in_kernel: bool = False,
     cu_seqlens: torch.LongTensor | None = None,
-) -> tuple[torch.Tensor, torch.Tensor]:
+    initial_state_indices: torch.LongTensor | None = None,
+    output_intermediate_states: bool = False,
+) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
     B, T, H, K, V = *k.shape, v.shape[-1]
     HV = v.shape[2]
     N = B if cu_seqlens is None else len(cu_seqlens) - 1
@@ -157,7 +179,12 @@ def fused_recurrent_gated_delta_rule_fwd(
     NV = triton.cdiv(V, BV)
 
     o = torch.empty_like(v)
-    final_state = q.new_empty(N, HV, K, V, dtype=torch.float32) if output_final_state else None
+    if initial_state_indices is not None:
+        # the states are gathered from and scattered back to the pool in-place
+        final_state = initial_state if output_final_state else None
+    else:
+        final_state = q.new_empty(N, HV, K, V, dtype=torch.float32) if output_final_state else None
+    intermediate_states = q.new_empty(B, T, HV, K, V, dtype=torch.float32) if output_intermediate_states else None
 
     grid = (NV, N * HV)
     fused_recurrent_gated_delta_rule_fwd_kernel[grid](
@@ -171,7 +198,9 @@ def fused_recurrent_gated_delta_rule_fwd(
         o=o,
         h0=initial_state,
         ht=final_state,
+        hs=intermediate_states,
         cu_seqlens=cu_seqlens,
+        state_indices=initial_state_indices,
         scale=scale,
         T=T,
         B=B,
@@ -186,7 +215,7 @@ def fused_recurrent_gated_delta_rule_fwd(
         num_warps=1,
         num_stages=3,
     )
-    return o, final_state
+    return o, final_state, intermediate_states
 
 
 class FusedRecurrentFunction(torch.autograd.Function):
@@ -207,8 +236,10 @@ class FusedRecurrentFunction(torch.autograd.Function):
         output_final_state: bool = False,
         use_qk_l2norm_in_kernel: bool = False,
         cu_seqlens: torch.LongTensor | None = None,
+        initial_state_indices: torch.LongTensor | None = None,
+        output_intermediate_states: bool = False,
     ):
-        o, final_state = fused_recurrent_gated_delta_rule_fwd(
+        o, final_state, intermediate_states = fused_recurrent_gated_delta_rule_fwd(
             q=q,
             k=k,
             v=v,
@@ -221,13 +252,15 @@ class FusedRecurrentFunction(torch.autograd.Function):
             output_final_state=output_final_state,
             use_qk_l2norm_in_kernel=use_qk_l2norm_in_kernel,
             cu_seqlens=cu_seqlens,
+            initial_state_indices=initial_state_indices,
+            output_intermediate_states=output_intermediate_states,
         )
 
-        return o, final_state
+        return o, final_state, intermediate_states
 
     @staticmethod
     @input_guard
-    def backward(ctx, do, dht):
+    def backward(ctx, do, dht, dhs):
         raise NotImplementedError(
             "Backward pass is not implemented yet and we do not have plans to implement it "
             "because we haven't figured out how to compute dg without materializing the full "
@@ -235,7 +268,66 @@ class FusedRecurrentFunction(torch.autograd.Function):
         )
 
 
-def fused_recurrent_gated_delta_rule(
+if FLA_USE_CUSTOM_OPS:
+    # The same forward pass as `FusedRecurrentFunction` registered as a custom op, with `None` stood in for by
+    # empty placeholders. The state pool indexed by `initial_state_indices` is updated in-place and returned as
+    # the final state, which a functional op cannot do, so such calls are left to `FusedRecurrentFunction`.
+
+    @torch.library.custom_op('fla::fused_recurrent_gated_delta_rule_fwd', mutates_args=())
+    @input_guard
+    def fused_recurrent_gated_delta_rule_fwd_op(
+        q: torch.Tensor,
+        k: torch.Tensor,
+        v: torch.Tensor,
+        g: torch.Tensor | None,
+        gk: torch.Tensor | None,
+        gv: torch.Tensor | None,
+        beta: torch.Tensor,
+        scale: float,
+        initial_state: torch.Tensor | None,
+        output_final_state: bool,
+        use_qk_l2norm_in_kernel: bool,
+        cu_seqlens: torch.Tensor | None,
+        output_intermediate_states: bool,
+    ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        o, final_state, intermediate_states = fused_recurrent_gated_delta_rule_fwd(
+            q=q,
+            k=k,
+            v=v,
+            g=g,
+            gk=gk,
+            gv=gv,
+            beta=beta,
+            scale=scale,
+            initial_state=initial_state,
+            output_final_state=output_final_state,
+            use_qk_l2norm_in_kernel=use_qk_l2norm_in_kernel,
+            cu_seqlens=cu_seqlens,
+            output_intermediate_states=output_intermediate_states,
+        )
+        final_state = final_state if final_state is not None else placeholder(v)
+        intermediate_states = intermediate_states if intermediate_states is not None else placeholder(v)
+        return o, final_state, intermediate_states
+
+    @fused_recurrent_gated_delta_rule_fwd_op.register_fake
+    def _(q, k, v, g, gk, gv, beta, scale, initial_state, output_final_state, use_qk_l2norm_in_kernel, cu_seqlens,
+          output_intermediate_states):
+        B, T, H, K, HV, V = *k.shape, *v.shape[2:]
+        N = B if cu_seqlens is None else cu_seqlens.shape[0] - 1
+        final_state = q.new_empty(N, HV, K, V, dtype=torch.float) if output_final_state else placeholder(v)
+        intermediate_states = (
+            q.new_empty(B, T, HV, K, V, dtype=torch.float) if output_intermediate_states else placeholder(v)
+        )
+        return torch.empty_like(v), final_state, intermediate_states
+
+    def fused_recurrent_gated_delta_rule_backward(ctx, do, dht, dhs):
+        # raises, as the backward pass is not implemented
+        return FusedRecurrentFunction.backward(ctx, do, dht, dhs)
+
+    fused_recurrent_gated_delta_rule_fwd_op.register_autograd(fused_recurrent_gated_delta_rule_backward)
+
+
+def use_fused_recurrent_gated_delta_rule_cpu(
     q: torch.Tensor,
     k: torch.Tensor,
     v: torch.Tensor,
@@ -248,7 +340,57 @@ def fused_recurrent_gated_delta_rule(
     output_final_state: bool = False,
     use_qk_l2norm_in_kernel: bool = False,
     cu_seqlens: torch.LongTensor | None = None,
+    initial_state_indices: torch.LongTensor | None = None,
+    output_intermediate_states: bool = False,
+) -> bool:
+    # only the scalar decays of the chunkwise reference are covered on the host
+    return (
+        q.device.type == 'cpu' and gk is None and gv is None and
+        initial_state_indices is None and not output_intermediate_states
+    )
+
+
+@register_backend('fused_recurrent_gated_delta_rule', 'torch', check=use_fused_recurrent_gated_delta_rule_cpu)
+def fused_recurrent_gated_delta_rule_cpu(
+    q: torch.Tensor,
+    k: torch.Tensor,
+    v: torch.Tensor,
+    g: torch.Tensor | None = None,
+    gk: torch.Tensor | None = None,
+    gv: torch.Tensor | None = None,
+    beta: torch.Tensor | None = None,
+    scale: float = None,
+    initial_state: torch.Tensor = None,
+    output_final_state: bool = False,
+    use_qk_l2norm_in_kernel: bool = False,
+    cu_seqlens: torch.LongTensor | None = None,
+    **kwargs,
 ) -> tuple[torch.Tensor, torch.Tensor]:
+    # the recurrence is computed chunkwise, which is exact up to the rounding errors
+    if beta is None:
+        beta = torch.ones_like(q[..., 0])
+    return chunk_gated_delta_rule_torch(q, k, v, beta, g=g, scale=scale, initial_state=initial_state,
+                                        output_final_state=output_final_state,
+                                        use_qk_l2norm_in_kernel=use_qk_l2norm_in_kernel, cu_seqlens=cu_seqlens)
+
+
+@dispatch('fused_recurrent_gated_delta_rule')
+def fused_recurrent_gated_delta_rule(
+    q: torch.Tensor,
+    k: torch.Tensor,
+    v: torch.Tensor,
+    g: torch.Tensor | None = None,
+    gk: torch.Tensor | None = None,
+    gv: torch.Tensor | None = None,
+    beta: torch.Tensor | None = None,
+    scale: float = None,
+    initial_state: torch.Tensor = None,
+    output_final_state: bool = False,
+    use_qk_l2norm_in_kernel: bool = False,
+    cu_seqlens: torch.LongTensor | None = None,
+    initial_state_indices: torch.LongTensor | None = None,
+    output_intermediate_states: bool = False,
+) -> tuple[torch.Tensor, torch.Tensor] | tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
     r"""
     Args:
         q (torch.Tensor):
@@ -280,12 +422,24 @@ def fused_recurrent_gated_delta_rule(
         cu_seqlens (torch.LongTensor):
             Cumulative sequence lengths of shape `[N+1]` used for variable-length training,
             consistent with the FlashAttention API.
+        initial_state_indices (Optional[torch.LongTensor]):
+            Slot indices of shape `[N]` into a state pool.
+            If provided, `initial_state` is treated as a pool of shape `[S, HV, K, V]` with `S >= N` slots,
+            the `i`-th sequence reads its state from slot `initial_state_indices[i]`,
+            and the final states are written back to the same slots **inplace** if `output_final_state=True`.
+            Default: `None`.
+        output_intermediate_states (Optional[bool]):
+            Whether to additionally output the state after each token of shape `[B, T, HV, K, V]`,
+            e.g., for rolling back the rejected tokens of speculative decoding. Default: `False`.
 
     Returns:
         o (torch.Tensor):
             Outputs of shape `[B, T, HV, V]`.
         final_state (torch.Tensor):
             Final state of shape `[N, HV, K, V]` if `output_final_state=True` else `None`.
+            If `initial_state_indices` is provided, this is the updated state pool itself.
+        intermediate_states (torch.Tensor):
+            States after each token of shape `[B, T, HV, K, V]`, only returned if `output_intermediate_states=True`.
 
     Examples::
         >>> import torch
@@ -322,28 +476,53 @@ def fused_recurrent_gated_delta_rule(
                 f"The batch size is expected to be 1 rather than {q.shape[0]} when using `cu_seqlens`."
                 f"Please flatten variable-length inputs before processing.",
             )
-        if initial_state is not None and initial_state.shape[0] != len(cu_seqlens) - 1:
+        if initial_state is not None and initial_state_indices is None and initial_state.shape[0] != len(cu_seqlens) - 1:
             raise ValueError(
                 f"The number of initial states is expected to be equal to the number of input sequences, "
                 f"i.e., {len(cu_seqlens) - 1} rather than {initial_state.shape[0]}.",
             )
+    if initial_state_indices is not None and initial_state is None:
+        raise ValueError("`initial_state` is required as the state pool when `initial_state_indices` is provided.")
     if scale is None:
         scale = k.shape[-1] ** -0.5
     if beta is None:
         beta = torch.ones_like(q[..., 0])
 
-    o, final_state = FusedRecurrentFunction.apply(
-        q,
-        k,
-        v,
-        g,
-        gk,
-        gv,
-        beta,
-        scale,
-        initial_state,
-        output_final_state,
-        use_qk_l2norm_in_kernel,
-        cu_seqlens,
-    )
+    if FLA_USE_CUSTOM_OPS and initial_state_indices is None:
+        o, final_state, intermediate_states = fused_recurrent_gated_delta_rule_fwd_op(
+            q,
+            k,
+            v,
+            g,
+            gk,
+            gv,
+            beta,
+            scale,
+            initial_state,
+            output_final_state,
+            use_qk_l2norm_in_kernel,
+            cu_seqlens,
+            output_intermediate_states,
+        )
+        final_state = final_state if output_final_state else None
+        intermediate_states = intermediate_states if output_intermediate_states else None
+    else:
+        o, final_state, intermediate_states = FusedRecurrentFunction.apply(
+            q,
+            k,
+            v,
+            g,
+            gk,
+            gv,
+            beta,
+            scale,
+            initial_state,
+            output_final_state,
+            use_qk_l2norm_in_kernel,
+            cu_seqlens,
+            initial_state_indices,
+            output_intermediate_states,
+        )
+    if output_intermediate_states:
+        return o, final_state, intermediate_states
     return o, final_state
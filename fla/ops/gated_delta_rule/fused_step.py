@@ -0,0 +1,243 @@
+# Copyright (c) 2023-2025, Songlin Yang, Yu Zhang
+
+
+import torch
+import triton
+import triton.language as tl
+
+from fla.ops.utils.op import exp, log
+from fla.utils import input_guard
+
+
+@triton.jit
+def fused_short_conv_step(x, conv, new_conv, weight, bias, o_d, m_d, o_w, W: tl.constexpr, USE_CONV_BIAS: tl.constexpr):
+    # the window of the last `W` inputs of each channel `[BD, BW]`, i.e., the cache shifted by 1 followed by `x`
+    m_w = o_w < W
+    b_c = tl.load(conv + o_d[:, None] * W + o_w[None, :] + 1, mask=m_d[:, None] & (o_w[None, :] < W - 1), other=0)
+    b_c = tl.where(o_w[None, :] == W - 1, x[:, None], b_c.to(tl.float32))
+    tl.store(new_conv + o_d[:, None] * W + o_w[None, :], b_c.to(new_conv.dtype.element_ty), mask=m_d[:, None] & m_w[None, :])
+    b_w = tl.load(weight + o_d[:, None] * W + o_w[None, :], mask=m_d[:, None] & m_w[None, :], other=0).to(tl.float32)
+    b_y = tl.sum(b_c * b_w, 1)
+    if USE_CONV_BIAS:
+        b_y += tl.load(bias + o_d, mask=m_d, other=0).to(tl.float32)
+    return b_y
+
+
+@triton.heuristics({
+    'USE_CONV': lambda args: args['conv_q'] is not None,
+    'USE_CONV_BIAS': lambda args: args['bias_q'] is not None,
+})
+@triton.jit
+def fused_gated_delta_rule_step_kernel(
+    q,
+    k,
+    v,
+    a,
+    b,
+    A_log,
+    dt_bias,
+    o,
+    h,
+    conv_q,
+    conv_k,
+    conv_v,
+    new_conv_q,
+    new_conv_k,
+    new_conv_v,
+    weight_q,
+    weight_k,
+    weight_v,
+    bias_q,
+    bias_k,
+    bias_v,
+    scale,
+    s_qk,
+    s_v,
+    H: tl.constexpr,
+    HV: tl.constexpr,
+    K: tl.constexpr,
+    V: tl.constexpr,
+    W: tl.constexpr,
+    BK: tl.constexpr,
+    BV: tl.constexpr,
+    BW: tl.constexpr,
+    USE_CONV: tl.constexpr,
+    USE_CONV_BIAS: tl.constexpr,
+    ALLOW_NEG_EIGVAL: tl.constexpr,
+):
+    i_v, i_nh = tl.program_id(0), tl.program_id(1)
+    i_n, i_hv = i_nh // HV, i_nh % HV
+    i_h = i_hv // (HV // H)
+
+    o_k = tl.arange(0, BK)
+    o_v = i_v * BV + tl.arange(0, BV)
+    o_w = tl.arange(0, BW)
+    mask_k = o_k < K
+    mask_v = o_v < V
+    mask_h = mask_k[:, None] & mask_v[None, :]
+
+    b_q = tl.load(q + (i_n * H + i_h) * K + o_k, mask=mask_k, other=0).to(tl.float32)
+    b_k = tl.load(k + (i_n * H + i_h) * K + o_k, mask=mask_k, other=0).to(tl.float32)
+    b_v = tl.load(v + (i_n * HV + i_hv) * V + o_v, mask=mask_v, other=0).to(tl.float32)
+    if USE_CONV:
+        # the conv states of the queries/keys are read by all programs of the head and thus written out of place,
+        # while the value channels are owned by this program
+        o_qk, o_dv = i_h * K + o_k, i_hv * V + o_v
+        b_q = fused_short_conv_step(b_q, conv_q + i_n * s_qk, new_conv_q + i_n * s_qk, weight_q, bias_q,
+                                    o_qk, mask_k, o_w, W, USE_CONV_BIAS)
+        b_k = fused_short_conv_step(b_k, conv_k + i_n * s_qk, new_conv_k + i_n * s_qk, weight_k, bias_k,
+                                    o_qk, mask_k, o_w, W, USE_CONV_BIAS)
+        b_v = fused_short_conv_step(b_v, conv_v + i_n * s_v, new_conv_v + i_n * s_v, weight_v, bias_v,
+                                    o_dv, mask_v, o_w, W, USE_CONV_BIAS)
+    b_q = b_q * tl.sigmoid(b_q)
+    b_k = b_k * tl.sigmoid(b_k)
+    b_v = b_v * tl.sigmoid(b_v)
+    b_q = b_q / tl.sqrt(tl.sum(b_q * b_q) + 1e-6) * scale
+    b_k = b_k / tl.sqrt(tl.sum(b_k * b_k) + 1e-6)
+
+    # g = -exp(A_log) * softplus(a + dt_bias), beta = sigmoid(b)
+    b_a = tl.load(a + i_n * HV + i_hv).to(tl.float32) + tl.load(dt_bias + i_hv).to(tl.float32)
+    b_g = -exp(tl.load(A_log + i_hv).to(tl.float32)) * tl.where(b_a < 20., log(1 + exp(b_a)), b_a)
+    b_beta = tl.sigmoid(tl.load(b + i_n * HV + i_hv).to(tl.float32))
+    if ALLOW_NEG_EIGVAL:
+        b_beta = b_beta * 2.
+
+    # the state is updated inplace, each program owning a `[K, BV]` slice
+    p_h = h + (i_n * HV + i_hv) * K*V + o_k[:, None] * V + o_v[None, :]
+    b_h = tl.load(p_h, mask=mask_h, other=0).to(tl.float32) * exp(b_g)
+    b_v = b_beta * (b_v - tl.sum(b_h * b_k[:, None], 0))
+    b_h += b_k[:, None] * b_v[None, :]
+    b_o = tl.sum(b_h * b_q[:, None], 0)
+    tl.store(o + (i_n * HV + i_hv) * V + o_v, b_o.to(o.dtype.element_ty), mask=mask_v)
+    tl.store(p_h, b_h.to(p_h.dtype.element_ty), mask=mask_h)
+
+
+@input_guard
+def fused_gated_delta_rule_step(
+    q: torch.Tensor,
+    k: torch.Tensor,
+    v: torch.Tensor,
+    a: torch.Tensor,
+    b: torch.Tensor,
+    A_log: torch.Tensor,
+    dt_bias: torch.Tensor,
+    recurrent_state: torch.Tensor,
+    conv_state: torch.Tensor | tuple[torch.Tensor, torch.Tensor, torch.Tensor] | None = None,
+    conv_weight: torch.Tensor | tuple[torch.Tensor, torch.Tensor, torch.Tensor] | None = None,
+    conv_bias: torch.Tensor | tuple[torch.Tensor, torch.Tensor, torch.Tensor] | None = None,
+    scale: float | None = None,
+    allow_neg_eigval: bool = False,
+) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor | tuple[torch.Tensor, torch.Tensor, torch.Tensor] | None]:
+    r"""
+    Decodes one token per sequence through the Gated DeltaNet recurrence in a single kernel,
+    fusing the short convolution updates, the SiLU activations, the L2 normalization of queries/keys,
+    the gate/beta computation and the state update, see :class:`fla.layers.GatedDeltaNet`.
+
+    Args:
+        q (torch.Tensor):
+            Projected queries of shape `[N, H, K]` before the short convolution.
+        k (torch.Tensor):
+            Projected keys of shape `[N, H, K]` before the short convolution.
+        v (torch.Tensor):
+            Projected values of shape `[N, HV, V]` before the short convolution. GVA is applied if `HV > H`.
+        a (torch.Tensor):
+            The inputs of the decays of shape `[N, HV]`, i.e., `g = -A_log.exp() * softplus(a + dt_bias)`.
+        b (torch.Tensor):
+            The inputs of the betas of shape `[N, HV]`, i.e., `beta = b.sigmoid()`.
+        A_log (torch.Tensor):
+            The log decay rates of shape `[HV]`.
+        dt_bias (torch.Tensor):
+            The bias of the decays of shape `[HV]`.
+        recurrent_state (torch.Tensor):
+            The states of shape `[N, HV, K, V]`, updated **inplace**.
+        conv_state (Optional[Tuple[torch.Tensor]]):
+            The caches of the short convolutions of the queries/keys/values
+            of shape `[N, H*K, W]`, `[N, H*K, W]` and `[N, HV*V, W]`,
+            or a single packed cache of shape `[N, 2*H*K+HV*V, W]` as used by the fused `qkv_conv1d`.
+            The activations are applied without convolutions if `None`. Default: `None`.
+        conv_weight (Optional[Tuple[torch.Tensor]]):
+            The weights of the short convolutions of shape `[H*K, W]`, `[H*K, W]` and `[HV*V, W]`,
+            packed into `[2*H*K+HV*V, W]` along with a packed `conv_state`. Default: `None`.
+        conv_bias (Optional[Tuple[torch.Tensor]]):
+            The biases of the short convolutions of shape `[H*K]`, `[H*K]` and `[HV*V]`,
+            packed likewise. Default: `None`.
+        scale (Optional[float]):
+            Scale factor of the queries. If not provided, it will default to `1 / sqrt(K)`. Default: `None`.
+        allow_neg_eigval (bool):
+            Whether to double the betas to allow negative eigenvalues. Default: `False`.
+
+    Returns:
+        o (torch.Tensor):
+            Outputs of shape `[N, HV, V]`.
+        recurrent_state (torch.Tensor):
+            The updated states, i.e., `recurrent_state` itself.
+        conv_state (Optional[Tuple[torch.Tensor]]):
+            The updated caches of the short convolutions in the same layout as `conv_state`, newly allocated
+            as the query/key caches are shared by all programs of a head, `None` if `conv_state` is not provided.
+    """
+    N, H, K = q.shape
+    HV, V = v.shape[1:]
+    if scale is None:
+        scale = K ** -0.5
+    if conv_state is not None and conv_weight is None:
+        raise ValueError("`conv_weight` is required along with `conv_state`")
+    W = conv_state[0].shape[-1] if conv_state is not None else 1
+    packed = isinstance(conv_state, torch.Tensor)
+    BK = triton.next_power_of_2(K)
+    BV = min(8, triton.next_power_of_2(V))
+    NV = triton.cdiv(V, BV)
+
+    o = torch.empty_like(v)
+    if conv_state is None:
+        conv_state = new_conv_state = conv_weight = conv_bias = (None,) * 3
+        output_conv_state = None
+    elif packed:
+        # channel views into the packed tensors, sharing the batch stride of the whole cache
+        sizes = (H * K, H * K, HV * V)
+        output_conv_state = torch.empty_like(conv_state)
+        conv_state, new_conv_state = conv_state.split(sizes, 1), output_conv_state.split(sizes, 1)
+        conv_weight = conv_weight.split(sizes, 0)
+        conv_bias = conv_bias.split(sizes, 0) if conv_bias is not None else (None,) * 3
+    else:
+        new_conv_state = output_conv_state = tuple(torch.empty_like(x) for x in conv_state)
+        conv_bias = conv_bias if conv_bias is not None else (None,) * 3
+
+    grid = (NV, N * HV)
+    fused_gated_delta_rule_step_kernel[grid](
+        q=q,
+        k=k,
+        v=v,
+        a=a,
+        b=b,
+        A_log=A_log,
+        dt_bias=dt_bias,
+        o=o,
+        h=recurrent_state,
+        conv_q=conv_state[0],
+        conv_k=conv_state[1],
+        conv_v=conv_state[2],
+        new_conv_q=new_conv_state[0],
+        new_conv_k=new_conv_state[1],
+        new_conv_v=new_conv_state[2],
+        weight_q=conv_weight[0],
+        weight_k=conv_weight[1],
+        weight_v=conv_weight[2],
+        bias_q=conv_bias[0],
+        bias_k=conv_bias[1],
+        bias_v=conv_bias[2],
+        scale=scale,
+        s_qk=conv_state[0].stride(0) if conv_state[0] is not None else 0,
+        s_v=conv_state[2].stride(0) if conv_state[2] is not None else 0,
+        H=H,
+        HV=HV,
+        K=K,
+        V=V,
+        W=W,
+        BK=BK,
+        BV=BV,
+        BW=triton.next_power_of_2(W),
+        ALLOW_NEG_EIGVAL=allow_neg_eigval,
+        num_warps=1,
+        num_stages=3,
+    )
+    return o, recurrent_state, output_conv_state
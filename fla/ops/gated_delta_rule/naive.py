@@ -0,0 +1,57 @@
+
+import torch
+import torch.nn.functional as F
+
+
+def naive_gated_delta_rule_step(
+    q: torch.Tensor,
+    k: torch.Tensor,
+    v: torch.Tensor,
+    a: torch.Tensor,
+    b: torch.Tensor,
+    A_log: torch.Tensor,
+    dt_bias: torch.Tensor,
+    recurrent_state: torch.Tensor,
+    conv_state: torch.Tensor | tuple[torch.Tensor, torch.Tensor, torch.Tensor] | None = None,
+    conv_weight: torch.Tensor | tuple[torch.Tensor, torch.Tensor, torch.Tensor] | None = None,
+    conv_bias: torch.Tensor | tuple[torch.Tensor, torch.Tensor, torch.Tensor] | None = None,
+    scale: float | None = None,
+    allow_neg_eigval: bool = False,
+):
+    """
+    The PyTorch reference of :func:`fla.ops.gated_delta_rule.fused_step.fused_gated_delta_rule_step`,
+    returning new states rather than updating `recurrent_state` inplace.
+    """
+    N, H, K = q.shape
+    HV, V = v.shape[1:]
+    dtype = v.dtype
+    if scale is None:
+        scale = K ** -0.5
+    x = [q.reshape(N, -1), k.reshape(N, -1), v.reshape(N, -1)]
+    new_conv_state = None
+    packed = isinstance(conv_state, torch.Tensor)
+    if packed:
+        sizes = (H * K, H * K, HV * V)
+        conv_state, conv_weight = conv_state.split(sizes, 1), conv_weight.split(sizes, 0)
+        conv_bias = conv_bias.split(sizes, 0) if conv_bias is not None else None
+    if conv_state is not None:
+        new_conv_state = tuple(torch.cat((c[..., 1:], i.unsqueeze(-1).to(c)), -1) for c, i in zip(conv_state, x, strict=False))
+        x = [(c.float() * w.float()).sum(-1) for c, w in zip(new_conv_state, conv_weight, strict=False)]
+        if conv_bias is not None:
+            x = [i + bias.float() for i, bias in zip(x, conv_bias, strict=False)]
+    q, k, v = (F.silu(i.float()) for i in x)
+    q, k, v = q.view(N, H, K), k.view(N, H, K), v.view(N, HV, V)
+    q = q / torch.sqrt((q * q).sum(-1, keepdim=True) + 1e-6) * scale
+    k = k / torch.sqrt((k * k).sum(-1, keepdim=True) + 1e-6)
+    if HV > H:
+        q, k = q.repeat_interleave(HV // H, 1), k.repeat_interleave(HV // H, 1)
+
+    g = -A_log.float().exp() * F.softplus(a.float() + dt_bias.float())
+    beta = b.float().sigmoid() * (2. if allow_neg_eigval else 1.)
+    h = recurrent_state.float() * g.exp()[..., None, None]
+    v = beta[..., None] * (v - (h * k[..., None]).sum(-2))
+    h = h + k[..., None] * v[..., None, :]
+    o = (h * q[..., None]).sum(-2)
+    if packed:
+        new_conv_state = torch.cat(new_conv_state, 1)
+    return o.to(dtype), h.to(recurrent_state.dtype), new_conv_state
@@ -5,8 +5,10 @@ import triton
 import triton.language as tl
 
 from fla.ops.common.chunk_h import chunk_bwd_dh, chunk_fwd_h
+from fla.ops.common.chunk_torch import chunk_gla_torch
 from fla.ops.utils import prepare_chunk_indices
 from fla.ops.utils.cumsum import chunk_local_cumsum
+from fla.ops.utils.dispatch import dispatch, on_device, register_backend
 from fla.ops.utils.op import exp, exp2
 from fla.utils import autotune_cache_kwargs, check_shared_mem, input_guard
 
@@ -1258,7 +1260,23 @@ class ChunkGLAFunction(torch.autograd.Function):
         return dq.to(q), dk.to(k), dv.to(v), dg, None, dh0, None, None
 
 
+@register_backend('chunk_gla', 'torch', check=on_device('cpu'))
+def chunk_gla_cpu(
+    q: torch.Tensor,
+    k: torch.Tensor,
+    v: torch.Tensor,
+    g: torch.Tensor,
+    scale: int | None = None,
+    initial_state: torch.Tensor = None,
+    output_final_state: bool = False,
+    cu_seqlens: torch.LongTensor | None = None,
+) -> tuple[torch.Tensor, torch.Tensor]:
+    return chunk_gla_torch(q, k, v, gk=g, scale=scale, initial_state=initial_state,
+                           output_final_state=output_final_state, cu_seqlens=cu_seqlens)
+
+
 @torch.compiler.disable
+@dispatch('chunk_gla')
 def chunk_gla(
     q: torch.Tensor,
     k: torch.Tensor,
@@ -17,7 +17,8 @@ def fused_recurrent_gla(
     output_final_state: bool = False,
     reverse: bool = False,
     cu_seqlens: torch.LongTensor | None = None,
-) -> tuple[torch.Tensor, torch.Tensor]:
+    output_intermediate_states: bool = False,
+) -> tuple[torch.Tensor, torch.Tensor] | tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
     r"""
     Args:
         q (torch.Tensor):
@@ -44,12 +45,17 @@ def fused_recurrent_gla(
         cu_seqlens (torch.LongTensor):
             Cumulative sequence lengths of shape `[N+1]` used for variable-length training,
             consistent with the FlashAttention API.
+        output_intermediate_states (Optional[bool]):
+            Whether to additionally output the state after each token of shape `[B, T, H, K, V]`,
+            e.g., for rolling back the rejected tokens of speculative decoding. Default: `False`.
 
     Returns:
         o (torch.Tensor):
             Outputs of shape `[B, T, H, V]`.
         final_state (torch.Tensor):
             Final state of shape `[N, H, K, V]` if `output_final_state=True` else `None`.
+        intermediate_states (torch.Tensor):
+            States after each token of shape `[B, T, H, K, V]`, only returned if `output_intermediate_states=True`.
 
     Examples::
         >>> import torch
@@ -93,7 +99,7 @@ def fused_recurrent_gla(
             )
     if scale is None:
         scale = k.shape[-1] ** -0.5
-    o, final_state = fused_recurrent(
+    return fused_recurrent(
         q=q,
         k=k,
         v=v,
@@ -105,5 +111,5 @@ def fused_recurrent_gla(
         output_final_state=output_final_state,
         reverse=reverse,
         cu_seqlens=cu_seqlens,
+        output_intermediate_states=output_intermediate_states,
     )
-    return o, final_state
@@ -174,6 +174,7 @@ def fused_recurrent_gsa_fwd(
         o=ok,
         h0=hk0,
         ht=hkt,
+        hs=None,
         cu_seqlens=cu_seqlens,
         scale=scale,
         B=B,
@@ -206,6 +207,7 @@ def fused_recurrent_gsa_fwd(
         o=ov,
         h0=hv0,
         ht=hvt,
+        hs=None,
         cu_seqlens=cu_seqlens,
         scale=1.,
         B=B,
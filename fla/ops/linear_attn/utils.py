@@ -1,9 +1,20 @@
 
+from typing import Optional
+
 import torch
+import torch.nn.functional as F
 
 
 @torch.jit.script
-def normalize_output(q: torch.Tensor, k: torch.Tensor, o: torch.Tensor) -> torch.Tensor:
+def normalize_output(
+    q: torch.Tensor,
+    k: torch.Tensor,
+    o: torch.Tensor,
+    cu_seqlens: Optional[torch.Tensor] = None,
+) -> torch.Tensor:
     k = k.cumsum(1)
+    if cu_seqlens is not None:
+        # restart the cumsum of the keys at the beginning of each sequence
+        k = k - torch.repeat_interleave(F.pad(k, (0, 0, 0, 0, 1, 0))[:, cu_seqlens[:-1]], cu_seqlens.diff(), dim=1)
     z = (q * k).sum(-1, keepdim=True)
     return o / (z + 1e-10)
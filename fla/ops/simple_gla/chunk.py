@@ -7,7 +7,9 @@ import triton
 
 from fla.ops.common.chunk_h import chunk_bwd_dh, chunk_fwd_h
 from fla.ops.common.chunk_o import chunk_bwd_dqkwg, chunk_bwd_dv, chunk_fwd_o
+from fla.ops.common.chunk_torch import chunk_gla_torch
 from fla.ops.utils import chunk_local_cumsum
+from fla.ops.utils.dispatch import dispatch, on_device, register_backend
 from fla.utils import autocast_custom_bwd, autocast_custom_fwd, input_guard
 
 
@@ -185,7 +187,27 @@ class ChunkSimpleGLAFunction(torch.autograd.Function):
         return dq.to(q), dk.to(k), dv.to(v), dg, None, None, dh0, None, None
 
 
+@register_backend('chunk_simple_gla', 'torch', check=on_device('cpu'))
+def chunk_simple_gla_cpu(
+    q: torch.Tensor,
+    k: torch.Tensor,
+    v: torch.Tensor,
+    g: torch.Tensor | None = None,
+    g_gamma: torch.Tensor | None = None,
+    scale: float | None = None,
+    initial_state: torch.Tensor | None = None,
+    output_final_state: bool = False,
+    cu_seqlens: torch.LongTensor | None = None,
+    **kwargs,
+) -> tuple[torch.Tensor, torch.Tensor]:
+    if g is None and g_gamma is not None:
+        g = g_gamma.float().expand(*q.shape[:3])
+    return chunk_gla_torch(q, k, v, g=g, scale=scale, initial_state=initial_state,
+                           output_final_state=output_final_state, cu_seqlens=cu_seqlens)
+
+
 @torch.compiler.disable
+@dispatch('chunk_simple_gla')
 def chunk_simple_gla(
     q: torch.Tensor,
     k: torch.Tensor,
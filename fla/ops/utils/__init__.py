@@ -7,7 +7,9 @@ from .cumsum import (
     chunk_local_cumsum_vector,
 )
 from .index import (
+    VarlenPlan,
     get_max_num_splits,
+    get_varlen_plan,
     prepare_chunk_indices,
     prepare_chunk_offsets,
     prepare_cu_seqlens_from_lens,
@@ -17,9 +19,12 @@ from .index import (
     prepare_position_ids,
     prepare_sequence_ids,
     prepare_token_indices,
+    prepare_total_tokens,
 )
+from .dispatch import dispatch, get_backends, get_dispatch_report, register_backend, set_backend, use_backend
 from .logsumexp import logsumexp_fwd
 from .matmul import addmm, matmul
+from .mode import calibrate, get_crossover, select_mode
 from .pack import pack_sequence, unpack_sequence
 from .pooling import mean_pooling
 from .softmax import softmax_bwd, softmax_fwd
@@ -27,14 +32,21 @@ from .softplus import softplus
 from .solve_tril import solve_tril
 
 __all__ = [
+    "VarlenPlan",
     "addmm",
+    "calibrate",
     "chunk_global_cumsum",
     "chunk_global_cumsum_scalar",
     "chunk_global_cumsum_vector",
     "chunk_local_cumsum",
     "chunk_local_cumsum_scalar",
     "chunk_local_cumsum_vector",
+    "dispatch",
+    "get_backends",
+    "get_crossover",
+    "get_dispatch_report",
     "get_max_num_splits",
+    "get_varlen_plan",
     "logsumexp_fwd",
     "matmul",
     "mean_pooling",
@@ -48,9 +60,14 @@ __all__ = [
     "prepare_position_ids",
     "prepare_sequence_ids",
     "prepare_token_indices",
+    "prepare_total_tokens",
+    "register_backend",
+    "select_mode",
+    "set_backend",
     "softmax_bwd",
     "softmax_fwd",
     "softplus",
     "solve_tril",
     "unpack_sequence",
+    "use_backend",
 ]
@@ -0,0 +1,198 @@
+# Copyright (c) 2023-2025, Songlin Yang, Yu Zhang
+
+from __future__ import annotations
+
+import argparse
+import functools
+import itertools
+import json
+import logging
+import os
+import sys
+from collections.abc import Iterator
+from types import ModuleType
+
+import torch
+import triton
+from triton.runtime.autotuner import Autotuner, Config
+from triton.runtime.jit import JITFunction, KernelInterface
+
+from fla.ops.utils.mode import CALIBRATION_OPS, get_calibration_fns, get_device_key
+from fla.utils import device
+
+logger = logging.getLogger(__name__)
+
+AUTOTUNE_DB_VERSION = 1
+FLA_AUTOTUNE_DB = os.getenv('FLA_AUTOTUNE_DB', os.path.join(os.path.expanduser('~'), '.cache', 'fla', 'autotune.json'))
+
+
+def get_autotuners(prefix: str = 'fla.', module: ModuleType | None = None) -> Iterator[tuple[str, Autotuner]]:
+    """
+    Yields the autotuned kernels defined in the imported modules starting with `prefix`, or in `module` only if given,
+    named by the modules and functions of their underlying JIT functions.
+    """
+    seen = set()
+    modules = [(module.__name__, module)] if module is not None else list(sys.modules.items())
+    for name, module in modules:
+        if module is None or not name.startswith(prefix):
+            continue
+        for kernel in list(vars(module).values()):
+            autotuner = None
+            # autotuners may be wrapped by heuristics and wrap JIT functions themselves
+            while isinstance(kernel, KernelInterface) and not isinstance(kernel, JITFunction):
+                if isinstance(kernel, Autotuner):
+                    autotuner = kernel
+                kernel = getattr(kernel, 'fn', None)
+            if autotuner is None or not isinstance(kernel, JITFunction) or id(autotuner) in seen:
+                continue
+            seen.add(id(autotuner))
+            yield f"{kernel.module}.{kernel.__name__}", autotuner
+
+
+def serialize_config(config: Config) -> dict:
+    return {
+        'kwargs': dict(config.kwargs),
+        'num_warps': config.num_warps,
+        'num_stages': config.num_stages,
+        'num_ctas': getattr(config, 'num_ctas', 1),
+    }
+
+
+def get_db_key() -> str:
+    return f"{get_device_key()}|triton-{triton.__version__}"
+
+
+def read_db(path: str) -> dict:
+    if os.path.isfile(path):
+        with open(path) as f:
+            db = json.load(f)
+        if db.get('version') == AUTOTUNE_DB_VERSION:
+            return db
+        logger.warning(f"Ignoring the tuned configs at {path} written by an incompatible version {db.get('version')}.")
+    return {'version': AUTOTUNE_DB_VERSION, 'configs': {}}
+
+
+def dump_tuned_configs(path: str | None = None, prefix: str = 'fla.') -> int:
+    """
+    Merges the configs picked by all autotuned kernels so far into the database at `path` (`FLA_AUTOTUNE_DB` by default),
+    under the name of the current device and Triton version, and returns the number of configs written.
+
+    The database is a JSON file of the form
+    `{"version": 1, "configs": {"<device>|triton-<version>": {"<kernel>": [{"key": [...], "config": {...}}]}}}`,
+    where the keys are the values of the autotuning keys of the kernel followed by the dtypes of its tensor arguments.
+    """
+    path = path or FLA_AUTOTUNE_DB
+    db = read_db(path)
+    configs = db['configs'].setdefault(get_db_key(), {})
+    count = 0
+    for name, autotuner in get_autotuners(prefix):
+        entries = {json.dumps(entry['key']): entry for entry in configs.get(name, [])}
+        for key, config in autotuner.cache.items():
+            try:
+                entries[json.dumps(list(key))] = {'key': list(key), 'config': serialize_config(config)}
+            except TypeError:
+                # keys with values not representable in JSON can not be restored anyway
+                continue
+            count += 1
+        if entries:
+            configs[name] = list(entries.values())
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(db, f, indent=2)
+    return count
+
+
+@functools.lru_cache(maxsize=8)
+def read_tuned_configs(path: str, mtime: float) -> dict:
+    # cached per modification time, as the configs are loaded again for each kernel module imported
+    return read_db(path)['configs'].get(get_db_key(), {})
+
+
+def load_tuned_configs(path: str | None = None, prefix: str = 'fla.', module: ModuleType | None = None) -> int:
+    """
+    Seeds the autotuned kernels defined in the imported modules starting with `prefix`, or in `module` only if given,
+    with the configs tuned for the current device and Triton version in the database at `path`
+    (`FLA_AUTOTUNE_DB` by default), so that the calls with tuned keys skip autotuning entirely.
+    Returns the number of configs loaded.
+
+    The `fla` modules are seeded by themselves once imported, see :func:`fla.lazy.seed_tuned_configs_on_import`.
+    Tuned configs that are no longer among the candidates of their kernels are skipped.
+    """
+    path = path or FLA_AUTOTUNE_DB
+    if not os.path.isfile(path):
+        return 0
+    configs = read_tuned_configs(path, os.path.getmtime(path))
+    count = 0
+    for name, autotuner in get_autotuners(prefix, module):
+        if name not in configs:
+            continue
+        candidates = {json.dumps(serialize_config(config), sort_keys=True): config for config in autotuner.configs}
+        for entry in configs[name]:
+            config = candidates.get(json.dumps(entry['config'], sort_keys=True))
+            if config is not None:
+                autotuner.cache[tuple(entry['key'])] = config
+                count += 1
+    return count
+
+
+def sweep(
+    ops: tuple[str, ...] = CALIBRATION_OPS,
+    batch_sizes: tuple[int, ...] = (1, 8),
+    seq_lens: tuple[int, ...] = (64, 512, 2048, 8192),
+    num_heads: tuple[int, ...] = (16,),
+    head_dims: tuple[tuple[int, int], ...] = ((64, 64), (128, 128), (128, 256)),
+    dtype: torch.dtype = torch.bfloat16,
+    backward: bool = True,
+    path: str | None = None,
+) -> int:
+    """
+    Autotunes the kernels of the chunk and fused_recurrent modes of each op over the grid of shapes,
+    including the backward pass of the chunk mode if `backward=True`, and writes the picked configs to the database
+    at `path` (`FLA_AUTOTUNE_DB` by default) by :func:`dump_tuned_configs`.
+
+    Also available from the command line, e.g., `fla-autotune --ops gated_delta_rule --seq-lens 2048 8192`.
+    """
+    for op in ops:
+        chunk, fused_recurrent, inputs = get_calibration_fns(op)
+        for B, T, H, (K, V) in itertools.product(batch_sizes, seq_lens, num_heads, head_dims):
+            print(f"{op:>20} B={B:<4} T={T:<6} H={H:<4} K={K:<4} V={V:<4}")
+            kwargs = inputs(B, T, H, K, V, dtype, device)
+            with torch.no_grad():
+                fused_recurrent(**kwargs)
+            if backward:
+                for x in kwargs.values():
+                    if isinstance(x, torch.Tensor) and x.is_floating_point():
+                        x.requires_grad_()
+            o, _ = chunk(**kwargs)
+            if backward:
+                o.sum().backward()
+    return dump_tuned_configs(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Autotune the FLA kernels offline over a grid of shapes.")
+    parser.add_argument('--ops', nargs='+', default=list(CALIBRATION_OPS), choices=CALIBRATION_OPS)
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 8])
+    parser.add_argument('--seq-lens', nargs='+', type=int, default=[64, 512, 2048, 8192])
+    parser.add_argument('--num-heads', nargs='+', type=int, default=[16])
+    parser.add_argument('--head-dims', nargs='+', default=['64x64', '128x128', '128x256'],
+                        help="head dims of the keys and values as `KxV`")
+    parser.add_argument('--dtype', default='bfloat16', choices=['bfloat16', 'float16', 'float32'])
+    parser.add_argument('--no-backward', action='store_true', help="only tune the kernels of the forward passes")
+    parser.add_argument('--output', default=FLA_AUTOTUNE_DB)
+    args = parser.parse_args()
+    count = sweep(
+        ops=tuple(args.ops),
+        batch_sizes=tuple(args.batch_sizes),
+        seq_lens=tuple(args.seq_lens),
+        num_heads=tuple(args.num_heads),
+        head_dims=tuple(tuple(int(i) for i in dims.split('x')) for dims in args.head_dims),
+        dtype=getattr(torch, args.dtype),
+        backward=not args.no_backward,
+        path=args.output,
+    )
+    print(f"Wrote {count} tuned configs for {get_db_key()} to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+# Copyright (c) 2023-2025, Songlin Yang, Yu Zhang
+
+import os
+from collections.abc import Callable
+
+import torch
+
+from fla.utils import check_pytorch_version
+
+# `torch.library.custom_op` is available since PyTorch 2.4
+FLA_USE_CUSTOM_OPS = os.getenv('FLA_USE_CUSTOM_OPS', '0') == '1' and check_pytorch_version('2.4')
+
+
+def compiler_disable_without_custom_ops(fn: Callable) -> Callable:
+    """
+    Excludes `fn` from `torch.compile` unless its kernels are registered as custom ops,
+    which the compiler traces as opaque nodes through their fake implementations rather than breaking the graph.
+    """
+    return fn if FLA_USE_CUSTOM_OPS else torch.compiler.disable(fn)
+
+
+def placeholder(x: torch.Tensor) -> torch.Tensor:
+    """
+    An empty tensor standing in for `None` outputs, which custom ops cannot return.
+    """
+    return x.new_empty(0)
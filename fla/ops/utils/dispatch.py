@@ -0,0 +1,197 @@
+# Copyright (c) 2023-2025, Songlin Yang, Yu Zhang
+
+import contextlib
+import functools
+import logging
+import os
+from collections import Counter
+from collections.abc import Callable, Iterator
+from typing import NamedTuple
+
+import torch
+
+from fla.utils import get_cpu_device, get_triton_device, is_triton_device_available
+
+logger = logging.getLogger(__name__)
+
+FLA_BACKEND = os.getenv('FLA_BACKEND')
+
+
+class Implementation(NamedTuple):
+    op: str
+    backend: str
+    fn: Callable
+    priority: int
+    check: Callable[..., bool] | None
+
+
+# all implementations registered per op, the per-op and global overrides, and the number of calls per `(op, backend)`
+_REGISTRY: dict[str, dict[str, Implementation]] = {}
+_OVERRIDES: dict[str, str] = {}
+_GLOBAL_OVERRIDE: list[str | None] = [FLA_BACKEND]
+_DISPATCHES: Counter = Counter()
+
+
+def on_device(*device_types: str) -> Callable[..., bool]:
+    """
+    Returns a check accepting the calls whose first tensor argument lives on one of `device_types`.
+    """
+
+    def check(*args, **kwargs) -> bool:
+        for arg in (*args, *kwargs.values()):
+            if isinstance(arg, torch.Tensor):
+                return arg.device.type in device_types
+        return False
+    return check
+
+
+def register_backend(
+    op: str,
+    backend: str,
+    priority: int = 0,
+    check: Callable[..., bool] | None = None,
+) -> Callable[[Callable], Callable]:
+    """
+    Registers the decorated function as the `backend` implementation of `op`.
+
+    Args:
+        op (str):
+            The name of the op, e.g., `chunk_gla`.
+        backend (str):
+            The name of the backend, e.g., `triton`, `torch` or `cuda`.
+        priority (int):
+            Implementations with higher priorities are tried first. Default: 0.
+        check (Optional[Callable]):
+            A predicate called with the arguments of the op, telling whether the implementation supports the inputs,
+            e.g., by their devices, dtypes or shapes. The implementation accepts all inputs if `None`. Default: `None`.
+    """
+
+    def decorator(fn: Callable) -> Callable:
+        _REGISTRY.setdefault(op, {})[backend] = Implementation(op, backend, fn, priority, check)
+        return fn
+    return decorator
+
+
+def select_backend(op: str, *args, **kwargs) -> Implementation:
+    """
+    Selects the implementation of `op` for the given arguments.
+    A per-op override takes precedence over a global one, which only applies to ops implemented by that backend.
+    Otherwise, the first implementation in order of priority whose check accepts the arguments is selected.
+    """
+    impls = _REGISTRY.get(op)
+    if not impls:
+        raise ValueError(f"No implementation is registered for op `{op}`.")
+    if op in _OVERRIDES:
+        backend = _OVERRIDES[op]
+        if backend not in impls:
+            raise ValueError(f"Backend `{backend}` is not available for op `{op}`, must be one of {list(impls)}.")
+        return impls[backend]
+    if _GLOBAL_OVERRIDE[-1] in impls:
+        return impls[_GLOBAL_OVERRIDE[-1]]
+    for impl in sorted(impls.values(), key=lambda impl: -impl.priority):
+        if impl.check is None or impl.check(*args, **kwargs):
+            return impl
+    raise ValueError(f"None of the backends {list(impls)} of op `{op}` supports the given inputs.")
+
+
+def dispatch(
+    op: str,
+    backend: str = 'triton',
+    check: Callable[..., bool] | None = None,
+) -> Callable[[Callable], Callable]:
+    """
+    Registers the decorated function as the `backend` implementation of `op` with the lowest priority,
+    and replaces it with an entry point dispatching each call to the implementation picked by :func:`select_backend`.
+    The first call dispatched to each implementation is logged at the INFO level,
+    and all eager calls are counted in :func:`get_dispatch_report`.
+    """
+
+    def decorator(fn: Callable) -> Callable:
+        register_backend(op, backend, priority=-1, check=check)(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            impl = select_backend(op, *args, **kwargs)
+            # the bookkeeping is skipped while tracing, as the compiled graphs no longer go through the dispatcher
+            if not torch.compiler.is_compiling():
+                record(impl)
+            return impl.fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record(impl: Implementation) -> None:
+    """
+    Counts a call dispatched to `impl` in :func:`get_dispatch_report`, logging the first one at the INFO level.
+    """
+    key = (impl.op, impl.backend)
+    if key not in _DISPATCHES:
+        logger.info(f"Dispatching `{impl.op}` to the `{impl.backend}` backend ({impl.fn.__module__}.{impl.fn.__name__}).")
+    _DISPATCHES[key] += 1
+
+
+def resolve(op: str, *args, **kwargs) -> Implementation:
+    """
+    Selects the implementation of `op` by :func:`select_backend` once rather than per call,
+    for the choices made on import or on construction of a layer, e.g., the math functions compiled into the kernels.
+    The selection is counted in :func:`get_dispatch_report` like a dispatched call.
+    """
+    impl = select_backend(op, *args, **kwargs)
+    record(impl)
+    return impl
+
+
+def get_backends(op: str | None = None) -> dict[str, list[str]]:
+    """
+    Returns the backends registered per op in order of priority, for `op` only if given.
+    """
+    ops = [op] if op is not None else sorted(_REGISTRY)
+    return {op: [impl.backend for impl in sorted(_REGISTRY.get(op, {}).values(), key=lambda impl: -impl.priority)]
+            for op in ops}
+
+
+def set_backend(op: str, backend: str | None) -> None:
+    """
+    Forces all calls of `op` to the `backend` implementation, or restores automatic selection if `backend` is `None`.
+    """
+    if backend is None:
+        _OVERRIDES.pop(op, None)
+    else:
+        _OVERRIDES[op] = backend
+
+
+@contextlib.contextmanager
+def use_backend(backend: str | None = None, **overrides: str) -> Iterator[None]:
+    """
+    Overrides the backends within the context, globally by `backend` for all ops implemented by it,
+    and per op by keyword arguments, e.g., `use_backend('torch', chunk_gated_delta_rule='triton')`.
+    The overrides apply to the whole process rather than to the current thread.
+    """
+    previous = {op: _OVERRIDES.get(op) for op in overrides}
+    _GLOBAL_OVERRIDE.append(backend if backend is not None else _GLOBAL_OVERRIDE[-1])
+    for op, op_backend in overrides.items():
+        set_backend(op, op_backend)
+    try:
+        yield
+    finally:
+        _GLOBAL_OVERRIDE.pop()
+        for op, op_backend in previous.items():
+            set_backend(op, op_backend)
+
+
+def get_dispatch_report(reset: bool = False) -> dict[str, dict[str, int]]:
+    """
+    Returns the number of calls dispatched to each backend per op since the start or the last reset,
+    e.g., `{'chunk_gla': {'triton': 24, 'torch': 0}}`, for auditing which implementations actually ran.
+    """
+    report = {op: {backend: _DISPATCHES[(op, backend)] for backend in backends} for op, backends in get_backends().items()}
+    if reset:
+        _DISPATCHES.clear()
+    return report
+
+
+# the device is selected on import of `fla.utils`, before the registry is available,
+# so its backends are registered here and the device actually selected is recorded
+register_backend('device', 'triton', priority=1, check=is_triton_device_available)(get_triton_device)
+register_backend('device', 'cpu')(get_cpu_device)
+record(_REGISTRY['device']['triton' if is_triton_device_available() else 'cpu'])
@@ -1,12 +1,17 @@
 # Copyright (c) 2023-2025, Songlin Yang, Yu Zhang
 
 
+import functools
+import weakref
+from collections.abc import Callable
+from typing import Any
+
 import torch
 import torch.nn.functional as F
 import triton
 import triton.language as tl
 
-from fla.utils import autotune_cache_kwargs, tensor_cache
+from fla.utils import autotune_cache_kwargs, tensor_cache, tensor_version
 
 
 @triton.autotune(
@@ -67,12 +72,15 @@ def prepare_split_cu_seqlens(
     cu_seqlens: torch.LongTensor | None = None,
     dtype: torch.dtype | None = torch.int32,
     device: torch.device | None = torch.device('cpu'),
+    cu_seqlens_cpu: torch.LongTensor | None = None,
 ) -> torch.LongTensor:
     if cu_seqlens is None:
         total_tokens = batch_size * seq_len
         cu_seqlens = list(range(0, total_tokens, seq_len)) + [total_tokens]
     else:
-        cu_seqlens = cu_seqlens.tolist()
+        # the CPU copy avoids the host synchronization of reading the boundaries back from the device
+        cu_seqlens_cpu = get_cu_seqlens_cpu(cu_seqlens, cu_seqlens_cpu)
+        cu_seqlens = (cu_seqlens_cpu if cu_seqlens_cpu is not None else cu_seqlens).tolist()
     return torch.tensor(
         [
             i
@@ -84,28 +92,69 @@ def prepare_split_cu_seqlens(
     )
 
 
-@tensor_cache
-def prepare_position_ids(cu_seqlens: torch.LongTensor, cu_seqlens_cpu: torch.LongTensor | None = None) -> torch.LongTensor:
+def get_cu_seqlens_cpu(
+    cu_seqlens: torch.LongTensor,
+    cu_seqlens_cpu: torch.LongTensor | None = None,
+) -> torch.LongTensor | None:
+    """
+    Returns `cu_seqlens_cpu` if provided, otherwise the host copy of the :class:`VarlenPlan` owning `cu_seqlens` if any.
+    """
+    if cu_seqlens_cpu is None:
+        plan = get_varlen_plan(cu_seqlens)
+        cu_seqlens_cpu = plan.cu_seqlens_cpu if plan is not None else None
+    return cu_seqlens_cpu
+
+
+def prepare_total_tokens(
+    cu_seqlens: torch.LongTensor,
+    cu_seqlens_cpu: torch.LongTensor | None = None,
+    total_tokens: int | None = None,
+) -> int:
+    """
+    Returns the total number of tokens of variable-length inputs,
+    only reading `cu_seqlens` back from the device if neither `total_tokens` nor `cu_seqlens_cpu` is provided.
+    """
+    if total_tokens is not None:
+        return total_tokens
+    cu_seqlens_cpu = get_cu_seqlens_cpu(cu_seqlens, cu_seqlens_cpu)
     if cu_seqlens_cpu is not None:
-        return torch.cat([
-            torch.arange(n, dtype=cu_seqlens.dtype, device=cu_seqlens.device)
-            for n in prepare_lens(cu_seqlens_cpu).unbind()
-        ])
-    return torch.cat([
-        torch.arange(n, dtype=cu_seqlens.dtype, device=cu_seqlens.device)
-        for n in prepare_lens(cu_seqlens).unbind()
-    ])
+        return int(cu_seqlens_cpu[-1])
+    return cu_seqlens[-1].item()
+
+
+@tensor_cache
+def prepare_sequence_ids(
+    cu_seqlens: torch.LongTensor,
+    cu_seqlens_cpu: torch.LongTensor | None = None,
+    total_tokens: int | None = None,
+) -> torch.LongTensor:
+    tokens = torch.arange(
+        prepare_total_tokens(cu_seqlens, cu_seqlens_cpu, total_tokens),
+        dtype=cu_seqlens.dtype,
+        device=cu_seqlens.device,
+    )
+    return torch.searchsorted(cu_seqlens[1:].contiguous(), tokens, right=True).to(cu_seqlens.dtype)
 
 
 @tensor_cache
-def prepare_sequence_ids(cu_seqlens: torch.LongTensor, cu_seqlens_cpu: torch.LongTensor | None = None) -> torch.LongTensor:
-    return prepare_position_ids(cu_seqlens, cu_seqlens_cpu).eq(0).cumsum(0) - 1
+def prepare_position_ids(
+    cu_seqlens: torch.LongTensor,
+    cu_seqlens_cpu: torch.LongTensor | None = None,
+    total_tokens: int | None = None,
+) -> torch.LongTensor:
+    sequence_ids = prepare_sequence_ids(cu_seqlens, cu_seqlens_cpu, total_tokens)
+    tokens = torch.arange(sequence_ids.shape[0], dtype=cu_seqlens.dtype, device=cu_seqlens.device)
+    return tokens - cu_seqlens[sequence_ids.long()]
 
 
 @tensor_cache
-def prepare_token_indices(cu_seqlens: torch.LongTensor, cu_seqlens_cpu: torch.LongTensor | None = None) -> torch.LongTensor:
-    position_ids = prepare_position_ids(cu_seqlens, cu_seqlens_cpu)
-    return torch.stack([prepare_sequence_ids(cu_seqlens, cu_seqlens_cpu), position_ids], 1).to(cu_seqlens)
+def prepare_token_indices(
+    cu_seqlens: torch.LongTensor,
+    cu_seqlens_cpu: torch.LongTensor | None = None,
+    total_tokens: int | None = None,
+) -> torch.LongTensor:
+    position_ids = prepare_position_ids(cu_seqlens, cu_seqlens_cpu, total_tokens)
+    return torch.stack([prepare_sequence_ids(cu_seqlens, cu_seqlens_cpu, total_tokens), position_ids], 1).to(cu_seqlens)
 
 
 @tensor_cache
@@ -114,12 +163,14 @@ def prepare_chunk_indices(
     chunk_size: int,
     cu_seqlens_cpu: torch.LongTensor | None = None,
 ) -> torch.LongTensor:
-    if cu_seqlens_cpu is not None:
-        indices = torch.cat([torch.arange(n, device=cu_seqlens.device)
-                            for n in triton.cdiv(prepare_lens(cu_seqlens_cpu), chunk_size).tolist()])
-        return torch.stack([indices.eq(0).cumsum(0) - 1, indices], 1).to(cu_seqlens)
-    indices = torch.cat([torch.arange(n) for n in triton.cdiv(prepare_lens(cu_seqlens), chunk_size).tolist()])
-    return torch.stack([indices.eq(0).cumsum(0) - 1, indices], 1).to(cu_seqlens)
+    # the indices are built on the host from `cu_seqlens_cpu` if provided, requiring only an asynchronous copy,
+    # otherwise the number of chunks is the only value read back from the device
+    cu_seqlens_cpu = get_cu_seqlens_cpu(cu_seqlens, cu_seqlens_cpu)
+    chunk_offsets = prepare_chunk_offsets(cu_seqlens_cpu if cu_seqlens_cpu is not None else cu_seqlens, chunk_size)
+    indices = torch.arange(int(chunk_offsets[-1]), dtype=chunk_offsets.dtype, device=chunk_offsets.device)
+    sequence_ids = torch.searchsorted(chunk_offsets[1:].contiguous(), indices, right=True)
+    indices = torch.stack([sequence_ids, indices - chunk_offsets[sequence_ids]], 1)
+    return indices.to(device=cu_seqlens.device, dtype=cu_seqlens.dtype, non_blocking=True)
 
 
 @tensor_cache
@@ -134,8 +185,184 @@ def prepare_chunk_offsets(
 def get_max_num_splits(
     cu_seqlens: torch.LongTensor,
     chunk_size: int,
-    cu_seqlens_cpu: torch.LongTensor | None = None
+    cu_seqlens_cpu: torch.LongTensor | None = None,
+    max_seqlen: int | None = None,
 ) -> int:
+    if max_seqlen is not None:
+        return triton.cdiv(max_seqlen, chunk_size)
+    cu_seqlens_cpu = get_cu_seqlens_cpu(cu_seqlens, cu_seqlens_cpu)
     if cu_seqlens_cpu is not None:
-        return triton.cdiv(int(max(prepare_lens(cu_seqlens_cpu))), chunk_size)
-    return triton.cdiv(int(max(prepare_lens(cu_seqlens))), chunk_size)
+        return triton.cdiv(int(prepare_lens(cu_seqlens_cpu).max()), chunk_size)
+    return triton.cdiv(prepare_lens(cu_seqlens).max().item(), chunk_size)
+
+
+def prepare_unpad_indices(mask: torch.BoolTensor, total_tokens: int | None = None) -> torch.LongTensor:
+    """
+    Returns the indices of the valid tokens in the flattened `mask` of shape `[B, T]`,
+    without synchronizing with the host if the number of valid tokens `total_tokens` is known.
+    """
+    if total_tokens is not None:
+        # a stable sort moves the valid tokens to the front in order, with the output size known in advance
+        return mask.flatten().to(torch.int8).argsort(descending=True, stable=True)[:total_tokens]
+    return torch.nonzero(mask.flatten(), as_tuple=False).flatten()
+
+
+_VARLEN_PLANS: dict[int, weakref.ref] = {}
+
+
+class VarlenPlan:
+    """
+    The metadata of a batch of variable-length inputs, built once at the top of the forward pass of a model and
+    passed to all layers as `varlen_plan` via `**kwargs`. The host copy of `cu_seqlens` is read back once on
+    first use rather than on construction, so that plans whose host metadata is never needed, e.g., in decoding,
+    involve no host synchronization. All derived tensors are built on first use and memoized for the following layers.
+
+    Ops receive the plain `cu_seqlens` of the plan as before and look its plan up by :func:`get_varlen_plan`,
+    so that the index helpers of this module use the host metadata of the plan for any `cu_seqlens` it owns.
+
+    Args:
+        cu_seqlens (torch.LongTensor):
+            Cumulative sequence lengths of shape `[N+1]`.
+        cu_seqlens_cpu (Optional[torch.LongTensor]):
+            The host copy of `cu_seqlens`, copied from the device if not provided. Default: `None`.
+        attention_mask (Optional[torch.Tensor]):
+            The padding mask of shape `[B, T]` `cu_seqlens` is derived from, if any. Default: `None`.
+    """
+
+    def __init__(
+        self,
+        cu_seqlens: torch.LongTensor,
+        cu_seqlens_cpu: torch.LongTensor | None = None,
+        attention_mask: torch.Tensor | None = None,
+    ) -> None:
+        self.cu_seqlens = cu_seqlens
+        self.attention_mask = attention_mask
+        self._cu_seqlens_cpu = cu_seqlens_cpu
+        self._cache = {}
+
+        key = id(cu_seqlens)
+
+        def unregister(ref):
+            if _VARLEN_PLANS.get(key) is ref:
+                del _VARLEN_PLANS[key]
+        _VARLEN_PLANS[key] = weakref.ref(self, unregister)
+
+    @classmethod
+    def from_attention_mask(cls, attention_mask: torch.Tensor) -> 'VarlenPlan':
+        return cls(prepare_cu_seqlens_from_mask(attention_mask), attention_mask=attention_mask)
+
+    @classmethod
+    def from_inputs(
+        cls,
+        attention_mask: torch.Tensor | None = None,
+        cu_seqlens: torch.LongTensor | None = None,
+        cu_seqlens_cpu: torch.LongTensor | None = None,
+        seq_len: int | None = None,
+    ) -> 'VarlenPlan | None':
+        """
+        Builds the plan of the inputs of a model, i.e., from `cu_seqlens` if provided, otherwise from `attention_mask`,
+        returning `None` for inputs of fixed length. If `seq_len` is given, the plan is built from the mask of the
+        last `seq_len` tokens, i.e., the slice the layers consume, which differs from the whole mask in decoding.
+        """
+        if cu_seqlens is not None:
+            return cls(cu_seqlens, cu_seqlens_cpu)
+        if attention_mask is not None:
+            return cls.from_attention_mask(attention_mask[:, -seq_len:] if seq_len is not None else attention_mask)
+        return None
+
+    @property
+    def cu_seqlens_cpu(self) -> torch.LongTensor:
+        if self._cu_seqlens_cpu is None:
+            self._cu_seqlens_cpu = self.cu_seqlens.cpu()
+        return self._cu_seqlens_cpu
+
+    @functools.cached_property
+    def total_tokens(self) -> int:
+        return int(self.cu_seqlens_cpu[-1])
+
+    @functools.cached_property
+    def max_seqlen(self) -> int:
+        return int(torch.diff(self.cu_seqlens_cpu).max()) if self.cu_seqlens_cpu.numel() > 1 else 0
+
+    @property
+    def batch_size(self) -> int:
+        return self.cu_seqlens.shape[0] - 1
+
+    def memoize(self, key: tuple, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        if key not in self._cache:
+            self._cache[key] = fn(*args, **kwargs)
+        return self._cache[key]
+
+    def lens(self) -> torch.LongTensor:
+        return self.memoize(('lens',), prepare_lens, self.cu_seqlens)
+
+    def chunk_indices(self, chunk_size: int) -> torch.LongTensor:
+        return self.memoize(
+            ('chunk_indices', chunk_size),
+            prepare_chunk_indices, self.cu_seqlens, chunk_size, cu_seqlens_cpu=self.cu_seqlens_cpu,
+        )
+
+    def chunk_offsets(self, chunk_size: int) -> torch.LongTensor:
+        return self.memoize(('chunk_offsets', chunk_size), prepare_chunk_offsets, self.cu_seqlens, chunk_size)
+
+    def sequence_ids(self) -> torch.LongTensor:
+        return self.memoize(
+            ('sequence_ids',),
+            prepare_sequence_ids, self.cu_seqlens, self.cu_seqlens_cpu, self.total_tokens,
+        )
+
+    def position_ids(self) -> torch.LongTensor:
+        return self.memoize(
+            ('position_ids',),
+            prepare_position_ids, self.cu_seqlens, self.cu_seqlens_cpu, self.total_tokens,
+        )
+
+    def token_indices(self) -> torch.LongTensor:
+        return self.memoize(
+            ('token_indices',),
+            prepare_token_indices, self.cu_seqlens, self.cu_seqlens_cpu, self.total_tokens,
+        )
+
+    def split_cu_seqlens(
+        self,
+        split_size: int,
+        dtype: torch.dtype | None = torch.int32,
+        device: torch.device | None = torch.device('cpu'),
+    ) -> torch.LongTensor:
+        return self.memoize(
+            ('split_cu_seqlens', split_size, dtype, device),
+            prepare_split_cu_seqlens, self.batch_size, self.max_seqlen, split_size, self.cu_seqlens, dtype, device,
+            cu_seqlens_cpu=self.cu_seqlens_cpu,
+        )
+
+    def max_num_splits(self, chunk_size: int) -> int:
+        return triton.cdiv(self.max_seqlen, chunk_size)
+
+    def unpad_data(self, attention_mask: torch.Tensor) -> tuple[torch.LongTensor, torch.LongTensor, int]:
+        """
+        Returns the outputs of :func:`fla.layers.utils.get_unpad_data` for `attention_mask`, usually a slice of the
+        mask of the model, memoized on its storage so that the slices taken by each layer share the results.
+        The slice covering the whole mask of the plan reuses `cu_seqlens` of the plan, while other slices,
+        e.g., the last tokens in decoding, build their own plan once.
+        """
+        shape, stride = tuple(attention_mask.shape), attention_mask.stride()
+        key = ('unpad_data', attention_mask.data_ptr(), shape, stride, tensor_version(attention_mask))
+        if key not in self._cache:
+            mask = self.attention_mask
+            if mask is not None and attention_mask.shape == mask.shape and attention_mask.data_ptr() == mask.data_ptr():
+                self._cache[key] = (prepare_unpad_indices(attention_mask, self.total_tokens), self.cu_seqlens, self.max_seqlen)
+            else:
+                plan = self.memoize(('plan', *key[1:]), VarlenPlan.from_attention_mask, attention_mask)
+                self._cache[key] = plan.unpad_data(attention_mask)
+        return self._cache[key]
+
+
+def get_varlen_plan(cu_seqlens: torch.LongTensor | None) -> 'VarlenPlan | None':
+    """
+    Returns the live :class:`VarlenPlan` owning `cu_seqlens`, if any.
+    """
+    if cu_seqlens is None:
+        return None
+    ref = _VARLEN_PLANS.get(id(cu_seqlens))
+    plan = ref() if ref is not None else None
+    return plan if plan is not None and plan.cu_seqlens is cu_seqlens else None
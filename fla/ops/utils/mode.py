@@ -0,0 +1,349 @@
+# Copyright (c) 2023-2025, Songlin Yang, Yu Zhang
+
+from __future__ import annotations
+
+import argparse
+import functools
+import itertools
+import json
+import math
+import os
+from collections.abc import Callable
+
+import torch
+import torch.nn.functional as F
+
+from fla.utils import device, device_torch_lib
+
+DEFAULT_CROSSOVER = 64
+MODE_TABLE_VERSION = 1
+FLA_MODE_TABLE = os.getenv('FLA_MODE_TABLE', os.path.join(os.path.expanduser('~'), '.cache', 'fla', 'mode_table.json'))
+
+
+def get_device_key() -> str:
+    if hasattr(device_torch_lib, 'get_device_name') and device_torch_lib.is_available():
+        return device_torch_lib.get_device_name(0)
+    return device
+
+
+@functools.cache
+def load_mode_table(path: str | None = None) -> dict[str, list[dict[str, int]]]:
+    """
+    Loads the crossover entries of the current device from the table at `path` (`FLA_MODE_TABLE` by default),
+    returning an empty table if the file does not exist or was calibrated by an incompatible version.
+    """
+    path = path or FLA_MODE_TABLE
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        table = json.load(f)
+    if table.get('version') != MODE_TABLE_VERSION:
+        return {}
+    return table.get('devices', {}).get(get_device_key(), {})
+
+
+@functools.lru_cache(maxsize=1024)
+def get_crossover(
+    op: str,
+    batch_size: int = 1,
+    num_heads: int | None = None,
+    head_k_dim: int | None = None,
+    head_v_dim: int | None = None,
+) -> int:
+    """
+    Returns the largest sequence length for which `fused_recurrent` is expected to outperform `chunk` for `op`,
+    taken from the calibrated entry nearest to the given shape in log scale.
+    """
+    entries = load_mode_table().get(op)
+    if not entries:
+        return DEFAULT_CROSSOVER
+    shape = {'B': batch_size, 'H': num_heads, 'K': head_k_dim, 'V': head_v_dim}
+
+    def distance(entry):
+        return sum(abs(math.log2(entry[key] / value)) for key, value in shape.items() if value and key in entry)
+    return min(entries, key=distance)['crossover']
+
+
+def select_mode(
+    op: str,
+    mode: str,
+    seq_len: int,
+    batch_size: int = 1,
+    num_heads: int | None = None,
+    head_k_dim: int | None = None,
+    head_v_dim: int | None = None,
+    cu_seqlens: torch.LongTensor | None = None,
+    training: bool = False,
+    history_size: int = 0,
+) -> str:
+    """
+    Chooses `fused_recurrent` over the configured `mode` if the sequences are short enough for `op`,
+    as the fixed overhead per chunk of the chunkwise kernels only amortizes over long enough sequences.
+    The crossover lengths are calibrated per device by :func:`calibrate`, defaulting to 64 tokens otherwise.
+
+    Args:
+        op (str):
+            The name of the op, i.e., the subpackage of `fla.ops`, e.g., `gated_delta_rule`.
+        mode (str):
+            The mode configured for the layer, used for long sequences and in training.
+        seq_len (int):
+            The length of the padded inputs, or the total number of tokens for variable-length inputs.
+        batch_size (int):
+            The batch size. Default: 1.
+        num_heads (Optional[int]):
+            The number of heads. Default: `None`.
+        head_k_dim (Optional[int]):
+            The head dim of the keys. Default: `None`.
+        head_v_dim (Optional[int]):
+            The head dim of the values. Default: `None`.
+        cu_seqlens (Optional[torch.LongTensor]):
+            Cumulative sequence lengths of variable-length inputs, whose average length is compared instead
+            if the crossovers of `op` are calibrated, otherwise the total number of tokens is compared.
+            Only the shape is read, i.e., no host synchronization is involved. Default: `None`.
+        training (bool):
+            Whether the layer is in training, where `mode` is always used. Default: `False`.
+        history_size (int):
+            The number of last tokens whose states are kept by the cache for rolling back, e.g., rejected draft tokens
+            in speculative decoding. As only the fused_recurrent kernels output the states of each token,
+            it is always chosen for the inputs of at most `history_size` tokens. Default: 0.
+    """
+    if training:
+        return mode
+    if seq_len <= history_size:
+        return 'fused_recurrent'
+    # the average length of variable-length inputs is only compared against calibrated crossovers,
+    # as the default crossover has always been compared against the total number of tokens
+    if cu_seqlens is not None and load_mode_table().get(op):
+        batch_size = max(cu_seqlens.shape[0] - 1, 1)
+        seq_len = math.ceil(seq_len / batch_size)
+    if seq_len <= get_crossover(op, batch_size, num_heads, head_k_dim, head_v_dim):
+        return 'fused_recurrent'
+    return mode
+
+
+def get_calibration_fns(op: str) -> tuple[Callable, Callable, Callable]:
+    """
+    Returns the chunk and fused_recurrent functions of `op` along with a function building their inputs from
+    `(B, T, H, K, V, dtype, device)`.
+    """
+
+    def qkv(B, T, H, K, V, dtype, device):
+        return (
+            torch.randn(B, T, H, K, dtype=dtype, device=device),
+            F.normalize(torch.randn(B, T, H, K, dtype=dtype, device=device), p=2, dim=-1),
+            torch.randn(B, T, H, V, dtype=dtype, device=device),
+        )
+
+    def decay(*shape, device):
+        return F.logsigmoid(torch.randn(*shape, dtype=torch.float, device=device))
+
+    if op == 'gated_delta_rule':
+        from fla.ops.gated_delta_rule import chunk_gated_delta_rule, fused_recurrent_gated_delta_rule
+
+        def inputs(B, T, H, K, V, dtype, device):
+            return dict(
+                zip('qkv', qkv(B, T, H, K, V, dtype, device), strict=False),
+                g=decay(B, T, H, device=device),
+                beta=torch.rand(B, T, H, dtype=dtype, device=device),
+            )
+        return chunk_gated_delta_rule, fused_recurrent_gated_delta_rule, inputs
+    if op == 'comba':
+        from fla.ops.comba import chunk_comba, fused_recurrent_comba
+
+        def inputs(B, T, H, K, V, dtype, device):
+            return dict(
+                zip('qkv', qkv(B, T, H, K, V, dtype, device), strict=False),
+                p=F.normalize(torch.randn(B, T, H, K, dtype=dtype, device=device), p=2, dim=-1),
+                g=decay(B, T, H, device=device),
+                beta=torch.rand(B, T, H, dtype=dtype, device=device),
+            )
+        return chunk_comba, fused_recurrent_comba, inputs
+    if op == 'gated_delta_product':
+        from fla.ops.gated_delta_product import chunk_gated_delta_product
+        from fla.ops.gated_delta_rule import fused_recurrent_gated_delta_rule
+
+        def inputs(B, T, H, K, V, dtype, device):
+            q, k, v = qkv(B, T * 2, H, K, V, dtype, device)
+            return dict(
+                q=q[:, :T],
+                k=k,
+                v=v,
+                g=decay(B, T, H, device=device),
+                beta=torch.rand(B, T * 2, H, dtype=dtype, device=device),
+            )
+
+        def chunk(**kwargs):
+            return chunk_gated_delta_product(num_householder=2, **kwargs)
+
+        def fused_recurrent(q, g, **kwargs):
+            # the layer runs the recurrent kernel over the householder steps interleaved along the time axis
+            q_new = q.new_zeros(q.shape[0], q.shape[1], 2, *q.shape[2:])
+            q_new[:, :, -1] = q
+            g_new = g.new_zeros(g.shape[0], g.shape[1], 2, g.shape[2])
+            g_new[:, :, 0] = g
+            return fused_recurrent_gated_delta_rule(q=q_new.flatten(1, 2), g=g_new.flatten(1, 2), **kwargs)
+        return chunk, fused_recurrent, inputs
+    if op == 'delta_rule':
+        from fla.ops.delta_rule import chunk_delta_rule, fused_recurrent_delta_rule
+
+        def inputs(B, T, H, K, V, dtype, device):
+            return dict(zip('qkv', qkv(B, T, H, K, V, dtype, device), strict=False),
+                        beta=torch.rand(B, T, H, dtype=dtype, device=device))
+        return chunk_delta_rule, fused_recurrent_delta_rule, inputs
+    if op == 'kda':
+        from fla.ops.kda import chunk_kda, fused_recurrent_kda
+
+        def inputs(B, T, H, K, V, dtype, device):
+            return dict(
+                zip('qkv', qkv(B, T, H, K, V, dtype, device), strict=False),
+                g=decay(B, T, H, K, device=device),
+                beta=torch.rand(B, T, H, dtype=dtype, device=device),
+            )
+        return chunk_kda, fused_recurrent_kda, inputs
+    if op == 'gla':
+        from fla.ops.gla import chunk_gla, fused_recurrent_gla
+
+        def inputs(B, T, H, K, V, dtype, device):
+            return dict(zip('qkv', qkv(B, T, H, K, V, dtype, device), strict=False), g=decay(B, T, H, K, device=device))
+
+        def fused_recurrent(g, **kwargs):
+            return fused_recurrent_gla(gk=g, **kwargs)
+        return chunk_gla, fused_recurrent, inputs
+    if op == 'gsa':
+        from fla.ops.gsa import chunk_gsa, fused_recurrent_gsa
+
+        def inputs(B, T, H, K, V, dtype, device):
+            # the number of slots defaults to the head dim of the keys
+            return dict(
+                zip('qkv', qkv(B, T, H, K, V, dtype, device), strict=False),
+                s=torch.randn(B, T, H, K, dtype=dtype, device=device),
+                g=decay(B, T, H, K, device=device),
+            )
+        return chunk_gsa, fused_recurrent_gsa, inputs
+    if op == 'hgrn':
+        from fla.ops.hgrn import chunk_hgrn, fused_recurrent_hgrn
+
+        def inputs(B, T, H, K, V, dtype, device):
+            return dict(
+                x=torch.randn(B, T, H * K, dtype=dtype, device=device),
+                g=decay(B, T, H * K, device=device),
+            )
+        return chunk_hgrn, fused_recurrent_hgrn, inputs
+    if op == 'rwkv6':
+        from fla.ops.rwkv6 import chunk_rwkv6, fused_recurrent_rwkv6
+
+        def inputs(B, T, H, K, V, dtype, device):
+            return dict(
+                zip('rkv', qkv(B, T, H, K, V, dtype, device), strict=False),
+                w=decay(B, T, H, K, device=device),
+                u=torch.randn(H, K, dtype=dtype, device=device),
+            )
+        return chunk_rwkv6, fused_recurrent_rwkv6, inputs
+    if op == 'simple_gla':
+        from fla.ops.simple_gla import chunk_simple_gla, fused_recurrent_simple_gla
+
+        def inputs(B, T, H, K, V, dtype, device):
+            return dict(zip('qkv', qkv(B, T, H, K, V, dtype, device), strict=False), g=decay(B, T, H, device=device))
+        return chunk_simple_gla, fused_recurrent_simple_gla, inputs
+    if op == 'retention':
+        from fla.ops.retention import chunk_retention, fused_recurrent_retention
+
+        def inputs(B, T, H, K, V, dtype, device):
+            return dict(zip('qkv', qkv(B, T, H, K, V, dtype, device), strict=False))
+        return chunk_retention, fused_recurrent_retention, inputs
+    raise ValueError(f"Calibration is not supported for op `{op}`.")
+
+
+CALIBRATION_OPS = (
+    'gated_delta_rule',
+    'gated_delta_product',
+    'comba',
+    'delta_rule',
+    'kda',
+    'gla',
+    'gsa',
+    'hgrn',
+    'rwkv6',
+    'simple_gla',
+    'retention',
+)
+
+
+@torch.inference_mode()
+def calibrate(
+    ops: tuple[str, ...] = CALIBRATION_OPS,
+    batch_sizes: tuple[int, ...] = (1, 8, 32),
+    num_heads: tuple[int, ...] = (16,),
+    head_dims: tuple[tuple[int, int], ...] = ((64, 64), (128, 128), (128, 256)),
+    seq_lens: tuple[int, ...] = (16, 32, 64, 96, 128, 192, 256, 384, 512, 1024),
+    dtype: torch.dtype = torch.bfloat16,
+    path: str | None = None,
+) -> dict[str, list[dict[str, int]]]:
+    """
+    Measures the forward pass of the chunk and fused_recurrent kernels of each op over the grid of shapes,
+    and records per `(B, H, K, V)` the largest sequence length for which the recurrent kernel is faster,
+    or the shortest length measured if it never is.
+    The entries of the current device are merged into the table at `path` (`FLA_MODE_TABLE` by default).
+
+    Also available from the command line, e.g.,
+    `python -m fla.ops.utils.mode --ops gated_delta_rule gla --batch-sizes 1 8 --head-dims 128x128`.
+    """
+    from triton.testing import do_bench
+
+    path = path or FLA_MODE_TABLE
+    entries = {}
+    for op in ops:
+        chunk, fused_recurrent, inputs = get_calibration_fns(op)
+        entries[op] = []
+        for B, H, (K, V) in itertools.product(batch_sizes, num_heads, head_dims):
+            # the shortest length is always left to the recurrent kernel, e.g., for decoding token by token
+            crossover = min(seq_lens)
+            for T in sorted(seq_lens):
+                kwargs = inputs(B, T, H, K, V, dtype, device)
+                t_chunk = do_bench(functools.partial(chunk, **kwargs))
+                t_recurrent = do_bench(functools.partial(fused_recurrent, **kwargs))
+                if t_recurrent > t_chunk:
+                    break
+                crossover = T
+            entries[op].append({'B': B, 'H': H, 'K': K, 'V': V, 'crossover': crossover})
+            print(f"{op:>20} B={B:<4} H={H:<4} K={K:<4} V={V:<4} crossover={crossover}")
+
+    table = {'version': MODE_TABLE_VERSION, 'devices': {}}
+    if os.path.isfile(path):
+        with open(path) as f:
+            table = json.load(f)
+        if table.get('version') != MODE_TABLE_VERSION:
+            table = {'version': MODE_TABLE_VERSION, 'devices': {}}
+    table['devices'].setdefault(get_device_key(), {}).update(entries)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(table, f, indent=2)
+    load_mode_table.cache_clear()
+    get_crossover.cache_clear()
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the crossover lengths between chunk and fused_recurrent kernels.")
+    parser.add_argument('--ops', nargs='+', default=list(CALIBRATION_OPS), choices=CALIBRATION_OPS)
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 8, 32])
+    parser.add_argument('--num-heads', nargs='+', type=int, default=[16])
+    parser.add_argument('--head-dims', nargs='+', default=['64x64', '128x128', '128x256'],
+                        help="head dims of the keys and values as `KxV`")
+    parser.add_argument('--seq-lens', nargs='+', type=int, default=[16, 32, 64, 96, 128, 192, 256, 384, 512, 1024])
+    parser.add_argument('--dtype', default='bfloat16', choices=['bfloat16', 'float16', 'float32'])
+    parser.add_argument('--output', default=FLA_MODE_TABLE)
+    args = parser.parse_args()
+    calibrate(
+        ops=tuple(args.ops),
+        batch_sizes=tuple(args.batch_sizes),
+        num_heads=tuple(args.num_heads),
+        head_dims=tuple(tuple(int(i) for i in dims.split('x')) for dims in args.head_dims),
+        seq_lens=tuple(args.seq_lens),
+        dtype=getattr(torch, args.dtype),
+        path=args.output,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -6,18 +6,23 @@ import triton
 import triton.language as tl
 import triton.language.extra.libdevice as tldevice
 
+from fla.ops.utils.dispatch import register_backend, resolve
 from fla.utils import IS_GATHER_SUPPORTED
 
-if os.environ.get('FLA_USE_FAST_OPS', '0') == '1':
-    exp = tldevice.fast_expf
-    exp2 = tldevice.exp2
-    log = tldevice.fast_logf
-    log2 = tldevice.fast_log2f
-else:
-    exp = tl.exp
-    exp2 = tl.math.exp2
-    log = tl.log
-    log2 = tl.log2
+
+@register_backend('math', 'libdevice', priority=1, check=lambda: os.environ.get('FLA_USE_FAST_OPS', '0') == '1')
+def fast_math():
+    return tldevice.fast_expf, tldevice.exp2, tldevice.fast_logf, tldevice.fast_log2f
+
+
+@register_backend('math', 'triton')
+def exact_math():
+    return tl.exp, tl.math.exp2, tl.log, tl.log2
+
+
+# the math functions are compiled into the kernels, so they are selected once on import,
+# i.e., `set_backend('math', ...)` only takes effect if called before the kernels are imported
+exp, exp2, log, log2 = resolve('math').fn()
 
 
 if not IS_GATHER_SUPPORTED:
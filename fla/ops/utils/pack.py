@@ -59,13 +59,16 @@ def pack_sequence_fwdbwd(
     x: torch.Tensor,
     cu_seqlens: torch.Tensor,
     padding_side: str,
+    total_tokens: int | None = None,
 ) -> torch.Tensor:
     B, S = x.shape[:2]
     D = x.numel() // (B * S)
     BD = min(triton.next_power_of_2(D), 4096)
     ND = triton.cdiv(D, BD)
 
-    y = torch.empty(cu_seqlens[-1].item(), *x.shape[2:], device=x.device, dtype=x.dtype)
+    if total_tokens is None:
+        total_tokens = cu_seqlens[-1].item()
+    y = torch.empty(total_tokens, *x.shape[2:], device=x.device, dtype=x.dtype)
     packunpack_sequence_kernel[ND, S, B](
         x=x,
         y=y,
@@ -84,9 +87,12 @@ def unpack_sequence_fwdbwd(
     cu_seqlens: torch.Tensor,
     padding_side: str,
     desired_shape: torch.Size,
+    max_seqlen: int | None = None,
 ) -> torch.Tensor:
     if desired_shape is None:
-        desired_shape = (len(cu_seqlens) - 1, prepare_lens(cu_seqlens).max().item(), *x.shape[1:])
+        if max_seqlen is None:
+            max_seqlen = prepare_lens(cu_seqlens).max().item()
+        desired_shape = (len(cu_seqlens) - 1, max_seqlen, *x.shape[1:])
     y = torch.zeros(desired_shape, device=x.device, dtype=x.dtype)
     B, S = y.shape[:2]
     D = y.numel() // (B * S)
@@ -115,6 +121,7 @@ class PackSequenceFunction(torch.autograd.Function):
         x: torch.Tensor,
         cu_seqlens: torch.Tensor,
         padding_side: str,
+        total_tokens: int | None = None,
     ) -> torch.Tensor:
         assert padding_side in ['left', 'right']
         assert x.ndim >= 2
@@ -127,6 +134,7 @@ class PackSequenceFunction(torch.autograd.Function):
             x=x,
             cu_seqlens=cu_seqlens,
             padding_side=padding_side,
+            total_tokens=total_tokens,
         )
         return y
 
@@ -152,6 +160,7 @@ class UnpackSequenceFunction(torch.autograd.Function):
         cu_seqlens: torch.Tensor,
         padding_side: str,
         desired_shape: torch.Size | None = None,
+        max_seqlen: int | None = None,
     ) -> torch.Tensor:
         assert padding_side in ['left', 'right']
         assert x.ndim >= 2
@@ -161,12 +170,15 @@ class UnpackSequenceFunction(torch.autograd.Function):
 
         ctx.cu_seqlens = cu_seqlens
         ctx.padding_side = padding_side
+        # the packed length is known from the inputs, sparing the synchronization in the backward pass
+        ctx.total_tokens = x.shape[0]
 
         y = unpack_sequence_fwdbwd(
             x=x,
             cu_seqlens=cu_seqlens,
             padding_side=padding_side,
             desired_shape=desired_shape,
+            max_seqlen=max_seqlen,
         )
         return y
 
@@ -177,19 +189,22 @@ class UnpackSequenceFunction(torch.autograd.Function):
             x=dy,
             cu_seqlens=ctx.cu_seqlens,
             padding_side=ctx.padding_side,
+            total_tokens=ctx.total_tokens,
         )
-        return dx, None, None, None
+        return dx, None, None, None, None
 
 
 def pack_sequence(
     x: torch.Tensor,
     cu_seqlens: torch.Tensor,
     padding_side: str = 'left',
+    total_tokens: int | None = None,
 ) -> torch.Tensor:
     return PackSequenceFunction.apply(
         x,
         cu_seqlens,
         padding_side,
+        total_tokens,
     )
 
 
@@ -198,10 +213,12 @@ def unpack_sequence(
     cu_seqlens: torch.Tensor,
     padding_side: str = 'left',
     desired_shape: torch.Size | None = None,
+    max_seqlen: int | None = None,
 ) -> torch.Tensor:
     return UnpackSequenceFunction.apply(
         x,
         cu_seqlens,
         padding_side,
         desired_shape,
+        max_seqlen,
     )
@@ -0,0 +1,16 @@
+# Copyright (c) 2023-2025, Songlin Yang, Yu Zhang
+
+from fla.serving.engine import Engine
+from fla.serving.load import SyntheticLoadGenerator, summarize
+from fla.serving.request import Request, RequestQueue, RequestStatus
+from fla.serving.scheduler import Scheduler
+
+__all__ = [
+    'Engine',
+    'Request',
+    'RequestQueue',
+    'RequestStatus',
+    'Scheduler',
+    'SyntheticLoadGenerator',
+    'summarize',
+]
@@ -0,0 +1,158 @@
+# Copyright (c) 2023-2025, Songlin Yang, Yu Zhang
+
+from __future__ import annotations
+
+import time
+
+import torch
+import torch.nn as nn
+
+from fla.models.utils import PagedFLACache
+from fla.serving.request import Request, RequestQueue, RequestStatus
+from fla.serving.scheduler import Scheduler
+
+
+class Engine:
+    """
+    A continuous-batching inference engine running FLA models on packed variable-length batches.
+
+    Each :meth:`step` packs the prompt chunks of newly admitted or prefilling requests
+    and the single decoding tokens of the running ones into one sequence of shape `[1, T]` along with its `cu_seqlens`,
+    runs a single forward pass starting from the per-request states gathered from a :class:`PagedFLACache`,
+    and writes the updated states back to the slots of the requests.
+    The logits are only computed at the last token of each sequence.
+    There is thus no padding, and requests join and leave the batch at every iteration.
+
+    As the attention layers do not read cached keys/values of packed sequences yet,
+    only models whose layers keep constant-size states, i.e., without hybrid attention layers, are supported.
+
+    Args:
+        model (`nn.Module`):
+            A `*ForCausalLM` model of FLA.
+        max_num_seqs (`int`, defaults to 64):
+            The maximum number of requests running at the same time.
+        max_num_batched_tokens (`int`, defaults to 2048):
+            The maximum number of tokens packed into one iteration.
+        prefill_chunk_size (`int`, defaults to 512):
+            The maximum number of prompt tokens of a request fed in one iteration.
+        queue (`RequestQueue`, *optional*):
+            The queue to pull incoming requests from at each iteration, a new one if not provided.
+    """
+
+    def __init__(
+        self,
+        model: nn.Module,
+        max_num_seqs: int = 64,
+        max_num_batched_tokens: int = 2048,
+        prefill_chunk_size: int = 512,
+        queue: RequestQueue | None = None,
+    ):
+        if getattr(model.config, 'attn', None) is not None:
+            raise NotImplementedError("Hybrid models with attention layers are not supported by the engine yet")
+        self.model = model.eval()
+        self.decoder = model.get_decoder()
+        self.lm_head = model.get_output_embeddings()
+        self.device = next(model.parameters()).device
+        self.scheduler = Scheduler(max_num_seqs, max_num_batched_tokens, prefill_chunk_size)
+        self.queue = queue if queue is not None else RequestQueue()
+        self.cache = PagedFLACache(max_slots=max_num_seqs)
+        self.num_steps = 0
+        self.num_batched_tokens = 0
+
+    def has_unfinished_requests(self) -> bool:
+        return len(self.scheduler) > 0 or len(self.queue) > 0
+
+    def add_request(self, request: Request) -> Request:
+        if request.num_prompt_tokens == 0:
+            raise ValueError(f"The prompt of request {request.request_id} is empty")
+        self.queue.put(request)
+        return request
+
+    def _sample(self, logits: torch.Tensor, requests: list[Request]) -> list[int]:
+        tokens = logits.argmax(-1)
+        temperatures = [request.temperature for request in requests]
+        if any(t > 0 for t in temperatures):
+            t = logits.new_tensor(temperatures).unsqueeze(-1)
+            probs = torch.softmax(logits.float() / t.clamp_min(1e-5), -1)
+            tokens = torch.where(t.squeeze(-1) > 0, torch.multinomial(probs, 1).squeeze(-1), tokens)
+        return tokens.tolist()
+
+    @torch.no_grad()
+    def step(self) -> list[Request]:
+        """Runs one iteration, returning the requests finished in it."""
+        for request in self.queue.drain():
+            self.scheduler.add(request)
+        batch = self.scheduler.schedule()
+        if len(batch) == 0:
+            return []
+        for request, _ in batch:
+            if request.slot is None:
+                request.slot = self.cache.allocate(1)[0]
+
+        tokens = [request.next_tokens(num_tokens) for request, num_tokens in batch]
+        lens = [len(x) for x in tokens]
+        input_ids = torch.tensor([x for seq in tokens for x in seq], dtype=torch.long, device=self.device).unsqueeze(0)
+        cu_seqlens = torch.tensor([0] + lens, dtype=torch.int32, device=self.device).cumsum(0)
+        self.cache.bind([request.slot for request, _ in batch])
+        hidden_states = self.decoder(
+            input_ids=input_ids,
+            past_key_values=self.cache,
+            use_cache=True,
+            cu_seqlens=cu_seqlens,
+        ).last_hidden_state
+        # the paged cache counts all packed tokens for each slot, restore the lengths of the individual sequences
+        for (request, _), n in zip(batch, lens, strict=False):
+            if request.is_prefilling:
+                request.num_computed_tokens += n
+            self.cache.table.seen_tokens[request.slot] = request.num_computed_tokens + len(request.output_ids)
+        self.num_steps += 1
+        self.num_batched_tokens += input_ids.shape[1]
+
+        # sample the next tokens of the requests done with their prompts
+        indices = [i for i, (request, _) in enumerate(batch) if not request.is_prefilling]
+        if len(indices) == 0:
+            return []
+        requests = [batch[i][0] for i in indices]
+        last = (cu_seqlens[1:] - 1)[torch.tensor(indices, device=self.device)]
+        logits = self.lm_head(hidden_states[0, last])
+        finished = []
+        for request, token in zip(requests, self._sample(logits, requests), strict=False):
+            request.append_token(token)
+            if request.is_finished:
+                finished.append(request)
+        if finished:
+            self.cache.free([request.slot for request in finished])
+            self.scheduler.finish(finished)
+            for request in finished:
+                request.slot = None
+        return finished
+
+    def run(self, until_empty: bool = True, timeout: float | None = None) -> list[Request]:
+        """
+        Steps until all requests are finished, returning them in the order of completion.
+        If `until_empty=False`, keeps polling the queue for new requests until `timeout` seconds have passed.
+        """
+        start, finished = time.perf_counter(), []
+        while True:
+            if not self.has_unfinished_requests():
+                if until_empty or (timeout is not None and time.perf_counter() - start > timeout):
+                    return finished
+                time.sleep(1e-4)
+                continue
+            finished.extend(self.step())
+
+    def generate(
+        self,
+        prompts: list[list[int]],
+        max_new_tokens: int = 16,
+        eos_token_id: int | None = None,
+        temperature: float = 0.,
+    ) -> list[list[int]]:
+        """Serves a list of prompts at once, returning the generated tokens of each one in order."""
+        requests = [
+            self.add_request(Request(prompt, max_new_tokens, eos_token_id=eos_token_id, temperature=temperature))
+            for prompt in prompts
+        ]
+        self.run()
+        assert all(request.status == RequestStatus.FINISHED for request in requests)
+        return [request.output_ids for request in requests]
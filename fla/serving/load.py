@@ -0,0 +1,90 @@
+# Copyright (c) 2023-2025, Songlin Yang, Yu Zhang
+
+from __future__ import annotations
+
+import random
+import threading
+import time
+
+from fla.serving.request import Request, RequestQueue
+
+
+class SyntheticLoadGenerator:
+    """
+    Generates requests with random prompts and output lengths arriving as a Poisson process,
+    for benchmarking the engine under mixed traffic of long prefills and short decodes.
+
+    Args:
+        vocab_size (`int`):
+            The size of the vocabulary to draw the prompt tokens from.
+        num_requests (`int`, defaults to 100):
+            The number of requests to generate.
+        request_rate (`float`, defaults to `inf`):
+            The mean number of requests arriving per second, all requests arrive at once if `inf`.
+        prompt_len (`tuple[int, int]`, defaults to `(32, 1024)`):
+            The range of the prompt lengths, sampled uniformly.
+        output_len (`tuple[int, int]`, defaults to `(16, 256)`):
+            The range of the numbers of tokens to generate, sampled uniformly.
+        seed (`int`, defaults to 0):
+            The random seed.
+    """
+
+    def __init__(
+        self,
+        vocab_size: int,
+        num_requests: int = 100,
+        request_rate: float = float('inf'),
+        prompt_len: tuple[int, int] = (32, 1024),
+        output_len: tuple[int, int] = (16, 256),
+        seed: int = 0,
+    ):
+        self.vocab_size = vocab_size
+        self.num_requests = num_requests
+        self.request_rate = request_rate
+        self.prompt_len = prompt_len
+        self.output_len = output_len
+        self.seed = seed
+
+    def generate(self) -> list[tuple[float, Request]]:
+        """Returns the requests along with their arrival times in seconds relative to the start."""
+        rng = random.Random(self.seed)
+        requests, arrival = [], 0.
+        for _ in range(self.num_requests):
+            if self.request_rate != float('inf'):
+                arrival += rng.expovariate(self.request_rate)
+            prompt = [rng.randrange(self.vocab_size) for _ in range(rng.randint(*self.prompt_len))]
+            requests.append((arrival, Request(prompt, max_new_tokens=rng.randint(*self.output_len))))
+        return requests
+
+    def start(self, queue: RequestQueue) -> threading.Thread:
+        """Pushes the requests to `queue` at their arrival times from a background thread."""
+        def feed(requests: list[tuple[float, Request]]):
+            start = time.perf_counter()
+            for arrival, request in requests:
+                delay = arrival - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+                request.arrival_time = time.perf_counter()
+                queue.put(request)
+
+        thread = threading.Thread(target=feed, args=(self.generate(),), daemon=True)
+        thread.start()
+        return thread
+
+
+def summarize(requests: list[Request], elapsed: float) -> dict[str, float]:
+    """Summarizes the throughput and latencies of the finished `requests` served in `elapsed` seconds."""
+    num_prompt_tokens = sum(request.num_prompt_tokens for request in requests)
+    num_output_tokens = sum(len(request.output_ids) for request in requests)
+    ttfts = [request.first_token_time - request.arrival_time for request in requests]
+    latencies = [request.finish_time - request.arrival_time for request in requests]
+    return {
+        'num_requests': len(requests),
+        'elapsed': elapsed,
+        'requests_per_second': len(requests) / elapsed,
+        'prompt_tokens_per_second': num_prompt_tokens / elapsed,
+        'output_tokens_per_second': num_output_tokens / elapsed,
+        'mean_ttft': sum(ttfts) / max(len(ttfts), 1),
+        'mean_latency': sum(latencies) / max(len(latencies), 1),
+        'max_latency': max(latencies, default=0.),
+    }
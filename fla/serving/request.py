@@ -0,0 +1,105 @@
+# Copyright (c) 2023-2025, Songlin Yang, Yu Zhang
+
+from __future__ import annotations
+
+import enum
+import itertools
+import queue
+import time
+from dataclasses import dataclass, field
+
+
+class RequestStatus(enum.Enum):
+    WAITING = enum.auto()
+    RUNNING = enum.auto()
+    FINISHED = enum.auto()
+
+
+_request_ids = itertools.count()
+
+
+@dataclass
+class Request:
+    """
+    A generation request served by the :class:`~fla.serving.Engine`.
+
+    Args:
+        prompt_ids (`list[int]`):
+            The token ids of the prompt.
+        max_new_tokens (`int`, defaults to 16):
+            The maximum number of tokens to generate.
+        eos_token_id (`int`, *optional*):
+            The token stopping the generation.
+        temperature (`float`, defaults to 0.):
+            The sampling temperature, 0 for greedy decoding.
+        request_id (`int`, *optional*):
+            A unique id of the request, assigned automatically if not provided.
+    """
+
+    prompt_ids: list[int]
+    max_new_tokens: int = 16
+    eos_token_id: int | None = None
+    temperature: float = 0.
+    request_id: int = field(default_factory=lambda: next(_request_ids))
+
+    status: RequestStatus = RequestStatus.WAITING
+    # the slot of the request in the paged cache while running
+    slot: int | None = None
+    # the number of prompt tokens already fed through the model
+    num_computed_tokens: int = 0
+    output_ids: list[int] = field(default_factory=list)
+    arrival_time: float = field(default_factory=time.perf_counter)
+    first_token_time: float | None = None
+    finish_time: float | None = None
+
+    @property
+    def num_prompt_tokens(self) -> int:
+        return len(self.prompt_ids)
+
+    @property
+    def is_prefilling(self) -> bool:
+        return self.num_computed_tokens < self.num_prompt_tokens
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status == RequestStatus.FINISHED
+
+    def next_tokens(self, num_tokens: int) -> list[int]:
+        """The next `num_tokens` tokens to feed, i.e., a chunk of the prompt or the last generated token."""
+        if self.is_prefilling:
+            return self.prompt_ids[self.num_computed_tokens:self.num_computed_tokens + num_tokens]
+        return self.output_ids[-1:]
+
+    def append_token(self, token: int):
+        now = time.perf_counter()
+        if self.first_token_time is None:
+            self.first_token_time = now
+        self.output_ids.append(token)
+        if len(self.output_ids) >= self.max_new_tokens or token == self.eos_token_id:
+            self.status = RequestStatus.FINISHED
+            self.finish_time = now
+
+
+class RequestQueue:
+    """
+    A thread-safe in-process queue of incoming requests, e.g., filled by a frontend or a load generator
+    on other threads while the engine is stepping.
+    """
+
+    def __init__(self):
+        self.queue: queue.Queue[Request] = queue.Queue()
+
+    def __len__(self) -> int:
+        return self.queue.qsize()
+
+    def put(self, request: Request):
+        self.queue.put(request)
+
+    def drain(self) -> list[Request]:
+        """Pops all requests currently queued without blocking."""
+        requests = []
+        while True:
+            try:
+                requests.append(self.queue.get_nowait())
+            except queue.Empty:
+                return requests
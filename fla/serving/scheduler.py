@@ -0,0 +1,68 @@
+# Copyright (c) 2023-2025, Songlin Yang, Yu Zhang
+
+from __future__ import annotations
+
+from collections import deque
+
+from fla.serving.request import Request, RequestStatus
+
+
+class Scheduler:
+    """
+    An iteration-level scheduler for continuous batching.
+
+    In each iteration, every running request gets its next decoding token or prompt chunk,
+    and waiting requests are admitted in FIFO order as long as there are free sequences and token budget left.
+    Prompts are fed in chunks of at most `prefill_chunk_size` tokens,
+    so that long prompts are interleaved with the decoding steps of other requests rather than stalling them.
+
+    Args:
+        max_num_seqs (`int`):
+            The maximum number of requests running at the same time, i.e., the number of slots of the cache.
+        max_num_batched_tokens (`int`, defaults to 2048):
+            The maximum number of tokens packed into one iteration.
+        prefill_chunk_size (`int`, defaults to 512):
+            The maximum number of prompt tokens of a request fed in one iteration.
+    """
+
+    def __init__(self, max_num_seqs: int, max_num_batched_tokens: int = 2048, prefill_chunk_size: int = 512):
+        if max_num_batched_tokens < max_num_seqs:
+            raise ValueError(
+                f"`max_num_batched_tokens={max_num_batched_tokens}` must be no less than `max_num_seqs={max_num_seqs}` "
+                "so that all running requests can decode in each iteration",
+            )
+        self.max_num_seqs = max_num_seqs
+        self.max_num_batched_tokens = max_num_batched_tokens
+        self.prefill_chunk_size = prefill_chunk_size
+        self.waiting: deque[Request] = deque()
+        self.running: list[Request] = []
+
+    def __len__(self) -> int:
+        return len(self.waiting) + len(self.running)
+
+    def add(self, request: Request):
+        self.waiting.append(request)
+
+    def schedule(self) -> list[tuple[Request, int]]:
+        """Returns the requests of the next iteration along with their numbers of tokens to feed, in batch order."""
+        batch, budget = [], self.max_num_batched_tokens
+        # decoding requests go first as they only need a single token each
+        for request in sorted(self.running, key=lambda r: r.is_prefilling):
+            num_tokens = 1
+            if request.is_prefilling:
+                num_tokens = min(request.num_prompt_tokens - request.num_computed_tokens, self.prefill_chunk_size, budget)
+            if num_tokens > 0:
+                batch.append((request, num_tokens))
+                budget -= num_tokens
+        while self.waiting and len(self.running) < self.max_num_seqs and budget > 0:
+            request = self.waiting.popleft()
+            request.status = RequestStatus.RUNNING
+            self.running.append(request)
+            num_tokens = min(request.num_prompt_tokens, self.prefill_chunk_size, budget)
+            batch.append((request, num_tokens))
+            budget -= num_tokens
+        return batch
+
+    def finish(self, requests: list[Request]):
+        finished = {request.request_id for request in requests}
+        self.running = [request for request in self.running if request.request_id not in finished]
@@ -7,10 +7,12 @@ import logging
 import os
 import sys
 import warnings
+import weakref
+from collections import OrderedDict
 from collections.abc import Callable
 from enum import Enum
 from functools import lru_cache
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, NamedTuple
 
 import torch
 import triton
@@ -24,6 +26,7 @@ if TYPE_CHECKING:
 FLA_CI_ENV = os.getenv("FLA_CI_ENV") == "1"
 FLA_CACHE_RESULTS = os.getenv('FLA_CACHE_RESULTS', '1') == '1'
 FLA_DISABLE_TENSOR_CACHE = os.getenv('FLA_DISABLE_TENSOR_CACHE', '0') == '1'
+FLA_TENSOR_CACHE_SIZE = int(os.getenv('FLA_TENSOR_CACHE_SIZE', '8'))
 
 
 SUPPORTS_AUTOTUNE_CACHE = "cache_results" in inspect.signature(triton.autotune).parameters
@@ -96,50 +99,137 @@ def assert_close(prefix, ref, tri, ratio, warning=False, err_atol=1e-6):
         assert error_rate < ratio, msg
 
 
+class TensorCacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+_TENSOR_CACHES: dict[str, Callable[..., Any]] = {}
+
+
+def tensor_version(x: torch.Tensor) -> int | None:
+    """
+    Returns the version counter of `x`, bumped by each inplace update, or `None` for the tensors created under
+    `torch.inference_mode()`, which do not track their versions.
+    """
+    return None if x.is_inference() else x._version
+
+
+def _tensor_cache_key(value: Any) -> Any:
+    # tensors are keyed on their identity and version counter, so that inplace updates invalidate the entries,
+    # while the other arguments are keyed on their types and values
+    if isinstance(value, torch.Tensor):
+        return (torch.Tensor, id(value), tensor_version(value))
+    if isinstance(value, (tuple, list)):
+        return (type(value), tuple(_tensor_cache_key(i) for i in value))
+    hash(value)
+    return (type(value), value)
+
+
+def _tensor_cache_tensors(value: Any) -> list[torch.Tensor]:
+    if isinstance(value, torch.Tensor):
+        return [value]
+    if isinstance(value, (tuple, list)):
+        return [t for i in value for t in _tensor_cache_tensors(i)]
+    return []
+
+
 def tensor_cache(
-    fn: Callable[..., torch.Tensor],
+    fn: Callable[..., torch.Tensor] | None = None,
+    *,
+    maxsize: int | None = None,
 ) -> Callable[..., torch.Tensor]:
     """
-    A decorator that caches the most recent result of a function with tensor inputs.
+    A decorator that caches the most recent results of a function with tensor inputs.
 
-    This decorator will store the output of the decorated function for the most recent set of input tensors.
-    If the function is called again with the same input tensors, it will return the cached result.
+    This decorator will store the outputs of the decorated function for the `maxsize` most recently used sets of
+    inputs, where tensors are matched by identity and version counter, i.e., inplace updates invalidate the entries,
+    and other arguments by value. Tensors created under `torch.inference_mode()` have no version counters and are
+    matched by identity alone. The input tensors are only weakly referenced, with the entries evicted once
+    any of them is freed. Calls with unhashable non-tensor arguments are not cached.
 
+    The number of entries defaults to the `FLA_TENSOR_CACHE_SIZE` environment variable (8 if not set).
     If FLA_DISABLE_TENSOR_CACHE environment variable is set to '1', caching is disabled.
+    The statistics of all cached functions are available via :func:`get_tensor_cache_info`.
 
     Args:
         fn (Callable[..., torch.Tensor]):
             The function to be decorated. It should take tensor inputs and return tensor outputs.
+        maxsize (Optional[int]):
+            The maximum number of cached entries. Default: `FLA_TENSOR_CACHE_SIZE`.
 
     Returns:
         Callable[..., torch.Tensor]:
-            A wrapped version of the input function with single-entry caching.
+            A wrapped version of the input function with bounded LRU caching,
+            exposing `cache_info()` and `cache_clear()` like :func:`functools.lru_cache`.
     """
-    last_args: tuple | None = None
-    last_kwargs: dict | None = None
-    last_result: Any = None
+    if fn is None:
+        return functools.partial(tensor_cache, maxsize=maxsize)
+    maxsize = FLA_TENSOR_CACHE_SIZE if maxsize is None else maxsize
+    cache: OrderedDict[tuple, tuple[list[weakref.ref], Any]] = OrderedDict()
+    hits = misses = 0
+
+    def evict(key: tuple) -> Callable[[weakref.ref], None]:
+        return lambda _: cache.pop(key, None)
 
     @functools.wraps(fn)
     def wrapper(*args: Any, **kwargs: Any) -> Any:
-        nonlocal last_args, last_kwargs, last_result
+        nonlocal hits, misses
 
         # Skip cache if FLA_DISABLE_TENSOR_CACHE is set
-        if FLA_DISABLE_TENSOR_CACHE:
+        if FLA_DISABLE_TENSOR_CACHE or maxsize <= 0:
             return fn(*args, **kwargs)
 
-        if last_args is not None and last_kwargs is not None:
-            if len(args) == len(last_args) and len(kwargs) == len(last_kwargs):
-                if all(a is b for a, b in zip(args, last_args, strict=False)) and \
-                        all(k in last_kwargs and v is last_kwargs[k] for k, v in kwargs.items()):
-                    return last_result
+        try:
+            key = _tensor_cache_key((args, tuple(sorted(kwargs.items()))))
+        except TypeError:
+            misses += 1
+            return fn(*args, **kwargs)
+        if key in cache:
+            hits += 1
+            cache.move_to_end(key)
+            return cache[key][1]
 
+        misses += 1
         result = fn(*args, **kwargs)
-        last_args, last_kwargs, last_result = args, kwargs, result
+        refs = [weakref.ref(i, evict(key)) for i in _tensor_cache_tensors((args, tuple(kwargs.values())))]
+        cache[key] = (refs, result)
+        if len(cache) > maxsize:
+            cache.popitem(last=False)
         return result
 
+    def cache_info() -> TensorCacheInfo:
+        return TensorCacheInfo(hits, misses, maxsize, len(cache))
+
+    def cache_clear() -> None:
+        nonlocal hits, misses
+        cache.clear()
+        hits = misses = 0
+
+    wrapper.cache_info = cache_info
+    wrapper.cache_clear = cache_clear
+    _TENSOR_CACHES[f"{fn.__module__}.{fn.__qualname__}"] = wrapper
     return wrapper
 
 
+def get_tensor_cache_info() -> dict[str, TensorCacheInfo]:
+    """
+    Returns the hit/miss statistics of all functions decorated by :func:`tensor_cache`, keyed by qualified names,
+    e.g., to check that the metadata of variable-length inputs is built once per batch rather than once per layer.
+    """
+    return {name: fn.cache_info() for name, fn in _TENSOR_CACHES.items()}
+
+
+def clear_tensor_cache() -> None:
+    """
+    Clears the entries and statistics of all functions decorated by :func:`tensor_cache`.
+    """
+    for fn in _TENSOR_CACHES.values():
+        fn.cache_clear()
+
+
 def input_guard(
     fn: Callable[..., torch.Tensor],
 ) -> Callable[..., torch.Tensor]:
@@ -374,13 +464,27 @@ def get_multiprocessor_count(tensor_idx: int = 0) -> int:
             return 1
 
 
-@functools.cache
-def get_available_device() -> str:
+def get_triton_device() -> str:
+    return triton.runtime.driver.active.get_current_target().backend
+
+
+def is_triton_device_available() -> bool:
     try:
-        return triton.runtime.driver.active.get_current_target().backend
+        get_triton_device()
+        return True
     except BaseException:
-        _cpu_device_warning()
-        return 'cpu'
+        return False
+
+
+def get_cpu_device() -> str:
+    _cpu_device_warning()
+    return 'cpu'
+
+
+@functools.cache
+def get_available_device() -> str:
+    # the choice is recorded as the `device` op of `fla.ops.utils.dispatch`, which cannot be imported this early
+    return get_triton_device() if is_triton_device_available() else get_cpu_device()
 
 
 def map_triton_backend_to_torch_device() -> str:
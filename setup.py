@@ -42,6 +42,9 @@ setup(
         'transformers',
         'einops',
     ],
+    entry_points={
+        'console_scripts': ['fla-autotune=fla.ops.utils.autotune:main'],
+    },
     extras_require={
         'conv1d': ['causal-conv1d>=1.4.0'],
         'benchmark': ['matplotlib', 'datasets>=3.3.0'],
@@ -0,0 +1,48 @@
+# Copyright (c) 2023-2025, Songlin Yang, Yu Zhang
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+def run(code: str, env: dict[str, str] | None = None) -> str:
+    # each check runs in a fresh interpreter, as the modules imported by the other tests are cached in `sys.modules`
+    env = {**os.environ, **env} if env is not None else None
+    return subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True, env=env).stdout.strip()
+
+
+@pytest.mark.parametrize('module', ['fla', 'fla.layers', 'fla.models', 'fla.ops'])
+def test_lazy_import(module):
+    # neither the layers nor the kernels are imported until they are accessed
+    loaded = run(f"import sys, {module}; print([m for m in sys.modules if m.startswith(('fla.layers.', 'fla.ops.gla'))])")
+    assert loaded == '[]'
+
+
+def test_lazy_attribute():
+    assert run("import fla; print(fla.GatedDeltaNet.__module__)") == 'fla.layers.gated_deltanet'
+    assert run("from fla.ops import chunk_gla; print(chunk_gla.__module__)") == 'fla.ops.gla.chunk'
+    assert run("import fla.models; print('GLAForCausalLM' in dir(fla.models))") == 'True'
+    with pytest.raises(subprocess.CalledProcessError):
+        run("import fla; fla.NoSuchLayer")
+
+
+def test_lazy_auto_config():
+    code = "import fla; from transformers import AutoConfig; c = AutoConfig.for_model('gla'); print(type(c).__name__)"
+    assert run(code) == 'GLAConfig'
+
+
+def test_lazy_tuned_configs(tmp_path):
+    from fla.modules.l2norm import l2norm_fwd_kernel
+    from fla.ops.utils.autotune import AUTOTUNE_DB_VERSION, get_db_key, serialize_config
+
+    path = str(tmp_path / 'autotune.json')
+    entry = {'key': [64, 1], 'config': serialize_config(l2norm_fwd_kernel.configs[0])}
+    configs = {get_db_key(): {'fla.modules.l2norm.l2norm_fwd_kernel': [entry]}}
+    with open(path, 'w') as f:
+        json.dump({'version': AUTOTUNE_DB_VERSION, 'configs': configs}, f)
+    # the kernels are seeded once their modules are imported, without going through the lazy attributes
+    code = "import fla.modules.l2norm as m; print(list(m.l2norm_fwd_kernel.cache))"
+    assert run(code, env={'FLA_AUTOTUNE_DB': path}) == '[(64, 1)]'
@@ -0,0 +1,635 @@
+# Copyright (c) 2023-2025, Songlin Yang, Yu Zhang
+
+import pytest
+import torch
+
+from fla.models import GatedDeltaNetConfig, TransformerConfig
+from fla.models.utils import Cache, FLACache, OffloadedFLACache, PagedFLACache, PrefixStateCache, StaticFLACache, iter_tensors
+from fla.utils import assert_close, device
+
+from .test_modeling_utils import create_model_and_config
+
+requires_fla_cache = pytest.mark.skipif(
+    not issubclass(Cache, FLACache),
+    reason="The layered cache requires a recent version of transformers.",
+)
+
+
+# ===================================================================================
+# Test for Batch Manipulation
+# ===================================================================================
+def test_cache_batch_ops():
+    torch.manual_seed(42)
+    B, T = 4, 6
+    cache = Cache()
+    recurrent_state = torch.randn(B, 2, 8, 8, device=device)
+    conv_state = tuple(torch.randn(B, 16, 4, device=device) for _ in range(3))
+    attn_state = (torch.randn(B, T, 16, device=device), torch.randn(B, T, 16, device=device))
+    cache.update(recurrent_state=recurrent_state.clone(), conv_state=conv_state, layer_idx=0, offset=T)
+    cache.update(attn_state=attn_state, layer_idx=1, offset=T)
+
+    beam_idx = torch.tensor([2, 2, 0, 1], device=device)
+    cache.reorder_cache(beam_idx)
+    assert_close('recurrent_state', recurrent_state[beam_idx], cache[0]['recurrent_state'], 1e-6)
+    assert_close('conv_state', conv_state[1][beam_idx], cache[0]['conv_state'][1], 1e-6)
+    assert_close('k', attn_state[0][beam_idx], cache[1]['attn_state'][0], 1e-6)
+
+    cache.batch_select_indices(torch.tensor([1, 3], device=device))
+    assert_close('recurrent_state', recurrent_state[[2, 1]], cache[0]['recurrent_state'], 1e-6)
+    cache.batch_repeat_interleave(3)
+    assert cache[0]['recurrent_state'].shape[0] == 6
+    assert cache[1]['attn_state'][1].shape[:2] == (6, T)
+    assert_close('v', attn_state[1][[2, 2, 2, 1, 1, 1]], cache[1]['attn_state'][1], 1e-6)
+
+    # the states of linear attention layers can not be rolled back
+    with pytest.raises(ValueError):
+        cache.crop(-2)
+    assert cache.get_seq_length() == T
+    assert cache[1]['attn_state'][0].shape[1] == T
+
+    attn_cache = Cache()
+    attn_cache.update(attn_state=attn_state, layer_idx=0, offset=T)
+    attn_cache.crop(-2)
+    assert attn_cache.get_seq_length() == T - 2
+    assert_close('k', attn_state[0][:, :T-2], attn_cache[0]['attn_state'][0], 1e-6)
+
+
+@pytest.mark.parametrize(
+    ['L', 'B', 'T', 'H', 'D', 'num_beams', 'dtype'],
+    [
+        pytest.param(*test, id="L{}-B{}-T{}-H{}-D{}-num_beams{}-{}".format(*test))
+        for test in [
+            (2, 1, 32, 4, 64, 2, torch.float32),
+            (2, 2, 50, 4, 64, 4, torch.float32),
+        ]
+    ],
+)
+def test_beam_search(
+    L: int,
+    B: int,
+    T: int,
+    H: int,
+    D: int,
+    num_beams: int,
+    dtype: torch.dtype,
+):
+    torch.manual_seed(42)
+    model, config = create_model_and_config(GatedDeltaNetConfig, L, H, D, dtype=dtype)
+    model.eval()
+    input_ids = torch.randint(low=0, high=config.vocab_size, size=(B, T), device=device)
+    kwargs = dict(max_new_tokens=8, num_beams=num_beams, do_sample=False, pad_token_id=0, eos_token_id=None)
+    ref = model.generate(input_ids, use_cache=False, **kwargs)
+    gen = model.generate(input_ids, use_cache=True, **kwargs)
+    assert torch.equal(ref, gen)
+
+
+# ===================================================================================
+# Test for Sliding Window Cache
+# ===================================================================================
+@pytest.mark.parametrize('ring_buffer', [False, True])
+def test_sliding_window_cache(ring_buffer: bool):
+    torch.manual_seed(42)
+    B, W, D = 3, 16, 8
+    cache = Cache()
+    keys, ptrs = [], set()
+    for i, T in enumerate([5, 1, 1, 3, 9, 1, 1, 1, 20, 1, 1, 2, 1, 1, 1, 1, 1]):
+        k = torch.randn(B, T, D, device=device)
+        keys.append(k)
+        k_cached, v_cached = cache.update(
+            attn_state=(k, -k),
+            layer_idx=0,
+            offset=T,
+            cache_kwargs=dict(window_size=W, ring_buffer=ring_buffer),
+        )['attn_state']
+        if i == 10:
+            # beam search reorders the whole ring buffers
+            beam_idx = torch.tensor([2, 0, 0], device=device)
+            cache.reorder_cache(beam_idx)
+            keys = [x[beam_idx] for x in keys]
+            k_cached = cache[0]['attn_state'][0]
+        ref = torch.cat(keys, 1)[:, -W:]
+        assert k_cached.shape == ref.shape
+        start = cache.get_window_offset(0)
+        if not ring_buffer:
+            assert start == 0
+        elif i > 10:
+            # decoding writes to the preallocated buffers in place
+            ptrs.add(k_cached.data_ptr())
+        assert_close('k', ref, k_cached.roll(-start, dims=1), 1e-6)
+    assert not ring_buffer or len(ptrs) == 1
+
+    cache.crop(-3)
+    assert_close('k', torch.cat(keys, 1)[:, -W:-3], cache[0]['attn_state'][0], 1e-6)
+
+
+@pytest.mark.parametrize(
+    ['L', 'B', 'T', 'H', 'D', 'W', 'dtype'],
+    [
+        pytest.param(*test, id="L{}-B{}-T{}-H{}-D{}-W{}-{}".format(*test))
+        for test in [
+            (2, 3, 20, 4, 64, 16, torch.float16),
+            (2, 2, 40, 4, 64, 8, torch.float16),
+        ]
+    ],
+)
+def test_sliding_window_generation(
+    L: int,
+    B: int,
+    T: int,
+    H: int,
+    D: int,
+    W: int,
+    dtype: torch.dtype,
+):
+    torch.manual_seed(42)
+    model, config = create_model_and_config(TransformerConfig, L, H, D, dtype=dtype, window_size=W)
+    model.eval()
+    input_ids = torch.randint(low=1, high=config.vocab_size, size=(B, T), device=device)
+    attention_mask = torch.ones_like(input_ids)
+    # left padding of different lengths, masked out of the ring buffers by rolling the mask
+    for i in range(1, B):
+        input_ids[i, :i * 3] = 0
+        attention_mask[i, :i * 3] = 0
+    kwargs = dict(attention_mask=attention_mask, max_new_tokens=2 * W, do_sample=False, pad_token_id=0, eos_token_id=None)
+    ref = model.generate(input_ids, use_cache=False, **kwargs)
+    gen = model.generate(input_ids, use_cache=True, **kwargs)
+    assert torch.equal(ref, gen)
+
+
+# ===================================================================================
+# Test for Paged Cache
+# ===================================================================================
+@requires_fla_cache
+def test_paged_cache_slots():
+    torch.manual_seed(42)
+    cache = PagedFLACache(max_slots=4, max_cache_len=16)
+    cache.bind(cache.allocate(3))
+    states = torch.randn(3, 2, 8, 8, device=device)
+    kv = (torch.randn(3, 5, 16, device=device), torch.randn(3, 5, 16, device=device))
+    cache.update(recurrent_state=states, attn_state=kv, layer_idx=0, offset=5)
+    assert cache.get_seq_length() == 5
+
+    # the leaving sequence does not touch the others
+    cache.free([1])
+    assert cache.slots == [0, 2]
+    assert_close('recurrent_state', states[[0, 2]], cache[0]['recurrent_state'], 1e-6)
+    assert_close('k', kv[0][[0, 2]], cache[0]['attn_state'][0], 1e-6)
+
+    # the joining sequence starts from zero states
+    slot = cache.allocate(1)
+    assert slot == [1]
+    cache.bind([2, 1, 0])
+    state = cache[0]['recurrent_state']
+    assert_close('recurrent_state', states[2], state[0], 1e-6)
+    assert state[1].abs().max() == 0
+    assert_close('recurrent_state', states[0], state[2], 1e-6)
+    assert cache.get_slot_seq_lengths() == [5, 0, 5]
+
+    with pytest.raises(RuntimeError):
+        cache.allocate(2)
+    with pytest.raises(ValueError):
+        cache.bind([3])
+
+    # beams are copied to newly allocated slots
+    cache.free([1])
+    cache.bind([2])
+    cache.batch_repeat_interleave(2)
+    assert cache.slots == [2, 1]
+    assert_close('recurrent_state', states[[2, 2]], cache[0]['recurrent_state'], 1e-6)
+    assert_close('k', kv[0][[2, 2]], cache[0]['attn_state'][0], 1e-6)
+    cache.reorder_cache(torch.tensor([1, 1], device=device))
+    assert cache.get_slot_seq_lengths() == [5, 5]
+
+
+@requires_fla_cache
+@pytest.mark.parametrize(
+    ['L', 'B', 'T', 'H', 'D', 'slots', 'dtype'],
+    [
+        pytest.param(*test, id="L{}-B{}-T{}-H{}-D{}-slots{}-{}".format(*test))
+        for test in [
+            (2, 2, 64, 4, 64, [0, 1], torch.float16),
+            (2, 3, 100, 4, 64, [4, 1, 2], torch.float16),
+        ]
+    ],
+)
+def test_paged_cache_generation(
+    L: int,
+    B: int,
+    T: int,
+    H: int,
+    D: int,
+    slots: list[int],
+    dtype: torch.dtype,
+):
+    torch.manual_seed(42)
+    model, config = create_model_and_config(GatedDeltaNetConfig, L, H, D, dtype=dtype)
+    model.eval()
+    input_ids = torch.randint(low=0, high=config.vocab_size, size=(B, T), device=device)
+    ref = model(input_ids=input_ids, use_cache=False).logits
+
+    cache = PagedFLACache(max_slots=max(slots) + 1)
+    allocated = cache.allocate(max(slots) + 1)
+    cache.free([slot for slot in allocated if slot not in slots])
+    cache.bind(slots)
+    logits = [model(input_ids=input_ids[:, :T // 2], use_cache=True, past_key_values=cache).logits]
+    for i in range(T // 2, T):
+        logits.append(model(input_ids=input_ids[:, i:i+1], use_cache=True, past_key_values=cache).logits)
+    assert_close('logits', ref, torch.cat(logits, 1), 2e-3)
+
+
+# ===================================================================================
+# Test for Cache Persistence
+# ===================================================================================
+@pytest.mark.parametrize(
+    ['L', 'B', 'T', 'H', 'D', 'quantization', 'tol', 'dtype'],
+    [
+        pytest.param(*test, id="L{}-B{}-T{}-H{}-D{}-{}-tol{}-{}".format(*test))
+        for test in [
+            (4, 2, 100, 4, 64, None, 1e-3, torch.float32),
+            (4, 2, 100, 4, 64, 'int8', 2e-2, torch.float32),
+            (4, 2, 100, 4, 64, 'fp8', 1e-1, torch.float32),
+        ]
+    ],
+)
+def test_cache_save_load(
+    L: int,
+    B: int,
+    T: int,
+    H: int,
+    D: int,
+    quantization: str | None,
+    tol: float,
+    dtype: torch.dtype,
+    tmp_path,
+):
+    if quantization == 'fp8' and not hasattr(torch, 'float8_e4m3fn'):
+        pytest.skip("fp8 is not supported by this version of PyTorch.")
+    torch.manual_seed(42)
+    attn = {'layers': list(range(1, L, 2)), 'num_heads': H, 'window_size': 32}
+    model, config = create_model_and_config(GatedDeltaNetConfig, L, H, D, dtype=dtype, attn=attn)
+    model.eval()
+    input_ids = torch.randint(low=0, high=config.vocab_size, size=(B, T), device=device)
+    ref = model(input_ids=input_ids, use_cache=False).logits
+
+    cache = Cache()
+    model(input_ids=input_ids[:, :T // 2], use_cache=True, past_key_values=cache)
+    # wrap the sliding window buffers around before saving
+    for i in range(T // 2, T // 2 + 10):
+        model(input_ids=input_ids[:, i:i+1], use_cache=True, past_key_values=cache)
+    path = tmp_path / 'cache.pt'
+    cache.save(path, quantization=quantization)
+    del cache
+
+    cache = Cache.load(path, device=device)
+    assert cache.get_seq_length() == T // 2 + 10
+    logits = [model(input_ids=input_ids[:, i:i+1], use_cache=True, past_key_values=cache).logits
+              for i in range(T // 2 + 10, T)]
+    assert_close('logits', ref[:, T // 2 + 10:], torch.cat(logits, 1), tol)
+
+
+# ===================================================================================
+# Test for Memory Accounting
+# ===================================================================================
+@pytest.mark.parametrize(
+    ['L', 'B', 'T', 'H', 'D', 'window_size', 'dtype'],
+    [
+        pytest.param(*test, id="L{}-B{}-T{}-H{}-D{}-window_size{}-{}".format(*test))
+        for test in [
+            (4, 2, 100, 4, 64, None, torch.float32),
+            (4, 3, 200, 4, 64, 32, torch.bfloat16),
+        ]
+    ],
+)
+def test_cache_memory_footprint(
+    L: int,
+    B: int,
+    T: int,
+    H: int,
+    D: int,
+    window_size: int | None,
+    dtype: torch.dtype,
+):
+    torch.manual_seed(42)
+    attn = {'layers': list(range(1, L, 2)), 'num_heads': H, 'window_size': window_size}
+    model, config = create_model_and_config(GatedDeltaNetConfig, L, H, D, dtype=dtype, attn=attn)
+    model.eval()
+    input_ids = torch.randint(low=0, high=config.vocab_size, size=(B, T), device=device)
+    cache = Cache()
+    model(input_ids=input_ids, use_cache=True, past_key_values=cache)
+
+    footprint = cache.memory_footprint()
+    estimate = Cache.estimate_cache_bytes(config, B, T, dtype=dtype)
+    assert len(footprint['layers']) == len(estimate['layers']) == L
+    assert footprint['total'] == sum(layer['total'] for layer in footprint['layers'])
+    assert footprint['total'] == sum(footprint['devices'].values())
+    for key in ('recurrent_state', 'attn_state'):
+        assert footprint['states'][key] == estimate['states'][key]
+    assert footprint['states']['conv_state'] >= estimate['states']['conv_state'] > 0
+    # the attention layers hold no recurrent states, and vice versa
+    assert footprint['layers'][1]['recurrent_state'] == 0
+    assert footprint['layers'][0]['attn_state'] == 0
+
+
+def test_estimate_cache_bytes_undeclared(monkeypatch):
+    from fla.layers import GatedDeltaNet
+
+    config = GatedDeltaNetConfig(hidden_size=256, num_hidden_layers=2, num_heads=4)
+    assert Cache.estimate_cache_bytes(config, 2, 100)['states']['recurrent_state'] > 0
+    # layers not declaring their states fail loudly rather than being counted as stateless
+    monkeypatch.delattr(GatedDeltaNet, 'state_shapes')
+    with pytest.raises(NotImplementedError, match='GatedDeltaNet'):
+        Cache.estimate_cache_bytes(config, 2, 100)
+
+
+# ===================================================================================
+# Test for Static Cache
+# ===================================================================================
+@requires_fla_cache
+@pytest.mark.parametrize(
+    ['L', 'B', 'T', 'H', 'D', 'window_size', 'dtype'],
+    [
+        pytest.param(*test, id="L{}-B{}-T{}-H{}-D{}-window_size{}-{}".format(*test))
+        for test in [
+            (4, 2, 64, 4, 64, None, torch.float32),
+            (4, 3, 100, 4, 64, 32, torch.float32),
+        ]
+    ],
+)
+def test_static_cache(
+    L: int,
+    B: int,
+    T: int,
+    H: int,
+    D: int,
+    window_size: int | None,
+    dtype: torch.dtype,
+):
+    torch.manual_seed(42)
+    attn = {'layers': list(range(1, L, 2)), 'num_heads': H, 'window_size': window_size}
+    model, config = create_model_and_config(GatedDeltaNetConfig, L, H, D, dtype=dtype, attn=attn)
+    model.eval()
+    input_ids = torch.randint(low=0, high=config.vocab_size, size=(B, T), device=device)
+    ref = model(input_ids=input_ids, use_cache=False).logits
+
+    cache = StaticFLACache(max_batch_size=B + 1, max_cache_len=T)
+
+    def buffers():
+        windows = [x for layer in cache.layers if layer.window is not None for x in layer.window.buffers]
+        return [x.data_ptr() for layer in cache.layers for x in iter_tensors(layer.buffers)] + [x.data_ptr() for x in windows]
+
+    first_ptrs = None
+    for _ in range(2):
+        logits = [model(input_ids=input_ids[:, :T // 2], use_cache=True, past_key_values=cache).logits]
+        ptrs = buffers()
+        # the sliding window buffers included, e.g., for the captured CUDA graphs to stay valid
+        assert first_ptrs is None or ptrs == first_ptrs
+        first_ptrs = ptrs
+        for i in range(T // 2, T):
+            logits.append(model(input_ids=input_ids[:, i:i+1], use_cache=True, past_key_values=cache).logits)
+            # the states are views of the buffers updated inplace
+            assert cache[0]['recurrent_state'].data_ptr() == cache.layers[0].buffers['recurrent_state'].data_ptr()
+        assert ptrs == buffers()
+        assert_close('logits', ref, torch.cat(logits, 1), 1e-3)
+        # the buffers are reused by the next request
+        cache.reset()
+
+    model(input_ids=input_ids, use_cache=True, past_key_values=cache)
+    with pytest.raises(ValueError):
+        cache.batch_repeat_interleave(2)
+
+
+# ===================================================================================
+# Test for Offloaded Cache
+# ===================================================================================
+@requires_fla_cache
+@pytest.mark.skipif(device != 'cuda', reason="Offloading requires CUDA streams.")
+@pytest.mark.parametrize(
+    ['L', 'B', 'T', 'H', 'D', 'dtype'],
+    [
+        pytest.param(*test, id="L{}-B{}-T{}-H{}-D{}-{}".format(*test))
+        for test in [
+            (4, 2, 64, 4, 64, torch.float16),
+            (6, 3, 100, 4, 64, torch.float16),
+        ]
+    ],
+)
+def test_offloaded_cache(
+    L: int,
+    B: int,
+    T: int,
+    H: int,
+    D: int,
+    dtype: torch.dtype,
+):
+    torch.manual_seed(42)
+    # hybrid model with sliding window attention, whose states are of constant size
+    attn = {'layers': list(range(1, L, 2)), 'num_heads': H, 'window_size': 32}
+    model, config = create_model_and_config(GatedDeltaNetConfig, L, H, D, dtype=dtype, attn=attn)
+    model.eval()
+    input_ids = torch.randint(low=0, high=config.vocab_size, size=(B, T), device=device)
+    ref = model(input_ids=input_ids, use_cache=False).logits
+
+    cache = OffloadedFLACache()
+    logits = [model(input_ids=input_ids[:, :T // 2], use_cache=True, past_key_values=cache).logits]
+    for i in range(T // 2, T):
+        logits.append(model(input_ids=input_ids[:, i:i+1], use_cache=True, past_key_values=cache).logits)
+        # only the last layer and the prefetched first layer reside on the device between the steps
+        assert set(cache.get_device_layers()) <= {0, L - 1}
+    assert_close('logits', ref, torch.cat(logits, 1), 2e-3)
+    # the pinned buffers are reused across steps
+    ptrs = {x.data_ptr() for buffers in cache.pool.values() for x in buffers}
+    model(input_ids=input_ids[:, -1:], use_cache=True, past_key_values=cache)
+    assert ptrs == {x.data_ptr() for buffers in cache.pool.values() for x in buffers}
+
+
+# ===================================================================================
+# Test for Speculative Decoding
+# ===================================================================================
+@pytest.mark.parametrize(
+    ['L', 'T', 'H', 'D', 'num_draft', 'num_accepted', 'dtype'],
+    [
+        pytest.param(*test, id="L{}-T{}-H{}-D{}-num_draft{}-num_accepted{}-{}".format(*test))
+        for test in [
+            (4, 200, 4, 64, 4, 0, torch.float32),
+            (4, 200, 4, 64, 5, 2, torch.float32),
+            (4, 200, 4, 64, 5, 5, torch.float32),
+        ]
+    ],
+)
+def test_cache_rollback(
+    L: int,
+    T: int,
+    H: int,
+    D: int,
+    num_draft: int,
+    num_accepted: int,
+    dtype: torch.dtype,
+):
+    torch.manual_seed(42)
+    attn = {'layers': list(range(1, L, 2)), 'num_heads': H}
+    model, config = create_model_and_config(GatedDeltaNetConfig, L, H, D, dtype=dtype, attn=attn)
+    model.eval()
+    input_ids = torch.randint(low=0, high=config.vocab_size, size=(1, T), device=device)
+    drafts = torch.randint(low=0, high=config.vocab_size, size=(1, num_draft), device=device)
+    ref = model(input_ids=input_ids, use_cache=False).logits
+
+    cache = Cache()
+    cache.history_size = num_draft
+    model(input_ids=input_ids[:, :T // 2], use_cache=True, past_key_values=cache)
+    # the recurrent states of the prompt processed in chunk mode are not tracked
+    with pytest.raises(ValueError):
+        cache.crop(-1)
+    # verify the drafts, keeping the accepted ones and rolling back the rest
+    ids = torch.cat((input_ids[:, T // 2:T // 2 + num_accepted], drafts[:, num_accepted:]), 1)
+    logits = [model(input_ids=ids, use_cache=True, past_key_values=cache).logits[:, :num_accepted]]
+    cache.rollback(num_accepted)
+    assert cache.get_seq_length() == T // 2 + num_accepted
+    for i in range(T // 2 + num_accepted, T):
+        logits.append(model(input_ids=input_ids[:, i:i+1], use_cache=True, past_key_values=cache).logits)
+    assert_close('logits', ref[:, T // 2:], torch.cat(logits, 1), 1e-3)
+
+
+@pytest.mark.parametrize(
+    ['L', 'T', 'H', 'D', 'num_draft_tokens', 'dtype'],
+    [
+        pytest.param(*test, id="L{}-T{}-H{}-D{}-num_draft_tokens{}-{}".format(*test))
+        for test in [
+            (2, 20, 4, 64, 1, torch.float32),
+            (2, 20, 4, 64, 4, torch.float32),
+            (2, 100, 4, 64, 6, torch.float32),
+        ]
+    ],
+)
+def test_speculative_generate(
+    L: int,
+    T: int,
+    H: int,
+    D: int,
+    num_draft_tokens: int,
+    dtype: torch.dtype,
+):
+    torch.manual_seed(42)
+    model, config = create_model_and_config(GatedDeltaNetConfig, L, H, D, dtype=dtype)
+    model.eval()
+    # a draft model of the same vocabulary but unrelated weights, whose drafts are mostly rejected
+    draft_model, _ = create_model_and_config(GatedDeltaNetConfig, 1, H, D, dtype=dtype)
+    draft_model.eval()
+    input_ids = torch.randint(low=0, high=config.vocab_size, size=(1, T), device=device)
+    kwargs = dict(max_new_tokens=16, do_sample=False, pad_token_id=0, eos_token_id=None)
+    ref = model.generate(input_ids, **kwargs)
+    for draft in (draft_model, model):
+        gen = model.generate(input_ids, draft_model=draft, num_draft_tokens=num_draft_tokens, **kwargs)
+        assert torch.equal(ref, gen)
+    gen = model.generate(input_ids, draft_model=draft_model, max_length=T + 8, do_sample=False, pad_token_id=0)
+    assert torch.equal(ref[:, :T + 8], gen)
+    # the arguments speculative decoding can not honor are rejected rather than silently falling back to greedy
+    with pytest.raises(ValueError):
+        model.generate(input_ids, draft_model=draft_model, max_new_tokens=16, do_sample=True)
+    with pytest.raises(ValueError):
+        model.generate(input_ids, draft_model=draft_model, max_new_tokens=16, top_k=10)
+
+
+# ===================================================================================
+# Test for Prefix State Cache
+# ===================================================================================
+@pytest.mark.parametrize(
+    ['L', 'T', 'H', 'D', 'interval', 'dtype'],
+    [
+        pytest.param(*test, id="L{}-T{}-H{}-D{}-interval{}-{}".format(*test))
+        for test in [
+            (2, 100, 4, 64, 32, torch.float32),
+            (2, 300, 4, 64, 128, torch.float32),
+        ]
+    ],
+)
+def test_prefix_cache(
+    L: int,
+    T: int,
+    H: int,
+    D: int,
+    interval: int,
+    dtype: torch.dtype,
+):
+    torch.manual_seed(42)
+    model, config = create_model_and_config(GatedDeltaNetConfig, L, H, D, dtype=dtype)
+    model.eval()
+    prefix = torch.randint(low=0, high=config.vocab_size, size=(1, T), device=device)
+    prompts = [
+        torch.cat((prefix, torch.randint(low=0, high=config.vocab_size, size=(1, n), device=device)), 1)
+        for n in (10, 20)
+    ]
+    prefix_cache = PrefixStateCache(max_bytes=1 << 30, interval=interval, boundaries=[T])
+    kwargs = dict(max_new_tokens=8, do_sample=False, pad_token_id=0, eos_token_id=None)
+    for prompt in prompts:
+        ref = model.generate(prompt, **kwargs)
+        gen = model.generate(prompt, prefix_cache=prefix_cache, **kwargs)
+        assert torch.equal(ref, gen)
+    assert prefix_cache.misses == 1 and prefix_cache.hits == 1
+
+    # only the most recent snapshot fits in the budget
+    nbytes = max(size for _, size in prefix_cache.entries.values())
+    prefix_cache = PrefixStateCache(max_bytes=nbytes, interval=interval)
+    prefix_cache.prefill(model, prompts[0])
+    assert len(prefix_cache) == 1
+    assert next(iter(prefix_cache.entries))[0] == (prompts[0].shape[1] // interval) * interval
+
+
+# ===================================================================================
+# Test for Chunked Prefill
+# ===================================================================================
+@pytest.mark.parametrize(
+    ['L', 'B', 'T', 'H', 'D', 'chunk_size', 'dtype'],
+    [
+        pytest.param(*test, id="L{}-B{}-T{}-H{}-D{}-chunk_size{}-{}".format(*test))
+        for test in [
+            (2, 1, 300, 4, 64, 64, torch.float32),
+            (4, 2, 500, 4, 64, 128, torch.float32),
+        ]
+    ],
+)
+def test_chunked_prefill(
+    L: int,
+    B: int,
+    T: int,
+    H: int,
+    D: int,
+    chunk_size: int,
+    dtype: torch.dtype,
+):
+    torch.manual_seed(42)
+    attn = {'layers': list(range(1, L, 2)), 'num_heads': H}
+    model, config = create_model_and_config(GatedDeltaNetConfig, L, H, D, dtype=dtype, attn=attn)
+    model.eval()
+    input_ids = torch.randint(low=0, high=config.vocab_size, size=(B, T), device=device)
+    attention_mask = torch.ones_like(input_ids)
+    ref_cache = Cache()
+    ref = model(input_ids=input_ids, use_cache=True, past_key_values=ref_cache).logits
+
+    cache = model.chunked_prefill(input_ids[:, :-1], chunk_size)
+    assert cache.get_seq_length() == T - 1
+    logits = model(input_ids=input_ids[:, -1:], use_cache=True, past_key_values=cache).logits
+    assert_close('logits', ref[:, -1:], logits, 1e-3)
+    assert_close('recurrent_state', ref_cache[0]['recurrent_state'], cache[0]['recurrent_state'], 1e-3)
+
+    kwargs = dict(max_new_tokens=8, do_sample=False, pad_token_id=0, eos_token_id=None)
+    ref = model.generate(input_ids, attention_mask=attention_mask, **kwargs)
+    gen = model.generate(input_ids, attention_mask=attention_mask, prefill_chunk_size=chunk_size, **kwargs)
+    assert torch.equal(ref, gen)
+
+
+# ===================================================================================
+# Test for Fused Sampling
+# ===================================================================================
+def test_fused_sampling_generate():
+    torch.manual_seed(42)
+    model, config = create_model_and_config(GatedDeltaNetConfig, 2, 4, 64, dtype=torch.float32)
+    model.eval()
+    input_ids = torch.randint(low=1, high=config.vocab_size, size=(2, 16), device=device)
+    # greedy decoding by both loops, with the length resolved from `max_length`
+    kwargs = dict(max_length=24, do_sample=False, pad_token_id=0, eos_token_id=None)
+    ref = model.generate(input_ids, **kwargs)
+    gen = model.generate(input_ids, use_fused_sampling=True, **kwargs)
+    assert gen.shape == (2, 24)
+    assert torch.equal(ref, gen)
+    with pytest.raises(ValueError, match='stopping_criteria'):
+        model.generate(input_ids, use_fused_sampling=True, stopping_criteria=[], **kwargs)
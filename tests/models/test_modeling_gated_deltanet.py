@@ -3,8 +3,10 @@ import pytest
 import torch
 
 from fla.models import GatedDeltaNetConfig
+from fla.utils import assert_close, device
 
 from .test_modeling_base import run_test_generation, run_test_model_forward_backward
+from .test_modeling_utils import create_model_and_config
 
 
 # ===================================================================================
@@ -53,3 +55,49 @@ def test_generation(
     dtype: torch.dtype,
 ):
     run_test_generation(L, B, T, H, D, GatedDeltaNetConfig, dtype)
+
+
+# ===================================================================================
+# Test for Fused QKV
+# ===================================================================================
+@pytest.mark.parametrize(
+    ['L', 'B', 'T', 'H', 'D', 'dtype'],
+    [
+        pytest.param(*test, id="L{}-B{}-T{}-H{}-D{}-{}".format(*test))
+        for test in [
+            (2, 4, 256, 4, 64, torch.float16),
+        ]
+    ],
+)
+def test_fuse_qkv(
+    L: int,
+    B: int,
+    T: int,
+    H: int,
+    D: int,
+    dtype: torch.dtype,
+):
+    torch.manual_seed(42)
+    model, config = create_model_and_config(GatedDeltaNetConfig, L, H, D, dtype)
+    fused_model, _ = create_model_and_config(GatedDeltaNetConfig, L, H, D, dtype, fuse_qkv=True)
+    # checkpoints of the unfused layout are packed on load, and unpacked vice versa
+    fused_model.load_state_dict(model.state_dict())
+    assert all('qkv_proj' not in key for key in model.state_dict())
+    assert any('qkv_proj' in key for key in fused_model.state_dict())
+    model.eval()
+    fused_model.eval()
+
+    input_ids = torch.randint(low=0, high=config.vocab_size, size=(B, T)).to(device)
+    ref = model(input_ids=input_ids[:, :-4], use_cache=True)
+    tri = fused_model(input_ids=input_ids[:, :-4], use_cache=True)
+    assert_close('logits', ref.logits, tri.logits, 2e-3)
+    assert len(tri.past_key_values[0]['conv_state']) == 1
+    ref_cache, tri_cache = ref.past_key_values, tri.past_key_values
+    for i in range(T - 4, T):
+        ref = model(input_ids=input_ids[:, i:i+1], past_key_values=ref_cache, use_cache=True)
+        tri = fused_model(input_ids=input_ids[:, i:i+1], past_key_values=tri_cache, use_cache=True)
+        assert_close(f'logits{i}', ref.logits, tri.logits, 2e-3)
+    assert_close('conv_state', torch.cat(ref_cache[0]['conv_state'], 1), tri_cache[0]['conv_state'][0], 2e-3)
+
+    model.load_state_dict(fused_model.state_dict())
+    run_test_generation(L, B, T, H, D, GatedDeltaNetConfig, dtype, model=fused_model, config=config)
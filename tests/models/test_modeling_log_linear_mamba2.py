@@ -1,10 +1,9 @@
 
-import os
-
 import pytest
 import torch
 
 from fla.models import LogLinearMamba2Config, LogLinearMamba2ForCausalLM
+from fla.ops.utils.dispatch import use_backend
 from fla.utils import device
 
 
@@ -35,8 +34,6 @@ def test_modeling(
     Test the forward and backward pass of the Mamba2 model by manually
     instantiating the configuration and the model.
     """
-    os.environ['FLA_CONV_BACKEND'] = conv_backend
-
     # Manually create a consistent configuration
     # The key relationship is: num_heads = expand * hidden_size / head_dim
     # To ensure consistency, we derive hidden_size from other parameters.
@@ -52,7 +49,9 @@ def test_modeling(
         vocab_size=1000,  # dummy vocab size
     )
 
-    model = LogLinearMamba2ForCausalLM(config).to(device=device, dtype=dtype)
+    # the convolution backend is resolved on construction of the layers
+    with use_backend(causal_conv1d=conv_backend):
+        model = LogLinearMamba2ForCausalLM(config).to(device=device, dtype=dtype)
     model.eval()
 
     # Create random input tensor
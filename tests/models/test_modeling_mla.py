@@ -2,9 +2,13 @@
 import pytest
 import torch
 
+from fla.layers.mla import MultiheadLatentAttention, latent_attention, naive_latent_attention
 from fla.models import MLAConfig
+from fla.models.utils import Cache
+from fla.utils import assert_close, device
 
 from .test_modeling_base import run_test_generation, run_test_model_forward_backward
+from .test_modeling_utils import create_model_and_config
 
 
 # ===================================================================================
@@ -54,3 +58,109 @@ def test_generation(
     dtype: torch.dtype,
 ):
     run_test_generation(L, B, T, H, D, MLAConfig, dtype)
+
+
+@pytest.mark.parametrize(
+    ['L', 'B', 'T', 'H', 'D', 'dtype'],
+    [
+        pytest.param(*test, id="L{}-B{}-T{}-H{}-D{}-{}".format(*test))
+        for test in [
+            (2, 4, 2000, 8, 64, torch.float16),
+        ]
+    ],
+)
+def test_generation_latent_cache(
+    L: int,
+    B: int,
+    T: int,
+    H: int,
+    D: int,
+    dtype: torch.dtype,
+):
+    model, config = create_model_and_config(MLAConfig, L, H, D, dtype=dtype, latent_cache=True)
+    run_test_generation(L, B, T, H, D, MLAConfig, dtype, model=model, config=config)
+
+
+# ===================================================================================
+# Test for Latent Cache
+# ===================================================================================
+@pytest.mark.parametrize(
+    ['B', 'T', 'S', 'H', 'R', 'D', 'window_size', 'dtype'],
+    [
+        pytest.param(*test, id="B{}-T{}-S{}-H{}-R{}-D{}-window_size{}-{}".format(*test))
+        for test in [
+            (2, 1, 100, 8, 128, 32, None, torch.float16),
+            (3, 1, 100, 4, 512, 64, 32, torch.float16),
+            (2, 16, 300, 8, 256, 64, None, torch.bfloat16),
+        ]
+    ],
+)
+def test_latent_attention(
+    B: int,
+    T: int,
+    S: int,
+    H: int,
+    R: int,
+    D: int,
+    window_size: int | None,
+    dtype: torch.dtype,
+):
+    torch.manual_seed(42)
+    q_lat = torch.randn(B, T, H, R, dtype=dtype, device=device)
+    q_rot = torch.randn(B, T, H, D, dtype=dtype, device=device)
+    c = torch.randn(B, S, R, dtype=dtype, device=device)
+    k_rot = torch.randn(B, S, D, dtype=dtype, device=device)
+    attention_mask = torch.ones(B, S, dtype=torch.bool, device=device)
+    attention_mask[1:, :S // 3] = False
+
+    ref = naive_latent_attention(q_lat, q_rot, c, k_rot, (R + D) ** -0.5, attention_mask, window_size)
+    tri = latent_attention(q_lat, q_rot, c, k_rot, (R + D) ** -0.5, attention_mask, window_size)
+    assert_close('o', ref, tri, 0.005)
+
+
+@pytest.mark.parametrize(
+    ['B', 'T', 'H', 'D', 'window_size', 'dtype'],
+    [
+        pytest.param(*test, id="B{}-T{}-H{}-D{}-window_size{}-{}".format(*test))
+        for test in [
+            (2, 64, 4, 64, None, torch.float16),
+            (2, 100, 8, 128, 32, torch.float16),
+        ]
+    ],
+)
+def test_latent_cache(
+    B: int,
+    T: int,
+    H: int,
+    D: int,
+    window_size: int | None,
+    dtype: torch.dtype,
+):
+    torch.manual_seed(42)
+    layer = MultiheadLatentAttention(
+        hidden_size=H * D,
+        num_heads=H,
+        q_lora_rank=64,
+        qk_rope_head_dim=32,
+        kv_lora_rank=128,
+        v_head_dim=D,
+        qk_nope_head_dim=D,
+        qk_head_dim=D + 32,
+        window_size=window_size,
+        layer_idx=0,
+    ).to(device=device, dtype=dtype)
+    x = torch.randn(B, T + 16, H * D, dtype=dtype, device=device)
+
+    outputs, caches = [], []
+    with torch.no_grad():
+        for latent_cache in (False, True):
+            layer.latent_cache = latent_cache
+            cache = Cache()
+            o = [layer(x[:, :T], attention_mask=None, past_key_values=cache)[0]]
+            o += [layer(x[:, i:i+1], attention_mask=None, past_key_values=cache)[0] for i in range(T, x.shape[1])]
+            outputs.append(torch.cat(o, 1))
+            caches.append(cache)
+    # the full-KV path serves as the reference
+    assert_close('o', outputs[0], outputs[1], 0.005)
+    full, latent = (sum(x.numel() for x in cache[0]['attn_state']) for cache in caches)
+    assert latent < full
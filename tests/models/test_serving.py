@@ -0,0 +1,70 @@
+# Copyright (c) 2023-2025, Songlin Yang, Yu Zhang
+
+import pytest
+import torch
+
+from fla.models import GatedDeltaNetConfig, GLAConfig
+from fla.models.utils import Cache, FLACache
+from fla.serving import Engine, Request, RequestQueue, Scheduler, SyntheticLoadGenerator
+from fla.utils import device
+
+from .test_modeling_utils import create_model_and_config
+
+
+@pytest.mark.skipif(not issubclass(Cache, FLACache), reason="The paged cache requires a recent version of transformers.")
+@pytest.mark.parametrize(
+    ['config_class', 'L', 'H', 'D', 'max_num_seqs', 'prefill_chunk_size', 'dtype'],
+    [
+        pytest.param(*test, id="{}-L{}-H{}-D{}-max_num_seqs{}-prefill_chunk_size{}-{}".format(*test))
+        for test in [
+            (GatedDeltaNetConfig, 2, 4, 64, 3, 16, torch.float32),
+            (GatedDeltaNetConfig, 2, 4, 64, 8, 128, torch.float32),
+            (GLAConfig, 2, 4, 64, 3, 64, torch.float32),
+        ]
+    ],
+)
+def test_engine(
+    config_class,
+    L: int,
+    H: int,
+    D: int,
+    max_num_seqs: int,
+    prefill_chunk_size: int,
+    dtype: torch.dtype,
+):
+    torch.manual_seed(42)
+    model, config = create_model_and_config(config_class, L, H, D, dtype=dtype)
+    model.eval()
+    generator = SyntheticLoadGenerator(config.vocab_size, num_requests=6, prompt_len=(1, 200), output_len=(1, 12))
+    requests = [request for _, request in generator.generate()]
+
+    engine = Engine(model, max_num_seqs=max_num_seqs, max_num_batched_tokens=256, prefill_chunk_size=prefill_chunk_size)
+    for request in requests:
+        engine.add_request(request)
+    finished = engine.run()
+    assert len(finished) == len(requests)
+    assert engine.cache.num_free_slots == max_num_seqs
+
+    for request in requests:
+        input_ids = torch.tensor([request.prompt_ids], device=device)
+        kwargs = dict(max_new_tokens=request.max_new_tokens, do_sample=False, pad_token_id=0, eos_token_id=None)
+        ref = model.generate(input_ids, **kwargs)
+        assert ref[0, input_ids.shape[1]:].tolist() == request.output_ids
+
+
+def test_scheduler():
+    scheduler = Scheduler(max_num_seqs=2, max_num_batched_tokens=8, prefill_chunk_size=4)
+    queue = RequestQueue()
+    for n in (10, 3, 5):
+        queue.put(Request(list(range(n))))
+    for request in queue.drain():
+        scheduler.add(request)
+    batch = scheduler.schedule()
+    # the third request waits for a free sequence
+    assert [n for _, n in batch] == [4, 3]
+    for request, n in batch:
+        request.num_computed_tokens += n
+    batch[1][0].output_ids.append(0)
+    # decoding requests go first, the prompt chunks fill the rest of the budget
+    batch = scheduler.schedule()
+    assert [(request.num_prompt_tokens, n) for request, n in batch] == [(3, 1), (10, 4)]
@@ -5,6 +5,7 @@ import torch.nn.functional as F
 from einops import rearrange
 
 from fla.modules.convolution import ShortConvolution, causal_conv1d, causal_conv1d_update
+from fla.ops.utils.custom_op import FLA_USE_CUSTOM_OPS
 from fla.utils import assert_close, device
 
 try:
@@ -789,3 +790,31 @@ def test_conv_cache_backward(
     names = ["x", "weight", "bias", "residual", "cache"]
     for name, g_ref, g_tri in zip(names, grads_ref, grads_tri, strict=False):
         assert_close(name, g_ref, g_tri, ratio=1e-3)
+
+
+@pytest.mark.parametrize(
+    ('has_bias', 'has_residual', 'output_final_state', 'activation'),
+    [
+        pytest.param(*test, id="bias{}-residual{}-output_final_state{}-{}".format(*test))
+        for test in [
+            (False, False, False, None),
+            (True, True, True, 'swish'),
+        ]
+    ],
+)
+@pytest.mark.skipif(
+    not FLA_USE_CUSTOM_OPS,
+    reason='Custom ops are not registered',
+)
+def test_conv_custom_op(has_bias: bool, has_residual: bool, output_final_state: bool, activation: str | None):
+    from fla.modules.convolution import causal_conv1d_fwd_op
+
+    torch.manual_seed(42)
+    B, T, D, W = 2, 100, 128, 4
+    x = torch.randn(B, T, D, dtype=torch.bfloat16, device=device).requires_grad_()
+    weight = torch.randn(D, W, dtype=torch.bfloat16, device=device).requires_grad_()
+    bias = torch.randn(D, dtype=torch.bfloat16, device=device).requires_grad_() if has_bias else None
+    residual = torch.randn(B, T, D, dtype=torch.bfloat16, device=device).requires_grad_() if has_residual else None
+    h0 = torch.randn(B, D, W, dtype=torch.bfloat16, device=device).requires_grad_()
+    args = (x, weight, bias, residual, h0, output_final_state, activation, None, None, None)
+    torch.library.opcheck(causal_conv1d_fwd_op, args, test_utils=('test_schema', 'test_faketensor'))
@@ -4,6 +4,7 @@ import torch
 import torch.nn.functional as F
 
 from fla.modules.l2norm import l2_norm
+from fla.ops.utils.custom_op import FLA_USE_CUSTOM_OPS
 from fla.utils import assert_close, device
 
 
@@ -35,3 +36,25 @@ def test_l2norm(B: int, T: int, H: int, D: int, dtype: torch.dtype):
 
     assert_close('y', ref, tri, 0.005)
     assert_close('dx', ref_dx, tri_dx, 0.005)
+
+
+@pytest.mark.parametrize(
+    ('D', 'dtype'),
+    [
+        pytest.param(*test, id="D{}-{}".format(*test))
+        for test in [
+            (64, torch.float),
+            (1024, torch.bfloat16),
+        ]
+    ],
+)
+@pytest.mark.skipif(
+    not FLA_USE_CUSTOM_OPS,
+    reason='Custom ops are not registered',
+)
+def test_l2norm_custom_op(D: int, dtype: torch.dtype):
+    from fla.modules.l2norm import l2norm_fwd_op
+
+    torch.manual_seed(42)
+    x = torch.randn(2, 100, 4, D, dtype=dtype, device=device).requires_grad_()
+    torch.library.opcheck(l2norm_fwd_op, (x, 1e-6, None), test_utils=('test_schema', 'test_faketensor'))
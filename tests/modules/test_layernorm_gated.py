@@ -5,6 +5,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 
 from fla.modules import FusedLayerNormGated, FusedRMSNormGated
+from fla.ops.utils.custom_op import FLA_USE_CUSTOM_OPS
 from fla.utils import assert_close, device
 
 
@@ -90,3 +91,31 @@ def test_rmsnorm_gated(B: int, H: int, T: int, D: int, activation: str):
     assert_close('dx', ref_dx, tri_dx, 1e-3)
     assert_close('dg', ref_dg, tri_dg, 1e-3)
     assert_close('dw', ref_dw, tri_dw, 1e-3)
+
+
+@pytest.mark.parametrize(
+    ('has_residual', 'prenorm', 'residual_in_fp32', 'is_rms_norm'),
+    [
+        pytest.param(*test, id="residual{}-prenorm{}-residual_in_fp32{}-rms_norm{}".format(*test))
+        for test in [
+            (False, False, False, True),
+            (False, True, False, True),
+            (False, True, True, True),
+            (True, True, False, False),
+        ]
+    ],
+)
+@pytest.mark.skipif(
+    not FLA_USE_CUSTOM_OPS,
+    reason='Custom ops are not registered',
+)
+def test_layernorm_gated_custom_op(has_residual: bool, prenorm: bool, residual_in_fp32: bool, is_rms_norm: bool):
+    from fla.modules.fused_norm_gate import layer_norm_gated_fwd_op
+
+    torch.manual_seed(42)
+    B, T, D = 2, 100, 128
+    x, g = (torch.randn(B, T, D, dtype=torch.bfloat16, device=device).requires_grad_() for _ in range(2))
+    weight = torch.randn(D, dtype=torch.bfloat16, device=device).requires_grad_()
+    residual = torch.randn(B, T, D, dtype=torch.bfloat16, device=device).requires_grad_() if has_residual else None
+    args = (x, g, weight, None, 'swish', residual, 1e-6, prenorm, residual_in_fp32, is_rms_norm)
+    torch.library.opcheck(layer_norm_gated_fwd_op, args, test_utils=('test_schema', 'test_faketensor'))
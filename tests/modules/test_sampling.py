@@ -0,0 +1,103 @@
+
+import pytest
+import torch
+
+from fla.modules.sampling import FusedSampler, fused_sample
+from fla.utils import device
+
+
+def penalize_ref(logits, counts, repetition_penalty, presence_penalty, frequency_penalty):
+    logits = logits.float()
+    seen = counts > 0
+    logits = torch.where(seen & (logits > 0), logits / repetition_penalty, logits)
+    logits = torch.where(seen & (logits <= 0), logits * repetition_penalty, logits)
+    return logits - seen.float() * presence_penalty - counts.float() * frequency_penalty
+
+
+def allowed_ref(logits, top_k, top_p, min_p):
+    probs = logits.float().softmax(-1)
+    values, indices = probs.sort(-1, descending=True)
+    keep = torch.ones_like(values, dtype=torch.bool)
+    if top_k is not None:
+        keep[:, top_k:] = False
+    if top_p is not None:
+        keep &= (values.cumsum(-1) - values) < top_p
+    if min_p is not None:
+        keep &= values >= min_p * values[:, :1]
+    return keep.scatter(-1, indices, keep)
+
+
+@pytest.mark.parametrize(
+    ('B', 'V', 'dtype'),
+    [
+        pytest.param(*test, id="B{}-V{}-{}".format(*test))
+        for test in [
+            (4, 1000, torch.float),
+            (8, 32000, torch.bfloat16),
+            (3, 50257, torch.float16),
+        ]
+    ]
+)
+def test_sampling_greedy(B: int, V: int, dtype: torch.dtype):
+    torch.manual_seed(42)
+    logits = torch.randn(B, V, device=device).to(dtype)
+    ref = logits.float().argmax(-1)
+    assert torch.equal(fused_sample(logits, temperature=0.), ref)
+    assert torch.equal(fused_sample(logits, temperature=1., top_k=1), ref)
+    # greedy and sampled rows in the same batch
+    tokens = fused_sample(logits, temperature=[0.] * (B - 1) + [1.], seed=42)
+    assert torch.equal(tokens[:-1], ref[:-1])
+
+
+@pytest.mark.parametrize(
+    ('B', 'V', 'top_k', 'top_p', 'min_p'),
+    [
+        pytest.param(*test, id="B{}-V{}-top_k{}-top_p{}-min_p{}".format(*test))
+        for test in [
+            (4, 1000, 50, None, None),
+            (4, 1000, None, 0.5, None),
+            (4, 1000, None, None, 0.1),
+            (8, 32000, 20, 0.9, 0.05),
+        ]
+    ]
+)
+def test_sampling_filter(B: int, V: int, top_k: int | None, top_p: float | None, min_p: float | None):
+    torch.manual_seed(42)
+    logits = torch.randn(B, V, device=device) * 3
+    allowed = allowed_ref(logits, top_k, top_p, min_p)
+    for seed in range(32):
+        tokens = fused_sample(logits, top_k=top_k, top_p=top_p, min_p=min_p, seed=seed)
+        assert allowed.gather(-1, tokens.unsqueeze(-1)).all()
+    if top_k is not None:
+        # the per-row values given on the host and on the device
+        for k in ([top_k] * B, torch.full((B,), top_k, device=device)):
+            assert torch.equal(fused_sample(logits, top_k=k, top_p=top_p, min_p=min_p, seed=seed), tokens)
+
+
+@pytest.mark.parametrize(
+    ('B', 'V', 'repetition_penalty', 'presence_penalty', 'frequency_penalty'),
+    [
+        pytest.param(*test, id="B{}-V{}-rep{}-pre{}-freq{}".format(*test))
+        for test in [
+            (4, 1000, 1.5, None, None),
+            (4, 1000, None, 1.0, 0.5),
+            (8, 32000, 1.2, 0.5, 0.2),
+        ]
+    ]
+)
+def test_sampling_penalty(B: int, V: int, repetition_penalty: float, presence_penalty: float, frequency_penalty: float):
+    torch.manual_seed(42)
+    logits = torch.randn(B, V, device=device)
+    input_ids = torch.randint(0, V, (B, 64), device=device)
+    sampler = FusedSampler(
+        temperature=0.,
+        repetition_penalty=repetition_penalty,
+        presence_penalty=presence_penalty,
+        frequency_penalty=frequency_penalty,
+    )
+    sampler.reset(input_ids, V)
+    counts = sampler.token_counts.clone()
+    ref = penalize_ref(logits, counts, repetition_penalty or 1., presence_penalty or 0., frequency_penalty or 0.).argmax(-1)
+    tokens = sampler(logits)
+    assert torch.equal(tokens, ref)
+    assert torch.equal(sampler.token_counts - counts, torch.nn.functional.one_hot(tokens, V).to(counts))
@@ -7,7 +7,10 @@ import torch
 import torch.nn.functional as F
 from einops import rearrange, repeat
 
-from fla.ops.gated_delta_rule import chunk_gated_delta_rule, fused_recurrent_gated_delta_rule
+from fla.ops.delta_rule import chunk_delta_rule
+from fla.ops.gated_delta_rule import chunk_gated_delta_rule, fused_gated_delta_rule_step, fused_recurrent_gated_delta_rule
+from fla.ops.gated_delta_rule.naive import naive_gated_delta_rule_step
+from fla.ops.utils.custom_op import FLA_USE_CUSTOM_OPS
 from fla.utils import IS_INTEL_ALCHEMIST, assert_close, device
 
 
@@ -265,6 +268,66 @@ def test_chunk(
     assert_close('dh0', ref_dh0, tri_dh0, 0.008)
 
 
+@pytest.mark.parametrize(
+    ('B', 'T', 'H', 'HV', 'D', 'cu_seqlens', 'dtype'),
+    [
+        pytest.param(*test, id="B{}-T{}-H{}-HV{}-D{}-cu_seqlens{}-{}".format(*test))
+        for test in [
+            (2, 500, 2, 4, 64, None, torch.float16),
+            (2, 1024, 1, 4, 128, None, torch.float16),
+            (1, 1000, 2, 6, 100, [0, 256, 500, 1000], torch.float16),
+        ]
+    ],
+)
+def test_chunk_gva(
+    B: int,
+    T: int,
+    H: int,
+    HV: int,
+    D: int,
+    cu_seqlens: list[int] | None,
+    dtype: torch.dtype,
+):
+    torch.manual_seed(42)
+    N = B if cu_seqlens is None else len(cu_seqlens) - 1
+    if cu_seqlens is not None:
+        cu_seqlens = torch.LongTensor(cu_seqlens).to(device)
+    q = torch.randn(B, T, H, D, dtype=dtype)
+    k = torch.randn(B, T, H, D, dtype=dtype)
+    v = torch.randn(B, T, HV, D, dtype=dtype)
+    beta = torch.rand(B, T, HV, dtype=dtype).sigmoid()
+    g = F.logsigmoid(torch.rand(B, T, HV, dtype=torch.float32))
+    h0 = torch.randn(N, HV, D, D, dtype=torch.float32)
+    q, k, v, beta, g, h0 = map(lambda x: x.to(device).requires_grad_(True), (q, k, v, beta, g, h0))
+    do = torch.randn_like(v)
+    dht = torch.randn_like(h0)
+
+    def run(q, k):
+        o, ht = chunk_gated_delta_rule(
+            q=q,
+            k=k,
+            v=v.clone(),
+            g=g.clone(),
+            beta=beta.clone(),
+            initial_state=h0.clone(),
+            output_final_state=True,
+            use_qk_l2norm_in_kernel=True,
+            cu_seqlens=cu_seqlens,
+        )
+        ((o * do).sum() + (ht * dht).sum()).backward()
+        grads = q.grad, k.grad, v.grad, beta.grad, g.grad, h0.grad
+        q.grad = k.grad = v.grad = beta.grad = g.grad = h0.grad = None
+        return o, ht, *grads
+
+    # the queries/keys shared by the groups of value heads are consistent with materializing them
+    ref = run(*(x.repeat_interleave(HV // H, 2).detach().requires_grad_(True) for x in (q, k)))
+    ref_dq, ref_dk = (x.view(B, T, H, HV // H, D).sum(3) for x in ref[2:4])
+    tri = run(q, k)
+    assert tri[2].shape == q.shape and tri[3].shape == k.shape
+    for name, r, t in zip(['o', 'ht', 'dq', 'dk', 'dv', 'db', 'dg', 'dh0'], [*ref[:2], ref_dq, ref_dk, *ref[4:]], tri):
+        assert_close(name, r, t, 0.008)
+
+
 @pytest.mark.parametrize(
     ('H', 'D', 'mask_p', 'cu_seqlens', 'dtype'),
     [
@@ -352,3 +415,338 @@ def test_chunk_varlen(
     assert_close('db', ref_dbeta, tri_dbeta, 0.015)
     assert_close('dg', ref_dg, tri_dg, 0.015)
     assert_close('dh0', ref_dh0, tri_dh0, 0.007)
+
+
+@pytest.mark.parametrize(
+    ('N', 'S', 'T', 'H', 'HV', 'D', 'dtype'),
+    [
+        pytest.param(*test, id="N{}-S{}-T{}-H{}-HV{}-D{}-{}".format(*test))
+        for test in [
+            (2, 4, 1, 2, 2, 64, torch.float),
+            (3, 8, 1, 2, 4, 128, torch.float),
+            (3, 8, 16, 4, 4, 64, torch.float16),
+        ]
+    ],
+)
+def test_fused_recurrent_state_indices(
+    N: int,
+    S: int,
+    T: int,
+    H: int,
+    HV: int,
+    D: int,
+    dtype: torch.dtype,
+):
+    torch.manual_seed(42)
+    q = torch.randn(N, T, H, D, dtype=dtype, device=device)
+    k = torch.randn(N, T, H, D, dtype=dtype, device=device)
+    v = torch.randn(N, T, HV, D, dtype=dtype, device=device)
+    beta = torch.rand(N, T, HV, dtype=dtype, device=device).sigmoid()
+    g = F.logsigmoid(torch.rand(N, T, HV, dtype=torch.float32, device=device))
+    pool = torch.randn(S, HV, D, D, dtype=torch.float32, device=device)
+    indices = torch.randperm(S, device=device)[:N]
+
+    ref, ref_ht = fused_recurrent_gated_delta_rule(
+        q=q.clone(),
+        k=k.clone(),
+        v=v.clone(),
+        g=g.clone(),
+        beta=beta.clone(),
+        initial_state=pool[indices].clone(),
+        output_final_state=True,
+        use_qk_l2norm_in_kernel=True,
+    )
+    ref_pool = pool.clone()
+    ref_pool[indices] = ref_ht
+
+    tri, tri_pool = fused_recurrent_gated_delta_rule(
+        q=q.clone(),
+        k=k.clone(),
+        v=v.clone(),
+        g=g.clone(),
+        beta=beta.clone(),
+        initial_state=pool,
+        output_final_state=True,
+        use_qk_l2norm_in_kernel=True,
+        initial_state_indices=indices,
+    )
+    assert tri_pool.data_ptr() == pool.data_ptr()
+    assert_close('o', ref, tri, 1e-4)
+    assert_close('pool', ref_pool, tri_pool, 1e-4)
+
+
+@pytest.mark.parametrize(
+    ('B', 'T', 'H', 'HV', 'D', 'dtype'),
+    [
+        pytest.param(*test, id="B{}-T{}-H{}-HV{}-D{}-{}".format(*test))
+        for test in [
+            (2, 5, 2, 2, 64, torch.float),
+            (3, 9, 2, 4, 128, torch.float16),
+        ]
+    ],
+)
+def test_fused_recurrent_intermediate_states(
+    B: int,
+    T: int,
+    H: int,
+    HV: int,
+    D: int,
+    dtype: torch.dtype,
+):
+    torch.manual_seed(42)
+    q = torch.randn(B, T, H, D, dtype=dtype, device=device)
+    k = torch.randn(B, T, H, D, dtype=dtype, device=device)
+    v = torch.randn(B, T, HV, D, dtype=dtype, device=device)
+    beta = torch.rand(B, T, HV, dtype=dtype, device=device).sigmoid()
+    g = F.logsigmoid(torch.rand(B, T, HV, dtype=torch.float32, device=device))
+    h0 = torch.randn(B, HV, D, D, dtype=torch.float32, device=device)
+
+    tri, tri_ht, tri_hs = fused_recurrent_gated_delta_rule(
+        q=q.clone(),
+        k=k.clone(),
+        v=v.clone(),
+        g=g.clone(),
+        beta=beta.clone(),
+        initial_state=h0.clone(),
+        output_final_state=True,
+        use_qk_l2norm_in_kernel=True,
+        output_intermediate_states=True,
+    )
+    assert tri_hs.shape == (B, T, HV, D, D)
+    assert_close('ht', tri_ht, tri_hs[:, -1], 1e-6)
+    for t in range(T):
+        _, ref_ht = fused_recurrent_gated_delta_rule(
+            q=q[:, :t+1].clone(),
+            k=k[:, :t+1].clone(),
+            v=v[:, :t+1].clone(),
+            g=g[:, :t+1].clone(),
+            beta=beta[:, :t+1].clone(),
+            initial_state=h0.clone(),
+            output_final_state=True,
+            use_qk_l2norm_in_kernel=True,
+        )
+        assert_close(f'h{t}', ref_ht, tri_hs[:, t], 1e-5)
+
+
+@pytest.mark.parametrize(
+    ('B', 'H', 'HV', 'K', 'V', 'W', 'use_conv', 'dtype'),
+    [
+        pytest.param(*test, id="B{}-H{}-HV{}-K{}-V{}-W{}-use_conv{}-{}".format(*test))
+        for test in [
+            (1, 2, 2, 64, 128, 4, True, torch.float),
+            (3, 2, 4, 128, 256, 4, True, torch.float16),
+            (4, 4, 4, 100, 100, 3, True, torch.bfloat16),
+            (2, 2, 2, 64, 64, 4, False, torch.float),
+        ]
+    ],
+)
+def test_fused_step(
+    B: int,
+    H: int,
+    HV: int,
+    K: int,
+    V: int,
+    W: int,
+    use_conv: bool,
+    dtype: torch.dtype,
+):
+    torch.manual_seed(42)
+    q = torch.randn(B, H, K, dtype=dtype, device=device)
+    k = torch.randn(B, H, K, dtype=dtype, device=device)
+    v = torch.randn(B, HV, V, dtype=dtype, device=device)
+    a = torch.randn(B, HV, dtype=dtype, device=device)
+    b = torch.randn(B, HV, dtype=dtype, device=device)
+    A_log = torch.log(torch.empty(HV, dtype=torch.float32, device=device).uniform_(1, 16))
+    dt_bias = torch.randn(HV, dtype=torch.float32, device=device)
+    h0 = torch.randn(B, HV, K, V, dtype=torch.float32, device=device)
+    conv_state, conv_weight, conv_bias = None, None, None
+    if use_conv:
+        conv_state = tuple(torch.randn(B, D, W, dtype=dtype, device=device) for D in (H*K, H*K, HV*V))
+        conv_weight = tuple(torch.randn(D, W, dtype=dtype, device=device) / W for D in (H*K, H*K, HV*V))
+        conv_bias = tuple(torch.randn(D, dtype=dtype, device=device) for D in (H*K, H*K, HV*V))
+
+    ref, ref_ht, ref_conv = naive_gated_delta_rule_step(
+        q, k, v, a, b, A_log, dt_bias, h0.clone(), conv_state, conv_weight, conv_bias, allow_neg_eigval=True,
+    )
+    # the reference is consistent with the short convolutions followed by the recurrent kernel
+    x = [q.view(B, -1), k.view(B, -1), v.view(B, -1)]
+    if use_conv:
+        x = [(c.float() * w.float()).sum(-1) + bias.float() for c, w, bias in zip(ref_conv, conv_weight, conv_bias)]
+    x = [F.silu(i.float()) for i in x]
+    rec, rec_ht = fused_recurrent_gated_delta_rule(
+        q=x[0].view(B, 1, H, K),
+        k=x[1].view(B, 1, H, K),
+        v=x[2].view(B, 1, HV, V),
+        g=(-A_log.exp() * F.softplus(a.float() + dt_bias)).unsqueeze(1),
+        beta=(b.float().sigmoid() * 2).unsqueeze(1),
+        initial_state=h0.clone(),
+        output_final_state=True,
+        use_qk_l2norm_in_kernel=True,
+    )
+    assert_close('rec_o', rec.squeeze(1), ref, 1e-3)
+    assert_close('rec_ht', rec_ht, ref_ht, 1e-3)
+
+    tri_h0 = h0.clone()
+    tri, tri_ht, tri_conv = fused_gated_delta_rule_step(
+        q, k, v, a, b, A_log, dt_bias, tri_h0, conv_state, conv_weight, conv_bias, allow_neg_eigval=True,
+    )
+    assert tri_ht.data_ptr() == tri_h0.data_ptr()
+    assert_close('o', ref, tri, 2e-3)
+    assert_close('ht', ref_ht, tri_ht, 2e-3)
+    if use_conv:
+        for i in range(3):
+            assert_close(f'conv{i}', ref_conv[i], tri_conv[i], 1e-3)
+    else:
+        assert tri_conv is None
+
+
+@pytest.mark.parametrize(
+    ('H', 'HV', 'D', 'cu_seqlens', 'gate_logit_normalizer'),
+    [
+        pytest.param(*test, id="H{}-HV{}-D{}-cu_seqlens{}-gate_logit_normalizer{}".format(*test))
+        for test in [
+            (2, 2, 32, [0, 63], 1),
+            (2, 2, 60, [0, 15, 100, 164], 1),
+            (2, 4, 64, [0, 100, 300], 0.1),
+            (4, 4, 64, [0, 100, 300], 10),
+        ]
+    ],
+)
+def test_chunk_cpu(
+    H: int,
+    HV: int,
+    D: int,
+    cu_seqlens: list[int],
+    gate_logit_normalizer: float,
+):
+    torch.manual_seed(42)
+    T, N = cu_seqlens[-1], len(cu_seqlens) - 1
+    cu_seqlens = torch.tensor(cu_seqlens, dtype=torch.long)
+
+    q = torch.randn((1, T, H, D))
+    k = torch.randn((1, T, H, D))
+    v = torch.randn((1, T, HV, D))
+    beta = torch.rand(1, T, HV).sigmoid()
+    g = F.logsigmoid(torch.rand(1, T, HV)) / gate_logit_normalizer
+    h0 = torch.randn(N, HV, D, D)
+
+    tri, tri_ht = chunk_gated_delta_rule(
+        q=q,
+        k=k,
+        v=v,
+        g=g,
+        beta=beta,
+        initial_state=h0,
+        output_final_state=True,
+        use_qk_l2norm_in_kernel=True,
+        cu_seqlens=cu_seqlens,
+    )
+    q, k = (repeat(F.normalize(x, p=2, dim=-1), 'b t h d -> b t (h g) d', g=HV // H) for x in (q, k))
+    if H == HV:
+        tri_d, tri_d_ht = chunk_delta_rule(q, k, v, beta, initial_state=h0, output_final_state=True, cu_seqlens=cu_seqlens)
+    for i in range(N):
+        bos, eos = cu_seqlens[i], cu_seqlens[i+1]
+        ref, ref_ht = recurrent_gated_delta_rule_ref(
+            q=q[:, bos:eos],
+            k=k[:, bos:eos],
+            v=v[:, bos:eos],
+            beta=beta[:, bos:eos],
+            g=g[:, bos:eos],
+            initial_state=h0[i:i+1],
+            output_final_state=True,
+        )
+        assert_close(f'o{i}', ref, tri[:, bos:eos], 1e-4)
+        assert_close(f'ht{i}', ref_ht, tri_ht[i:i+1], 1e-4)
+        if H == HV:
+            ref, ref_ht = recurrent_gated_delta_rule_ref(
+                q=q[:, bos:eos],
+                k=k[:, bos:eos],
+                v=v[:, bos:eos],
+                beta=beta[:, bos:eos],
+                g=torch.zeros_like(g[:, bos:eos]),
+                initial_state=h0[i:i+1],
+                output_final_state=True,
+            )
+            assert_close(f'delta_o{i}', ref, tri_d[:, bos:eos], 1e-4)
+            assert_close(f'delta_ht{i}', ref_ht, tri_d_ht[i:i+1], 1e-4)
+
+
+@pytest.mark.parametrize(
+    ('H', 'HV', 'D', 'use_qk_l2norm_in_kernel', 'output_final_state'),
+    [
+        pytest.param(*test, id="H{}-HV{}-D{}-use_qk_l2norm_in_kernel{}-output_final_state{}".format(*test))
+        for test in [
+            (2, 2, 64, False, True),
+            (2, 4, 64, True, True),
+            (4, 4, 128, True, False),
+        ]
+    ],
+)
+@pytest.mark.skipif(
+    not FLA_USE_CUSTOM_OPS,
+    reason='Custom ops are not registered',
+)
+def test_chunk_custom_op(
+    H: int,
+    HV: int,
+    D: int,
+    use_qk_l2norm_in_kernel: bool,
+    output_final_state: bool,
+):
+    from fla.ops.gated_delta_rule.chunk import chunk_gated_delta_rule_fwd_op
+
+    B, T = 2, 100
+    # shapes are propagated through the fake implementations on the meta device
+    q, k = (torch.empty(B, T, H, D, device='meta') for _ in range(2))
+    v = torch.empty(B, T, HV, D, device='meta')
+    g, beta = (torch.empty(B, T, HV, device='meta') for _ in range(2))
+    h0 = torch.empty(B, HV, D, D, device='meta')
+    o, ht = chunk_gated_delta_rule(q, k, v, g, beta, initial_state=h0, output_final_state=output_final_state,
+                                   use_qk_l2norm_in_kernel=use_qk_l2norm_in_kernel)
+    assert o.shape == v.shape
+    assert ht.shape == h0.shape if output_final_state else ht is None
+
+    torch.manual_seed(42)
+    q = torch.randn(B, T, H, D, dtype=torch.bfloat16, device=device).requires_grad_()
+    k = F.normalize(torch.randn(B, T, H, D, dtype=torch.float32, device=device), p=2, dim=-1)
+    k = k.to(torch.bfloat16).requires_grad_()
+    v = torch.randn(B, T, HV, D, dtype=torch.bfloat16, device=device).requires_grad_()
+    g = F.logsigmoid(torch.rand(B, T, HV, dtype=torch.float32, device=device)).requires_grad_()
+    beta = torch.rand(B, T, HV, dtype=torch.bfloat16, device=device).sigmoid().requires_grad_()
+    h0 = torch.randn(B, HV, D, D, dtype=torch.float32, device=device).requires_grad_()
+    args = (q, k, v, g, beta, D ** -0.5, h0, output_final_state, None, use_qk_l2norm_in_kernel)
+    torch.library.opcheck(chunk_gated_delta_rule_fwd_op, args, test_utils=('test_schema', 'test_faketensor'))
+
+
+@pytest.mark.parametrize(
+    ('H', 'HV', 'D', 'output_final_state', 'output_intermediate_states'),
+    [
+        pytest.param(*test, id="H{}-HV{}-D{}-output_final_state{}-output_intermediate_states{}".format(*test))
+        for test in [
+            (2, 2, 64, False, False),
+            (2, 4, 128, True, True),
+        ]
+    ],
+)
+@pytest.mark.skipif(
+    not FLA_USE_CUSTOM_OPS,
+    reason='Custom ops are not registered',
+)
+def test_fused_recurrent_custom_op(
+    H: int,
+    HV: int,
+    D: int,
+    output_final_state: bool,
+    output_intermediate_states: bool,
+):
+    from fla.ops.gated_delta_rule.fused_recurrent import fused_recurrent_gated_delta_rule_fwd_op
+
+    torch.manual_seed(42)
+    B, T = 2, 100
+    q, k = (torch.randn(B, T, H, D, dtype=torch.bfloat16, device=device) for _ in range(2))
+    v = torch.randn(B, T, HV, D, dtype=torch.bfloat16, device=device)
+    g = F.logsigmoid(torch.rand(B, T, HV, dtype=torch.float32, device=device))
+    beta = torch.rand(B, T, HV, dtype=torch.bfloat16, device=device).sigmoid()
+    h0 = torch.randn(B, HV, D, D, dtype=torch.float32, device=device)
+    args = (q, k, v, g, None, None, beta, D ** -0.5, h0, output_final_state, True, None, output_intermediate_states)
+    torch.library.opcheck(fused_recurrent_gated_delta_rule_fwd_op, args, test_utils=('test_schema', 'test_faketensor'))
@@ -7,6 +7,7 @@ import torch.nn.functional as F
 
 from fla.ops.gla import chunk_gla, fused_recurrent_gla
 from fla.ops.gla.naive import naive_recurrent_gla
+from fla.ops.simple_gla import chunk_simple_gla
 from fla.utils import assert_close, device, device_platform
 
 
@@ -323,3 +324,109 @@ def test_chunk_varlen(
     assert_close('dv', ref_dv, tri_dv, 0.005)
     assert_close('dg', ref_dg, tri_dg, 0.005)
     assert_close('dh0', ref_dh0, tri_dh0, 0.005)
+
+
+@pytest.mark.parametrize(
+    ('B', 'T', 'H', 'D', 'dtype'),
+    [
+        pytest.param(*test, id="B{}-T{}-H{}-D{}-{}".format(*test))
+        for test in [
+            (2, 5, 2, 64, torch.float),
+            (3, 9, 4, 100, torch.float16),
+        ]
+    ],
+)
+@pytest.mark.skipif(
+    device_platform == 'intel',
+    reason='Intel Triton Failure',
+)
+def test_fused_recurrent_intermediate_states(
+    B: int,
+    T: int,
+    H: int,
+    D: int,
+    dtype: torch.dtype,
+):
+    torch.manual_seed(42)
+    q = torch.rand((B, T, H, D), dtype=dtype, device=device)
+    k = torch.rand((B, T, H, D), dtype=dtype, device=device)
+    v = torch.rand((B, T, H, D), dtype=dtype, device=device)
+    g = F.logsigmoid(torch.rand((B, T, H, D), dtype=dtype, device=device))
+    h0 = torch.rand(B, H, D, D, device=device)
+
+    tri, tri_ht, tri_hs = fused_recurrent_gla(
+        q=q,
+        k=k,
+        v=v,
+        gk=g,
+        initial_state=h0,
+        output_final_state=True,
+        output_intermediate_states=True,
+    )
+    assert tri_hs.shape == (B, T, H, D, D)
+    assert_close('ht', tri_ht, tri_hs[:, -1], 1e-6)
+    for t in range(T):
+        _, ref_ht = fused_recurrent_gla(
+            q=q[:, :t+1],
+            k=k[:, :t+1],
+            v=v[:, :t+1],
+            gk=g[:, :t+1],
+            initial_state=h0,
+            output_final_state=True,
+        )
+        assert_close(f'h{t}', ref_ht, tri_hs[:, t], 1e-5)
+
+
+@pytest.mark.parametrize(
+    ('H', 'D', 'cu_seqlens', 'gate_logit_normalizer'),
+    [
+        pytest.param(*test, id="H{}-D{}-cu_seqlens{}-gate_logit_normalizer{}".format(*test))
+        for test in [
+            (2, 32, [0, 63], 1),
+            (2, 60, [0, 15, 100, 164], 1),
+            (4, 64, [0, 100, 300], 0.1),
+            (4, 64, [0, 100, 300], 10),
+        ]
+    ],
+)
+def test_chunk_cpu(
+    H: int,
+    D: int,
+    cu_seqlens: list[int],
+    gate_logit_normalizer: float,
+):
+    torch.manual_seed(42)
+    T, N = cu_seqlens[-1], len(cu_seqlens) - 1
+    cu_seqlens = torch.tensor(cu_seqlens, dtype=torch.long)
+
+    q = torch.rand((1, T, H, D))
+    k = torch.rand((1, T, H, D))
+    v = torch.rand((1, T, H, D))
+    gk = F.logsigmoid(torch.rand((1, T, H, D))) / gate_logit_normalizer
+    g = F.logsigmoid(torch.rand((1, T, H))) / gate_logit_normalizer
+    h0 = torch.rand(N, H, D, D)
+
+    tri, tri_ht = chunk_gla(q, k, v, gk, initial_state=h0, output_final_state=True, cu_seqlens=cu_seqlens)
+    tri_s, tri_s_ht = chunk_simple_gla(q, k, v, g, initial_state=h0, output_final_state=True, cu_seqlens=cu_seqlens)
+    for i in range(N):
+        bos, eos = cu_seqlens[i], cu_seqlens[i+1]
+        ref, ref_ht = naive_recurrent_gla(
+            q=q[:, bos:eos],
+            k=k[:, bos:eos],
+            v=v[:, bos:eos],
+            gk=gk[:, bos:eos],
+            initial_state=h0[i:i+1],
+            output_final_state=True,
+        )
+        assert_close(f'o{i}', ref, tri[:, bos:eos], 1e-4)
+        assert_close(f'ht{i}', ref_ht, tri_ht[i:i+1], 1e-4)
+        ref, ref_ht = naive_recurrent_gla(
+            q=q[:, bos:eos],
+            k=k[:, bos:eos],
+            v=v[:, bos:eos],
+            gk=g[:, bos:eos, :, None].expand(-1, -1, -1, D),
+            initial_state=h0[i:i+1],
+            output_final_state=True,
+        )
+        assert_close(f'simple_o{i}', ref, tri_s[:, bos:eos], 1e-4)
+        assert_close(f'simple_ht{i}', ref_ht, tri_s_ht[i:i+1], 1e-4)
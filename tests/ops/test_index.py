@@ -1,7 +1,10 @@
 import pytest
 import torch
 
+from fla.layers.utils import get_unpad_data
 from fla.ops.utils.index import (
+    VarlenPlan,
+    get_varlen_plan,
     prepare_chunk_indices,
     prepare_chunk_offsets,
     prepare_position_ids,
@@ -176,3 +179,78 @@ def test_edge_cases():
     ref = ref_prepare_chunk_indices(cu_seqlens, chunk_size)
     opt = prepare_chunk_indices(cu_seqlens, chunk_size)
     torch.testing.assert_close(ref.long(), opt.long())
+
+
+@pytest.mark.parametrize("batch_size", [1, 4])
+@pytest.mark.parametrize("max_seq_len", [100, 500])
+@pytest.mark.parametrize("chunk_size", [16, 64])
+def test_host_metadata(batch_size, max_seq_len, chunk_size):
+    torch.manual_seed(42)
+
+    seqlens = torch.randint(1, max_seq_len, (batch_size,), device=device, dtype=torch.int32)
+    cu_seqlens = torch.cat([
+        torch.zeros(1, device=device, dtype=torch.int32),
+        seqlens.cumsum(0)
+    ])
+    cu_seqlens_cpu = cu_seqlens.cpu()
+    total_tokens = int(cu_seqlens_cpu[-1])
+
+    ref_seq = ref_prepare_sequence_ids(cu_seqlens)
+    ref_pos = ref_prepare_position_ids(cu_seqlens)
+    torch.testing.assert_close(ref_seq, prepare_sequence_ids(cu_seqlens, cu_seqlens_cpu=cu_seqlens_cpu))
+    torch.testing.assert_close(ref_pos, prepare_position_ids(cu_seqlens, total_tokens=total_tokens))
+    torch.testing.assert_close(
+        torch.stack([ref_seq, ref_pos], 1),
+        prepare_token_indices(cu_seqlens, cu_seqlens_cpu=cu_seqlens_cpu, total_tokens=total_tokens),
+    )
+    torch.testing.assert_close(
+        ref_prepare_chunk_indices(cu_seqlens, chunk_size).long(),
+        prepare_chunk_indices(cu_seqlens, chunk_size, cu_seqlens_cpu=cu_seqlens_cpu).long(),
+    )
+    torch.testing.assert_close(
+        ref_prepare_split_cu_seqlens(batch_size, max_seq_len, chunk_size, cu_seqlens=cu_seqlens),
+        prepare_split_cu_seqlens(
+            batch_size, max_seq_len, chunk_size, cu_seqlens, device=device, cu_seqlens_cpu=cu_seqlens_cpu,
+        ),
+    )
+
+
+@pytest.mark.parametrize("batch_size", [1, 4])
+@pytest.mark.parametrize("seq_len", [100, 500])
+def test_varlen_plan(batch_size, seq_len):
+    torch.manual_seed(42)
+
+    lens = torch.randint(1, seq_len + 1, (batch_size,), device=device)
+    lens[0] = seq_len
+    attention_mask = torch.arange(seq_len, device=device)[None, :] >= (seq_len - lens)[:, None]
+    plan = VarlenPlan.from_attention_mask(attention_mask)
+    # the host copy of cu_seqlens is deferred to its first use
+    assert plan._cu_seqlens_cpu is None
+    ref_indices, ref_cu_seqlens, ref_max_seqlen = get_unpad_data(attention_mask)
+    assert get_varlen_plan(plan.cu_seqlens) is plan
+    assert plan.total_tokens == lens.sum().item() and plan.max_seqlen == ref_max_seqlen == seq_len
+
+    # the slices taken by all layers share the same results, including the cu_seqlens owned by the plan
+    indices, cu_seqlens, max_seqlen = get_unpad_data(attention_mask[:, -seq_len:], varlen_plan=plan)
+    assert get_unpad_data(attention_mask[:, -seq_len:], varlen_plan=plan)[0] is indices
+    assert cu_seqlens is plan.cu_seqlens
+    torch.testing.assert_close(indices, ref_indices)
+    torch.testing.assert_close(cu_seqlens, ref_cu_seqlens)
+    assert max_seqlen == ref_max_seqlen
+    indices, cu_seqlens, max_seqlen = get_unpad_data(attention_mask[:, -1:], varlen_plan=plan)
+    torch.testing.assert_close(indices, torch.arange(batch_size, device=device))
+    assert max_seqlen == 1
+    # in decoding, the plan of a model is built from the slice the layers consume and owns their cu_seqlens
+    decoding_plan = VarlenPlan.from_inputs(attention_mask, seq_len=1)
+    assert get_unpad_data(attention_mask[:, -1:], varlen_plan=decoding_plan)[1] is decoding_plan.cu_seqlens
+    # the masks of inference-mode generation do not track versions
+    with torch.inference_mode():
+        mask = attention_mask.clone()
+        inference_plan = VarlenPlan.from_inputs(mask, seq_len=1)
+        indices = get_unpad_data(mask[:, -1:], varlen_plan=inference_plan)[0]
+        assert get_unpad_data(mask[:, -1:], varlen_plan=inference_plan)[0] is indices
+
+    torch.testing.assert_close(plan.chunk_indices(64).long(), ref_prepare_chunk_indices(ref_cu_seqlens, 64).long())
+    assert plan.chunk_indices(64) is plan.chunk_indices(64)
+    torch.testing.assert_close(plan.position_ids(), ref_prepare_position_ids(ref_cu_seqlens))
+    torch.testing.assert_close(plan.sequence_ids(), ref_prepare_sequence_ids(ref_cu_seqlens))
@@ -1,13 +1,19 @@
 
+import json
 import os
 
 import pytest
 import torch
+import triton
+import triton.language as tl
 
 from fla.ops.utils import chunk_global_cumsum, chunk_local_cumsum, mean_pooling
-from fla.ops.utils.index import prepare_lens
+from fla.ops.utils import autotune as autotune_utils
+from fla.ops.utils import dispatch as dispatch_utils
+from fla.ops.utils import mode as mode_utils
+from fla.ops.utils.index import prepare_chunk_indices, prepare_lens
 from fla.ops.utils.pack import pack_sequence, unpack_sequence
-from fla.utils import assert_close, device
+from fla.utils import assert_close, device, tensor_cache
 
 
 def reversed_cumsum(x, dim=-1):
@@ -416,3 +422,206 @@ def test_unpack_sequence(
 
     assert_close('y', ref, tri, 1e-3)
     assert_close('dx', ref_dx, tri_dx, 1e-3)
+
+
+@pytest.mark.parametrize(
+    ('B', 'T', 'crossover', 'training', 'varlen', 'history_size', 'expected'),
+    [
+        pytest.param(*test, id="B{}-T{}-crossover{}-training{}-varlen{}-history{}-{}".format(*test))
+        for test in [
+            (1, 64, None, False, False, 0, 'fused_recurrent'),
+            (1, 65, None, False, False, 0, 'chunk'),
+            (1, 64, None, True, False, 0, 'chunk'),
+            (8, 200, 256, False, False, 0, 'fused_recurrent'),
+            (8, 300, 256, False, False, 0, 'chunk'),
+            (4, 1000, 256, False, True, 0, 'fused_recurrent'),
+            (2, 1000, 256, False, True, 0, 'chunk'),
+            (8, 64, None, False, True, 0, 'fused_recurrent'),
+            (8, 200, None, False, True, 0, 'chunk'),
+            # the verify steps of speculative decoding need the states of each token to roll back rejected tokens
+            (8, 5, 0, False, False, 0, 'chunk'),
+            (8, 5, 0, False, False, 5, 'fused_recurrent'),
+            (8, 300, 256, False, False, 5, 'chunk'),
+        ]
+    ]
+)
+def test_select_mode(
+    tmp_path,
+    monkeypatch,
+    B: int,
+    T: int,
+    crossover: int | None,
+    training: bool,
+    varlen: bool,
+    history_size: int,
+    expected: str,
+):
+    path = str(tmp_path / 'mode_table.json')
+    if crossover is not None:
+        entries = [
+            {'B': 1, 'H': 16, 'K': 128, 'V': 128, 'crossover': 32},
+            {'B': 8, 'H': 16, 'K': 128, 'V': 128, 'crossover': crossover},
+        ]
+        table = {'version': mode_utils.MODE_TABLE_VERSION, 'devices': {mode_utils.get_device_key(): {'gla': entries}}}
+        with open(path, 'w') as f:
+            json.dump(table, f)
+    monkeypatch.setattr(mode_utils, 'FLA_MODE_TABLE', path)
+    mode_utils.load_mode_table.cache_clear()
+    mode_utils.get_crossover.cache_clear()
+
+    cu_seqlens = None
+    if varlen:
+        # the average length of the sequences is compared if calibrated, otherwise the total number of tokens
+        cu_seqlens = torch.linspace(0, T, B + 1, device=device).long()
+        cu_seqlens[-1] = T
+        B = 1
+    mode = mode_utils.select_mode('gla', 'chunk', T, B, 16, 128, 128, cu_seqlens=cu_seqlens, training=training,
+                                  history_size=history_size)
+    mode_utils.load_mode_table.cache_clear()
+    mode_utils.get_crossover.cache_clear()
+    assert mode == expected
+
+
+def test_calibrate_floor(tmp_path, monkeypatch):
+    import triton.testing
+
+    def chunk(**kwargs):
+        return 'chunk'
+
+    def fused_recurrent(**kwargs):
+        return 'fused_recurrent'
+
+    # the chunk kernel wins at every length, yet the shortest one is still left to the recurrent kernel
+    monkeypatch.setattr(mode_utils, 'get_calibration_fns', lambda op: (chunk, fused_recurrent, lambda *args: {}))
+    monkeypatch.setattr(triton.testing, 'do_bench', lambda fn: 1. if fn() == 'chunk' else 2.)
+    entries = mode_utils.calibrate(ops=('gla',), batch_sizes=(1,), num_heads=(16,), head_dims=((128, 128),),
+                                   seq_lens=(16, 32), path=str(tmp_path / 'mode_table.json'))
+    mode_utils.load_mode_table.cache_clear()
+    mode_utils.get_crossover.cache_clear()
+    assert entries['gla'][0]['crossover'] == 16
+
+
+def test_tensor_cache():
+    calls = []
+
+    @tensor_cache(maxsize=2)
+    def fn(x, chunk_size):
+        calls.append(chunk_size)
+        return x * chunk_size
+
+    x, y = torch.arange(4, device=device), torch.arange(8, device=device)
+    fn(x, 16), fn(x, 64), fn(x, 16), fn(x, chunk_size=16)
+    assert calls == [16, 64, 16]
+    # inplace updates bump the version counter and invalidate the entries of the tensor
+    x.add_(1)
+    assert torch.equal(fn(x, 16), x * 16)
+    fn(y, 16), fn(x, 16)
+    assert fn.cache_info().currsize == 2
+    # the least recently used entry, i.e., (y, 16), is evicted first
+    fn(x, 32), fn(y, 16)
+    assert calls == [16, 64, 16, 16, 16, 32, 16]
+    assert fn.cache_info() == (2, 7, 2, 2)
+    # the entries are released along with the input tensors
+    del y
+    assert fn.cache_info().currsize == 1
+    fn.cache_clear()
+    assert fn.cache_info() == (0, 0, 2, 0)
+
+
+def test_tensor_cache_inference_mode():
+    prepare_chunk_indices.cache_clear()
+    # inference tensors do not track versions, and are keyed on their identity alone
+    with torch.inference_mode():
+        cu_seqlens = torch.tensor([0, 100, 300], dtype=torch.long, device=device)
+        chunk_indices = prepare_chunk_indices(cu_seqlens, 64)
+        assert prepare_chunk_indices(cu_seqlens, 64) is chunk_indices
+    assert prepare_chunk_indices.cache_info().hits == 1
+
+
+def test_dispatch():
+    op = 'test_dispatch_op'
+
+    @dispatch_utils.register_backend(op, 'torch', check=dispatch_utils.on_device('cpu'))
+    def op_torch(x):
+        return 'torch'
+
+    @dispatch_utils.register_backend(op, 'cuda', priority=1, check=lambda x: x.dtype == torch.bfloat16)
+    def op_cuda(x):
+        return 'cuda'
+
+    @dispatch_utils.dispatch(op)
+    def op_triton(x):
+        return 'triton'
+
+    assert dispatch_utils.get_backends(op) == {op: ['cuda', 'torch', 'triton']}
+    x = torch.randn(4, device='cpu')
+    assert op_triton(x) == 'torch'
+    assert op_triton(x.bfloat16()) == 'cuda'
+    with dispatch_utils.use_backend('triton'):
+        assert op_triton(x) == 'triton'
+        with dispatch_utils.use_backend(**{op: 'cuda'}):
+            assert op_triton(x) == 'cuda'
+        assert op_triton(x) == 'triton'
+    assert op_triton(x) == 'torch'
+    dispatch_utils.set_backend(op, 'triton')
+    assert op_triton(x) == 'triton'
+    dispatch_utils.set_backend(op, 'unknown')
+    with pytest.raises(ValueError):
+        op_triton(x)
+    dispatch_utils.set_backend(op, None)
+
+    report = dispatch_utils.get_dispatch_report(reset=True)[op]
+    assert report == {'cuda': 2, 'torch': 2, 'triton': 3}
+    assert dispatch_utils.get_dispatch_report()[op] == {'cuda': 0, 'torch': 0, 'triton': 0}
+
+
+def test_dispatch_coverage():
+    # the backend choices of the modules and layers are all made through the registry
+    import fla.layers.mamba  # noqa: F401
+    import fla.layers.mamba2  # noqa: F401
+    import fla.modules  # noqa: F401
+    import fla.ops.gated_delta_rule  # noqa: F401
+    backends = dispatch_utils.get_backends()
+    assert backends['device'] == ['triton', 'cpu']
+    assert backends['math'] == ['libdevice', 'triton']
+    assert backends['causal_conv1d'] == ['mix', 'cuda', 'triton']
+    assert backends['causal_conv1d_update'] == ['cuda', 'triton']
+    assert backends['mamba'] == backends['mamba2'] == ['cuda', 'torch']
+    assert backends['fused_recurrent_gated_delta_rule'] == backends['rms_norm'] == ['torch', 'triton']
+
+    from fla.modules.layernorm import rms_norm, rms_norm_ref
+    x, residual, weight = torch.randn(4, 64), torch.randn(4, 64), torch.randn(64)
+    y, residual_out = rms_norm(x, weight, None, residual=residual, prenorm=True, residual_in_fp32=True)
+    ref, ref_residual_out = rms_norm_ref(x, weight, None, residual=residual, prenorm=True, upcast=True)
+    assert_close('y', ref, y, 1e-5)
+    assert_close('residual', ref_residual_out, residual_out, 1e-5)
+    assert dispatch_utils.get_dispatch_report()['rms_norm']['torch'] >= 1
+
+
+@triton.autotune(
+    configs=[triton.Config({'BD': BD}, num_warps=num_warps) for BD in [32, 64] for num_warps in [1, 2]],
+    key=['D'],
+)
+@triton.jit
+def autotune_db_test_kernel(x, y, D, BD: tl.constexpr):
+    o_d = tl.program_id(0) * BD + tl.arange(0, BD)
+    tl.store(y + o_d, tl.load(x + o_d, mask=o_d < D) * 2, mask=o_d < D)
+
+
+def test_autotune_db(tmp_path):
+    x = torch.randn(1000, device=device)
+    y = torch.empty_like(x)
+    autotune_db_test_kernel[lambda meta: (triton.cdiv(x.numel(), meta['BD']),)](x, y, x.numel())
+    assert_close('y', x * 2, y, 1e-6)
+
+    path = str(tmp_path / 'autotune.json')
+    assert autotune_utils.dump_tuned_configs(path, prefix=__name__) == 1
+    with open(path) as f:
+        db = json.load(f)
+    assert db['version'] == autotune_utils.AUTOTUNE_DB_VERSION
+    assert autotune_utils.get_db_key() in db['configs']
+
+    (key, config), = autotune_db_test_kernel.cache.items()
+    autotune_db_test_kernel.cache.clear()
+    assert autotune_utils.load_tuned_configs(path, prefix=__name__) == 1
+    assert autotune_db_test_kernel.cache[key] is config